@@ -11,6 +11,11 @@ import os
 import sys
 import logging
 
+try:
+    from stdatalog_core.HSD_utils.service_state import read_service_state
+except ImportError:
+    read_service_state = None
+
 # Minimal logging to avoid noise
 logging.basicConfig(
     level=logging.INFO,
@@ -26,9 +31,24 @@ class ServiceMonitor:
         self.max_failures = 5
         self.check_interval = 60  # 1 minute
         self.restart_wait = 20    # 20 seconds after restart
+        self.state_max_age = 30   # maximum age of the services state snapshots
         
+    def check_service_state(self, service_name):
+        """Check the state snapshot published by a service: True if recent, False if stale, None if not available"""
+        if read_service_state is None:
+            return None
+        snapshot = read_service_state(service_name, max_age=self.state_max_age)
+        if snapshot is None:
+            return None
+        logger.info(f"{service_name} state published {snapshot['age_s']:.1f} seconds ago")
+        return not snapshot['stale']
+
     def check_cli_health(self):
-        """Check if CLI service is responding via socket connection"""
+        """Check if CLI service is publishing its state, or responding via socket connection"""
+        state_healthy = self.check_service_state('stdatalog-cli')
+        if state_healthy is not None:
+            logger.info(f"CLI health check result: {'HEALTHY' if state_healthy else 'FAILED'} (service state)")
+            return state_healthy
         try:
             logger.info("Checking CLI health via socket 127.0.0.1:8888")
             sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
@@ -55,6 +75,11 @@ class ServiceMonitor:
             if not service_active:
                 logger.info("BLE health check FAILED - service not active")
                 return False
+
+            state_healthy = self.check_service_state('stdatalog-ble')
+            if state_healthy is not None:
+                logger.info(f"BLE health check result: {'HEALTHY' if state_healthy else 'FAILED'} (service state)")
+                return state_healthy
             
             # Check for recent log activity (last 2 minutes)
             log_file = '/home/kirwinr/logs/stdatalog-ble.log'
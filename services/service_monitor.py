@@ -4,7 +4,7 @@ STDatalog Service Monitor & Control Dashboard
 Enhanced version for STDatalog CLI and BLE services
 """
 
-from flask import Flask, render_template_string, request, jsonify, redirect
+from flask import Flask, render_template_string, request, jsonify, redirect, Response
 import subprocess
 import os
 import json
@@ -14,6 +14,8 @@ import threading
 from datetime import datetime
 import psutil
 import sys
+import socket
+import logging
 from flask import session, abort, url_for
 from functools import wraps
 
@@ -25,6 +27,41 @@ sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
 from thread.find_root import find_subfolder
 ACQ_FOLDER = find_subfolder("acquisition_data")
 
+try:
+    from stdatalog_core.HSD_utils.acquisition_catalog import AcquisitionCatalog, CATALOG_FILE_NAME
+except ImportError:
+    AcquisitionCatalog = None
+
+try:
+    from stdatalog_core.HSD_utils.service_state import read_service_state, format_prometheus_metrics
+except ImportError:
+    read_service_state = None
+
+# State snapshots published by the services (older snapshots: the service is stalled, status read from systemd/logs)
+SERVICE_STATE_MAX_AGE = 10
+# Maximum size (bytes) read from the end of a log file
+LOG_TAIL_SIZE = 16 * 1024
+
+# Offload progress published by thread/usb_transfer.py (ignored when older than USB_PROGRESS_MAX_AGE seconds)
+USB_PROGRESS_FILE = "/tmp/usb_transfer_progress.json"
+USB_PROGRESS_MAX_AGE = 30
+
+# Dashboard bind address and port (0.0.0.0: all the interfaces)
+DASHBOARD_HOST = "0.0.0.0"
+DASHBOARD_PORT = 8080
+
+# Maximum age (seconds) of the acquisition catalog before a (incremental) re-sync with the folder tree
+CATALOG_SYNC_INTERVAL = 60
+_acquisition_catalog = None
+
+def get_acquisition_catalog():
+    """Open the acquisition catalog maintained by the CLI logger (None if not available)"""
+    global _acquisition_catalog
+    if _acquisition_catalog is None and AcquisitionCatalog is not None and ACQ_FOLDER:
+        if os.path.exists(os.path.join(ACQ_FOLDER, CATALOG_FILE_NAME)):
+            _acquisition_catalog = AcquisitionCatalog(ACQ_FOLDER)
+    return _acquisition_catalog
+
 # Initialize Flask app
 app = Flask(__name__)
 
@@ -150,6 +187,27 @@ def ansi_to_html(text):
     
     return html_text
 
+def get_service_state(service_id):
+    """Get the state snapshot published by a service (None if not available or stale)"""
+    if read_service_state is None:
+        return None
+    snapshot = read_service_state(service_id, max_age=SERVICE_STATE_MAX_AGE)
+    if snapshot is None or snapshot['stale']:
+        return None
+    return snapshot
+
+def read_log_tail(log_file, max_lines):
+    """Get the last max_lines lines of a log file, reading only its end"""
+    with open(log_file, 'rb') as f:
+        f.seek(0, os.SEEK_END)
+        size = f.tell()
+        f.seek(max(0, size - LOG_TAIL_SIZE))
+        data = f.read()
+    lines = data.decode('utf-8', errors='replace').splitlines(keepends=True)
+    if size > LOG_TAIL_SIZE:
+        lines = lines[1:]  # partial first line
+    return lines[-max_lines:]
+
 def get_recent_logs():
     """Get recent log entries from both services separately with color support"""
     service_logs = {}
@@ -161,18 +219,16 @@ def get_recent_logs():
         log_file = config['log_file']
         if os.path.exists(log_file):
             try:
-                with open(log_file, 'r') as f:
-                    lines = f.readlines()
-                    # Get last 25 lines from each service
-                    recent = lines[-25:] if len(lines) > 25 else lines
-                    if recent:
-                        log_text = ''.join(recent)
-                        # Convert ANSI color codes to HTML for BLE service
-                        if service_id == 'stdatalog-ble':
-                            log_text = ansi_to_html(log_text)
-                        service_logs[service_id] = log_text
-                    else:
-                        service_logs[service_id] = "No recent logs available"
+                # Get last 25 lines from each service
+                recent = read_log_tail(log_file, 25)
+                if recent:
+                    log_text = ''.join(recent)
+                    # Convert ANSI color codes to HTML for BLE service
+                    if service_id == 'stdatalog-ble':
+                        log_text = ansi_to_html(log_text)
+                    service_logs[service_id] = log_text
+                else:
+                    service_logs[service_id] = "No recent logs available"
             except:
                 service_logs[service_id] = "Error reading log file"
         else:
@@ -185,8 +241,25 @@ LAST_KNOWN_BLE_STATUS = {
     'feedrate_sensor': {'connected': False, 'status': 'Unknown'}
 }
 
+BLE_SENSOR_KEYS = {'Speed': 'speed_sensor', 'Feedrate': 'feedrate_sensor'}
+
 def get_ble_status():
     global LAST_KNOWN_BLE_STATUS
+
+    # Fast path: connection state published by the BLE service
+    snapshot = get_service_state('stdatalog-ble')
+    if snapshot is not None:
+        ble_status = {}
+        for name, key in BLE_SENSOR_KEYS.items():
+            sensor = snapshot.get('sensors', {}).get(name, {})
+            connected = sensor.get('connected', False)
+            ble_status[key] = {
+                'connected': connected,
+                'status': "Connected and listening" if connected else "Disconnected, retrying...",
+                'mac': sensor.get('mac', '')
+            }
+        LAST_KNOWN_BLE_STATUS = ble_status
+        return ble_status
     
     # First check if the BLE service is running
     ble_service_status = get_service_status('stdatalog-ble')
@@ -205,10 +278,7 @@ def get_ble_status():
                 'feedrate_sensor': {'connected': False, 'status': 'Log not found'}
             }
 
-        with open(log_file, 'r') as f:
-            lines = f.readlines()
-            recent_lines = lines[-50:] if len(lines) > 50 else lines
-            recent_text = ''.join(recent_lines)
+        recent_text = ''.join(read_log_tail(log_file, 50))
 
         updated = False
 
@@ -252,6 +322,17 @@ def get_ble_status():
         }
 
 
+def get_usb_transfer_progress():
+    """Get the current USB offload progress (folder, percent, MB/s, ETA), None if no recent offload"""
+    try:
+        with open(USB_PROGRESS_FILE, 'r') as f:
+            progress = json.load(f)
+        if time.time() - progress.get('timestamp', 0) > USB_PROGRESS_MAX_AGE and progress.get('state') not in ('running', 'resuming', 'verifying'):
+            return None
+        return progress
+    except (OSError, ValueError):
+        return None
+
 def get_usb_status():
     """Check if any USB stick is mounted and get info"""
     import getpass
@@ -278,7 +359,8 @@ def get_usb_status():
                     'free_space_mb': free_mb,
                     'total_space_mb': total_mb,
                     'used_percent': used_percent,
-                    'mount_path': usb_path
+                    'mount_path': usb_path,
+                    'transfer': get_usb_transfer_progress()
                 }
         
         return {'connected': False}
@@ -625,6 +707,15 @@ HTML_TEMPLATE = """
                                 usbStatusEl.textContent = "CONNECTED";
                                 usbStatusEl.className = "usb-status usb-connected";
                                 usbInfoEl.textContent = `${data.system.usb_status.free_space_mb} MB free (${data.system.usb_status.used_percent}% used)`;
+                                const transfer = data.system.usb_status.transfer;
+                                if (transfer && transfer.state !== "done") {
+                                    if (transfer.state === "failed") {
+                                        usbInfoEl.textContent += ` | ${transfer.folder}: offload interrupted, will resume`;
+                                    } else {
+                                        const eta = transfer.eta_s != null ? `, ETA ${Math.floor(transfer.eta_s / 60)}m${transfer.eta_s % 60}s` : "";
+                                        usbInfoEl.textContent += ` | ${transfer.folder}: ${transfer.state} ${transfer.percent}% (${transfer.rate_mb_s} MB/s${eta})`;
+                                    }
+                                }
                             } else {
                                 usbStatusEl.textContent = "NOT DETECTED";
                                 usbStatusEl.className = "usb-status usb-disconnected";
@@ -857,6 +948,8 @@ HTML_TEMPLATE = """
 
 def get_service_status(service_name):
     """Get systemd service status"""
+    if get_service_state(service_name) is not None:
+        return 'active'
     try:
         result = subprocess.run(['systemctl', 'is-active', service_name], 
                               capture_output=True, text=True)
@@ -876,11 +969,15 @@ def get_service_info(service_name):
         
         if status == 'active':
             try:
-                # Get process info
-                result = subprocess.run(['systemctl', 'show', service_name, 
-                                       '--property=MainPID'], 
-                                      capture_output=True, text=True)
-                pid_line = result.stdout.strip()
+                # Get process info (PID published in the service state, systemd otherwise)
+                snapshot = get_service_state(service_name)
+                if snapshot is not None:
+                    pid_line = f"MainPID={snapshot['pid']}"
+                else:
+                    result = subprocess.run(['systemctl', 'show', service_name, 
+                                           '--property=MainPID'], 
+                                          capture_output=True, text=True)
+                    pid_line = result.stdout.strip()
                 if pid_line.startswith('MainPID='):
                     pid = int(pid_line.split('=')[1])
                     if pid > 0:
@@ -918,6 +1015,16 @@ def get_acquisition_stats():
     try:
         if not os.path.exists(ACQ_FOLDER):
             return 0, 0
+
+        # Fast path: query the acquisition catalog instead of walking the folder tree
+        catalog = get_acquisition_catalog()
+        if catalog is not None:
+            try:
+                catalog.sync(max_age=CATALOG_SYNC_INTERVAL)
+                cut_folders = catalog.get_cut_folders()
+                return sum(c['acquisitions'] for c in cut_folders), len(cut_folders)
+            except Exception as e:
+                print(f"[MONITOR] Acquisition catalog not available, scanning folders: {e}")
         
         folders = [d for d in os.listdir(ACQ_FOLDER) 
                   if os.path.isdir(os.path.join(ACQ_FOLDER, d))]
@@ -1054,10 +1161,32 @@ def api_status():
             'timestamp': datetime.now().isoformat(),
             'logs': logs,
             'usb_status': usb_status,
-            'ble_status': ble_status
+            'ble_status': ble_status,
+            'cli_state': get_service_state('stdatalog-cli')
         }
     })
 
+@app.route("/metrics")
+def metrics():
+    """Prometheus text endpoint: services state snapshots and acquisition storage"""
+    if read_service_state is None:
+        return "Service state not available (stdatalog_core not installed)", 503
+    snapshots = {service_id: read_service_state(service_id, max_age=SERVICE_STATE_MAX_AGE)
+                 for service_id, config in SERVICES.items() if not config.get('compact', False)}
+    acq_folders, cut_folders = get_acquisition_stats()
+    text = format_prometheus_metrics(snapshots)
+    text += (f"# TYPE stdatalog_acquisition_folders gauge\nstdatalog_acquisition_folders {acq_folders}\n"
+             f"# TYPE stdatalog_cut_folders gauge\nstdatalog_cut_folders {cut_folders}\n"
+             f"# TYPE stdatalog_disk_usage_percent gauge\nstdatalog_disk_usage_percent {get_disk_usage()}\n")
+    return Response(text, mimetype='text/plain; version=0.0.4')
+
+def get_metrics_url():
+    """URL of the /metrics endpoint on the configured bind address (this host for a wildcard address)"""
+    host = DASHBOARD_HOST if DASHBOARD_HOST not in ("", "0.0.0.0", "::") else socket.gethostname()
+    if ":" in host:
+        host = f"[{host}]"
+    return f"http://{host}:{DASHBOARD_PORT}/metrics"
+
 if __name__ == "__main__":
     # Create log directory if it doesn't exist
     os.makedirs('/home/kirwinr/logs', exist_ok=True)
@@ -1069,5 +1198,8 @@ if __name__ == "__main__":
     
     # Start browser opening in background
     open_browser_after_delay()
-    
-    app.run(host="0.0.0.0", port=8080, debug=False)
+
+    app.logger.setLevel(logging.INFO)
+    app.logger.info("Metrics available at: %s", get_metrics_url())
+
+    app.run(host=DASHBOARD_HOST, port=DASHBOARD_PORT, debug=False)
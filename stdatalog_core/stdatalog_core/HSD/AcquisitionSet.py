@@ -0,0 +1,432 @@
+# *****************************************************************************
+#  * @file    AcquisitionSet.py
+#  * @author  SRA
+# ******************************************************************************
+# * @attention
+# *
+# * Copyright (c) 2022 STMicroelectronics.
+# * All rights reserved.
+# *
+# * This software is licensed under terms that can be found in the LICENSE file
+# * in the root directory of this software component.
+# * If no LICENSE file comes with this software, it is provided AS-IS.
+# *
+# *
+# ******************************************************************************
+#
+
+"""
+Dataset API over a folder of HSD_v2 acquisitions, e.g. the `acquisition_data/cut_N/<timestamp>/`
+layout produced by the STDatalog CLI periodic logging.
+
+The root folder is scanned once: only device_config.json, acquisition_info.json and the .dat
+file sizes are read (no DTDL resolution), and the resulting index can be persisted in a json
+file, so that following scans only read new or modified acquisitions. The set can then be
+filtered by metadata and tags, and a component can be iterated, concatenated or exported
+across all the selected acquisitions, decoding folders in parallel.
+
+Example: export all the iis3dwb_acc data of the last week:
+
+    acq_set = AcquisitionSet("acquisition_data", index_file="acquisition_data/acquisition_set_index.json")
+    acq_set.filter(component="iis3dwb_acc", since=datetime.now() - timedelta(days=7)).export("iis3dwb_acc", "export", "CSV")
+"""
+
+import os
+import json
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from datetime import datetime, timezone
+
+import numpy as np
+
+from stdatalog_core.HSD.HSDatalog import HSDatalog
+from stdatalog_core.HSD_utils.acquisition_catalog import ACQUISITION_INFO_FILE_NAME, DEVICE_CONFIG_FILE_NAME, parse_iso_datetime, read_acquisition_metadata
+import stdatalog_core.HSD_utils.logger as logger
+
+log = logger.get_logger(__name__)
+
+INDEX_VERSION = 1
+
+class AcquisitionRecord:
+    """
+    Index entry of an acquisition folder.
+
+    :param path: Acquisition folder path.
+    :param rel_path: Path relative to the AcquisitionSet root folder.
+    :param metadata: Dictionary of metadata (see AcquisitionSet.read_acquisition_metadata).
+    """
+    def __init__(self, path, rel_path, metadata):
+        self.path = path
+        self.rel_path = rel_path
+        self.metadata = metadata
+        self.start_time = parse_iso_datetime(metadata.get("start_time"))
+        self.end_time = parse_iso_datetime(metadata.get("end_time"))
+
+    @property
+    def name(self):
+        return self.metadata.get("name")
+
+    @property
+    def cut(self):
+        return self.metadata.get("cut")
+
+    @property
+    def components(self):
+        return self.metadata.get("components", {})
+
+    @property
+    def tags(self):
+        return self.metadata.get("tags", [])
+
+    @property
+    def duration(self):
+        if self.start_time is None or self.end_time is None:
+            return None
+        return (self.end_time - self.start_time).total_seconds()
+
+    @property
+    def size(self):
+        return sum(c.get("file_size", 0) for c in self.components.values())
+
+    def to_dict(self):
+        return {"rel_path": self.rel_path, "metadata": self.metadata}
+
+    def __repr__(self):
+        return "AcquisitionRecord({}, start_time={}, duration={}, components={})".format(self.rel_path, self.metadata.get("start_time"), self.duration, list(self.components.keys()))
+
+def _load_component_data(acq_folder, comp_name, start_time, end_time, raw_data):
+    # Module level function: it is run by the worker threads or processes of AcquisitionSet
+    hsd = HSDatalog().create_hsd(acq_folder, update_catalog=False)
+    if hsd is None:
+        raise ValueError("{} is not a valid acquisition folder".format(acq_folder))
+    chunks = HSDatalog.get_data_and_timestamps_by_name(hsd, comp_name, start_time, end_time, raw_data)
+    if chunks is None or len(chunks) == 0:
+        return None, None
+    if len(chunks) == 1:
+        return chunks[0][0], chunks[0][1]
+    return np.concatenate([c[0] for c in chunks]), np.concatenate([c[1] for c in chunks])
+
+def _export_component(acq_folder, comp_name, output_folder, file_format, start_time, end_time, labeled, raw_data, which_tags, no_timestamps):
+    hsd = HSDatalog().create_hsd(acq_folder, update_catalog=False)
+    if hsd is None:
+        raise ValueError("{} is not a valid acquisition folder".format(acq_folder))
+    os.makedirs(output_folder, exist_ok=True)
+    component = HSDatalog.get_component(hsd, comp_name)
+    HSDatalog.convert_dat_to_xsv(hsd, component, start_time, end_time, labeled, raw_data, output_folder, file_format, which_tags, no_timestamps)
+    return output_folder
+
+class AcquisitionSet:
+    """
+    Collection of HSD_v2 acquisitions found under a root folder.
+
+    :param root_folder: Root folder to scan (e.g. "acquisition_data"). None to build a set from records only.
+    :param index_file: [Optional] Json file where the index is persisted (unchanged acquisitions are not read again).
+    :param workers: [Optional] Number of threads used to read the metadata of new acquisitions.
+    :param records: [Optional] List of AcquisitionRecord (used by filter).
+    """
+    def __init__(self, root_folder = None, index_file = None, workers = 8, records = None):
+        self.root_folder = os.path.abspath(root_folder) if root_folder is not None else None
+        self.index_file = index_file
+        if records is not None:
+            self.records = list(records)
+        elif root_folder is not None:
+            self.records = self.__scan(workers)
+        else:
+            self.records = []
+
+    def __len__(self):
+        return len(self.records)
+
+    def __iter__(self):
+        return iter(self.records)
+
+    def __getitem__(self, index):
+        return self.records[index]
+
+    @staticmethod
+    def find_acquisition_folders(root_folder):
+        """
+        Finds the HSD_v2 acquisition folders (device_config.json + acquisition_info.json) under a root folder.
+
+        :param root_folder: Root folder.
+        :return: Sorted list of acquisition folder paths.
+        """
+        folders = []
+        for root, dirs, files in os.walk(root_folder):
+            if ACQUISITION_INFO_FILE_NAME in files and DEVICE_CONFIG_FILE_NAME in files:
+                folders.append(root)
+                # Acquisitions are not nested
+                dirs[:] = []
+            else:
+                dirs.sort()
+        return sorted(folders)
+
+    @staticmethod
+    def read_acquisition_metadata(acq_folder):
+        """
+        Reads the metadata of an acquisition folder (see acquisition_catalog.read_acquisition_metadata).
+
+        :param acq_folder: Acquisition folder path.
+        :return: Metadata dictionary.
+        """
+        return read_acquisition_metadata(acq_folder)
+
+    @staticmethod
+    def __get_folder_mtime(acq_folder):
+        return max(os.path.getmtime(os.path.join(acq_folder, ACQUISITION_INFO_FILE_NAME)), os.path.getmtime(os.path.join(acq_folder, DEVICE_CONFIG_FILE_NAME)))
+
+    def __load_index(self):
+        if self.index_file is None or not os.path.exists(self.index_file):
+            return {}
+        try:
+            with open(self.index_file, "r") as f:
+                index = json.load(f)
+        except (OSError, ValueError) as e:
+            log.warning("AcquisitionSet index file {} not loaded: {}".format(self.index_file, e))
+            return {}
+        if index.get("version") != INDEX_VERSION:
+            return {}
+        return index.get("acquisitions", {})
+
+    def __save_index(self, entries):
+        if self.index_file is None:
+            return
+        index = {"version": INDEX_VERSION, "root_folder": self.root_folder, "acquisitions": entries}
+        tmp_file_path = self.index_file + ".tmp"
+        with open(tmp_file_path, "w") as f:
+            json.dump(index, f)
+        os.replace(tmp_file_path, self.index_file)
+
+    def __scan(self, workers):
+        folders = AcquisitionSet.find_acquisition_folders(self.root_folder)
+        cached_entries = self.__load_index()
+        entries = {}
+        to_read = []
+        for folder in folders:
+            rel_path = os.path.relpath(folder, self.root_folder)
+            mtime = AcquisitionSet.__get_folder_mtime(folder)
+            cached = cached_entries.get(rel_path)
+            if cached is not None and cached.get("mtime") == mtime:
+                entries[rel_path] = cached
+            else:
+                to_read.append((folder, rel_path, mtime))
+
+        def read(item):
+            folder, rel_path, mtime = item
+            try:
+                return rel_path, {"mtime": mtime, "metadata": AcquisitionSet.read_acquisition_metadata(folder)}
+            except (OSError, ValueError, KeyError, IndexError) as e:
+                log.warning("Acquisition {} skipped: {}".format(folder, e))
+                return rel_path, None
+
+        if len(to_read) > 0:
+            with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+                for rel_path, entry in executor.map(read, to_read):
+                    if entry is not None:
+                        entries[rel_path] = entry
+        log.info("AcquisitionSet: {} acquisitions found in {} ({} read, {} from index)".format(len(entries), self.root_folder, len(to_read), len(folders) - len(to_read)))
+        if len(to_read) > 0 or len(entries) != len(cached_entries):
+            self.__save_index(entries)
+
+        records = [AcquisitionRecord(os.path.join(self.root_folder, rel_path), rel_path, entries[rel_path]["metadata"]) for rel_path in sorted(entries)]
+        # Chronological order (acquisitions without start time last)
+        records.sort(key=lambda r: (r.start_time is None, r.start_time or datetime.min.replace(tzinfo=timezone.utc), r.rel_path))
+        return records
+
+    def filter(self, component = None, tags = None, since = None, until = None, board_id = None, fw_id = None, fw_name = None, cuts = None, min_duration = None, max_duration = None, predicate = None):
+        """
+        Selects a subset of the acquisitions. All the specified conditions must be satisfied.
+
+        :param component: [Optional] Component name (or list of names) that must be active.
+        :param tags: [Optional] Tag label (or list of labels): at least one must be present.
+        :param since: [Optional] Minimum start time (datetime or ISO8601 string, naive = local time).
+        :param until: [Optional] Maximum start time (datetime or ISO8601 string, naive = local time).
+        :param board_id: [Optional] Board ID.
+        :param fw_id: [Optional] Firmware ID.
+        :param fw_name: [Optional] Firmware name.
+        :param cuts: [Optional] List of cut numbers (cut_N folders).
+        :param min_duration: [Optional] Minimum acquisition duration [s].
+        :param max_duration: [Optional] Maximum acquisition duration [s].
+        :param predicate: [Optional] Function (AcquisitionRecord) -> bool.
+        :return: A new AcquisitionSet.
+        """
+        components = [component] if isinstance(component, str) else component
+        tags = [tags] if isinstance(tags, str) else tags
+        since = parse_iso_datetime(since)
+        until = parse_iso_datetime(until)
+
+        def match(r):
+            if components is not None and not all(c in r.components for c in components):
+                return False
+            if tags is not None and not any(t in r.tags for t in tags):
+                return False
+            if since is not None and (r.start_time is None or r.start_time < since):
+                return False
+            if until is not None and (r.start_time is None or r.start_time > until):
+                return False
+            if board_id is not None and r.metadata.get("board_id") != board_id:
+                return False
+            if fw_id is not None and r.metadata.get("fw_id") != fw_id:
+                return False
+            if fw_name is not None and r.metadata.get("fw_name") != fw_name:
+                return False
+            if cuts is not None and r.cut not in cuts:
+                return False
+            if min_duration is not None and (r.duration is None or r.duration < min_duration):
+                return False
+            if max_duration is not None and (r.duration is None or r.duration > max_duration):
+                return False
+            return predicate is None or predicate(r)
+
+        subset = AcquisitionSet(records=[r for r in self.records if match(r)])
+        subset.root_folder = self.root_folder
+        return subset
+
+    def get_components(self):
+        """
+        :return: Sorted list of the component names active in at least one acquisition.
+        """
+        return sorted({c for r in self.records for c in r.components})
+
+    def get_tags(self):
+        """
+        :return: Sorted list of the tag labels used in the acquisitions.
+        """
+        return sorted({t for r in self.records for t in r.tags})
+
+    def get_summary(self):
+        """
+        :return: Dictionary with the number of acquisitions, total duration and size, time range and per-component counts.
+        """
+        durations = [r.duration for r in self.records if r.duration is not None]
+        start_times = [r.start_time for r in self.records if r.start_time is not None]
+        comp_summary = {}
+        for r in self.records:
+            for c_name, c in r.components.items():
+                s = comp_summary.setdefault(c_name, {"acquisitions": 0, "size": 0, "odr": set()})
+                s["acquisitions"] += 1
+                s["size"] += c.get("file_size", 0)
+                s["odr"].add(c.get("odr"))
+        for s in comp_summary.values():
+            s["odr"] = sorted(o for o in s["odr"] if o is not None)
+        return {
+            "acquisitions": len(self.records),
+            "duration": sum(durations),
+            "size": sum(r.size for r in self.records),
+            "first_start_time": min(start_times).isoformat() if start_times else None,
+            "last_start_time": max(start_times).isoformat() if start_times else None,
+            "components": comp_summary,
+            "tags": self.get_tags(),
+        }
+
+    def __run_parallel(self, function, items, workers, use_processes):
+        """
+        Runs function(*args) for each (record, args) item, yielding (record, result) in order.
+        At most 2 * workers items are decoded ahead of the consumer.
+        """
+        if workers is None or workers <= 1:
+            for record, args in items:
+                yield record, function(*args)
+            return
+        executor_class = ProcessPoolExecutor if use_processes else ThreadPoolExecutor
+        executor = executor_class(max_workers=workers)
+        pending = deque()
+        items = iter(items)
+        try:
+            for record, args in items:
+                pending.append((record, executor.submit(function, *args)))
+                if len(pending) >= 2 * workers:
+                    break
+            while len(pending) > 0:
+                record, future = pending.popleft()
+                next_item = next(items, None)
+                if next_item is not None:
+                    pending.append((next_item[0], executor.submit(function, *next_item[1])))
+                yield record, future.result()
+        finally:
+            for _, future in pending:
+                future.cancel()
+            executor.shutdown(wait=True)
+
+    def iter_component(self, comp_name, start_time = 0, end_time = -1, raw_data = False, workers = 1, use_processes = False, skip_errors = True):
+        """
+        Lazily iterates the data of a component across the acquisitions (chronological order).
+
+        :param comp_name: Component name.
+        :param start_time: [Optional] Start time in each acquisition [s].
+        :param end_time: [Optional] End time in each acquisition [s] (-1: until the end).
+        :param raw_data: [Optional] If True, data are not scaled by the sensitivity.
+        :param workers: [Optional] Number of acquisitions decoded in parallel.
+        :param use_processes: [Optional] If True, acquisitions are decoded in worker processes instead of threads.
+        :param skip_errors: [Optional] If True, acquisitions that cannot be decoded are skipped (with a warning).
+        :return: A generator of (AcquisitionRecord, data, timestamps) tuples.
+        """
+        items = [(r, (r.path, comp_name, start_time, end_time, raw_data)) for r in self.records if comp_name in r.components]
+        results = self.__run_parallel(_load_component_data_safe if skip_errors else _load_component_data, items, workers, use_processes)
+        for record, result in results:
+            if isinstance(result, Exception):
+                log.warning("{} data not loaded from {}: {}".format(comp_name, record.path, result))
+                continue
+            data, timestamps = result
+            if data is None:
+                continue
+            yield record, data, timestamps
+
+    def concatenate(self, comp_name, start_time = 0, end_time = -1, raw_data = False, absolute_time = False, workers = 1, use_processes = False):
+        """
+        Concatenates the data of a component across the acquisitions.
+
+        :param comp_name: Component name.
+        :param absolute_time: [Optional] If True, timestamps are converted to POSIX times using each acquisition start time,
+            otherwise the timestamps of each acquisition are kept (they restart from 0 in each acquisition).
+        :return: A tuple (data, timestamps), (None, None) if no data.
+        (see iter_component for the other parameters)
+        """
+        data_list, time_list = [], []
+        for record, data, timestamps in self.iter_component(comp_name, start_time, end_time, raw_data, workers, use_processes):
+            if absolute_time:
+                if record.start_time is None:
+                    log.warning("{} skipped: unknown start time".format(record.path))
+                    continue
+                timestamps = timestamps + record.start_time.timestamp()
+            data_list.append(data)
+            time_list.append(timestamps)
+        if len(data_list) == 0:
+            return None, None
+        return np.concatenate(data_list), np.concatenate(time_list)
+
+    def export(self, comp_name, output_folder, file_format = "CSV", start_time = 0, end_time = -1, labeled = False, raw_data = False, which_tags = [], no_timestamps = False, workers = 1, use_processes = False):
+        """
+        Exports a component of all the acquisitions (HSDatalog.convert_dat_to_xsv), one output folder per acquisition
+        (the folder layout below the root folder is kept, e.g. <output_folder>/cut_3/20240916_15_38_55).
+
+        :param comp_name: Component name.
+        :param output_folder: Output root folder.
+        :param file_format: [Optional] Output format ('TXT', 'CSV', 'TSV', 'PARQUET').
+        :return: List of the output folders.
+        """
+        items = []
+        for r in self.records:
+            if comp_name in r.components:
+                acq_output_folder = os.path.join(output_folder, r.rel_path)
+                items.append((r, (r.path, comp_name, acq_output_folder, file_format, start_time, end_time, labeled, raw_data, which_tags, no_timestamps)))
+        output_folders = []
+        for record, result in self.__run_parallel(_export_component_safe, items, workers, use_processes):
+            if isinstance(result, Exception):
+                log.warning("{} not exported from {}: {}".format(comp_name, record.path, result))
+                continue
+            output_folders.append(result)
+        log.info("{} exported from {} acquisitions to {}".format(comp_name, len(output_folders), output_folder))
+        return output_folders
+
+def _load_component_data_safe(*args):
+    try:
+        return _load_component_data(*args)
+    except Exception as e:
+        return e
+
+def _export_component_safe(*args):
+    try:
+        return _export_component(*args)
+    except Exception as e:
+        return e
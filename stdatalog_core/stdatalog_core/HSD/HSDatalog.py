@@ -19,20 +19,27 @@
 import os
 import enum
 import numpy as np
-import h5py
-from pandas import DataFrame
+from typing import TYPE_CHECKING
 from warnings import warn
 from stdatalog_core.HSD.HSDatalog_v1 import HSDatalog_v1
 from stdatalog_core.HSD.HSDatalog_v2 import HSDatalog_v2
 from stdatalog_core.HSD.model.DeviceConfig import Device
 from stdatalog_core.HSD.utils.file_manager import FileManager
+from stdatalog_core.HSD.utils.virtual_fs import VirtualFS
+from stdatalog_core.HSD.utils.type_conversion import TypeConversion
 from stdatalog_core.HSD.utils.sensors_utils import SensorTypeConversion
-from stdatalog_core.HSD_utils.converters import NanoedgeCSVWriter, HSDatalogConverter
+from stdatalog_core.HSD_utils.converters import NanoedgeCSVWriter, ParquetBatchWriter, HSDatalogConverter
+from stdatalog_core.HSD_utils.columnar import TIME_COLUMN, TagsEncoding
+import stdatalog_core.HSD_utils.columnar as columnar
+from stdatalog_core.HSD_utils.integrity import check_dat_file, get_payload_byte_rate, is_report_clean, save_integrity_report
 from stdatalog_core.HSD_utils.exceptions import *
 import stdatalog_core.HSD_utils.logger as logger
 from stdatalog_pnpl.DTDL.device_template_manager import DeviceCatalogManager
 from stdatalog_pnpl.DTDL.dtdl_utils import AlgorithmTypeEnum, ComponentTypeEnum, SensorCategoryEnum
 
+if TYPE_CHECKING:
+    from pandas import DataFrame
+
 log = logger.get_logger(__name__)
 
 class HSDatalog:    
@@ -51,6 +58,7 @@ class HSDatalog:
 
         :param acquisition_folder: [Optional] The path to the folder where acquisition data is stored.
         :param device_config: [Optional] The configuration of the device, which can be used to determine the version of HSDatalog to instantiate.
+        :param update_catalog: [Optional] If False, the device catalog is not updated (faster open for batch processing).
         :return: An instance of HSDatalog_v1 or HSDatalog_v2.
         """
 
@@ -69,22 +77,25 @@ class HSDatalog:
             # Return the created HSDatalog instance
             return hsd
         
-        # If no device configuration is provided, attempt to create HSDatalog version 1 using the acquisition folder
-        try:
-            hsd = HSDatalog_v1(self.acquisition_folder)
-        except AcquisitionFormatError:
-            # If an AcquisitionFormatError is raised, it indicates the data format is not compatible with version 1
-            # Set the flag to indicate that the datalog is version 2
-            self.is_datalog2 = True
-
-        # If the datalog is determined to be version 2, create HSDatalog version 2 using the acquisition folder
-        if self.is_datalog2:
+        # If no device configuration is provided, dispatch on the files found in the acquisition folder
+        hsd_version = HSDatalog.validate_hsd_folder(self.acquisition_folder)
+        if hsd_version == HSDatalog.HSDVersion.V1:
+            return HSDatalog_v1(self.acquisition_folder)
+        if hsd_version == HSDatalog.HSDVersion.INVALID:
+            # Incomplete folder: HSDatalog_v1 raises AcquisitionFormatError if it is not a version 1 acquisition
             try:
-                hsd = HSDatalog_v2(self.acquisition_folder)
-            except Exception as e:
-                # If an exception occurs, log a warning and return None
-                log.warning(f"Failed to create HSDatalog_v2 instance: {e}")
-                return None
+                return HSDatalog_v1(self.acquisition_folder)
+            except AcquisitionFormatError:
+                pass
+
+        # Version 2 (HSDatalog_v2 reports what is missing in an incomplete folder)
+        self.is_datalog2 = True
+        try:
+            hsd = HSDatalog_v2(self.acquisition_folder, update_catalog=update_catalog)
+        except Exception as e:
+            # If an exception occurs, log a warning and return None
+            log.warning(f"Failed to create HSDatalog_v2 instance: {e}")
+            return None
         # Return the created HSDatalog instance
         return hsd
     
@@ -112,6 +123,59 @@ class HSDatalog:
                     return HSDatalog.HSDVersion.V2
         return HSDatalog.HSDVersion.INVALID
 
+    @staticmethod
+    def open_acquisition_set(root_folder, index_file = None, workers = 8):
+        """
+        Scans a folder containing multiple HSD_v2 acquisitions (e.g. the cut_N folders of a periodic logging session).
+
+        :param root_folder (str): The root folder to scan.
+        :param index_file (str): [Optional] Json file where the acquisitions index is persisted between scans.
+        :param workers (int): [Optional] Number of threads used to read the acquisitions metadata.
+        :return AcquisitionSet: The set of acquisitions found (see stdatalog_core.HSD.AcquisitionSet).
+        """
+        from stdatalog_core.HSD.AcquisitionSet import AcquisitionSet
+        return AcquisitionSet(root_folder, index_file, workers)
+
+    @staticmethod
+    def export_archive(acquisition_folder, archive_path = None, codec = None, verify = True):
+        """
+        Encodes an HSD_v2 acquisition folder into a compact, lossless archive (see stdatalog_core.HSD_utils.archive_codec).
+
+        :param acquisition_folder (str): The acquisition folder.
+        :param archive_path (str): [Optional] The output archive path. Default: acquisition folder + ".hsdz".
+        :param codec (str): [Optional] "zstd", "zlib" or "lzma". Default: zstd if the zstandard package is installed, otherwise zlib.
+        :param verify (bool): [Optional] If True, the .dat files are decoded back from the archive and checked against the originals.
+        :return str: The archive path.
+        """
+        from stdatalog_core.HSD_utils.archive_codec import create_archive
+        return create_archive(acquisition_folder, archive_path, codec, verify=verify)
+
+    @staticmethod
+    def import_archive(archive_path, output_folder = None, verify = True):
+        """
+        Rebuilds the original acquisition folder (byte exact .dat files) from an archive.
+
+        :param archive_path (str): The archive path.
+        :param output_folder (str): [Optional] The destination folder. Default: archive path without extension.
+        :param verify (bool): [Optional] If True, the sha256 of every rebuilt .dat file is checked.
+        :return str: The output folder, which can be loaded with HSDatalog.create_hsd.
+        """
+        from stdatalog_core.HSD_utils.archive_codec import extract_archive
+        if output_folder is None:
+            output_folder = os.path.splitext(archive_path)[0]
+        return extract_archive(archive_path, output_folder, verify)
+
+    @staticmethod
+    def open_archive(archive_path):
+        """
+        Opens an acquisition archive to read its components without extracting it.
+
+        :param archive_path (str): The archive path.
+        :return AcquisitionArchive: The archive reader (get_data_and_timestamps, read_dat, extract, ...).
+        """
+        from stdatalog_core.HSD_utils.archive_codec import AcquisitionArchive
+        return AcquisitionArchive(archive_path)
+
     @staticmethod
     def find_nearest_idx(array:np.array, value):
         idx = (np.abs(array - value)).argmin()
@@ -672,7 +736,7 @@ class HSDatalog:
             return None
 
     @staticmethod
-    def __create_group_keys(df:DataFrame, column_name:str, max_time_gap = None) -> DataFrame:
+    def __create_group_keys(df:"DataFrame", column_name:str, max_time_gap = None) -> "DataFrame":
         """
         Add a group key to a DataFrame to identify consecutive rows with the same value in a specified column,
         and ensure that the time gap between consecutive rows is not too large.
@@ -715,7 +779,7 @@ class HSDatalog:
         return df
 
     @staticmethod
-    def __save_tag_group_in_file(comp_name:str, group_df:DataFrame, tag_label:str, tag_info:dict, tags_columns:list, output_folder:str, out_format:str, with_times:bool, columns_labels = "default") -> None:
+    def __save_tag_group_in_file(comp_name:str, group_df:"DataFrame", tag_label:str, tag_info:dict, tags_columns:list, output_folder:str, out_format:str, with_times:bool, columns_labels = "default") -> None:
         """
         Save a group of tagged data to a file, creating a new file or appending data to an existing one as
         necessary based on tagging information contained in "tag_info" input dict.
@@ -882,7 +946,60 @@ class HSDatalog:
         # Retrieve data and timestamps in batches using the HSDatalog 'get_data_and_timestamp_gen' method.
         # The method will handle the specified time range, data type, and chunk size.
         return HSDatalog.get_data_and_timestamp_gen(hsd, component, start_time, end_time, raw_data, chunk_size)
-    
+
+    @staticmethod
+    def get_aligned_gen(hsd, components, target_rate, method = "linear", start_time = 0, end_time = -1, raw_data = False, tolerance = None, chunk_size = DEFAULT_SAMPLES_CHUNK_SIZE):
+        """
+        Retrieves the data of several components aligned on a common time base, using a generator.
+
+        The components are read chunk by chunk (always advancing the one that is behind) and resampled
+        on a uniform grid at target_rate (see stdatalog_core.HSD_utils.alignment). The grid starts at
+        start_time, or at the latest first timestamp of the components if start_time is 0, and ends
+        with the component that ends first.
+
+        :param hsd: An instance of HSDatalog.
+        :param components: A list of component names or of dictionaries {comp_name: comp_status}.
+        :param target_rate: The rate [Hz] of the common time base.
+        :param method: [Optional] "nearest", "linear" (default), "polyphase" (anti-aliasing FIR + linear, components with a nominal rate only) or "asof".
+        :param start_time: [Optional] The start time of the common time base.
+        :param end_time: [Optional] The end time (excluded) of the common time base. If -1, until the end.
+        :param raw_data: [Optional] A boolean indicating whether to retrieve raw data (not multiplied by sensitivity).
+        :param tolerance: [Optional] nearest/asof methods: maximum distance [s] between a grid time and the selected sample (NaN beyond).
+        :param chunk_size: [Optional] The number of samples per component chunk. Default is HSDatalog.DEFAULT_SAMPLES_CHUNK_SIZE.
+        :return: A generator that yields (aligned_data, timestamps): a dictionary comp_name -> numpy array (n, dim) and a numpy array (n, 1).
+        """
+        from stdatalog_core.HSD_utils.alignment import StreamAligner
+
+        comps = {}
+        for c in components:
+            if isinstance(c, str):
+                c = HSDatalog.get_component(hsd, c)
+            comp_name = list(c.keys())[0]
+            comps[comp_name] = c[comp_name]
+        ioffsets = {n: s.get("ioffset", 0) for n, s in comps.items()}
+        stream_rates = {n: s.get("measodr") or s.get("odr") or HSDatalog._get_measodr(s) for n, s in comps.items()}
+
+        aligner = StreamAligner(list(comps.keys()), target_rate, method, start_time or None, end_time, tolerance, stream_rates)
+        generators = {n: HSDatalog.get_data_and_timestamp_gen(hsd, {n: s}, start_time, end_time, raw_data, chunk_size) for n, s in comps.items()}
+        active = list(comps.keys())
+        try:
+            while active and not aligner.is_done():
+                # Advance the component that is behind (or has no data yet)
+                comp_name = min(active, key=lambda n: -np.inf if aligner.get_horizon(n) is None else aligner.get_horizon(n))
+                data_time = next(generators[comp_name], None)
+                if data_time is None or data_time[0] is None:
+                    active.remove(comp_name)
+                    aligner.finish(comp_name)
+                else:
+                    aligner.push(comp_name, data_time[0], data_time[1])
+                aligned = aligner.pop()
+                if aligned is not None:
+                    yield aligned
+        finally:
+            for comp_name, gen in generators.items():
+                gen.close()
+                HSDatalog.reset_status_conversion_side_info(comps[comp_name], ioffsets[comp_name])
+
     @staticmethod
     def __get_data_and_timestamps_batch(hsd, comp_name, comp_status, start_time = 0, end_time = -1, raw_data = False, chunk_size=DEFAULT_SAMPLES_CHUNK_SIZE):
         """
@@ -1122,6 +1239,99 @@ class HSDatalog:
                     varying the start_time and end_time parameters.: {e}")
             raise
 
+    @staticmethod
+    def get_arrow_gen(hsd, component, start_time = 0, end_time = -1, labeled = False, raw_data = False, which_tags:list = [], tags_encoding = TagsEncoding.BOOL, chunk_size=DEFAULT_SAMPLES_CHUNK_SIZE):
+        """
+        Retrieves data as a generator of pyarrow RecordBatches for a given component within a specified time range. (HSD_v2 only)
+        Each batch has the "Time" float64 column, one column per axis (native type or float64) and the tags columns
+        (see stdatalog_core.HSD_utils.columnar). Requires pyarrow.
+
+        :param hsd: An instance of HSDatalog.
+        :param component: A dictionary where the key is the component name and the value is its status.
+        :param start_time: The start time for the data retrieval (the closest greater timestamp will be selected).
+        :param end_time: The end time for the data retrieval (the closest greater timestamp will be selected).
+        :param labeled: Boolean to choose whether the output should contain information about labels (Input data must be labelled).
+        :param raw_data: Boolean indicating whether to output raw data (not multiplied by sensitivity).
+        :param which_tags: [Optional] List of tags to filter the data.
+        :param tags_encoding: [Optional] TagsEncoding.BOOL (one bool column per tag label, default) or TagsEncoding.DICTIONARY (single "Tag" column).
+        :param chunk_size: [Optional] The size of the data chunk (in samples) to be processed at a time. Default value = HSDatalog.DEFAULT_SAMPLES_CHUNK_SIZE = 10M Samples
+        :return: A generator that yields a RecordBatch for each chunk of data.
+        """
+        if not isinstance(hsd, HSDatalog_v2):
+            log.warning("Arrow results are supported only for HSD_v2 acquisitions")
+            return
+
+        c_name = list(component.keys())[0]
+        c_status = component[c_name]
+        # FFT algorithms have no Time column (as their dataframes)
+        no_timestamps = c_status.get("c_type") == ComponentTypeEnum.ALGORITHM.value \
+            and c_status.get("algorithm_type") == AlgorithmTypeEnum.IALGORITHM_TYPE_FFT.value
+        ioffset = c_status.get("ioffset", 0)
+        data_gen = HSDatalog.__get_data_and_timestamps_batch_gen(hsd, c_name, c_status, start_time, end_time, raw_data, chunk_size)
+        try:
+            for data, time in data_gen:
+                batch = hsd.to_record_batch(data, time, c_status, c_name, labeled, which_tags, raw_data, tags_encoding)
+                if no_timestamps:
+                    batch = batch.drop_columns([TIME_COLUMN])
+                yield batch
+        finally:
+            # The status side information is restored also when the generator is not exhausted (e.g. closed by the caller)
+            data_gen.close()
+            HSDatalog.reset_status_conversion_side_info(c_status, ioffset)
+
+    @staticmethod
+    def get_arrow_table(hsd, component, start_time = 0, end_time = -1, labeled = False, raw_data = False, which_tags:list = [], tags_encoding = TagsEncoding.BOOL, chunk_size=DEFAULT_SAMPLES_CHUNK_SIZE):
+        """
+        Retrieves data as a pyarrow Table for a given component within a specified time range. (HSD_v2 only)
+        The Table references the RecordBatches of get_arrow_gen (one per chunk) without concatenating them.
+
+        :param hsd: An instance of HSDatalog.
+        :param component: A dictionary where the key is the component name and the value is its status.
+        :param start_time: The start time for the data retrieval (the closest greater timestamp will be selected).
+        :param end_time: The end time for the data retrieval (the closest greater timestamp will be selected).
+        :param labeled: Boolean to choose whether the output should contain information about labels (Input data must be labelled).
+        :param raw_data: Boolean indicating whether to output raw data (not multiplied by sensitivity).
+        :param which_tags: [Optional] List of tags to filter the data.
+        :param tags_encoding: [Optional] TagsEncoding.BOOL (one bool column per tag label, default) or TagsEncoding.DICTIONARY (single "Tag" column).
+        :param chunk_size: [Optional] The size of the data chunk (in samples) to be processed at a time. Default value = HSDatalog.DEFAULT_SAMPLES_CHUNK_SIZE = 10M Samples
+        :return: A pyarrow Table, None if no data is available (or the acquisition is not HSD_v2).
+        """
+        import pyarrow as pa
+        batches = list(HSDatalog.get_arrow_gen(hsd, component, start_time, end_time, labeled, raw_data, which_tags, tags_encoding, chunk_size))
+        if len(batches) == 0:
+            return None
+        return pa.Table.from_batches(batches)
+
+    @staticmethod
+    def arrow_to_pandas(arrow_data):
+        """
+        Converts a RecordBatch or Table (see get_arrow_table) to a pandas DataFrame backed by the Arrow buffers (pandas.ArrowDtype columns).
+
+        :param arrow_data: pyarrow RecordBatch or Table.
+        :return: pandas DataFrame.
+        """
+        return columnar.to_pandas(arrow_data)
+
+    @staticmethod
+    def arrow_to_polars(arrow_data):
+        """
+        Converts a RecordBatch or Table (see get_arrow_table) to a polars DataFrame. Requires polars.
+
+        :param arrow_data: pyarrow RecordBatch or Table.
+        :return: polars DataFrame.
+        """
+        return columnar.to_polars(arrow_data)
+
+    @staticmethod
+    def arrow_to_numpy(arrow_data):
+        """
+        Converts a RecordBatch or Table (see get_arrow_table) to numpy arrays (views of the Arrow buffers for the numeric columns).
+
+        :param arrow_data: pyarrow RecordBatch or Table.
+        :return: Dictionary column name -> numpy array.
+        """
+        return columnar.to_numpy(arrow_data)
+
     @staticmethod
     def __get_dataframe_batch(hsd, comp_name, comp_status, start_time = 0, end_time = -1, labeled = False, raw_data = False, which_tags:list = [], chunk_size=DEFAULT_SAMPLES_CHUNK_SIZE):   
         """
@@ -1382,7 +1592,7 @@ class HSDatalog:
                 is_first_chunk = False
 
                 # Create a sequence of expected data values for comparison.
-                x = data[0] + np.array([i for i in range(len(data))]).astype(np.int16)
+                x = data[0] + np.arange(len(data), dtype=np.int16)
 
                 # Check if the actual data matches the expected sequence.
                 if not (data == x).all():
@@ -1404,7 +1614,7 @@ class HSDatalog:
         print("")
     
     @staticmethod
-    def check_dummy_data(hsd, component, start_time, end_time, chunk_size = DEFAULT_SAMPLES_CHUNK_SIZE):
+    def check_dummy_data(hsd, component, start_time, end_time, chunk_size = DEFAULT_SAMPLES_CHUNK_SIZE, report_path = None):
         """
         Checks the dummy data for a given component within a specified time range.
 
@@ -1413,6 +1623,7 @@ class HSDatalog:
         :param start_time: The start time for the data check (the closest greater timestamp will be selected).
         :param end_time: The end time for the data check (the closest greater timestamp will be selected).
         :param chunk_size: [Optional] The size of the data chunk (in samples) to be checked at a time. Default value = HSDatalog.DEFAULT_SAMPLES_CHUNK_SIZE = 10M Samples
+        :param report_path: [Optional] Folder where the integrity_report.json file is saved (or updated). If None (default), no report is written.
         """
 
         # Extract the component name from the dictionary keys. Assumes there is only one key-value pair.
@@ -1424,6 +1635,77 @@ class HSDatalog:
         # Call the private method __check_data_batch of the HSDatalog class to perform the data check.
         # This method will use the provided parameters to check the data for the specified component and time range.
         HSDatalog.__check_data_batch(hsd, c_name, c_status, start_time, end_time, chunk_size)
+
+        # Fast offline pass on packet counters and timestamps (the report is saved only if report_path is given).
+        HSDatalog.check_data_integrity(hsd, component, save_report = report_path is not None, report_path = report_path)
+
+    @staticmethod
+    def check_data_integrity(hsd, component, save_report = True, report_path = None):
+        """
+        Checks the packet counters and the timestamps of a component .dat file, reporting lost packets
+        (as byte and time ranges), duplicated and non-monotonic timestamps. (HSD_v2 only)
+
+        :param hsd: An instance of HSDatalog.
+        :param component: A dictionary where the key is the component name and the value is its status.
+        :param save_report: [Optional] If True, the result is saved in an integrity_report.json file.
+        :param report_path: [Optional] Folder of the saved integrity_report.json file (default: the acquisition folder).
+            Acquisitions read from an archive are never modified: their report is saved only in report_path.
+        :return: The component integrity report dictionary, or None if the check is not supported.
+        """
+        if not isinstance(hsd, HSDatalog_v2):
+            log.warning("Data integrity check is supported only for HSD_v2 acquisitions")
+            return None
+
+        c_name = list(component.keys())[0]
+        c_status = component[c_name]
+        file_path = os.path.join(hsd.get_acquisition_path(), FileManager.encode_file_name(c_name))
+        if not VirtualFS.exists(file_path):
+            log.error("No such file or directory: {} found for {} component".format(file_path, c_name))
+            return None
+
+        # data packet size (0:sd card, 1:usb, 2:ble, 3:serial)
+        interface = hsd.get_acquisition_interface()
+        data_protocol_size = hsd.get_data_protocol_size()
+        if interface == 0:
+            data_packet_size = c_status["sd_dps"] - data_protocol_size
+        elif interface == 1:
+            data_packet_size = c_status["usb_dps"]
+        elif interface == 2:
+            data_packet_size = c_status["ble_dps"]
+        elif interface == 3:
+            data_packet_size = c_status["serial_dps"]
+        else:
+            log.error(f"Unknown interface: {interface}. check your device_config.json file")
+            return None
+
+        frame_size = None
+        expected_period = None
+        payload_byte_rate = None
+        if c_status.get("c_type") == ComponentTypeEnum.SENSOR.value:
+            spts = c_status.get("samples_per_ts", 0)
+            if not isinstance(spts, int):
+                spts = spts.get("val", 0) if spts else 0
+            payload_byte_rate = get_payload_byte_rate(c_status)
+            odr = c_status.get("measodr") or c_status.get("odr")
+            if spts != 0 and "data_type" in c_status:
+                frame_size = spts * c_status.get("dim", 1) * TypeConversion.check_type_length(c_status["data_type"]) + 8
+                expected_period = spts / odr if odr else None
+
+        log.info(f"--> {c_name} Integrity check started...")
+        report = check_dat_file(file_path, data_packet_size, frame_size, payload_byte_rate, c_status.get("ioffset", 0), expected_period, data_protocol_size, c_name)
+        if is_report_clean(report):
+            log.info("### Integrity OK ###")
+        else:
+            ts_report = report.get("timestamps", {})
+            log.error("### Integrity ERRORS: {} lost packets ({} gap events), {} duplicated timestamps, {} non-monotonic timestamps ###".format(
+                report["nof_lost_packets"], report["nof_gap_events"], ts_report.get("nof_duplicated", 0), ts_report.get("nof_non_monotonic", 0)))
+        if save_report:
+            if report_path is None and VirtualFS.is_archive_path(hsd.get_acquisition_path()):
+                log.warning("Archived acquisition: integrity report not saved (set report_path to save it)")
+            else:
+                report_file = save_integrity_report(report_path or hsd.get_acquisition_path(), {c_name: report}, "offline")
+                log.info(f"--> Integrity report saved: {report_file}")
+        return report
     
     @staticmethod
     def __convert_to_xsv_batch(hsd, comp_name, comp_status, start_time, end_time, labeled, raw_data, output_folder, file_format, which_tags:list = [], no_timestamps = False, chunk_size = DEFAULT_SAMPLES_CHUNK_SIZE):
@@ -1543,6 +1825,34 @@ class HSDatalog:
         # Reset the status conversion side information for the component status.
         HSDatalog.reset_status_conversion_side_info(comp_status, ioffset)
 
+    @staticmethod
+    def __convert_to_parquet_batch(hsd, comp_name, comp_status, start_time, end_time, labeled, raw_data, output_folder, which_tags:list = [], no_timestamps = False, chunk_size = DEFAULT_SAMPLES_CHUNK_SIZE):
+        """
+        Converts sensor data to an Apache Parquet file, writing the Arrow record batches of each chunk
+        (see get_arrow_gen) as row groups of the same file. (HSD_v2 only)
+
+        :param hsd: An instance of HSDatalog_v2.
+        :param comp_name: The name of the component.
+        :param comp_status: A dictionary containing the status of the component.
+        :param start_time: The start time for the data conversion (the closest greater timestamp will be selected).
+        :param end_time: The end time for the data conversion (the closest greater timestamp will be selected).
+        :param labeled: Boolean to choose whether the output should contain information about labels (Input data must be labelled).
+        :param raw_data: Boolean to get raw data output (not multiplied by sensitivity).
+        :param output_folder: The folder where the output file will be saved.
+        :param which_tags: [Optional] List of tags labels to be included into exported file.
+        :param no_timestamps: [Optional] Boolean to decide whether to exclude timestamps from the output (if true, then no Time columns in exported file).
+        :param chunk_size: [Optional] The size of the data chunk (in samples) to be processed at a time. Default value = HSDatalog.DEFAULT_SAMPLES_CHUNK_SIZE = 10M Samples
+        """
+        sensor_file_path = HSDatalog.get_sensor_file_path(comp_name, output_folder)
+        log.info(f"--> {comp_name} Conversion started...")
+        with ParquetBatchWriter(sensor_file_path) as writer:
+            for batch in HSDatalog.get_arrow_gen(hsd, {comp_name: comp_status}, start_time, end_time, labeled, raw_data, which_tags, TagsEncoding.BOOL, chunk_size):
+                if no_timestamps and TIME_COLUMN in batch.schema.names:
+                    batch = batch.drop_columns([TIME_COLUMN])
+                writer.write(batch)
+                log.debug("--> Chunk Conversion completed")
+        log.info("--> Conversion completed")
+
     @staticmethod
     def convert_dat_to_xsv(hsd, component, start_time, end_time, labeled, raw_data, output_folder, file_format, which_tags:list = [], no_timestamps = False, chunk_size = DEFAULT_SAMPLES_CHUNK_SIZE):
         """
@@ -1562,6 +1872,9 @@ class HSDatalog:
         """
         c_name = list(component.keys())[0]
         c_status = component[c_name]
+        if file_format == 'PARQUET' and isinstance(hsd, HSDatalog_v2):
+            HSDatalog.__convert_to_parquet_batch(hsd, c_name, c_status, start_time, end_time, labeled, raw_data, output_folder, which_tags, no_timestamps, chunk_size)
+            return
         HSDatalog.__convert_to_xsv_batch(hsd, c_name, c_status, start_time, end_time, labeled, raw_data, output_folder, file_format, which_tags, no_timestamps, chunk_size)
     
     @staticmethod
@@ -1590,6 +1903,7 @@ class HSDatalog:
             hdf_file_path = f"{base_hdf_file_path}_{counter}.h5"
             counter += 1
 
+        import h5py
         # Create an HDF5 file in append mode
         hdf = h5py.File(hdf_file_path, 'a')
         
@@ -2146,6 +2460,42 @@ class HSDatalog:
         # using the provided parameters such as signal length, signal increment, and chunk size.
         HSDatalog.__convert_to_nanoedge_format_batch(hsd, c_name, c_status, signal_length, signal_increment, start_time, end_time, raw_data, output_folder, target_value, chunk_size)
     
+    @staticmethod
+    def convert_dat_to_windows(hsd, component, signal_length, signal_increment, start_time, end_time, raw_data, output_folder, out_format = "npy", target_value = None, chunk_size = DEFAULT_SAMPLES_CHUNK_SIZE):
+        """
+        Segments the data of a component in (overlapping) windows and saves them as a training dataset.
+
+        :param hsd: An instance of HSDatalog.
+        :param component: A dictionary with the component name as key and its status as value.
+        :param signal_length: The length of each window [samples].
+        :param signal_increment: The distance between the starts of two consecutive windows [samples]. e.g.: signal_length/2 is 50% overlap.
+        :param start_time: The start time for the conversion (the closest greater timestamp will be selected).
+        :param end_time: The end time for the conversion (the closest greater timestamp will be selected).
+        :param raw_data: Boolean indicating whether to output raw data (not multiplied by sensitivity).
+        :param output_folder: The directory where the dataset files will be saved.
+        :param out_format: [Optional] "npy" (<comp>_windows.npy (n, signal_length, dim), <comp>_times.npy, <comp>_targets.npy)
+            or "parquet" (<comp>_windows.parquet, requires pyarrow). See stdatalog_core.HSD_utils.windowing.
+        :param target_value: [Optional] The target value (label) of the windows.
+        :param chunk_size: [Optional] The number of samples per data chunk during conversion. Default is HSDatalog.DEFAULT_SAMPLES_CHUNK_SIZE = 10M Samples.
+        :return: The number of windows written.
+        """
+        from stdatalog_core.HSD_utils.windowing import SlidingWindowBuffer, WindowDatasetWriter
+
+        c_name = list(component.keys())[0]
+        c_status = component[c_name]
+        if "_ispu" in c_name or "_mlc" in c_name:
+            log.warning(f"{c_name}: window datasets are not supported for ISPU/MLC components")
+            return 0
+
+        windows_buffer = SlidingWindowBuffer(signal_length, signal_increment)
+        log.info(f"--> {c_name} Window dataset conversion started...")
+        with WindowDatasetWriter(output_folder, c_name, out_format, target_value) as writer:
+            for data, times in HSDatalog.get_data_and_timestamp_gen(hsd, component, start_time, end_time, raw_data, max(chunk_size, signal_length)):
+                windows, start_times = windows_buffer.push(data, times)
+                writer.write(windows, start_times)
+        log.info(f"--> {c_name} Window dataset conversion completed: {writer.nof_windows} windows ({writer.file_path})")
+        return writer.nof_windows
+
     @staticmethod
     def __convert_to_unico_format_batch(hsd, components, start_time, end_time, use_datalog_tags, output_folder, out_format, columns_labels = "default", with_times = False, raw_data = False, chunk_size = DEFAULT_SAMPLES_CHUNK_SIZE):
         """
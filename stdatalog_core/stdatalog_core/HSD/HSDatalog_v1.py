@@ -24,7 +24,6 @@ import struct
 from collections import OrderedDict
 
 import numpy as np
-import pandas as pd
 
 from stdatalog_core.HSD.utils.plot_utils import PlotUtils
 from stdatalog_core.HSD_utils.exceptions import *
@@ -34,6 +33,7 @@ from stdatalog_core.HSD.model.AcquisitionInfo import AcquisitionInfo
 from stdatalog_core.HSD.utils.cli_interaction import CLIInteraction as CLI
 from stdatalog_core.HSD.utils.file_manager import FileManager
 from stdatalog_core.HSD.utils.type_conversion import TypeConversion
+from stdatalog_core.HSD.utils.output_decoders import ISPUOutputDecoder
 from stdatalog_pnpl.DTDL.dtdl_utils import UnitMap
 
 log = logger.get_logger(__name__)
@@ -963,6 +963,7 @@ class HSDatalog_v1:
         return tags
 
     def __to_dataframe(self, data, time, ss_stat, sensor_name, labeled = False, which_tags:list = [], raw_flag = False):
+        import pandas as pd
         if data is not None and time is not None:
             cols = []
             s_type = ""
@@ -981,12 +982,7 @@ class HSDatalog_v1:
             else:
                 ispu_out_types = self.get_ispu_output_types()
                 if ispu_out_types is not None:
-                    output_bytes_count = sum(TypeConversion.check_type_length(ot) for ot in ispu_out_types)
-                    unpack_str = "=" + ''.join(TypeConversion.get_format_char(ot) for ot in ispu_out_types)
-                    output_data = [struct.unpack(unpack_str, np.array(d[0:output_bytes_count])) for d in data]
-                    np_output_data = np.array(output_data)
-                    final_out_data = [np_output_data[:,i] for i in range(len(ispu_out_types))]
-                    final_out_data = np.transpose(final_out_data)
+                    final_out_data = ISPUOutputDecoder.decode(data, ispu_out_types)
                     val = np.array(time)
                     val = np.append(val, final_out_data, axis=1)
                 else:
@@ -16,35 +16,36 @@
 #
 
 import math
+import logging
 
 from datetime import datetime
-from dateutil import parser
 import json
 import os
-import dask.dataframe as dd
 import struct
+import tempfile
 import numpy as np
-import pandas as pd
 from threading import Thread
-from werkzeug.serving import make_server
 
 from stdatalog_core.HSD.utils.plot_utils import PlotUtils
 from stdatalog_core.HSD_utils.exceptions import *
 import stdatalog_core.HSD_utils.logger as logger
+import stdatalog_core.HSD_utils.profiling as profiling
 from stdatalog_core.HSD.utils.cli_interaction import CLIInteraction as CLI
 from stdatalog_core.HSD.utils.file_manager import FileManager
+from stdatalog_core.HSD.utils.virtual_fs import VirtualFS
 from stdatalog_core.HSD.utils.type_conversion import TypeConversion
+from stdatalog_core.HSD.utils.output_decoders import ISPUOutputDecoder, RangingUtils
+from stdatalog_core.HSD_utils.columnar import TagsEncoding, build_record_batch
 from stdatalog_pnpl.DTDL.dtdl_utils import MC_FAST_TELEMETRY_SENSITIVITY, UnitMap
 from stdatalog_pnpl.DTDL.device_template_manager import DeviceCatalogManager, DeviceTemplateManager
 from stdatalog_pnpl.DTDL.device_template_model import ContentSchema, SchemaType
 from stdatalog_pnpl.DTDL.dtdl_utils import DTDL_SENSORS_ID_COMP_KEY, MC_FAST_TELEMETRY_COMP_NAME, MC_SLOW_TELEMETRY_COMP_NAME, AlgorithmTypeEnum, ComponentTypeEnum, SensorCategoryEnum
-from plotly.subplots import make_subplots
-import plotly.graph_objects as go
 
 log = logger.get_logger(__name__)
 
 class ServerThread(Thread):
     def __init__(self, app, port=8050):
+        from werkzeug.serving import make_server
         Thread.__init__(self)
         self.server = make_server('127.0.0.1', port, app.server)
         self.ctx = app.server.app_context()
@@ -78,9 +79,9 @@ class HSDatalog_v2:
 
         :param acquisition_folder: [Optional] The path to the folder where acquisition data is stored.
         """        
-        # Update the device catalog if the update_catalog flag is set to True
+        # Update the device catalog if the update_catalog flag is set to True (according to the catalog update policy)
         if update_catalog:
-            DeviceCatalogManager.update_catalog()
+            DeviceCatalogManager.request_catalog_update()
         # If an acquisition folder is provided, proceed with initialization.
         if acquisition_folder is not None:
             # Attempt to find and load the device configuration from the acquisition folder.
@@ -147,7 +148,7 @@ class HSDatalog_v2:
             MissingDeviceModelError: Exception returned if an error occour in device_config.json loading
         """        
         try:
-            with open(device_json_file_path, encoding="UTF-8") as f:
+            with VirtualFS.open(device_json_file_path, encoding="UTF-8") as f:
                 file_content = f.read()
                 if file_content[-1] == '\x00':
                     device_json_dict = json.loads(file_content[:-1])
@@ -169,7 +170,7 @@ class HSDatalog_v2:
             MissingAcquisitionInfoError: Exception returned if an error occour in acqusition_info.json loading
         """
         try:
-            with open(acq_info_json_file_path) as f:
+            with VirtualFS.open(acq_info_json_file_path) as f:
                 file_content = f.read()
                 if file_content[-1] == '\x00':
                     acq_info_json_dict = json.loads(file_content[:-1])
@@ -198,7 +199,7 @@ class HSDatalog_v2:
         Args:
             ispu_output_format_file_path ([str]): ispu_output_format.json path
         """
-        with open(ispu_output_format_file_path) as f:
+        with VirtualFS.open(ispu_output_format_file_path) as f:
             file_content = f.read()
             if file_content[-1] == '\x00':
                 ispu_out_json_dict = json.loads(file_content[:-1])
@@ -309,8 +310,8 @@ class HSDatalog_v2:
 
     def get_file_dimension(self, component_name):
         filepath = os.path.join(self.__acq_folder_path, f"{component_name}.dat")
-        if os.path.isfile(filepath):
-            return os.path.getsize(filepath)
+        if VirtualFS.isfile(filepath):
+            return VirtualFS.getsize(filepath)
         else:
             return None
 
@@ -552,6 +553,7 @@ class HSDatalog_v2:
 
     # Helper function to convert ISO8601 time strings to seconds
     def get_seconds_from_ISO8601(self, start_time_str, end_time_str):
+        from dateutil import parser
         start_time = parser.isoparse(start_time_str)
         end_time = parser.isoparse(end_time_str)
         duration = (end_time - start_time).total_seconds()
@@ -597,6 +599,7 @@ class HSDatalog_v2:
         elif comp_name == "fast_mc_telemetries":
             return [k for k in ss_stat.keys() if isinstance(ss_stat[k],dict) and k != "sensitivity" and ss_stat[k]["enabled"] == True]
     
+    @profiling.profiled("hsd.process_datalog")
     def __process_datalog(self, sensor_name, ss_stat, raw_data, dataframe_size, timestamp_size, raw_flag = False, start_time = None, prev_timestamp = None):
 
         #####################################################################
@@ -608,36 +611,17 @@ class HSDatalog_v2:
             """
             sensor_name_contains_mlc_ispu = "_mlc" in sensor_name or "_ispu" in sensor_name
             
+            frame_period = HSDatalog_v2.get_frame_period(sensor_name, ss_stat, samples_per_ts)
             if c_type == ComponentTypeEnum.SENSOR.value:
-                s_category = ss_stat.get("sensor_category")
                 if self.__checkTimestamps == True:
                     check_timestamps = not sensor_name_contains_mlc_ispu
                 else:
                     check_timestamps = False
-                if s_category == SensorCategoryEnum.ISENSOR_CLASS_LIGHT.value:
-                    odr = 1/(ss_stat.get("intermeasurement_time")/1000) if ss_stat.get("intermeasurement_time") > ss_stat.get("exposure_time")/1000 + 6  else (1/((ss_stat.get("exposure_time")/1000 + 6)/1000))
-                    frame_period = 0 if sensor_name_contains_mlc_ispu else samples_per_ts / odr
-                elif s_category == SensorCategoryEnum.ISENSOR_CLASS_POWERMETER.value:
-                    frame_period = 0 if sensor_name_contains_mlc_ispu else samples_per_ts / (1/(ss_stat.get("adc_conversion_time")/1000000))
-                else:
-                    measodr = ss_stat.get("measodr")
-                    if measodr is None or measodr == 0:
-                        measodr = ss_stat.get("odr")
-                    frame_period = 0 if sensor_name_contains_mlc_ispu else samples_per_ts / measodr
             elif c_type == ComponentTypeEnum.ALGORITHM.value:
                 check_timestamps = False
-                if ss_stat.get("algorithm_type") == AlgorithmTypeEnum.IALGORITHM_TYPE_FFT.value:
-                    fft_sample_freq = ss_stat.get("fft_sample_freq")
-                    frame_period = samples_per_ts / fft_sample_freq
-                else:
-                    frame_period = 0
                 algo_type = ss_stat.get("algorithm_type")
             elif c_type == ComponentTypeEnum.ACTUATOR.value:
                 check_timestamps = False
-                if "samples_per_ts" not in ss_stat:
-                    frame_period = 0
-                else:
-                    frame_period = samples_per_ts / ss_stat.get("odr")
 
             # rndDataBuffer = raw_data rounded to an integer # of frames
             rnd_data_buffer = raw_data[:int(frame_size * num_frames)]
@@ -650,13 +634,14 @@ class HSDatalog_v2:
             data_type = TypeConversion.get_np_dtype(data_type_string)
             data = np.zeros((data1D_per_frame * num_frames, 1), dtype=data_type)
 
+            is_int24 = data_type_string == "int24" or data_type_string == "int24_t"
             if timestamp_size != 0:
+                if is_int24 and num_frames > 0:
+                    # int24 samples of all the frames are decoded at once (strided view skipping the timestamps)
+                    frames = np.frombuffer(rnd_data_buffer, dtype=np.uint8).reshape(num_frames, frame_size)
+                    TypeConversion.decode_int24(frames[:, :dataframe_size], out=data)
                 for ii in range(num_frames):  # For each Frame:
                     start_frame = ii * frame_size
-                    # segment_data = data in the current frame
-                    segment_data = rnd_data_buffer[start_frame:start_frame + dataframe_size]
-                    if data_type_string == "int24" or data_type_string == "int24_t":
-                        segment_data = TypeConversion.int24_buffer_to_int32_buffer(segment_data)
 
                     # segment_tS = ts is at the end of each frame
                     segment_ts = rnd_data_buffer[start_frame + dataframe_size:start_frame + frame_size]
@@ -666,7 +651,10 @@ class HSDatalog_v2:
 
                     # Data of current frame
                     data_range = slice(ii * data1D_per_frame, (ii + 1) * data1D_per_frame)
-                    data[data_range, 0] = np.frombuffer(segment_data, dtype=data_type)
+                    if not is_int24:
+                        # segment_data = data in the current frame
+                        segment_data = rnd_data_buffer[start_frame:start_frame + dataframe_size]
+                        data[data_range, 0] = np.frombuffer(segment_data, dtype=data_type)
 
                     # Check Timestamp consistency
                     if check_timestamps and ii > 0:
@@ -676,9 +664,10 @@ class HSDatalog_v2:
                             timestamps[ii] = timestamps[ii - 1] + frame_period
                             log.warning("Sensor {}: corrupted data at {}".format(sensor_name, "{} sec".format(timestamps[ii])))
             else:                
-                if data_type_string == "int24" or data_type_string == "int24_t":
-                    rnd_data_buffer = TypeConversion.int24_buffer_to_int32_buffer(rnd_data_buffer)
-                data = np.frombuffer(rnd_data_buffer, dtype=data_type)
+                if is_int24:
+                    data = TypeConversion.decode_int24(rnd_data_buffer)
+                else:
+                    data = np.frombuffer(rnd_data_buffer, dtype=data_type)
                 is_first_chunk = ss_stat.get("is_first_chunk", False)
                 if is_first_chunk:
                     start_time = timestamp_first
@@ -700,29 +689,34 @@ class HSDatalog_v2:
                 s_dim = ss_stat.get('dim',1)
                 if raw_flag:
                     s_data = np.reshape(data, (-1, 64 if "_ispu" in sensor_name else s_dim))
-                else:
-                    s_data = np.reshape(data, (-1, 64 if "_ispu" in sensor_name else s_dim)).astype(dtype=np.byte if "_ispu" in sensor_name else np.float32)
+                elif "_ispu" in sensor_name:
+                    s_data = np.reshape(data, (-1, 64)).astype(dtype=np.byte)
                     sensitivity = float(ss_stat.get('sensitivity', 1))
                     np.multiply(s_data, sensitivity, out = s_data, casting='unsafe')
+                else:
+                    sensitivity = float(ss_stat.get('sensitivity', 1))
+                    s_data = TypeConversion.convert_and_scale(np.reshape(data, (-1, s_dim)), sensitivity)
             elif c_type == ComponentTypeEnum.ALGORITHM.value:
                 if algo_type == AlgorithmTypeEnum.IALGORITHM_TYPE_FFT.value:
-                    s_data = np.reshape(data, (-1, ss_stat['fft_length'])).astype(dtype=np.float32)
-                if not raw_flag:
-                    sensitivity = float(ss_stat.get('sensitivity', 1))
-                    np.multiply(s_data, sensitivity, out = s_data, casting='unsafe')
+                    s_data = np.reshape(data, (-1, ss_stat['fft_length']))
+                    if raw_flag:
+                        s_data = s_data.astype(dtype=np.float32)
+                    else:
+                        sensitivity = float(ss_stat.get('sensitivity', 1))
+                        s_data = TypeConversion.convert_and_scale(s_data, sensitivity)
             elif c_type == ComponentTypeEnum.ACTUATOR.value:
                 if sensor_name == MC_SLOW_TELEMETRY_COMP_NAME or sensor_name == MC_FAST_TELEMETRY_COMP_NAME:
                     active_fast_telemetries = self.__get_active_mc_telemetries_names(ss_stat, sensor_name)
                     nof_telemetries = len(active_fast_telemetries)
-                    s_data = np.reshape(data, (-1, nof_telemetries)).astype(dtype=np.float32)
-                if sensor_name == MC_FAST_TELEMETRY_COMP_NAME and not raw_flag: 
-                    scaler_current = ss_stat[MC_FAST_TELEMETRY_SENSITIVITY]['current']
-                    scaler_voltage = ss_stat[MC_FAST_TELEMETRY_SENSITIVITY]['voltage']
-                    for idx, t in enumerate(active_fast_telemetries):
-                        if "i" in t:
-                            s_data[:,idx] = s_data[:,idx] * scaler_current
-                        elif "v" in t:
-                            s_data[:,idx] = s_data[:,idx] * scaler_voltage 
+                    s_data = np.reshape(data, (-1, nof_telemetries))
+                    if sensor_name == MC_FAST_TELEMETRY_COMP_NAME and not raw_flag:
+                        # one scale factor per column: current and voltage telemetries have their own sensitivity
+                        scaler_current = ss_stat[MC_FAST_TELEMETRY_SENSITIVITY]['current']
+                        scaler_voltage = ss_stat[MC_FAST_TELEMETRY_SENSITIVITY]['voltage']
+                        scale = [scaler_current if "i" in t else scaler_voltage if "v" in t else 1 for t in active_fast_telemetries]
+                        s_data = TypeConversion.convert_and_scale(s_data, scale)
+                    else:
+                        s_data = s_data.astype(dtype=np.float32)
 
             
             if len(data) == 0:
@@ -762,9 +756,11 @@ class HSDatalog_v2:
                 if len(timestamps) > 0:
                     ss_stat["ioffset"] = timestamps[-1] #NOTE! Update the ioffset with the last extracted timestamp to allow eventual batch processing (this will be the start timestamp to continue the linear interpolation for the next chunk)
             
-            valid_indices = samples_times != -1
-            samples_times = samples_times[valid_indices.flatten()]
-            s_data = s_data[valid_indices.flatten()]
+            valid_indices = (samples_times != -1).flatten()
+            # boolean indexing copies the chunk: done only when there are invalid timestamps to drop
+            if not valid_indices.all():
+                samples_times = samples_times[valid_indices]
+                s_data = s_data[valid_indices]
 
             return s_data, samples_times
         #####################################################################
@@ -819,17 +815,20 @@ class HSDatalog_v2:
     
     def __get_sensor_file_path(self, sensor_name):
         file_path = os.path.join(self.__acq_folder_path, FileManager.encode_file_name(sensor_name))
-        if not os.path.exists(file_path):
+        if not VirtualFS.exists(file_path):
             log.error("No such file or directory: {} found for {} sensor".format(file_path, sensor_name))
             raise MissingFileForSensorError(file_path, sensor_name)
         return file_path
     
-    def __get_checked_sensor_file_path(self, sensor_name):
-        file_path = os.path.join(self.__acq_folder_path, FileManager.encode_file_name(sensor_name + "_checked"))
-        if not os.path.exists(file_path):
-            log.error("No such file or directory: {} found for {} sensor".format(file_path, sensor_name + "_checked"))
-            raise MissingFileForSensorError(file_path, sensor_name)
-        return file_path
+    @staticmethod
+    def __get_checked_sensor_file_path(file_path):
+        # The counters-free copy of a .dat file is written next to it, or in a temporary file if the
+        # acquisition is read from an archive (archives are read-only)
+        if VirtualFS.is_archive_path(file_path):
+            fd, checked_file_path = tempfile.mkstemp(suffix="_checked.dat")
+            os.close(fd)
+            return checked_file_path
+        return os.path.splitext(os.path.abspath(file_path))[0] + "_checked.dat"
 
     def remove_4bytes_every_n_optimized(self, arr, N):
         # Create a boolean mask for the elements to keep
@@ -843,9 +842,79 @@ class HSDatalog_v2:
         # Concatenate the remaining slices and return the result
         return new_arr
 
+    @staticmethod
+    def get_frame_period(comp_name, comp_status, samples_per_ts):
+        """
+        Returns the nominal time between two timestamps of a component stream (samples_per_ts / odr), used to
+        fill the missing first timestamps and to detect the timestamp gaps.
+
+        :param comp_name: Component name (mlc and ispu components have no frame period).
+        :param comp_status: Component status dictionary.
+        :param samples_per_ts: Number of samples per timestamp.
+        :return: The frame period [s], 0 if it is not defined for the component.
+        """
+        c_type = comp_status.get("c_type")
+        if c_type == ComponentTypeEnum.SENSOR.value:
+            if "_mlc" in comp_name or "_ispu" in comp_name:
+                return 0
+            s_category = comp_status.get("sensor_category")
+            if s_category == SensorCategoryEnum.ISENSOR_CLASS_LIGHT.value:
+                odr = 1/(comp_status.get("intermeasurement_time")/1000) if comp_status.get("intermeasurement_time") > comp_status.get("exposure_time")/1000 + 6  else (1/((comp_status.get("exposure_time")/1000 + 6)/1000))
+                return samples_per_ts / odr
+            elif s_category == SensorCategoryEnum.ISENSOR_CLASS_POWERMETER.value:
+                return samples_per_ts / (1/(comp_status.get("adc_conversion_time")/1000000))
+            measodr = comp_status.get("measodr")
+            if measodr is None or measodr == 0:
+                measodr = comp_status.get("odr")
+            return samples_per_ts / measodr
+        elif c_type == ComponentTypeEnum.ALGORITHM.value:
+            if comp_status.get("algorithm_type") == AlgorithmTypeEnum.IALGORITHM_TYPE_FFT.value:
+                return samples_per_ts / comp_status.get("fft_sample_freq")
+            return 0
+        elif c_type == ComponentTypeEnum.ACTUATOR.value:
+            if "samples_per_ts" not in comp_status:
+                return 0
+            return samples_per_ts / comp_status.get("odr")
+        return 0
+
+    @staticmethod
+    def get_acquisition_duration(acq_info):
+        """
+        Returns the acquisition duration (acquisition_info.json end_time - start_time), the last
+        timestamp [s] extracted by get_data_and_timestamps_batch.
+
+        :param acq_info: The acquisition info dictionary.
+        :return: The duration [s].
+        """
+        from dateutil import parser
+        acq_start_time = parser.isoparse(acq_info['start_time'])
+        acq_end_time = parser.isoparse(acq_info['end_time'])
+        return (acq_end_time - acq_start_time).total_seconds()
+
+    @staticmethod
+    def get_extraction_end_frame(timestamps, end_time, first_frame = 0):
+        """
+        Applies the end of acquisition stop condition of the .dat extraction (get_data_and_timestamps_batch
+        called by the HSDatalog batch loop) to a sequence of frame timestamps: the frames are extracted up to
+        the first one whose timestamp is >= end_time (included).
+        The stop of the first batch at the packet closer than samples_per_ts/odr to end_time only splits the
+        extraction, the following batch resumes from there.
+
+        :param timestamps: Frame timestamps (numpy array).
+        :param end_time: The extraction end time [s] (e.g. the acquisition duration).
+        :param first_frame: [Optional] Index of the first frame of timestamps in the file.
+        :return: The index (exclusive) of the last extracted frame, or None if the extraction does not stop within these frames.
+        """
+        after_end = np.flatnonzero(np.asarray(timestamps) >= end_time)
+        if len(after_end) == 0:
+            return None
+        return first_frame + int(after_end[0]) + 1
+
     def get_data_and_timestamps_batch(self, comp_name, comp_status, start_time = 0, end_time = -1, raw_flag = False):
         
         log.debug("Data & Timestamp extraction algorithm STARTED...")
+        # Per-packet debug messages are formatted only if they are logged
+        debug_log = log.isEnabledFor(logging.DEBUG)
 
         # get acquisition interface
         interface = self.acq_info_model['interface']
@@ -869,7 +938,7 @@ class HSDatalog_v2:
         
         # get dat file path and size (obtained from "sensor_name + sub_sensor_type")
         file_path = self.__get_sensor_file_path(comp_name)
-        file_size = os.path.getsize(file_path)
+        file_size = VirtualFS.getsize(file_path)
 
         cmplt_pkt_size = data_packet_size + data_protocol_size
         nof_data_packet = file_size // cmplt_pkt_size # "//" math.floor equivalent #CEIL
@@ -941,10 +1010,7 @@ class HSDatalog_v2:
             nof_counter_in_start = math.floor(start_data_and_times_bytes_idx/data_packet_size)
             start_idx = start_data_and_times_bytes_idx + nof_counter_in_start * data_protocol_size
             
-            acq_info = self.get_acquisition_info()
-            acq_start_time = parser.isoparse(acq_info['start_time'])
-            acq_end_time = parser.isoparse(acq_info['end_time'])
-            acquisition_duration = (acq_end_time - acq_start_time).total_seconds()
+            acquisition_duration = HSDatalog_v2.get_acquisition_duration(self.get_acquisition_info())
             
             # Last available timestamp
             last_timestamp = acquisition_duration
@@ -989,11 +1055,12 @@ class HSDatalog_v2:
                 skip_counter_check = False
                 prev_timestamp = None
 
-                with open(file_path, 'rb') as f:
+                with VirtualFS.open(file_path, 'rb') as f:
                     for n in range(nof_data_packet+1):
                         file_index = last_index + (n * cmplt_pkt_size)
-                        log.debug(f"missing_bytes: {missing_bytes}")
-                        log.debug(f"file_index: {file_index}")
+                        if debug_log:
+                            log.debug(f"missing_bytes: {missing_bytes}")
+                            log.debug(f"file_index: {file_index}")
                         if (file_index >= file_size):
                             comp_status["missing_bytes"] = byte_chest_index
                             comp_status["saved_bytes"] = raw_data_array_index
@@ -1003,7 +1070,8 @@ class HSDatalog_v2:
                         if last_index != 0:
                             if saved_bytes != 0 and saved_bytes <= missing_bytes:
                                 raw_data = f.read(missing_bytes)
-                                log.debug(f"Bytes read from file: {missing_bytes}")
+                                if debug_log:
+                                    log.debug(f"Bytes read from file: {missing_bytes}")
                                 comp_status["is_same_dps"] = True
                                 if len(raw_data) < missing_bytes:
                                     return [],None
@@ -1013,7 +1081,8 @@ class HSDatalog_v2:
                             else:
                                 raw_data = f.read(missing_bytes + cmplt_pkt_size)
                                 comp_status["is_same_dps"] = False
-                                log.debug(f"Bytes read from file: {missing_bytes + cmplt_pkt_size}")
+                                if debug_log:
+                                    log.debug(f"Bytes read from file: {missing_bytes + cmplt_pkt_size}")
                                 if len(raw_data) < missing_bytes + cmplt_pkt_size:
                                     return [],None
                                 data_bytes = raw_data[:missing_bytes] + raw_data[missing_bytes + data_protocol_size:]
@@ -1022,7 +1091,8 @@ class HSDatalog_v2:
                             comp_status["missing_bytes"] = missing_bytes = 0
                         else:
                             raw_data = f.read(cmplt_pkt_size)
-                            log.debug(f"Bytes read from file: {cmplt_pkt_size}")
+                            if debug_log:
+                                log.debug(f"Bytes read from file: {cmplt_pkt_size}")
                             if (len(raw_data) + byte_chest_index) < cmplt_pkt_size:
                                 return [],None
                             
@@ -1031,8 +1101,9 @@ class HSDatalog_v2:
                         
                         if not skip_counter_check:
                             counter = struct.unpack('<I', counter_bytes)[0]
-                            log.debug(f"Extracted counter: {counter}")
-                            log.debug(f"data_byte_counter: {data_byte_counter}")
+                            if debug_log:
+                                log.debug(f"Extracted counter: {counter}")
+                                log.debug(f"data_byte_counter: {data_byte_counter}")
                             data_byte_counter = comp_status.get("prev_data_byte_counter")
                             if data_byte_counter is None:
                                 comp_status["prev_data_byte_counter"] =  counter
@@ -1077,9 +1148,10 @@ class HSDatalog_v2:
                             while byte_chest_index >= dataframe_byte_size + timestamp_byte_size:
                                 extracted_timestamp_bytes = byte_chest[dataframe_byte_size:dataframe_byte_size+timestamp_byte_size]
                                 extracted_timestamp = struct.unpack('d', extracted_timestamp_bytes)[0]
-                                log.debug(f"start_time: {start_time}")
-                                log.debug(f"extracted_timestamp: {extracted_timestamp}")
-                                log.debug(f"end_time: {end_time}")
+                                if debug_log:
+                                    log.debug(f"start_time: {start_time}")
+                                    log.debug(f"extracted_timestamp: {extracted_timestamp}")
+                                    log.debug(f"end_time: {end_time}")
                                 if extracted_timestamp > start_time:
                                     
                                     extracted_data_length = dataframe_byte_size + timestamp_byte_size
@@ -1089,7 +1161,8 @@ class HSDatalog_v2:
                                     if end_time != -1 and extracted_timestamp >= end_time:
                                         if prev_timestamp is None and comp_status.get("is_first_chunk",False):
                                             prev_timestamp = extracted_timestamp
-                                            log.debug(f"prev_timestamp: {prev_timestamp}")
+                                            if debug_log:
+                                                log.debug(f"prev_timestamp: {prev_timestamp}")
                                             if prev_timestamp > start_time:
                                                 if last_index == 0:
                                                     prev_timestamp = comp_status.get("ioffset",0)
@@ -1114,7 +1187,8 @@ class HSDatalog_v2:
                                     else:
                                         if prev_timestamp is None and comp_status.get("is_first_chunk",False):
                                             prev_timestamp = extracted_timestamp
-                                            log.debug(f"prev_timestamp: {prev_timestamp}")
+                                            if debug_log:
+                                                log.debug(f"prev_timestamp: {prev_timestamp}")
                                             if prev_timestamp > start_time:
                                                 if last_index == 0:
                                                     prev_timestamp = comp_status.get("ioffset",0)
@@ -1130,7 +1204,8 @@ class HSDatalog_v2:
                                     is_first_chunk = comp_status.get("is_first_chunk", False)
                                     if is_first_chunk:
                                         prev_timestamp = extracted_timestamp
-                                        log.debug(f"prev_timestamp: {prev_timestamp}")
+                                        if debug_log:
+                                            log.debug(f"prev_timestamp: {prev_timestamp}")
 
                                     byte_chest = byte_chest[dataframe_byte_size + timestamp_byte_size:]
                                     byte_chest_index -= dataframe_byte_size + timestamp_byte_size
@@ -1160,12 +1235,15 @@ class HSDatalog_v2:
                 return raw_data_array, prev_timestamp
             
             nof_prev_timestamps = max(0, nof_timestamps_in_start - 2)
-            raw_data_array, prev_timestamp = __extract_data(start_time, end_time, nof_prev_timestamps)
+            # .dat packets read and counters strip (interleaved, packet by packet)
+            with profiling.span("hsd.dat_read", {"component": comp_name}):
+                raw_data_array, prev_timestamp = __extract_data(start_time, end_time, nof_prev_timestamps)
 
-            if nof_prev_timestamps != 0:
-                while prev_timestamp is not None and prev_timestamp > start_time:
-                    nof_prev_timestamps -= 1
-                    raw_data_array, prev_timestamp = __extract_data(start_time, end_time, nof_prev_timestamps)
+                if nof_prev_timestamps != 0:
+                    while prev_timestamp is not None and prev_timestamp > start_time:
+                        nof_prev_timestamps -= 1
+                        raw_data_array, prev_timestamp = __extract_data(start_time, end_time, nof_prev_timestamps)
+            profiling.count("hsd.dat_bytes", len(raw_data_array))
 
             log.debug("Data & Timestamp extraction algorithm COMPLETED!")
             data, timestamp = self.__process_datalog(comp_name, comp_status, raw_data_array,
@@ -1186,11 +1264,11 @@ class HSDatalog_v2:
         elif c_type == ComponentTypeEnum.ACTUATOR.value and "odr" not in comp_status:
             if comp_name == MC_SLOW_TELEMETRY_COMP_NAME or comp_name == MC_FAST_TELEMETRY_COMP_NAME:
                 if data_packet_size is not None:
-                    with open(file_path, "rb") as f:
+                    with VirtualFS.open(file_path, "rb") as f:
                         f_data = f.read()
                         if not f_data:
-                            log.error("No data @ index: {} for file \"{}\" size: {}[bytes]".format(0, file_path, os.stat(f.name).st_size))
-                            raise NoDataAtIndexError(0, file_path, os.stat(f.name).st_size)
+                            log.error("No data @ index: {} for file \"{}\" size: {}[bytes]".format(0, file_path, VirtualFS.getsize(file_path)))
+                            raise NoDataAtIndexError(0, file_path, VirtualFS.getsize(file_path))
                         raw_data = np.fromstring(f_data, dtype='uint8')
                         new_array = self.remove_4bytes_every_n_optimized(raw_data, cmplt_pkt_size)
                     
@@ -1219,11 +1297,11 @@ class HSDatalog_v2:
                 dataframe_byte_size = int(s_dim * s_data_type_len)
                 timestamp_byte_size = 0
 
-                with open(file_path, "rb") as f:
+                with VirtualFS.open(file_path, "rb") as f:
                     f_data = f.read()
                     if not f_data:
-                        log.error("No data @ index: {} for file \"{}\" size: {}[bytes]".format(0, file_path, os.stat(f.name).st_size))
-                        raise NoDataAtIndexError(0, file_path, os.stat(f.name).st_size)
+                        log.error("No data @ index: {} for file \"{}\" size: {}[bytes]".format(0, file_path, VirtualFS.getsize(file_path)))
+                        raise NoDataAtIndexError(0, file_path, VirtualFS.getsize(file_path))
                     raw_data = np.fromstring(f_data, dtype='uint8')
                     new_array = self.remove_4bytes_every_n_optimized(raw_data, cmplt_pkt_size)
                 
@@ -1265,26 +1343,26 @@ class HSDatalog_v2:
         
         # get dat file path and size (obtained from "sensor_name + sub_sensor_type")
         file_path = self.__get_sensor_file_path(sensor_name)
-        file_size = os.path.getsize(file_path)
+        file_size = VirtualFS.getsize(file_path)
         
         cmplt_pkt_size = data_packet_size + data_protocol_size
         nof_data_packet = file_size // cmplt_pkt_size # "//" math.floor equivalent
-        checked_file_path = os.path.splitext(os.path.abspath(file_path))[0] + "_checked.dat"
+        checked_file_path = self.__get_checked_sensor_file_path(file_path)
 
         #TODO: Check data integrity looking at the first 4 bytes counter
-        with open(checked_file_path, 'wb') as f, open(file_path, "rb") as rf:
+        with profiling.span("hsd.packet_strip", {"component": sensor_name}), open(checked_file_path, 'wb') as f, VirtualFS.open(file_path, "rb") as rf:
             # cmplt_pkt_size = data_packet_size + data_protocol_size
             for n in range(nof_data_packet):
                 index = n * cmplt_pkt_size
                 rf.seek(index)
                 rf_data = rf.read(cmplt_pkt_size)[4:]
                 if not rf_data:
-                    log.error("No data @ index: {} for file \"{}\" size: {}[bytes]".format(index, file_path, os.stat(f.name).st_size))
-                    raise NoDataAtIndexError(index, file_path, os.stat(f.name).st_size)
+                    log.error("No data @ index: {} for file \"{}\" size: {}[bytes]".format(index, file_path, file_size))
+                    raise NoDataAtIndexError(index, file_path, file_size)
                 f.write(np.frombuffer(rf_data, dtype='uint8'))
 
-        # get checked dat file path and size (obtained from "sensor_name + sub_sensor_type") reusing the same variables
-        file_path = self.__get_checked_sensor_file_path(sensor_name)
+        # get checked dat file path and size reusing the same variables
+        file_path = checked_file_path
         file_size = os.path.getsize(file_path)
         
         c_type = s_stat.get("c_type")
@@ -1359,12 +1437,12 @@ class HSDatalog_v2:
                     read_start_bytes = (blocks_before_ss * dataframe_byte_size) + ((blocks_before_ss - 1) * timestamp_byte_size) if blocks_before_ss > 0 else 0
                     read_end_bytes = ((blocks_before_se + 1) * dataframe_byte_size) + ((blocks_before_se + 1) * timestamp_byte_size)
                 
-                with open(file_path, "rb") as f:
+                with profiling.span("hsd.dat_read", {"component": sensor_name}), VirtualFS.open(file_path, "rb") as f:
                     f.seek(read_start_bytes)
                     raw_data = f.read(read_end_bytes - read_start_bytes)
                     if len(raw_data) == 0:
-                        log.error("No data @ index: {} for file \"{}\" size: {}[bytes]".format(read_start_bytes, file_path, os.stat(f.name).st_size))
-                        raise NoDataAtIndexError(read_start_bytes, file_path, os.stat(f.name).st_size)
+                        log.error("No data @ index: {} for file \"{}\" size: {}[bytes]".format(read_start_bytes, file_path, VirtualFS.getsize(file_path)))
+                        raise NoDataAtIndexError(read_start_bytes, file_path, VirtualFS.getsize(file_path))
                 
                 raw_data = np.fromstring(raw_data, dtype='uint8')
 
@@ -1403,11 +1481,11 @@ class HSDatalog_v2:
                 dataframe_byte_size = int(s_dim * s_data_type_len)
                 timestamp_byte_size = 0
 
-                with open(file_path, "rb") as f:
+                with VirtualFS.open(file_path, "rb") as f:
                     f_data = f.read()
                     if not f_data:
-                        log.error("No data @ index: {} for file \"{}\" size: {}[bytes]".format(0, file_path, os.stat(f.name).st_size))
-                        raise NoDataAtIndexError(0, file_path, os.stat(f.name).st_size)
+                        log.error("No data @ index: {} for file \"{}\" size: {}[bytes]".format(0, file_path, VirtualFS.getsize(file_path)))
+                        raise NoDataAtIndexError(0, file_path, VirtualFS.getsize(file_path))
                     raw_data = np.fromstring(f_data, dtype='uint8')
                 
                 data, timestamp = self.__process_datalog(sensor_name, s_stat, raw_data, dataframe_byte_size, timestamp_byte_size, raw_flag = raw_flag )
@@ -1439,13 +1517,13 @@ class HSDatalog_v2:
                     
                     # read_start_bytes = sample_start * (s_data_type_len* s_dim)
                     # read_end_bytes = sample_end * (s_data_type_len* s_dim)
-                    with open(file_path, "rb") as f:
+                    with VirtualFS.open(file_path, "rb") as f:
                         # f.seek(read_start_bytes)
                         # f_data = f.read(read_end_bytes - read_start_bytes)
                         f_data = f.read()
                         if not f_data:
-                            log.error("No data @ index: {} for file \"{}\" size: {}[bytes]".format(0, file_path, os.stat(f.name).st_size))
-                            raise NoDataAtIndexError(0, file_path, os.stat(f.name).st_size)
+                            log.error("No data @ index: {} for file \"{}\" size: {}[bytes]".format(0, file_path, VirtualFS.getsize(file_path)))
+                            raise NoDataAtIndexError(0, file_path, VirtualFS.getsize(file_path))
                         raw_data = np.fromstring(f_data, dtype='uint8')
 
                     # print(len(raw_data))
@@ -1620,94 +1698,130 @@ class HSDatalog_v2:
         
         return c
 
-    def __to_dataframe(self, data, time, ss_stat, sensor_name, labeled = False, which_tags:list = [], raw_flag = False):
-        if data is not None and time is not None:
-            cols = []
-            s_type = ""
-            c_type = ss_stat.get("c_type")
-            if c_type == ComponentTypeEnum.SENSOR.value:
-                s_name, s_type = FileManager.decode_file_name(sensor_name)
-            
-            if s_type != "ispu":
-                try:
-                    if len(time) > len(data):
-                        time = time[:len(data)]
-                    val = np.concatenate((time, data), axis=1)
-                except:
-                    pass
+    def __get_typed_columns(self, data, time, ss_stat, sensor_name, raw_flag = False):
+        """
+        Arranges a chunk of samples as output columns.
+
+        :return: (time, columns names, values): the timestamps (trimmed to the number of samples), the data columns
+            names and the (n_samples, n_columns) data block in the output dtype of the columns.
+        """
+        s_type = ""
+        c_type = ss_stat.get("c_type")
+        if c_type == ComponentTypeEnum.SENSOR.value:
+            s_name, s_type = FileManager.decode_file_name(sensor_name)
+        
+        if len(time) > len(data):
+            time = time[:len(data)]
+        if s_type != "ispu":
+            values = data
+        else:
+            ispu_out_types = self.get_ispu_output_types()
+            if ispu_out_types is not None:
+                values = ISPUOutputDecoder.decode(data, ispu_out_types)
             else:
-                ispu_out_types = self.get_ispu_output_types()
-                if ispu_out_types is not None:
-                    output_bytes_count = sum(TypeConversion.check_type_length(ot) for ot in ispu_out_types)
-                    unpack_str = "=" + ''.join(TypeConversion.get_format_char(ot) for ot in ispu_out_types)
-                    output_data = [struct.unpack(unpack_str, np.array(d[0:output_bytes_count])) for d in data]
-                    np_output_data = np.array(output_data)
-                    final_out_data = [np_output_data[:,i] for i in range(len(ispu_out_types))]
-                    final_out_data = np.transpose(final_out_data)
-                    val = np.array(time)
-                    val = np.append(val, final_out_data, axis=1)
+                raise MissingISPUOutputDescriptorException(sensor_name)
+        
+        cols = list(self.get_component_columns_names(ss_stat, sensor_name))
+
+        sensitivity = ss_stat.get("sensitivity", 1)
+        if c_type == ComponentTypeEnum.ACTUATOR.value:
+            sensitivity = 0
+        data_type = ss_stat.get("data_type")
+        if s_type == "ispu":
+            # Decoded ISPU outputs are float64 (exact for every output type): the data_type of the raw frames does not apply
+            values = values.round(decimals=6)
+        elif raw_flag or sensitivity == 1 and data_type:
+            # The block is cast only when the reader dtype differs from the native one (e.g. float32 samples with sensitivity 1)
+            np_dtype = np.dtype(TypeConversion.get_np_dtype(data_type))
+            if values.dtype != np_dtype:
+                values = values.astype(np_dtype)
+            if data_type in ["float","float32","double"]:
+                values = values.round(decimals=6)
+        else:
+            # Scaled samples are returned as float64 rounded to 6 decimals (rounded in place in the float64 copy)
+            values = values.astype(np.float64)
+            np.round(values, decimals=6, out=values)
+        return time, cols, values
+
+    def __get_tags_masks(self, time, which_tags:list = []):
+        """
+        :return: Dictionary tag label -> numpy bool array (n_samples,), True for the samples inside the tag intervals.
+        """
+        tags = self.get_tags()
+        if len(tags) == 0:
+            raise MissingTagsException() 
+        if len(which_tags) > 0:
+            filtered_tags = [t for t in tags if t["label"] in which_tags]
+            tags = filtered_tags
+
+        tags_masks = {}
+        for tag in tags:
+            tag_label = tag.get("label")
+            tag_times = tag.get("times")
+            for t in tag_times:
+                enter_time = t[0]
+                exit_time = t[1]
+                # Find the nearest indices for the enter and exit times
+                enter_index = self.find_nearest_index(time, enter_time)
+                exit_index = self.find_nearest_index(time, exit_time)
+                
+                # Create an array of booleans with the same length as times_array
+                bool_array = np.zeros_like(time, dtype=bool)
+                if enter_time <= time[-1]:
+                    if not(exit_time <= time[-1] and (enter_index == exit_index)):
+                        # Set True for indices between enter_index and exit_index (inclusive)
+                        bool_array[enter_index:exit_index+1] = True
+
+                # Flatten the boolean array to match the shape of the input times array
+                bool_array = bool_array.flatten()
+                
+                if tag_label not in tags_masks:
+                    tags_masks[tag_label] = bool_array
                 else:
-                    raise MissingISPUOutputDescriptorException(sensor_name)
-            
-            cols =np.concatenate((["Time"], self.get_component_columns_names(ss_stat, sensor_name)), axis=0)
+                    tags_masks[tag_label] = tags_masks[tag_label] | bool_array
+        return tags_masks
 
-            try:
-                ss_data_frame = pd.DataFrame(data=val, columns=cols)
-            except Exception as e:
-                pass
+    @profiling.profiled("hsd.dataframe_build")
+    def __to_dataframe(self, data, time, ss_stat, sensor_name, labeled = False, which_tags:list = [], raw_flag = False):
+        import pandas as pd
+        if data is not None and time is not None:
+            time, cols, values = self.__get_typed_columns(data, time, ss_stat, sensor_name, raw_flag)
 
-            if labeled:
-                tags = self.get_tags()
-                if len(tags) == 0:
-                    raise MissingTagsException() 
-                if len(which_tags) > 0:
-                    filtered_tags = [t for t in tags if t["label"] in which_tags]
-                    tags = filtered_tags
-
-                for tag in tags:
-                    tag_label = tag.get("label")
-                    tag_times = tag.get("times")
-                    for t in tag_times:
-                        enter_time = t[0]
-                        exit_time = t[1]
-                        # Find the nearest indices for the enter and exit times
-                        enter_index = self.find_nearest_index(time, enter_time)
-                        exit_index = self.find_nearest_index(time, exit_time)
-                        
-                        # Create an array of booleans with the same length as times_array
-                        bool_array = np.zeros_like(time, dtype=bool)
-                        if enter_time <= time[-1]:
-                            if not(exit_time <= time[-1] and (enter_index == exit_index)):
-                                # Set True for indices between enter_index and exit_index (inclusive)
-                                bool_array[enter_index:exit_index+1] = True
-
-                        # Flatten the boolean array to match the shape of the input times array
-                        bool_array = bool_array.flatten()
-                        
-                        if tag_label not in ss_data_frame:
-                            ss_data_frame[tag_label] = bool_array
-                        else:
-                            ss_data_frame[tag_label] = ss_data_frame[tag_label] | bool_array
+            # Time and data columns are kept as separate blocks (no concatenation in a single matrix)
+            ss_data_frame = pd.DataFrame(data=values, columns=cols)
+            ss_data_frame.insert(0, "Time", np.asarray(time, dtype=np.float64).reshape(-1).round(decimals=6))
 
-            sensitivity = ss_stat.get("sensitivity", 1)
-            if c_type == ComponentTypeEnum.ACTUATOR.value:
-                sensitivity = 0
-            data_type = ss_stat.get("data_type")
-            ss_data_frame["Time"] = ss_data_frame["Time"].round(decimals=6)
-            for i, c in enumerate(cols):
-                if c != "Time":
-                    if raw_flag or sensitivity == 1 and data_type:
-                        if i != 0:
-                            ss_data_frame[c] = ss_data_frame[c].astype(TypeConversion.get_np_dtype(data_type))
-                            if data_type in ["float","float32","double"]:
-                                ss_data_frame[c] = ss_data_frame[c].round(decimals=6)
-                    else:
-                        ss_data_frame[c] = ss_data_frame[c].round(decimals=6)
+            if labeled:
+                for tag_label, tag_mask in self.__get_tags_masks(time, which_tags).items():
+                    ss_data_frame[tag_label] = tag_mask
             
             return ss_data_frame
         log.error("Error extracting data and timestamp from sensor {}".format(sensor_name))
         raise DataExtractionError(sensor_name)
 
+    @profiling.profiled("hsd.record_batch_build")
+    def to_record_batch(self, data, time, ss_stat, sensor_name, labeled = False, which_tags:list = [], raw_flag = False, tags_encoding = TagsEncoding.BOOL):
+        """
+        Arranges a chunk of samples (see get_data_and_timestamps_batch) as a pyarrow RecordBatch with the same
+        columns and values of the corresponding dataframe (see stdatalog_core.HSD_utils.columnar).
+
+        :param data: numpy array (n_samples, n_columns) of samples.
+        :param time: numpy array (n_samples, 1) of timestamps.
+        :param ss_stat: The component status dictionary.
+        :param sensor_name: The component name.
+        :param labeled: [Optional] Boolean to add the tags columns (Input data must be labelled).
+        :param which_tags: [Optional] List of tags labels to be included.
+        :param raw_flag: [Optional] Boolean indicating whether data are raw (not multiplied by sensitivity).
+        :param tags_encoding: [Optional] TagsEncoding of the tags columns (bool columns or a single dictionary column).
+        :return: pyarrow RecordBatch.
+        """
+        if data is not None and time is not None:
+            time, cols, values = self.__get_typed_columns(data, time, ss_stat, sensor_name, raw_flag)
+            tags_masks = self.__get_tags_masks(time, which_tags) if labeled else None
+            return build_record_batch(np.asarray(time, dtype=np.float64).reshape(-1).round(decimals=6), values, cols, tags_masks, tags_encoding)
+        log.error("Error extracting data and timestamp from sensor {}".format(sensor_name))
+        raise DataExtractionError(sensor_name)
+
     #TODO deprecate this function
     def get_dataframe(self, sensor_name, sensor_type = None, start_time = 0, end_time = -1, labeled = False, raw_flag = False):       
         # get sensor component status
@@ -1748,6 +1862,8 @@ class HSDatalog_v2:
     # Plots Helper Functions ################################################################################################################
     def __plot_ranging_sensor(self, sensor_name, ss_data_frame, res, output_format):
 
+        import pandas as pd
+        import plotly.graph_objects as go
         # Function to extract the target identifier from the key
         def __extract_target_identifier(key):
             if key != "nof_outputs":
@@ -1756,7 +1872,6 @@ class HSDatalog_v2:
 
         # Group the targets
         targets = {}
-        new_shape = (res, res)
         
         # Create a list to store figures to be returned
         figures = []
@@ -1779,39 +1894,17 @@ class HSDatalog_v2:
             dist_df = ss_data_frame.iloc[:, range(dist_id, len(ss_data_frame.columns), nof_outputs)]
             status_id = targets[t]['status']["start_id"] + 1
             status_df = ss_data_frame.iloc[:, range(status_id, len(ss_data_frame.columns), nof_outputs)]
-            status_df.columns = dist_df.columns
-            mask_df = status_df == 5
+            # Invalid zones (target status != 5) are masked, for all the frames at once
+            masked_values = np.where(status_df.to_numpy() == 5, dist_df.to_numpy(dtype=float), np.nan)
+            masked_df = pd.DataFrame(masked_values, columns=dist_df.columns, index=dist_df.index)
             times = ss_data_frame["Time"]
-            # use the boolean matrix as a mask for the second dataframe
-            masked_df = dist_df.where(mask_df)
-            nof_rows = len(mask_df)
-
-            dist_matrices = np.empty((nof_rows, ), dtype=object)
-            for r_id in range(nof_rows):
-                row_t1 = masked_df.iloc[r_id]
-                t1_mat = np.array(row_t1.values).reshape(new_shape).astype('float')
-                t1_mat = np.rot90(t1_mat, k=3)
-                t1_mat = np.flip(t1_mat, axis=0)
-                t1_mat = np.swapaxes(t1_mat, 0, 1)
-                dist_matrices[r_id] = t1_mat
-
-            # Handle NaN values by filling them with a default value (e.g., 0)
-            dist_matrices = [np.nan_to_num(matrix, nan=-1) for matrix in dist_matrices]
+            nof_rows = len(masked_values)
+
+            # (nof_rows, res, res) zone matrices, NaN values filled with a default value (-1)
+            dist_matrices = np.nan_to_num(RangingUtils.get_zone_matrices(masked_values, res), nan=-1)
 
             # Prepare annotation arrays for each frame
-            annotations_list = []
-            for frame_idx in range(nof_rows):
-                frame_annotations = np.zeros((new_shape[0], new_shape[1]), dtype=object)
-                for i in range(new_shape[0]):
-                    for j in range(new_shape[1]):
-                        z_index = new_shape[0]*(new_shape[0]-1-i)+(new_shape[1]-1-j)
-                        z_value = dist_matrices[frame_idx][i][j]
-                        if z_value == -1:
-                            z_str = "-"
-                        else:
-                            z_str = f"{int(z_value)}"
-                        frame_annotations[i][j] = f'Z{z_index}<br>{z_str}'
-                annotations_list.append(frame_annotations)
+            annotations_list = RangingUtils.get_zone_annotations(dist_matrices)
 
             # Define a custom colorscale
             custom_colorscale = [
@@ -1940,6 +2033,9 @@ class HSDatalog_v2:
         return figures
 
     def __plot_pixels_over_time(self, sensor_name, ss_data_frame, resolution, t1_dist_df):
+        import pandas as pd
+        import plotly.graph_objects as go
+        from plotly.subplots import make_subplots
         times_col = ss_data_frame.iloc[:, 0]
         times_df = pd.DataFrame({"Time": times_col})
         ss_t1_dist_df = pd.concat([times_df, t1_dist_df.fillna(0)], axis=1)
@@ -1968,6 +2064,7 @@ class HSDatalog_v2:
         return fig
     
     def __plot_light_sensor(self, sensor_name, dask_chunk, cols, label):
+        import plotly.graph_objects as go
         layout = go.Layout(
             title=f"{sensor_name.upper()} - Ambient Light Sensor",
             xaxis_title="Time (s)",
@@ -1990,6 +2087,8 @@ class HSDatalog_v2:
 
     def __plot_presence_sensor(self, sensor_name, dask_chunk, cols, label, software_compensation, embedded_compensation):
         
+        import plotly.graph_objects as go
+        from plotly.subplots import make_subplots
         # Create a list to store figures to be returned
         figures = []
         
@@ -2080,6 +2179,8 @@ class HSDatalog_v2:
         return figures
 
     def __plot_mems_audio_sensor(self, sensor_name, dask_chunk, cols, dim, subplots, label, raw_flag, unit, fft_params):
+        import plotly.graph_objects as go
+        from plotly.subplots import make_subplots
         # Create a list to store figures to be returned
         figures = []
         
@@ -2211,6 +2312,7 @@ class HSDatalog_v2:
         Args:
             fig (plotly.graph_objects.Figure): The Plotly figure to display.
         """
+        import plotly.graph_objects as go
         import socket
         import webbrowser
         from plotly_resampler import FigureResampler
@@ -2255,6 +2357,7 @@ class HSDatalog_v2:
         webbrowser.open(f"http://127.0.0.1:{port}")
 
     def get_dask_df(self, comp_name, comp_status, start_time=0, end_time=-1, label=None, raw_flag=False):
+        import dask.dataframe as dd
         from stdatalog_core.HSD.HSDatalog import HSDatalog
         try:
             labeled = label is not None
@@ -2272,6 +2375,7 @@ class HSDatalog_v2:
             return None
 
     def get_sensor_plot(self, sensor_name, sensor_status, start_time = 0, end_time = -1, label=None, which_tags = [], subplots=False, raw_flag = False, fft_plots = False, save_plots = False):
+        import dask.dataframe as dd
         from stdatalog_core.HSD.HSDatalog import HSDatalog
         try:
             labeled = label is not None
@@ -2356,6 +2460,8 @@ class HSDatalog_v2:
         self.get_sensor_plot(actuator_name, actuator_status, start_time, end_time, label, which_tags, True, raw_flag, save_plots=save_plots)
 
     def get_algorithm_plot(self, algorithm_name, algorithm_status, start_time = 0, end_time = -1, label=None, which_tags = [], subplots=False, raw_flag = False):
+        import dask.dataframe as dd
+        import plotly.graph_objects as go
         from stdatalog_core.HSD.HSDatalog import HSDatalog
         try:
             labeled = label is not None
@@ -15,6 +15,8 @@
 
 import os
 
+from stdatalog_core.HSD.utils.virtual_fs import VirtualFS
+
 class FileManager:
     
     @staticmethod
@@ -47,6 +49,8 @@ class FileManager:
 
     @staticmethod
     def get_dat_files_from_folder(acq_folder_path):
+        if VirtualFS.is_archive_path(acq_folder_path):
+            return [f for f in VirtualFS.list_files(acq_folder_path) if f.endswith('.dat') and "_checked" not in f]
         file_names = []
         with os.scandir(acq_folder_path) as listOfEntries:
             for entry in listOfEntries:
@@ -64,6 +68,13 @@ class FileManager:
         :param path: The directory path to search for the file.
         :return: The full path to the file if found, otherwise None.
         """
+        # Acquisition stored in a zip/tar/hsdz archive (see VirtualFS)
+        if VirtualFS.is_archive_path(path):
+            return VirtualFS.find_file(name, path)
+        # Fast path: the file is in 'path' itself (os.walk would return it first anyway).
+        file_path = os.path.join(path, name)
+        if os.path.isfile(file_path):
+            return file_path
         # Walk through the directory tree starting at 'path'.
         for root, dirs, files in os.walk(path):
             # If the file is found, return the full path to the file.
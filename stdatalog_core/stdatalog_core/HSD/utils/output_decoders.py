@@ -0,0 +1,103 @@
+# *****************************************************************************
+#  * @file    output_decoders.py
+#  * @author  SRA
+# ******************************************************************************
+# * @attention
+# *
+# * Copyright (c) 2022 STMicroelectronics.
+# * All rights reserved.
+# *
+# * This software is licensed under terms that can be found in the LICENSE file
+# * in the root directory of this software component.
+# * If no LICENSE file comes with this software, it is provided AS-IS.
+# *
+# *
+# ******************************************************************************
+#
+
+import numpy as np
+
+from stdatalog_core.HSD.utils.type_conversion import TypeConversion
+
+class ISPUOutputDecoder:
+    """
+    Decodes ISPU output frames (rows of raw bytes) as described in ispu_output_format.json,
+    with a numpy structured dtype applied to all the rows at once.
+    """
+
+    @staticmethod
+    def get_dtype(out_types):
+        """
+        Builds the packed, little-endian structured dtype of an ISPU output frame.
+        int24 fields are described as 3 raw bytes (sign extended by decode).
+
+        :param out_types: List of output types (e.g. ["int16_t", "float"]).
+        :return: numpy structured dtype.
+        """
+        fields = []
+        for i, ot in enumerate(out_types):
+            if TypeConversion.check_type(ot) == "int24":
+                fields.append(("f{}".format(i), "u1", (3,)))
+            else:
+                fields.append(("f{}".format(i), np.dtype(TypeConversion.get_np_dtype(ot)).newbyteorder("<")))
+        return np.dtype(fields)
+
+    @staticmethod
+    def decode(data, out_types):
+        """
+        Decodes ISPU output frames.
+
+        :param data: numpy array (n_frames, frame_bytes) of 1-byte items (ISPU raw data, int8).
+        :param out_types: List of output types (see ISPUOutputDecoder.get_dtype).
+        :return: numpy float64 array (n_frames, len(out_types)).
+        """
+        dtype = ISPUOutputDecoder.get_dtype(out_types)
+        frames = np.asarray(data)
+        frames = np.ascontiguousarray(frames.reshape(len(frames), -1)).view(np.uint8)
+        if frames.shape[1] < dtype.itemsize:
+            raise ValueError("ISPU output frame too short: {} bytes, {} expected".format(frames.shape[1], dtype.itemsize))
+        records = np.ascontiguousarray(frames[:, :dtype.itemsize]).view(dtype).reshape(-1)
+        out = np.empty((len(records), len(out_types)), dtype=np.float64)
+        for i in range(len(out_types)):
+            field = records["f{}".format(i)]
+            if field.ndim == 2:
+                # int24 field: 3 raw bytes per frame, decoded directly in the output column
+                TypeConversion.decode_int24(field, out=out[:, i:i + 1])
+            else:
+                out[:, i] = field
+        return out
+
+class RangingUtils:
+    """
+    Vectorized helpers for ranging (ToF) sensors zone frames.
+    """
+
+    @staticmethod
+    def get_zone_matrices(zone_values, res):
+        """
+        Arranges the zone values of all the frames as (res x res) matrices, in the sensor view
+        orientation (each frame rotated by 270°, flipped vertically and transposed, i.e. reversed on both axes).
+
+        :param zone_values: numpy array (n_frames, res * res).
+        :param res: Matrix side (4 or 8).
+        :return: numpy float64 array (n_frames, res, res).
+        """
+        matrices = np.asarray(zone_values, dtype=np.float64).reshape(-1, res, res)
+        return matrices[:, ::-1, ::-1]
+
+    @staticmethod
+    def get_zone_annotations(zone_matrices, invalid_value = -1):
+        """
+        Builds the heatmap annotations ("Z<zone index><br><distance>") of all the frames.
+
+        :param zone_matrices: numpy array (n_frames, res, res) from RangingUtils.get_zone_matrices.
+        :param invalid_value: [Optional] Value of the invalid zones (annotated as "-").
+        :return: numpy str array (n_frames, res, res).
+        """
+        n_frames, res, _ = zone_matrices.shape
+        zone_ids = (res * res - 1) - np.arange(res * res).reshape(res, res)
+        zone_labels = np.char.add(np.char.add("Z", zone_ids.astype(str)), "<br>")
+        invalid = zone_matrices == invalid_value
+        values = np.where(invalid, 0, zone_matrices).astype(np.int64).astype(str)
+        values = np.where(invalid, "-", values)
+        return np.char.add(np.broadcast_to(zone_labels, (n_frames, res, res)), values)
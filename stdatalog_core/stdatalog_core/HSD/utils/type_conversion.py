@@ -13,7 +13,12 @@
 # ******************************************************************************
 #
 
+import sys
 import numpy as np
+
+# Number of samples decoded per block when int24 samples are converted into a non-int32 (or strided) output
+INT24_DECODE_BLOCK_SAMPLES = 65536
+
 class TypeConversion:
 
     @staticmethod
@@ -149,20 +154,102 @@ class TypeConversion:
         # Ensure the buffer length is a multiple of 3 bytes (24 bits)
         if len(buffer) % 3 != 0:
             raise ValueError("Buffer length must be a multiple of 3 bytes")
+        return TypeConversion.decode_int24(buffer).tobytes()
+
+    @staticmethod
+    def __int24_into_int32(samples, out):
+        # samples: (..., 3) uint8 view (little endian 24-bit samples), out: C-contiguous int32 array of shape samples.shape[:-1]
+        if sys.byteorder == "little":
+            # the 3 sample bytes are copied in the low bytes of each int32, the high byte is the sign extension
+            # (arithmetic shift of the sample most significant byte: 0x00 or 0xFF)
+            out_bytes = out.view(np.uint8).reshape(out.shape + (4,))
+            out_bytes[..., :3] = samples
+            np.right_shift(samples[..., 2].view(np.int8), 7, out=out_bytes[..., 3].view(np.int8))
+        else:
+            np.left_shift(samples[..., 2].view(np.int8), 16, out=out, dtype=np.int32)
+            out |= samples[..., 1].astype(np.int32) << 8
+            out |= samples[..., 0]
+
+    @staticmethod
+    def decode_int24(raw, out = None, dtype = np.int32):
+        """
+        Decodes packed little endian 24-bit signed samples into sign extended int32 (or floating point) values,
+        writing them directly in the output array (no intermediate byte buffers).
+
+        :param raw: bytes-like object or uint8/int8 numpy array whose last axis holds packed 3-byte samples.
+            Strided views are accepted, e.g. frames[:, :dataframe_size] to skip the timestamp of each frame.
+        :param out: [Optional] Output array of shape raw.shape[:-1] + (raw.shape[-1] // 3,) (or a C-contiguous array
+            with the same number of elements), e.g. a slice of a preallocated chunk buffer. Its dtype sets the output type.
+        :param dtype: [Optional] Output dtype when out is not provided (np.int32, np.float32 or np.float64).
+        :return: The output array.
+        """
+        if not isinstance(raw, np.ndarray):
+            raw = np.frombuffer(raw, dtype=np.uint8)
+        elif raw.dtype != np.uint8:
+            raw = raw.view(np.uint8)
+        if raw.shape[-1] % 3 != 0:
+            raise ValueError("Buffer length must be a multiple of 3 bytes")
+        samples = raw.reshape(raw.shape[:-1] + (raw.shape[-1] // 3, 3))
 
-        # Convert the buffer to a NumPy array of uint8
-        byte_array = np.frombuffer(buffer, dtype=np.uint8)
+        if out is None:
+            out = np.empty(samples.shape[:-1], dtype=dtype)
+        target = out
+        if target.shape != samples.shape[:-1]:
+            if target.size != samples.size // 3 or not target.flags.c_contiguous:
+                raise ValueError("Output shape {} does not match {} int24 samples".format(target.shape, samples.size // 3))
+            target = target.reshape(samples.shape[:-1])
+        if samples.size == 0:
+            return out
 
-        # Reshape the byte array to have 3 columns (each row is a 24-bit integer)
-        byte_array = byte_array.reshape(-1, 3)
+        if target.dtype == np.int32 and target.flags.c_contiguous:
+            TypeConversion.__int24_into_int32(samples, target)
+            return out
 
-        # Convert the 3-byte rows into 32-bit integers
-        int32_array = (byte_array[:, 2].astype(np.uint32) << 16) | \
-                      (byte_array[:, 1].astype(np.uint32) << 8) | \
-                      byte_array[:, 0].astype(np.uint32)
+        # Other output types (or strided outputs): decode blocks of rows into an int32 scratch buffer, then cast
+        if samples.ndim == 2:
+            samples = samples[:, None, :]
+            target = target[:, None]
+        elif samples.ndim > 3:
+            if not target.flags.c_contiguous:
+                raise ValueError("Strided outputs with more than 2 dimensions are not supported")
+            samples = samples.reshape((-1,) + samples.shape[-2:])
+            target = target.reshape(samples.shape[:-1])
+        row_samples = samples.shape[1]
+        block_rows = max(1, INT24_DECODE_BLOCK_SAMPLES // row_samples)
+        scratch = np.empty((min(block_rows, len(samples)), row_samples), dtype=np.int32)
+        for start in range(0, len(samples), block_rows):
+            block_samples = samples[start:start + block_rows]
+            block = scratch[:len(block_samples)]
+            TypeConversion.__int24_into_int32(block_samples, block)
+            np.copyto(target[start:start + len(block_samples)], block, casting="unsafe")
+        return out
 
-        # Handle sign extension for 24-bit integers
-        int32_array = np.where(int32_array & 0x800000, int32_array | 0xFF000000, int32_array)
+    @staticmethod
+    def convert_and_scale(samples, scale = None, offset = None, out = None, dtype = np.float32):
+        """
+        Converts raw typed samples to physical units (samples * scale + offset) in a single pass,
+        writing the result directly in the output array (no intermediate floating point copy of the raw data).
 
-        return int32_array.tobytes()
-    
+        :param samples: numpy array of raw typed values, e.g. the (n_samples, n_columns) view of a datalog chunk.
+        :param scale: [Optional] Scale factor: scalar or vector with one value per column (e.g. sensitivities).
+        :param offset: [Optional] Offset: scalar or vector with one value per column.
+        :param out: [Optional] Output array (float32 or float64) with the same shape of samples, or a reusable buffer
+            with more rows: only the first len(samples) rows are written. Its dtype sets the output type.
+        :param dtype: [Optional] Output dtype when out is not provided.
+        :return: The converted samples (a view of out, if provided).
+        """
+        samples = np.asarray(samples)
+        if out is None:
+            target = np.empty(samples.shape, dtype=dtype)
+        else:
+            if out.shape[1:] != samples.shape[1:] or len(out) < len(samples):
+                raise ValueError("Output shape {} does not match samples shape {}".format(out.shape, samples.shape))
+            target = out[:len(samples)]
+        # The arithmetic is done in the output type, as the previous astype + in place multiply did
+        if scale is None:
+            np.copyto(target, samples, casting="unsafe")
+        else:
+            np.multiply(samples, np.asarray(scale, dtype=target.dtype), out=target, dtype=target.dtype, casting="unsafe")
+        if offset is not None:
+            np.add(target, np.asarray(offset, dtype=target.dtype), out=target)
+        return target
@@ -0,0 +1,482 @@
+# *****************************************************************************
+#  * @file    virtual_fs.py
+#  * @author  SRA
+# ******************************************************************************
+# * @attention
+# *
+# * Copyright (c) 2022 STMicroelectronics.
+# * All rights reserved.
+# *
+# * This software is licensed under terms that can be found in the LICENSE file
+# * in the root directory of this software component.
+# * If no LICENSE file comes with this software, it is provided AS-IS.
+# *
+# *
+# ******************************************************************************
+#
+
+"""
+Read-only virtual file system used by the HSD readers to open acquisitions stored in archives.
+
+A path can cross an archive file, e.g. "offload/cut_1.zip/20240916_15_45_40/iis3dwb_acc.dat":
+VirtualFS splits it into the archive and the member path and returns seekable binary streams on
+the members, without extracting them. Supported archives:
+
+- .zip (stored members are read in place, deflated members through zipfile),
+- .tar (members read in place) and compressed tar: .tar.gz/.tgz, .tar.bz2/.tbz2, .tar.xz/.txz,
+  .tar.zst/.tzst (zstandard package required). Compressed streams are seekable: forward seeks
+  decompress and skip, backward seeks restart the decompression, so sequential reads (the HSD
+  readers access pattern) cost a single pass,
+- .hsdz acquisition archives (stdatalog_core.HSD_utils.archive_codec): .dat members are decoded
+  block by block while they are read.
+
+Paths that do not cross an archive go straight to the os / builtin functions.
+"""
+
+import io
+import os
+import bz2
+import gzip
+import lzma
+import tarfile
+import zipfile
+import threading
+
+from stdatalog_core.HSD_utils.exceptions import AcquisitionArchiveError
+
+ZIP_EXTENSIONS = (".zip",)
+HSDZ_EXTENSIONS = (".hsdz",)
+TAR_EXTENSIONS = (".tar",)
+TAR_GZ_EXTENSIONS = (".tar.gz", ".tgz")
+TAR_BZ2_EXTENSIONS = (".tar.bz2", ".tbz2")
+TAR_XZ_EXTENSIONS = (".tar.xz", ".txz")
+TAR_ZST_EXTENSIONS = (".tar.zst", ".tzst")
+ARCHIVE_EXTENSIONS = ZIP_EXTENSIONS + HSDZ_EXTENSIONS + TAR_EXTENSIONS + TAR_GZ_EXTENSIONS + TAR_BZ2_EXTENSIONS + TAR_XZ_EXTENSIONS + TAR_ZST_EXTENSIONS
+
+MEMBER_BUFFER_SIZE = 1024 * 1024
+SKIP_CHUNK_SIZE = 4 * 1024 * 1024
+
+class _FileWindow(io.RawIOBase):
+    """Seekable read-only view on the [offset, offset + size) range of a shared seekable stream."""
+    def __init__(self, fileobj, offset, size, lock):
+        self.__fileobj = fileobj
+        self.__offset = offset
+        self.__size = size
+        self.__lock = lock
+        self.__pos = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self.__pos
+
+    def seek(self, offset, whence = io.SEEK_SET):
+        if whence == io.SEEK_SET:
+            pos = offset
+        elif whence == io.SEEK_CUR:
+            pos = self.__pos + offset
+        elif whence == io.SEEK_END:
+            pos = self.__size + offset
+        else:
+            raise ValueError("Invalid whence: {}".format(whence))
+        if pos < 0:
+            raise ValueError("Negative seek position {}".format(pos))
+        self.__pos = pos
+        return pos
+
+    def readinto(self, b):
+        n = min(len(b), self.__size - self.__pos)
+        if n <= 0:
+            return 0
+        with self.__lock:
+            self.__fileobj.seek(self.__offset + self.__pos)
+            data = self.__fileobj.read(n)
+        b[:len(data)] = data
+        self.__pos += len(data)
+        return len(data)
+
+class _IterStream(io.RawIOBase):
+    """Non-seekable stream on a generator of bytes chunks."""
+    def __init__(self, chunks):
+        self.__chunks = chunks
+        self.__pending = b""
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        while not self.__pending:
+            self.__pending = next(self.__chunks, None)
+            if self.__pending is None:
+                self.__pending = b""
+                return 0
+        n = min(len(b), len(self.__pending))
+        b[:n] = self.__pending[:n]
+        self.__pending = self.__pending[n:]
+        return n
+
+class _ReopenableStream(io.RawIOBase):
+    """
+    Seekable view on a sequential stream: forward seeks read and discard, backward seeks reopen the stream.
+
+    :param opener: Function returning a new readable stream positioned at 0.
+    :param size: [Optional] Stream size, needed by SEEK_END.
+    """
+    def __init__(self, opener, size = None):
+        self.__opener = opener
+        self.__size = size
+        self.__stream = opener()
+        self.__stream_pos = 0
+        self.__pos = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self.__pos
+
+    def seek(self, offset, whence = io.SEEK_SET):
+        if whence == io.SEEK_SET:
+            pos = offset
+        elif whence == io.SEEK_CUR:
+            pos = self.__pos + offset
+        elif whence == io.SEEK_END and self.__size is not None:
+            pos = self.__size + offset
+        else:
+            raise io.UnsupportedOperation("Unsupported seek")
+        if pos < 0:
+            raise ValueError("Negative seek position {}".format(pos))
+        self.__pos = pos
+        return pos
+
+    def __sync(self):
+        if self.__pos < self.__stream_pos:
+            self.__stream.close()
+            self.__stream = self.__opener()
+            self.__stream_pos = 0
+        while self.__stream_pos < self.__pos:
+            skipped = self.__stream.read(min(SKIP_CHUNK_SIZE, self.__pos - self.__stream_pos))
+            if not skipped:
+                break
+            self.__stream_pos += len(skipped)
+
+    def readinto(self, b):
+        self.__sync()
+        if self.__stream_pos < self.__pos:
+            return 0
+        data = self.__stream.read(len(b))
+        b[:len(data)] = data
+        self.__stream_pos += len(data)
+        self.__pos += len(data)
+        return len(data)
+
+    def close(self):
+        if not self.closed:
+            self.__stream.close()
+        super().close()
+
+class _ArchiveFS:
+    """Base class: member index (path -> size) and directory lookups."""
+    def __init__(self, archive_path):
+        self.archive_path = archive_path
+        self.lock = threading.RLock()
+        self.members = {}
+
+    def _add_member(self, name, size):
+        name = name.strip("/")
+        if name:
+            self.members[name] = size
+
+    def isfile(self, inner_path):
+        return inner_path in self.members
+
+    def isdir(self, inner_path):
+        if inner_path == "":
+            return True
+        prefix = inner_path + "/"
+        return any(m.startswith(prefix) for m in self.members)
+
+    def getsize(self, inner_path):
+        if inner_path not in self.members:
+            raise FileNotFoundError(os.path.join(self.archive_path, inner_path))
+        return self.members[inner_path]
+
+    def list_files(self, inner_dir):
+        prefix = inner_dir + "/" if inner_dir else ""
+        return sorted(m[len(prefix):] for m in self.members if m.startswith(prefix) and "/" not in m[len(prefix):])
+
+    def find_file(self, name, inner_dir):
+        """Same search order as os.walk: the folder itself first, then its subfolders (shallowest first)."""
+        prefix = inner_dir + "/" if inner_dir else ""
+        found = [m for m in self.members if m.startswith(prefix) and m.rsplit("/", 1)[-1] == name]
+        if not found:
+            return None
+        return min(found, key=lambda m: (m.count("/"), m))
+
+    def open_member(self, inner_path):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+class _ZipFS(_ArchiveFS):
+    def __init__(self, archive_path):
+        super().__init__(archive_path)
+        self.__zf = zipfile.ZipFile(archive_path, "r")
+        self.__fp = open(archive_path, "rb")
+        self.__infos = {}
+        for info in self.__zf.infolist():
+            if not info.is_dir():
+                self._add_member(info.filename, info.file_size)
+                self.__infos[info.filename.strip("/")] = info
+
+    def open_member(self, inner_path):
+        info = self.__infos[inner_path]
+        if info.compress_type == zipfile.ZIP_STORED:
+            with self.lock:
+                self.__fp.seek(info.header_offset)
+                header = self.__fp.read(30)
+            name_len = int.from_bytes(header[26:28], "little")
+            extra_len = int.from_bytes(header[28:30], "little")
+            return _FileWindow(self.__fp, info.header_offset + 30 + name_len + extra_len, info.file_size, self.lock)
+        return self.__zf.open(info)
+
+    def close(self):
+        self.__fp.close()
+        self.__zf.close()
+
+class _TarFS(_ArchiveFS):
+    def __init__(self, archive_path, opener = None):
+        super().__init__(archive_path)
+        if opener is None:
+            self.__stream = open(archive_path, "rb")
+        else:
+            self.__stream = _ReopenableStream(opener)
+        self.__tf = tarfile.open(fileobj=self.__stream, mode="r:")
+        self.__infos = {}
+        for info in self.__tf.getmembers():
+            if info.isfile():
+                self._add_member(info.name, info.size)
+                self.__infos[info.name.strip("/")] = info
+
+    def open_member(self, inner_path):
+        info = self.__infos[inner_path]
+        if info.issparse():
+            with self.lock:
+                return io.BytesIO(self.__tf.extractfile(info).read())
+        return _FileWindow(self.__stream, info.offset_data, info.size, self.lock)
+
+    def close(self):
+        self.__tf.close()
+        self.__stream.close()
+
+class _HsdzFS(_ArchiveFS):
+    def __init__(self, archive_path):
+        super().__init__(archive_path)
+        from stdatalog_core.HSD_utils.archive_codec import AcquisitionArchive
+        self.__archive = AcquisitionArchive(archive_path)
+        for file_name in self.__archive.manifest["files"]:
+            self._add_member(file_name, None)
+        for comp_name, desc in self.__archive.manifest["components"].items():
+            self._add_member(comp_name + ".dat", desc["original_size"])
+
+    def getsize(self, inner_path):
+        size = super().getsize(inner_path)
+        if size is None:
+            with self.lock:
+                size = len(self.__archive.read_file(inner_path))
+            self.members[inner_path] = size
+        return size
+
+    def open_member(self, inner_path):
+        if inner_path.endswith(".dat") and inner_path[:-len(".dat")] in self.__archive.manifest["components"]:
+            comp_name = inner_path[:-len(".dat")]
+            archive = self.__archive
+            lock = self.lock
+            def opener():
+                def chunks():
+                    gen = archive.iter_dat(comp_name)
+                    while True:
+                        with lock:
+                            chunk = next(gen, None)
+                        if chunk is None:
+                            return
+                        yield chunk
+                return _IterStream(chunks())
+            return _ReopenableStream(opener, self.members[inner_path])
+        with self.lock:
+            return io.BytesIO(self.__archive.read_file(inner_path))
+
+    def close(self):
+        self.__archive.close()
+
+def _zstd_opener(archive_path):
+    try:
+        import zstandard
+    except ImportError:
+        raise AcquisitionArchiveError("{}: install the zstandard package to read .zst archives".format(archive_path))
+    def opener():
+        return zstandard.ZstdDecompressor().stream_reader(open(archive_path, "rb"), closefd=True)
+    return opener
+
+class VirtualFS:
+
+    __archives = {}
+    __archives_lock = threading.Lock()
+
+    @staticmethod
+    def is_archive_file(path):
+        return path.lower().endswith(ARCHIVE_EXTENSIONS) and os.path.isfile(path)
+
+    @staticmethod
+    def is_archive_path(path):
+        """
+        :return: True if the path is an archive file or crosses one.
+        """
+        return path is not None and VirtualFS.split_archive_path(path)[0] is not None
+
+    @staticmethod
+    def split_archive_path(path):
+        """
+        Splits a path crossing an archive file.
+
+        :param path: File or folder path.
+        :return: (archive_path, inner_path) with inner_path "/" separated (possibly ""), or (None, path)
+            if the path does not cross an archive.
+        """
+        lower = os.path.normcase(path).lower()
+        if not any(ext in lower for ext in ARCHIVE_EXTENSIONS):
+            return None, path
+        parts = os.path.normpath(path).split(os.sep)
+        for i in range(1, len(parts) + 1):
+            prefix = os.sep.join(parts[:i])
+            if prefix and VirtualFS.is_archive_file(prefix):
+                return prefix, "/".join(p for p in parts[i:] if p not in ("", "."))
+        return None, path
+
+    @staticmethod
+    def __open_archive(archive_path):
+        key = os.path.abspath(archive_path)
+        st = os.stat(key)
+        with VirtualFS.__archives_lock:
+            entry = VirtualFS.__archives.get(key)
+            if entry is not None and entry[0] == (st.st_mtime_ns, st.st_size):
+                return entry[1]
+            lower = key.lower()
+            if lower.endswith(ZIP_EXTENSIONS):
+                fs = _ZipFS(key)
+            elif lower.endswith(HSDZ_EXTENSIONS):
+                fs = _HsdzFS(key)
+            elif lower.endswith(TAR_GZ_EXTENSIONS):
+                fs = _TarFS(key, lambda: gzip.open(key, "rb"))
+            elif lower.endswith(TAR_BZ2_EXTENSIONS):
+                fs = _TarFS(key, lambda: bz2.open(key, "rb"))
+            elif lower.endswith(TAR_XZ_EXTENSIONS):
+                fs = _TarFS(key, lambda: lzma.open(key, "rb"))
+            elif lower.endswith(TAR_ZST_EXTENSIONS):
+                fs = _TarFS(key, _zstd_opener(key))
+            else:
+                fs = _TarFS(key)
+            if entry is not None:
+                entry[1].close()
+            VirtualFS.__archives[key] = ((st.st_mtime_ns, st.st_size), fs)
+            return fs
+
+    @staticmethod
+    def close_archives():
+        """Closes the archives opened so far (they are kept open to share their member index)."""
+        with VirtualFS.__archives_lock:
+            for _, fs in VirtualFS.__archives.values():
+                fs.close()
+            VirtualFS.__archives.clear()
+
+    @staticmethod
+    def __resolve(path):
+        archive_path, inner_path = VirtualFS.split_archive_path(path)
+        if archive_path is None:
+            return None, path
+        return VirtualFS.__open_archive(archive_path), inner_path
+
+    @staticmethod
+    def isfile(path):
+        fs, inner_path = VirtualFS.__resolve(path)
+        if fs is None:
+            return os.path.isfile(path)
+        return fs.isfile(inner_path)
+
+    @staticmethod
+    def isdir(path):
+        fs, inner_path = VirtualFS.__resolve(path)
+        if fs is None:
+            return os.path.isdir(path)
+        return fs.isdir(inner_path)
+
+    @staticmethod
+    def exists(path):
+        fs, inner_path = VirtualFS.__resolve(path)
+        if fs is None:
+            return os.path.exists(path)
+        return fs.isfile(inner_path) or fs.isdir(inner_path)
+
+    @staticmethod
+    def getsize(path):
+        fs, inner_path = VirtualFS.__resolve(path)
+        if fs is None:
+            return os.path.getsize(path)
+        return fs.getsize(inner_path)
+
+    @staticmethod
+    def open(path, mode = "r", encoding = None):
+        """
+        Opens a file for reading, inside an archive or not.
+
+        :param path: File path.
+        :param mode: [Optional] "r" (text) or "rb" (binary).
+        :param encoding: [Optional] Text encoding (text mode only).
+        :return: A file object. Binary archive members are buffered and seekable.
+        """
+        fs, inner_path = VirtualFS.__resolve(path)
+        if fs is None:
+            return open(path, mode, encoding=encoding)
+        if mode not in ("r", "rb", "rt"):
+            raise io.UnsupportedOperation("Archived acquisitions are read-only ({})".format(path))
+        if not fs.isfile(inner_path):
+            raise FileNotFoundError(path)
+        raw = fs.open_member(inner_path)
+        stream = io.BufferedReader(raw, MEMBER_BUFFER_SIZE) if isinstance(raw, io.RawIOBase) else raw
+        if mode == "rb":
+            return stream
+        return io.TextIOWrapper(stream, encoding=encoding or "utf-8")
+
+    @staticmethod
+    def list_files(path):
+        """
+        :return: Names of the files in a folder (not recursive).
+        """
+        fs, inner_path = VirtualFS.__resolve(path)
+        if fs is None:
+            with os.scandir(path) as it:
+                return sorted(entry.name for entry in it if entry.is_file())
+        return fs.list_files(inner_path)
+
+    @staticmethod
+    def find_file(name, path):
+        """
+        Finds a file by name in an archived folder tree (the folder itself first).
+
+        :return: The full path to the file if found, otherwise None (also if the path does not cross an archive).
+        """
+        fs, inner_path = VirtualFS.__resolve(path)
+        if fs is None:
+            return None
+        found = fs.find_file(name, inner_path)
+        if found is None:
+            return None
+        return os.path.join(fs.archive_path, *found.split("/"))
@@ -24,13 +24,15 @@ from stdatalog_core.HSD_link.HSDLink_v2 import HSDLink_v2
 from stdatalog_core.HSD_link.HSDLink_v2 import HSDLink_v2_Serial
 from stdatalog_core.HSD_link.HSDLink_v1 import HSDLink_v1
 from stdatalog_core.HSD_utils.exceptions import CommunicationEngineOpenError
+from stdatalog_core.HSD_utils.file_sink import SensorDataFileSink, estimate_stream_size
+from stdatalog_core.HSD_utils.acquisition_catalog import AcquisitionCatalog
 import stdatalog_core.HSD_utils.logger as logger
 from stdatalog_pnpl.PnPLCmd import PnPLCMDManager
 
 log = logger.get_logger(__name__)
 
 class SensorAcquisitionThread(Thread):
-    def __init__(self, event, hsd_link, sensor_data_file, d_id, s_id, ss_id = None, print_data_cnt = False):
+    def __init__(self, event, hsd_link, sensor_data_file, d_id, s_id, ss_id = None, print_data_cnt = False, data_server = None):
         """
         Initializes the SensorAcquisitionThread.
 
@@ -41,6 +43,7 @@ class SensorAcquisitionThread(Thread):
         :param s_id: Sensor ID.
         :param ss_id: Sub-sensor ID (optional).
         :param print_data_cnt: Flag to print data count.
+        :param data_server: [Optional] LiveDataServer to publish sensor data to (HSD_v2 only).
         """
         Thread.__init__(self)
         self.stopped = event
@@ -50,6 +53,7 @@ class SensorAcquisitionThread(Thread):
         self.s_id = s_id
         self.ss_id = ss_id
         self.print_data_cnt = print_data_cnt
+        self.data_server = data_server
         if isinstance(hsd_link, HSDLink_v2):
             self.hsd_link.sensor_data_counts[self.s_id] = 0
         else:
@@ -87,6 +91,10 @@ class SensorAcquisitionThread(Thread):
                 if self.sensor_data_file is not None:
                     res = self.sensor_data_file.write(sensor_data)
 
+                ## live data streaming
+                if self.data_server is not None:
+                    self.data_server.publish_block(self.s_id, sensor_data)
+
     def run_no_print(self):
         """
         Runs the thread without data count printing.
@@ -107,6 +115,10 @@ class SensorAcquisitionThread(Thread):
                 if self.sensor_data_file is not None:
                     res = self.sensor_data_file.write(sensor_data)
 
+                ## live data streaming
+                if self.data_server is not None:
+                    self.data_server.publish_block(self.s_id, sensor_data)
+
 class HSDLink:
     def create_hsd_link(self, dev_com_type: str = 'st_hsd', acquisition_folder = None, plug_callback = None, unplug_callback = None, update_catalog = True):
         """
@@ -594,7 +606,36 @@ class HSDLink:
             return hsd_link.update_base_acquisition_folder(base_acquisition_path)
         else:
             return None
-        
+
+    @staticmethod
+    def enable_acquisition_catalog(hsd_link, root_folder, db_path = None):
+        """
+        Enables the acquisition catalog: the acquisitions started, stopped and saved by hsd_link are
+        recorded in a SQLite database (see HSD_utils.acquisition_catalog). Only supported for HSDv2.
+
+        :param hsd_link: Instance of HSDLink.
+        :param root_folder: Root folder of the acquisitions (e.g. the base acquisition folder).
+        :param db_path: [Optional] Database file path (default: <root_folder>/acquisition_catalog.db).
+        :return: The AcquisitionCatalog instance, None for HSDv1.
+        """
+        if isinstance(hsd_link, HSDLink_v2):
+            acquisition_catalog = AcquisitionCatalog(root_folder, db_path)
+            hsd_link.set_acquisition_catalog(acquisition_catalog)
+            return acquisition_catalog
+        else:
+            log.warning("Acquisition catalog not supported for HSDv1")
+            return None
+
+    @staticmethod
+    def get_acquisition_catalog(hsd_link):
+        """
+        Retrieves the acquisition catalog enabled on hsd_link.
+
+        :param hsd_link: Instance of HSDLink.
+        :return: The AcquisitionCatalog instance, or None.
+        """
+        return getattr(hsd_link, "acquisition_catalog", None)
+
     @staticmethod
     def set_device_template(hsd_link, dev_template_json):
         """
@@ -1297,9 +1338,10 @@ class HSDLink:
             return self.hsd_link.sensor_data_counts[s_id]
             
     @staticmethod
-    def start_sensor_acquisition_thread(hsd_link, device_id, sensor, threads_stop_flags, sensor_data_files, print_data_cnt = False):
+    def start_sensor_acquisition_thread(hsd_link, device_id, sensor, threads_stop_flags, sensor_data_files, print_data_cnt = False, sink_options = None, expected_duration = None, data_server = None, sensor_data_file = None):
         """
         Starts the sensor acquisition thread.
+        Sensor data are saved through a SensorDataFileSink (buffered, batched writes).
 
         :param hsd_link: Instance of HSDLink.
         :param device_id: Device ID.
@@ -1307,27 +1349,137 @@ class HSDLink:
         :param threads_stop_flags: List of thread stop flags.
         :param sensor_data_files: List of sensor data files.
         :param print_data_cnt: Flag to print data count.
+        :param sink_options: [Optional] Dictionary of SensorDataFileSink options (buffer_size, background_writer, max_queued_bytes, fsync_policy, fsync_period, max_buffer_age, direct_io).
+        :param expected_duration: [Optional] Expected acquisition duration [s], used to preallocate the sensor data file (HSD_v2 only).
+        :param data_server: [Optional] Running LiveDataServer: decoded sensor data are also streamed to its subscribers (HSD_v2 only).
+        :param sensor_data_file: [Optional] File-like object (write/close) receiving the sensor data instead of a new SensorDataFileSink (HSD_v2 only).
         :return: None
         """
+        sink_options = dict(sink_options) if sink_options is not None else {}
         output_acquisition_path = hsd_link.get_acquisition_folder()
         if isinstance(hsd_link, HSDLink_v1):
             for sd in sensor.sensor_descriptor.sub_sensor_descriptor:
                 sensor_data_file_path = os.path.join(output_acquisition_path,(str(sensor.name) + "_"  + str(sd.sensor_type) + ".dat"))
-                sensor_data_file = open(sensor_data_file_path, "wb+")
+                sensor_data_file = SensorDataFileSink(sensor_data_file_path, **sink_options)
                 sensor_data_files.append(sensor_data_file)
                 stopFlag = Event()
                 threads_stop_flags.append(stopFlag)
                 thread = SensorAcquisitionThread(stopFlag, hsd_link, sensor_data_file, device_id, sensor.id, sd.id, print_data_cnt = print_data_cnt)
                 thread.start()
         else:
-            sensor_data_file_path = os.path.join(output_acquisition_path,(str(sensor) + ".dat"))
-            sensor_data_file = open(sensor_data_file_path, "wb+")
+            if sensor_data_file is None:
+                sensor_data_file_path = os.path.join(output_acquisition_path,(str(sensor) + ".dat"))
+                if expected_duration is not None and "preallocate_size" not in sink_options:
+                    sink_options["preallocate_size"] = HSDLink.get_expected_sensor_data_size(hsd_link, device_id, sensor, expected_duration)
+                sensor_data_file = SensorDataFileSink(sensor_data_file_path, **sink_options)
             sensor_data_files.append(sensor_data_file)
+            if data_server is not None:
+                comp_status = HSDLink.get_component_status(hsd_link, device_id, sensor)
+                if comp_status is not None:
+                    comp_status = comp_status.get(sensor, comp_status)
+                if comp_status is None or not data_server.add_component(sensor, comp_status):
+                    log.warning("{} cannot be streamed by the live data server".format(sensor))
             stopFlag = Event()
             threads_stop_flags.append(stopFlag)
-            thread = SensorAcquisitionThread(stopFlag, hsd_link, sensor_data_file, device_id, sensor, print_data_cnt = print_data_cnt)
+            thread = SensorAcquisitionThread(stopFlag, hsd_link, sensor_data_file, device_id, sensor, print_data_cnt = print_data_cnt, data_server = data_server)
             thread.start()
 
+    @staticmethod
+    def start_segmented_log(hsd_link, device_id, components, output_folder, segment_time = None, segment_size = None, sink_options = None, data_server = None, on_segment_published = None, extra_files = None):
+        """
+        Starts a continuous logging session whose output is split in segments (HSD_v2 only).
+        The device keeps streaming: the segments are rotated by time and/or size at data frame boundaries,
+        each one is a complete acquisition folder published atomically in output_folder (see HSD_utils.segmented_log).
+
+        :param hsd_link: Instance of HSDLink.
+        :param device_id: Device ID.
+        :param components: Names of the components to save (e.g. the active sensors list).
+        :param output_folder: Folder where the segments are published.
+        :param segment_time: [Optional] Segment duration [s].
+        :param segment_size: [Optional] Maximum segment size [bytes].
+        :param sink_options: [Optional] Dictionary of SensorDataFileSink options (see start_sensor_acquisition_thread).
+        :param data_server: [Optional] Running LiveDataServer: sensor data are also streamed to its subscribers.
+        :param on_segment_published: [Optional] Callback(segment_folder, segment_index) called after each segment publication.
+        :param extra_files: [Optional] Dictionary file name -> source file path of files copied in every segment (e.g. UCF files).
+        :return: The started SegmentedAcquisition (rotate() to cut a segment on request, stop() to end the session).
+        """
+        from stdatalog_core.HSD_utils.segmented_log import SegmentedAcquisition
+        segmented_acquisition = SegmentedAcquisition(hsd_link, device_id, components, output_folder, segment_time, segment_size, sink_options,
+                                                     data_server, on_segment_published, HSDLink.get_acquisition_catalog(hsd_link), extra_files)
+        segmented_acquisition.start()
+        return segmented_acquisition
+
+    @staticmethod
+    def start_pretrigger_log(hsd_link, device_id, components, output_folder, pre_trigger_time, post_trigger_time = 0, sink_options = None, data_server = None, on_acquisition_published = None, extra_files = None):
+        """
+        Starts a pre-trigger logging session (HSD_v2 only). The device streams continuously and the last
+        pre_trigger_time seconds of data are kept in memory: each acquisition started by trigger() includes them,
+        and ends post_trigger_time seconds after release() (see HSD_utils.pretrigger_log).
+
+        :param hsd_link: Instance of HSDLink.
+        :param device_id: Device ID.
+        :param components: Names of the components to save (e.g. the active sensors list).
+        :param output_folder: Folder where the acquisitions are published.
+        :param pre_trigger_time: History [s] saved before the trigger.
+        :param post_trigger_time: [Optional] Time [s] recorded after the release.
+        :param sink_options: [Optional] Dictionary of SensorDataFileSink options (see start_sensor_acquisition_thread).
+        :param data_server: [Optional] Running LiveDataServer: sensor data are also streamed to its subscribers.
+        :param on_acquisition_published: [Optional] Callback(acquisition_folder, acquisition_index) called after each publication.
+        :param extra_files: [Optional] Dictionary file name -> source file path of files copied in every acquisition (e.g. UCF files).
+        :return: The started PreTriggerAcquisition (trigger()/release() for each acquisition, stop() to end the session).
+        """
+        from stdatalog_core.HSD_utils.pretrigger_log import PreTriggerAcquisition
+        pretrigger_acquisition = PreTriggerAcquisition(hsd_link, device_id, components, output_folder, pre_trigger_time, post_trigger_time, sink_options,
+                                                       data_server, on_acquisition_published, HSDLink.get_acquisition_catalog(hsd_link), extra_files)
+        pretrigger_acquisition.start()
+        return pretrigger_acquisition
+
+    @staticmethod
+    def create_logging_session(hsd_link, device_id, components, output_folder, sink_options = None, expected_duration = None, data_server = None, extra_files = None, rearm = True):
+        """
+        Creates a warm-start logging session (HSD_v2 only): acquisition threads, output folder and .dat files
+        are prepared while the device is idle, so that the acquisition starts with minimal latency on trigger
+        (see HSD_utils.logging_session).
+
+        :param hsd_link: Instance of HSDLink.
+        :param device_id: Device ID.
+        :param components: Names of the components to save (e.g. the active sensors list).
+        :param output_folder: Folder where the acquisitions are published.
+        :param sink_options: [Optional] Dictionary of SensorDataFileSink options (see start_sensor_acquisition_thread).
+        :param expected_duration: [Optional] Expected acquisition duration [s], used to preallocate the sensor data files.
+        :param data_server: [Optional] Running LiveDataServer: sensor data are also streamed to its subscribers.
+        :param extra_files: [Optional] Dictionary file name -> source file path of files copied in every acquisition (e.g. UCF files).
+        :param rearm: If True (default), the session is armed again after each stop.
+        :return: The LoggingSession (prepare() to arm it, trigger() to start, stop() to publish the acquisition, close() to end it).
+        """
+        from stdatalog_core.HSD_utils.logging_session import LoggingSession
+        return LoggingSession(hsd_link, device_id, components, output_folder, sink_options, expected_duration,
+                              data_server, HSDLink.get_acquisition_catalog(hsd_link), extra_files, rearm)
+
+    @staticmethod
+    def get_expected_sensor_data_size(hsd_link, device_id, comp_name, duration):
+        """
+        Estimates the size of a component .dat file from its current configuration (ODR x duration). (HSD_v2 only)
+
+        :param hsd_link: Instance of HSDLink.
+        :param device_id: Device ID.
+        :param comp_name: Component name.
+        :param duration: Expected acquisition duration [s].
+        :return: The estimated size in bytes, or None if it cannot be estimated.
+        """
+        comp_status = HSDLink.get_component_status(hsd_link, device_id, comp_name)
+        if comp_status is None:
+            return None
+        comp_status = comp_status.get(comp_name, comp_status)
+        odr = comp_status.get("measodr") or comp_status.get("odr")
+        data_type = comp_status.get("data_type")
+        if not odr or data_type is None:
+            return None
+        spts = comp_status.get("samples_per_ts", 0)
+        if not isinstance(spts, int):
+            spts = spts["val"] if spts and "val" in spts else 0
+        return estimate_stream_size(odr, duration, comp_status.get("dim", 1), data_type, spts, comp_status.get("usb_dps"))
+
     @staticmethod
     def stop_sensor_acquisition_threads(threads_stop_flags, sensor_data_files):
         """
@@ -1341,6 +1493,16 @@ class HSDLink:
             sf.set()
         for f in sensor_data_files:
             f.close()
+
+    @staticmethod
+    def get_sensor_data_files_stats(sensor_data_files):
+        """
+        Retrieves the write statistics (latency histograms, storage stalls) of the sensor data files.
+
+        :param sensor_data_files: List of sensor data files.
+        :return: List of statistics dictionaries (see SensorDataFileSink.get_stats).
+        """
+        return [f.get_stats() for f in sensor_data_files if isinstance(f, SensorDataFileSink)]
     
     @staticmethod
     def stop_log(hsd_link, device_id):
@@ -18,10 +18,13 @@
 import os
 import json
 import time
+import sqlite3
 from datetime import datetime
 
 from stdatalog_core.HSD_utils.exceptions import InvalidCommandSetError, NoDeviceConnectedError
+from stdatalog_core.HSD_utils.acquisition_catalog import AcquisitionState
 import stdatalog_core.HSD_utils.logger as logger
+import stdatalog_core.HSD_utils.profiling as profiling
 from stdatalog_pnpl.PnPLCmd import PnPLCMDManager
 from .communication.PnPL_HSD.PnPLHSD_com_manager import PnPLHSD_CommandManager, PnPLHSD_Creator
 from stdatalog_core.HSD_link.communication.PnPL_STSRL.PnPLSTSRL_com_manager import PnPLSTSRL_Creator
@@ -39,9 +42,9 @@ class HSDLink_v2:
     
     def __init__(self, dev_com_type: str = 'st_hsd', acquisition_folder = None, plug_callback = None, unplug_callback = None, update_catalog = True):
         
-        # Update the device catalog if the update_catalog flag is set to True
+        # Update the device catalog if the update_catalog flag is set to True (according to the catalog update policy)
         if update_catalog:
-            DeviceCatalogManager.update_catalog()
+            DeviceCatalogManager.request_catalog_update()
         
         self.__create_com_manager(dev_com_type, plug_callback, unplug_callback)
         
@@ -49,6 +52,7 @@ class HSDLink_v2:
         self.sensor_data_counts = {}
         self.nof_connected_devices = 0
         self.save_files = True
+        self.acquisition_catalog = None
                 
         self.__dt_manager = None
         if acquisition_folder is None:
@@ -67,6 +71,23 @@ class HSDLink_v2:
         else:
             self.__base_acquisition_folder = "."
 
+    def set_acquisition_catalog(self, acquisition_catalog):
+        """
+        Sets the AcquisitionCatalog updated by start_log, stop_log and save_json_* (None to disable).
+
+        :param acquisition_catalog: AcquisitionCatalog instance (see HSD_utils.acquisition_catalog).
+        """
+        self.acquisition_catalog = acquisition_catalog
+
+    def __update_acquisition_catalog(self, method_name, *args):
+        # Catalog errors must never stop the acquisition
+        if self.acquisition_catalog is None or not self.save_files:
+            return
+        try:
+            getattr(self.acquisition_catalog, method_name)(*args)
+        except (sqlite3.Error, OSError) as e:
+            log.warning("Acquisition catalog not updated ({}): {}".format(method_name, e))
+
     def set_device_template(self, dev_template_json: dict):
         self.__dt_manager = DeviceTemplateManager(dev_template_json)
 
@@ -353,6 +374,7 @@ class HSDLink_v2:
     # def set_hw_tag_class_label_by_id(self, d_id:int, tag_class_id:int, new_label: str):
     #     return self.__com_manager.set_property(d_id, new_label, "tags_info", "hw_tag{}".format(tag_class_id), "label")
     
+    @profiling.profiled("usb.get_sensor_data")
     def get_sensor_data(self, d_id:int, comp_name:str, ss_id = None):
         return self.__com_manager.get_sensor_data(d_id, comp_name)
     
@@ -363,8 +385,9 @@ class HSDLink_v2:
         message = PnPLCMDManager.create_command_cmd("log_controller","set_time","datetime", time if dtime is None else dtime)
         return self.send_command(d_id, message)
     
-    def start_log(self, d_id:int, interface:int = 1, acq_folder = None, sub_folder = True, save_files = True):
-        self.set_rtc_time(d_id)
+    def start_log(self, d_id:int, interface:int = 1, acq_folder = None, sub_folder = True, save_files = True, set_rtc = True):
+        if set_rtc:
+            self.set_rtc_time(d_id)
         log.info("Log Started")
         self.save_files = save_files
         if acq_folder is not None:
@@ -376,6 +399,7 @@ class HSDLink_v2:
                 
         if self.save_files and not os.path.exists(self.acquisition_folder):
             os.makedirs(self.acquisition_folder)
+        self.__update_acquisition_catalog("register_acquisition", self.acquisition_folder)
         return self.__com_manager.start_log(d_id, interface)
     
     def switch_bank(self, d_id:int):
@@ -384,7 +408,10 @@ class HSDLink_v2:
 
     def stop_log(self, d_id:int):
         log.info("Log Stopped")
-        return self.__com_manager.stop_log(d_id)
+        res = self.__com_manager.stop_log(d_id)
+        if self.acquisition_folder is not None:
+            self.__update_acquisition_catalog("set_acquisition_state", self.acquisition_folder, AcquisitionState.STOPPED)
+        return res
     
     def save_config(self, d_id):
         message = PnPLCMDManager.create_command_cmd("log_controller","save_config")
@@ -410,6 +437,7 @@ class HSDLink_v2:
                     sensor_data_file.write(json.dumps(res, indent = 4))
                     sensor_data_file.close()
                     log.info("device_config.json Configuration file correctly saved")
+                    self.__update_acquisition_catalog("update_acquisition", json_save_path)
                     return True
             except:
                 raise
@@ -434,6 +462,7 @@ class HSDLink_v2:
                         acq_info_file.write(json.dumps(res["acquisition_info"], indent = 4))
                     acq_info_file.close()
                     log.info("acquisition_info.json file correctly saved")
+                    self.__update_acquisition_catalog("update_acquisition", json_save_path)
                     return True
             except:
                 raise
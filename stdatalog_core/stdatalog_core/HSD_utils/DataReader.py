@@ -18,9 +18,33 @@ import struct
 import numpy as np
 
 from stdatalog_core.HSD.utils.type_conversion import TypeConversion
+import stdatalog_core.HSD_utils.profiling as profiling
+from stdatalog_core.HSD_utils.integrity import DATA_PROTOCOL_SIZE
 
 from .DataClass import DataClass
 
+def feed_sensor_data_block(data_reader, comp_name, block, packet_data_size, integrity_checker = None, sensor_data_file = None):
+    """
+    Processes a block of complete packets received from a component (get_sensor_data), as the live
+    acquisition threads of the GUI do: packet-counter check, DataReader.feed_data of the payload of
+    each packet and write of the block (counters included) to the .dat file.
+
+    :param data_reader: DataReader (or any object with a feed_data(DataClass) method) of the component.
+    :param comp_name: Component name.
+    :param block: The data block (bytes-like object).
+    :param packet_data_size: Number of payload bytes per packet (e.g. usb_dps).
+    :param integrity_checker: [Optional] PacketCounterChecker of the component stream.
+    :param sensor_data_file: [Optional] File object the block is written to.
+    :return: List of the gaps found by the integrity checker (empty without checker).
+    """
+    gaps = integrity_checker.check_block(block) if integrity_checker is not None else []
+    packet_size = packet_data_size + DATA_PROTOCOL_SIZE
+    for p in range(len(block) // packet_size):
+        data_reader.feed_data(DataClass(comp_name, block[p * packet_size + DATA_PROTOCOL_SIZE:(p + 1) * packet_size]))
+    if sensor_data_file is not None:
+        sensor_data_file.write(block)
+    return gaps
+
 class DataReader(object):
     def __init__(self, output_function, comp_name, samples_per_ts, dimensions, sample_size, data_format, sensitivity=1, interleaved_data=True, flat_raw_data=False):
         self.output_function = output_function
@@ -78,8 +102,7 @@ class DataReader(object):
             self.data_samples_counter = int(data_samples)
             # copy data into buffer
             if self.sample_size == 3:
-                a = TypeConversion.int24_buffer_to_int32_buffer(data[:int_rem_data_bytes])
-                self.data_buffer = np.frombuffer(a, dtype=self.data_format, count=int(data_samples))
+                self.data_buffer = TypeConversion.decode_int24(data[:int_rem_data_bytes])
             else:
                 self.data_buffer = np.frombuffer(data[:int_rem_data_bytes], dtype=self.data_format, count=int(data_samples))
             # take the remaining bytes, if any (e.g., if data finish with a non complete sample (x,y,) z missing)
@@ -105,14 +128,16 @@ class DataReader(object):
             # unpack data from the byte raw data buffer
             # copy data into buffer
             if self.sample_size == 3:
-                data_t = TypeConversion.int24_buffer_to_int32_buffer(data[: n_cplt_packet * (self.data_size + self.time_size)])
-                self.data_buffer = list(struct.unpack(format, data_t))
+                # int24 samples of all the complete packets are decoded at once (strided view skipping the timestamps)
+                packets = np.frombuffer(data, dtype=np.uint8, count=n_cplt_packet * (self.data_size + self.time_size))
+                packets = packets.reshape(n_cplt_packet, self.data_size + self.time_size)
+                self.data_buffer = TypeConversion.decode_int24(packets[:, :self.data_size]).reshape(-1)
             else:
                 data_t = data[: n_cplt_packet * (self.data_size + self.time_size)]
                 self.data_buffer = list(struct.unpack(format, data_t))
-            # remove timestamps extracted
-            if self.samples_per_ts != 0:
-                del self.data_buffer[(self.samples_per_ts * self.dimensions) :: (self.samples_per_ts * self.dimensions) + 1]
+                # remove timestamps extracted
+                if self.samples_per_ts != 0:
+                    del self.data_buffer[(self.samples_per_ts * self.dimensions) :: (self.samples_per_ts * self.dimensions) + 1]
             #else:
                 #del self.data_buffer[self.dimensions :: self.dimensions + 1]
             # take the remaining bytes
@@ -131,17 +156,18 @@ class DataReader(object):
             self.data_samples_counter = int(data_samples)
             # add remaining extracted data into the data_buffer
             if self.sample_size == 3:
-                a = TypeConversion.int24_buffer_to_int32_buffer(data[n_cplt_packet * (self.data_size + self.time_size) : n_cplt_packet * (self.data_size + self.time_size) + int_rem_data_bytes])
-                self.data_buffer.extend(np.frombuffer(a,dtype=self.data_format, count=self.data_samples_counter))
+                a = TypeConversion.decode_int24(data[n_cplt_packet * (self.data_size + self.time_size) : n_cplt_packet * (self.data_size + self.time_size) + int_rem_data_bytes])
+                self.data_buffer = np.concatenate((self.data_buffer, a))
             else:
                 self.data_buffer.extend(np.frombuffer(data[n_cplt_packet * (self.data_size + self.time_size) : n_cplt_packet * (self.data_size + self.time_size) + int_rem_data_bytes], dtype=self.data_format, count=self.data_samples_counter))
-            # cast self.data_buffer to be a numpy array
-            self.data_buffer = np.array(self.data_buffer)
+                # cast self.data_buffer to be a numpy array
+                self.data_buffer = np.array(self.data_buffer)
             # take the remaining bytes, if any (e.g., if data finish with a non complete sample (x,y,) z missing)
             self.rem_dim_bytes = data[ n_cplt_packet * (self.data_size + self.time_size) + int_rem_data_bytes :]
             # update data_samples_counter and timestamp flag
             self.update_data_samples_counter_and_time_flag()
 
+    @profiling.profiled("datareader.feed_data")
     def feed_data(self, data):
         if self.comp_name == self.comp_name:
             if len(self.rem_dim_bytes) != 0:
@@ -173,8 +199,7 @@ class DataReader(object):
                     [int_rem_data_bytes, data_samples] = self.calculate_data_to_extract(data.data)
                     # copy data into buffer
                     if self.sample_size == 3:
-                        a = TypeConversion.int24_buffer_to_int32_buffer(data.data[:int_rem_data_bytes])
-                        self.data_buffer = np.frombuffer(a, dtype=self.data_format, count=int(int_rem_data_bytes / self.sample_size))
+                        self.data_buffer = TypeConversion.decode_int24(data.data[:int_rem_data_bytes])
                     else:
                         self.data_buffer = np.frombuffer(data.data[:int_rem_data_bytes], dtype=self.data_format, count=int(int_rem_data_bytes / self.sample_size))
                     # update the data_samples_counter
@@ -184,8 +209,7 @@ class DataReader(object):
                 else:
                     # copy data into buffer
                     if self.sample_size == 3:
-                        a = TypeConversion.int24_buffer_to_int32_buffer(data.data[: diff * self.sample_size])
-                        self.data_buffer = np.frombuffer(a, dtype=self.data_format, count=diff)
+                        self.data_buffer = TypeConversion.decode_int24(data.data[: diff * self.sample_size])
                     else:
                         self.data_buffer = np.frombuffer(data.data[: diff * self.sample_size], dtype=self.data_format, count=diff)
                     # reinit data_samples_counter
@@ -0,0 +1,642 @@
+# *****************************************************************************
+#  * @file    acquisition_catalog.py
+#  * @author  SRA
+# ******************************************************************************
+# * @attention
+# *
+# * Copyright (c) 2022 STMicroelectronics.
+# * All rights reserved.
+# *
+# * This software is licensed under terms that can be found in the LICENSE file
+# * in the root directory of this software component.
+# * If no LICENSE file comes with this software, it is provided AS-IS.
+# *
+# *
+# ******************************************************************************
+#
+
+"""
+Persistent SQLite catalog of the acquisitions stored under a root folder (e.g. acquisition_data/).
+
+The catalog is maintained by the acquisition layer (HSDLink_v2 start_log/stop_log/save_json_*)
+and records, for each acquisition folder: path, start/end time, device and firmware, active
+components (ODR, dim, data type, .dat size), tag intervals, integrity status (from
+integrity_report.json) and export/transfer state. Dashboards and transfer jobs query it instead
+of walking the folder tree; sync() reconciles the catalog with the file system incrementally
+(only the acquisitions whose json files changed are parsed again).
+
+The database uses WAL journaling, so that the logger, the dashboard and the transfer service can
+use it concurrently from different processes.
+"""
+
+import os
+import re
+import json
+import time
+import sqlite3
+from contextlib import closing
+from datetime import datetime
+
+import stdatalog_core.HSD_utils.logger as logger
+
+log = logger.get_logger(__name__)
+
+CATALOG_FILE_NAME = "acquisition_catalog.db"
+CATALOG_SCHEMA_VERSION = 1
+ACQUISITION_INFO_FILE_NAME = "acquisition_info.json"
+DEVICE_CONFIG_FILE_NAME = "device_config.json"
+INTEGRITY_REPORT_FILE_NAME = "integrity_report.json"
+CUT_FOLDER_PATTERN = re.compile(r"^cut_(\d+)$")
+
+class AcquisitionState:
+    LOGGING = "logging"
+    STOPPED = "stopped"
+    COMPLETE = "complete"
+    REMOVED = "removed"
+
+class IntegrityStatus:
+    UNCHECKED = "unchecked"
+    OK = "ok"
+    ERRORS = "errors"
+
+class TransferState:
+    NONE = "none"
+    PENDING = "pending"
+    TRANSFERRED = "transferred"
+    FAILED = "failed"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE IF NOT EXISTS acquisitions (
+    id INTEGER PRIMARY KEY,
+    rel_path TEXT UNIQUE NOT NULL,
+    parent TEXT NOT NULL,
+    cut INTEGER,
+    state TEXT NOT NULL,
+    name TEXT, description TEXT, uuid TEXT,
+    start_time TEXT, end_time TEXT, start_ts REAL, end_ts REAL, duration REAL,
+    board_id INTEGER, fw_id INTEGER, fw_name TEXT, fw_version TEXT, interface INTEGER,
+    size INTEGER DEFAULT 0,
+    integrity_status TEXT DEFAULT 'unchecked',
+    export_state TEXT DEFAULT 'none', export_target TEXT, exported_at REAL,
+    transfer_state TEXT DEFAULT 'none', transfer_target TEXT, transferred_at REAL,
+    mtime REAL DEFAULT 0,
+    created_at REAL, updated_at REAL
+);
+CREATE INDEX IF NOT EXISTS acquisitions_start_ts ON acquisitions (start_ts);
+CREATE INDEX IF NOT EXISTS acquisitions_parent ON acquisitions (parent);
+CREATE INDEX IF NOT EXISTS acquisitions_cut ON acquisitions (cut);
+CREATE TABLE IF NOT EXISTS components (
+    acq_id INTEGER NOT NULL REFERENCES acquisitions (id) ON DELETE CASCADE,
+    name TEXT NOT NULL, c_type INTEGER, odr REAL, measodr REAL, dim INTEGER, data_type TEXT, sensitivity REAL,
+    size INTEGER DEFAULT 0,
+    PRIMARY KEY (acq_id, name)
+);
+CREATE INDEX IF NOT EXISTS components_name ON components (name);
+CREATE TABLE IF NOT EXISTS tags (
+    acq_id INTEGER NOT NULL REFERENCES acquisitions (id) ON DELETE CASCADE,
+    label TEXT NOT NULL, start_s REAL, end_s REAL
+);
+CREATE INDEX IF NOT EXISTS tags_label ON tags (label);
+CREATE TABLE IF NOT EXISTS folders (rel_path TEXT PRIMARY KEY, parent TEXT, mtime REAL);
+"""
+
+def parse_iso_datetime(value):
+    """
+    Parses an ISO8601 date (as written in acquisition_info.json, e.g. "2024-09-16T15:38:54.000Z").
+    Naive datetimes are considered local times.
+
+    :param value: ISO8601 string or datetime.
+    :return: A timezone-aware datetime, or None.
+    """
+    if value is None or value == "":
+        return None
+    if isinstance(value, datetime):
+        dt = value
+    else:
+        value = str(value)
+        if value.endswith("Z"):
+            value = value[:-1] + "+00:00"
+        try:
+            dt = datetime.fromisoformat(value)
+        except ValueError:
+            return None
+    return dt if dt.tzinfo is not None else dt.astimezone()
+
+def get_tag_intervals(acq_info_tags, start_time = None, end_time = None):
+    """
+    Pairs the tag events of acquisition_info.json ({"l": label, "e": enable, "ta": time}) into intervals.
+
+    :param acq_info_tags: The "tags" list of acquisition_info.json.
+    :param start_time: [Optional] Acquisition start time (datetime), used to compute relative times.
+    :param end_time: [Optional] Acquisition end time (datetime), used to close the tags left open.
+    :return: List of dictionaries {"label", "start", "end"} (seconds from the acquisition start).
+    """
+    intervals = []
+    open_tags = {}
+    def rel_time(ta):
+        t = parse_iso_datetime(ta)
+        if t is None or start_time is None:
+            return None
+        return (t - start_time).total_seconds()
+    for t in acq_info_tags or []:
+        label = t.get("l")
+        if label is None:
+            continue
+        if t.get("e", False):
+            open_tags[label] = rel_time(t.get("ta"))
+        elif label in open_tags:
+            intervals.append({"label": label, "start": open_tags.pop(label), "end": rel_time(t.get("ta"))})
+    acq_end = (end_time - start_time).total_seconds() if start_time is not None and end_time is not None else None
+    for label, start in open_tags.items():
+        intervals.append({"label": label, "start": start, "end": acq_end})
+    return intervals
+
+def read_acquisition_metadata(acq_folder):
+    """
+    Reads the metadata of an HSD_v2 acquisition folder (no DTDL model resolution, no data decoding).
+
+    :param acq_folder: Acquisition folder path.
+    :return: Dictionary with name, description, start/end time, interface, device ids, firmware info,
+        tags labels and intervals, folder size and the active components (status subset and .dat file size).
+    """
+    with open(os.path.join(acq_folder, ACQUISITION_INFO_FILE_NAME), "r") as f:
+        acq_info = json.load(f)
+    with open(os.path.join(acq_folder, DEVICE_CONFIG_FILE_NAME), "r") as f:
+        device_config = json.load(f)
+    device = device_config["devices"][0] if "devices" in device_config else device_config
+
+    file_sizes = {}
+    with os.scandir(acq_folder) as it:
+        for entry in it:
+            if entry.is_file(follow_symlinks=False):
+                file_sizes[entry.name] = entry.stat().st_size
+
+    fw_info = {}
+    components = {}
+    for c in device.get("components", []):
+        comp_name = list(c.keys())[0]
+        comp_status = c[comp_name]
+        if comp_name == "firmware_info":
+            fw_info = comp_status
+        if not isinstance(comp_status, dict) or not comp_status.get("enable", False):
+            continue
+        dat_file_name = comp_name + ".dat"
+        if dat_file_name not in file_sizes:
+            continue
+        components[comp_name] = {
+            "c_type": comp_status.get("c_type"),
+            "odr": comp_status.get("odr"),
+            "measodr": comp_status.get("measodr"),
+            "dim": comp_status.get("dim"),
+            "data_type": comp_status.get("data_type"),
+            "sensitivity": comp_status.get("sensitivity"),
+            "file_size": file_sizes[dat_file_name],
+        }
+
+    cut = None
+    for part in reversed(os.path.normpath(os.path.abspath(acq_folder)).split(os.sep)):
+        m = CUT_FOLDER_PATTERN.match(part)
+        if m is not None:
+            cut = int(m.group(1))
+            break
+
+    acq_info_tags = acq_info.get("tags", [])
+    return {
+        "name": acq_info.get("name"),
+        "description": acq_info.get("description"),
+        "uuid": acq_info.get("uuid"),
+        "start_time": acq_info.get("start_time"),
+        "end_time": acq_info.get("end_time"),
+        "interface": acq_info.get("interface"),
+        "board_id": device.get("board_id"),
+        "fw_id": device.get("fw_id"),
+        "fw_name": fw_info.get("fw_name"),
+        "fw_version": fw_info.get("fw_version"),
+        "tags": sorted({t.get("l") for t in acq_info_tags if t.get("l") is not None}),
+        "tag_intervals": get_tag_intervals(acq_info_tags, parse_iso_datetime(acq_info.get("start_time")), parse_iso_datetime(acq_info.get("end_time"))),
+        "cut": cut,
+        "size": sum(file_sizes.values()),
+        "components": components,
+    }
+
+def read_integrity_status(acq_folder):
+    """
+    :param acq_folder: Acquisition folder path.
+    :return: IntegrityStatus of the integrity_report.json saved in the folder (UNCHECKED if missing).
+    """
+    report_path = os.path.join(acq_folder, INTEGRITY_REPORT_FILE_NAME)
+    if not os.path.exists(report_path):
+        return IntegrityStatus.UNCHECKED
+    try:
+        with open(report_path, "r") as f:
+            report = json.load(f)
+    except (OSError, ValueError):
+        return IntegrityStatus.UNCHECKED
+    results = [r.get("ok", True) for c in report.get("components", {}).values() for r in c.values() if isinstance(r, dict)]
+    return IntegrityStatus.OK if all(results) else IntegrityStatus.ERRORS
+
+def is_acquisition_folder(folder_path):
+    return os.path.exists(os.path.join(folder_path, ACQUISITION_INFO_FILE_NAME)) or os.path.exists(os.path.join(folder_path, DEVICE_CONFIG_FILE_NAME))
+
+def _get_acquisition_mtime(acq_folder):
+    mtime = 0
+    for file_name in (ACQUISITION_INFO_FILE_NAME, DEVICE_CONFIG_FILE_NAME, INTEGRITY_REPORT_FILE_NAME):
+        try:
+            mtime = max(mtime, os.stat(os.path.join(acq_folder, file_name)).st_mtime)
+        except OSError:
+            pass
+    return mtime
+
+def _escape_like(value, escape = "\\"):
+    # LIKE pattern matching value literally (used with ESCAPE '\')
+    return value.replace(escape, escape * 2).replace("%", escape + "%").replace("_", escape + "_")
+
+class AcquisitionCatalog:
+    """
+    SQLite catalog of the acquisitions stored under a root folder.
+
+    :param root_folder: Root folder of the acquisitions (e.g. acquisition_data). Paths are stored relative to it.
+    :param db_path: [Optional] Database file path (default: <root_folder>/acquisition_catalog.db).
+    """
+    def __init__(self, root_folder, db_path = None):
+        self.root_folder = os.path.abspath(root_folder)
+        self.db_path = db_path if db_path is not None else os.path.join(self.root_folder, CATALOG_FILE_NAME)
+        db_folder = os.path.dirname(os.path.abspath(self.db_path))
+        if not os.path.exists(db_folder):
+            os.makedirs(db_folder)
+        with closing(self.__connect()) as conn:
+            with conn:
+                conn.executescript(_SCHEMA)
+                conn.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('schema_version', ?)", (str(CATALOG_SCHEMA_VERSION),))
+
+    def __connect(self):
+        # A connection per operation: the catalog is shared by threads and processes
+        conn = sqlite3.connect(self.db_path, timeout = 10)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA foreign_keys=ON")
+        return conn
+
+    def __rel_path(self, folder_path):
+        rel_path = os.path.relpath(os.path.abspath(folder_path), self.root_folder)
+        return "" if rel_path == "." else rel_path.replace(os.sep, "/")
+
+    def __abs_path(self, rel_path):
+        return os.path.join(self.root_folder, *rel_path.split("/")) if rel_path else self.root_folder
+
+    @staticmethod
+    def __parent(rel_path):
+        return rel_path.rsplit("/", 1)[0] if "/" in rel_path else ""
+
+    @staticmethod
+    def __cut(rel_path):
+        for part in reversed(rel_path.split("/")):
+            m = CUT_FOLDER_PATTERN.match(part)
+            if m is not None:
+                return int(m.group(1))
+        return None
+
+    def register_acquisition(self, acq_folder, state = AcquisitionState.LOGGING):
+        """
+        Adds an acquisition folder to the catalog (e.g. when the logging starts). Metadata are read by update_acquisition.
+
+        :param acq_folder: Acquisition folder path.
+        :param state: [Optional] Acquisition state.
+        """
+        rel_path = self.__rel_path(acq_folder)
+        now = time.time()
+        with closing(self.__connect()) as conn:
+            with conn:
+                conn.execute("INSERT INTO acquisitions (rel_path, parent, cut, state, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?) "
+                             "ON CONFLICT (rel_path) DO UPDATE SET state = excluded.state, updated_at = excluded.updated_at",
+                             (rel_path, AcquisitionCatalog.__parent(rel_path), AcquisitionCatalog.__cut(rel_path), state, now, now))
+
+    def set_acquisition_state(self, acq_folder, state):
+        self.__update_fields(acq_folder, state = state)
+
+    def update_acquisition(self, acq_folder, state = None):
+        """
+        Reads the metadata of an acquisition folder (json files, file sizes, integrity report) and stores them in the catalog.
+
+        :param acq_folder: Acquisition folder path.
+        :param state: [Optional] New acquisition state. If None, the state is set to COMPLETE when the acquisition
+            end time is known, otherwise it is left unchanged.
+        :return: True if the acquisition metadata were read, False if the folder json files are missing or invalid.
+        """
+        rel_path = self.__rel_path(acq_folder)
+        mtime = _get_acquisition_mtime(acq_folder)
+        try:
+            metadata = read_acquisition_metadata(acq_folder)
+        except (OSError, ValueError, KeyError, IndexError) as e:
+            log.debug("Acquisition {} metadata not available: {}".format(acq_folder, e))
+            metadata = None
+        now = time.time()
+        with closing(self.__connect()) as conn:
+            with conn:
+                row = conn.execute("SELECT id, state FROM acquisitions WHERE rel_path = ?", (rel_path,)).fetchone()
+                if row is None:
+                    cur = conn.execute("INSERT INTO acquisitions (rel_path, parent, cut, state, created_at) VALUES (?, ?, ?, ?, ?)",
+                                       (rel_path, AcquisitionCatalog.__parent(rel_path), AcquisitionCatalog.__cut(rel_path), AcquisitionState.STOPPED, now))
+                    acq_id, cur_state = cur.lastrowid, AcquisitionState.STOPPED
+                else:
+                    acq_id, cur_state = row["id"], row["state"]
+                if metadata is None:
+                    conn.execute("UPDATE acquisitions SET state = ?, mtime = ?, updated_at = ? WHERE id = ?", (state or cur_state, mtime, now, acq_id))
+                    return False
+
+                start_time = parse_iso_datetime(metadata["start_time"])
+                end_time = parse_iso_datetime(metadata["end_time"])
+                if state is None:
+                    state = AcquisitionState.COMPLETE if end_time is not None else cur_state
+                    if state == AcquisitionState.REMOVED:
+                        state = AcquisitionState.COMPLETE
+                conn.execute("UPDATE acquisitions SET state = ?, name = ?, description = ?, uuid = ?, start_time = ?, end_time = ?, start_ts = ?, end_ts = ?, duration = ?, "
+                             "board_id = ?, fw_id = ?, fw_name = ?, fw_version = ?, interface = ?, size = ?, integrity_status = ?, mtime = ?, updated_at = ? WHERE id = ?",
+                             (state, metadata["name"], metadata["description"], metadata["uuid"], metadata["start_time"], metadata["end_time"],
+                              start_time.timestamp() if start_time is not None else None,
+                              end_time.timestamp() if end_time is not None else None,
+                              (end_time - start_time).total_seconds() if start_time is not None and end_time is not None else None,
+                              metadata["board_id"], metadata["fw_id"], metadata["fw_name"], metadata["fw_version"], metadata["interface"],
+                              metadata["size"], read_integrity_status(acq_folder), mtime, now, acq_id))
+                conn.execute("DELETE FROM components WHERE acq_id = ?", (acq_id,))
+                conn.executemany("INSERT INTO components (acq_id, name, c_type, odr, measodr, dim, data_type, sensitivity, size) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                                 [(acq_id, n, c["c_type"], c["odr"], c["measodr"], c["dim"], c["data_type"], c["sensitivity"], c["file_size"]) for n, c in metadata["components"].items()])
+                conn.execute("DELETE FROM tags WHERE acq_id = ?", (acq_id,))
+                conn.executemany("INSERT INTO tags (acq_id, label, start_s, end_s) VALUES (?, ?, ?, ?)",
+                                 [(acq_id, t["label"], t["start"], t["end"]) for t in metadata["tag_intervals"]])
+        return True
+
+    def move_acquisition(self, src_folder, dst_folder):
+        """
+        Updates the path of a moved acquisition folder (e.g. into its cut_N folder).
+
+        :param src_folder: Previous acquisition folder path.
+        :param dst_folder: New acquisition folder path.
+        """
+        src_rel_path = self.__rel_path(src_folder)
+        dst_rel_path = self.__rel_path(dst_folder)
+        with closing(self.__connect()) as conn:
+            with conn:
+                conn.execute("DELETE FROM acquisitions WHERE rel_path = ?", (dst_rel_path,))
+                cur = conn.execute("UPDATE acquisitions SET rel_path = ?, parent = ?, cut = ?, updated_at = ? WHERE rel_path = ?",
+                                   (dst_rel_path, AcquisitionCatalog.__parent(dst_rel_path), AcquisitionCatalog.__cut(dst_rel_path), time.time(), src_rel_path))
+        if cur.rowcount == 0:
+            self.update_acquisition(dst_folder)
+
+    def remove_acquisitions(self, folder_path, keep_history = True):
+        """
+        Marks as removed (or deletes) the acquisitions of a folder (an acquisition folder or a folder containing acquisitions).
+
+        :param folder_path: Folder path.
+        :param keep_history: [Optional] If True, the catalog entries are kept with REMOVED state (transfer history).
+        :return: The number of acquisitions removed.
+        """
+        where, params = self.__folder_filter(folder_path)
+        with closing(self.__connect()) as conn:
+            with conn:
+                if keep_history:
+                    cur = conn.execute("UPDATE acquisitions SET state = ?, updated_at = ? WHERE " + where, (AcquisitionState.REMOVED, time.time()) + params)
+                else:
+                    cur = conn.execute("DELETE FROM acquisitions WHERE " + where, params)
+                conn.execute("DELETE FROM folders WHERE " + where, params)
+        return cur.rowcount
+
+    def __folder_filter(self, folder_path):
+        rel_path = self.__rel_path(folder_path)
+        if rel_path == "":
+            return "1", ()
+        # '%' and '_' are valid folder name characters: they are escaped to match the sub folders only
+        return "(rel_path = ? OR rel_path LIKE ? ESCAPE '\\')", (rel_path, _escape_like(rel_path) + "/%")
+
+    def __update_fields(self, folder_path, **fields):
+        where, params = self.__folder_filter(folder_path)
+        fields["updated_at"] = time.time()
+        with closing(self.__connect()) as conn:
+            with conn:
+                cur = conn.execute("UPDATE acquisitions SET " + ", ".join("{} = ?".format(k) for k in fields) + " WHERE " + where, tuple(fields.values()) + params)
+        return cur.rowcount
+
+    def set_integrity_status(self, acq_folder, status):
+        """
+        :param acq_folder: Acquisition folder path.
+        :param status: IntegrityStatus value.
+        """
+        return self.__update_fields(acq_folder, integrity_status = status)
+
+    def set_export_state(self, folder_path, state, target = None):
+        """
+        Sets the export state of the acquisitions of a folder (acquisition folder or cut folder).
+
+        :param folder_path: Folder path.
+        :param state: Export state (e.g. TransferState values).
+        :param target: [Optional] Export destination.
+        :return: The number of acquisitions updated.
+        """
+        return self.__update_fields(folder_path, export_state = state, export_target = target, exported_at = time.time())
+
+    def set_transfer_state(self, folder_path, state, target = None):
+        """
+        Sets the transfer state of the acquisitions of a folder (acquisition folder or cut folder).
+
+        :param folder_path: Folder path.
+        :param state: TransferState value.
+        :param target: [Optional] Transfer destination (e.g. the archive path on the USB drive).
+        :return: The number of acquisitions updated.
+        """
+        return self.__update_fields(folder_path, transfer_state = state, transfer_target = target, transferred_at = time.time())
+
+    def sync(self, full = False, max_age = None):
+        """
+        Reconciles the catalog with the acquisitions on disk. Folders whose modification time did not change are not
+        listed again and acquisitions whose json files did not change are not parsed again (unless full is True).
+        Acquisitions no more on disk are marked as REMOVED.
+
+        :param full: [Optional] If True, all the folders are listed and all the acquisitions parsed again.
+        :param max_age: [Optional] If set, the sync is skipped if the last one is more recent than max_age seconds.
+        :return: A dictionary with the number of added, updated and removed acquisitions (None if skipped).
+        """
+        t0 = time.time()
+        with closing(self.__connect()) as conn:
+            if max_age is not None and not full:
+                row = conn.execute("SELECT value FROM meta WHERE key = 'last_sync'").fetchone()
+                if row is not None and t0 - float(row["value"]) < max_age:
+                    return None
+            known_folders = {r["rel_path"]: (r["parent"], r["mtime"]) for r in conn.execute("SELECT rel_path, parent, mtime FROM folders")}
+            known_acqs = {r["rel_path"]: (r["state"], r["mtime"]) for r in conn.execute("SELECT rel_path, state, mtime FROM acquisitions")}
+
+        children = {}
+        for rel_path, (parent, _) in known_folders.items():
+            if rel_path != "":
+                children.setdefault(parent, []).append(rel_path)
+        for rel_path, (state, _) in known_acqs.items():
+            if state != AcquisitionState.REMOVED:
+                children.setdefault(AcquisitionCatalog.__parent(rel_path), []).append(rel_path)
+
+        seen_folders = {}
+        seen_acqs = set()
+        to_update = []
+        stack = [""]
+        while stack:
+            rel_path = stack.pop()
+            abs_path = self.__abs_path(rel_path)
+            try:
+                mtime = os.stat(abs_path).st_mtime
+            except OSError:
+                continue
+            if rel_path != "" and (rel_path in known_acqs and known_acqs[rel_path][0] != AcquisitionState.REMOVED or is_acquisition_folder(abs_path)):
+                seen_acqs.add(rel_path)
+                known = known_acqs.get(rel_path)
+                if full or known is None or known[0] in (AcquisitionState.LOGGING, AcquisitionState.REMOVED) or _get_acquisition_mtime(abs_path) != known[1]:
+                    to_update.append(rel_path)
+                continue
+            seen_folders[rel_path] = (AcquisitionCatalog.__parent(rel_path), mtime)
+            known = known_folders.get(rel_path)
+            if full or known is None or known[1] != mtime:
+                try:
+                    with os.scandir(abs_path) as it:
+                        sub_folders = [rel_path + "/" + e.name if rel_path else e.name for e in it if e.is_dir(follow_symlinks=False)]
+                except OSError:
+                    sub_folders = []
+            else:
+                sub_folders = children.get(rel_path, [])
+            stack.extend(sub_folders)
+
+        for rel_path in to_update:
+            self.update_acquisition(self.__abs_path(rel_path))
+        removed = [p for p, (state, _) in known_acqs.items() if state != AcquisitionState.REMOVED and p not in seen_acqs]
+        with closing(self.__connect()) as conn:
+            with conn:
+                conn.executemany("UPDATE acquisitions SET state = ?, updated_at = ? WHERE rel_path = ?", [(AcquisitionState.REMOVED, t0, p) for p in removed])
+                conn.execute("DELETE FROM folders")
+                conn.executemany("INSERT INTO folders (rel_path, parent, mtime) VALUES (?, ?, ?)", [(p, v[0], v[1]) for p, v in seen_folders.items()])
+                conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('last_sync', ?)", (str(t0),))
+        added = len([p for p in to_update if p not in known_acqs])
+        res = {"added": added, "updated": len(to_update) - added, "removed": len(removed)}
+        log.debug("Acquisition catalog sync ({:.1f} ms): {}".format((time.time() - t0) * 1000, res))
+        return res
+
+    def __row_to_dict(self, conn, row):
+        acq = dict(row)
+        acq["path"] = self.__abs_path(acq["rel_path"])
+        acq["components"] = {r["name"]: {k: r[k] for k in r.keys() if k not in ("acq_id", "name")} for r in conn.execute("SELECT * FROM components WHERE acq_id = ?", (acq["id"],))}
+        acq["tags"] = [{"label": r["label"], "start": r["start_s"], "end": r["end_s"]} for r in conn.execute("SELECT label, start_s, end_s FROM tags WHERE acq_id = ?", (acq["id"],))]
+        return acq
+
+    def get_acquisition(self, acq_folder):
+        """
+        :param acq_folder: Acquisition folder path.
+        :return: The catalog entry of the acquisition (dictionary, with components and tags), or None.
+        """
+        with closing(self.__connect()) as conn:
+            row = conn.execute("SELECT * FROM acquisitions WHERE rel_path = ?", (self.__rel_path(acq_folder),)).fetchone()
+            return self.__row_to_dict(conn, row) if row is not None else None
+
+    def query(self, component = None, tags = None, since = None, until = None, board_id = None, fw_id = None, fw_name = None, cut = None,
+              state = None, integrity_status = None, export_state = None, transfer_state = None, min_duration = None, include_removed = False,
+              limit = None, details = True):
+        """
+        Queries the acquisitions. All the specified conditions must be satisfied.
+
+        :param component: [Optional] Component name (or list of names) that must be active.
+        :param tags: [Optional] Tag label (or list of labels): at least one must be present.
+        :param since: [Optional] Minimum start time (datetime or ISO8601 string, naive = local time).
+        :param until: [Optional] Maximum start time (datetime or ISO8601 string, naive = local time).
+        :param board_id: [Optional] Board ID.
+        :param fw_id: [Optional] Firmware ID.
+        :param fw_name: [Optional] Firmware name.
+        :param cut: [Optional] Cut number (or list of cut numbers).
+        :param state: [Optional] AcquisitionState value.
+        :param integrity_status: [Optional] IntegrityStatus value.
+        :param export_state: [Optional] Export state.
+        :param transfer_state: [Optional] TransferState value.
+        :param min_duration: [Optional] Minimum duration [s].
+        :param include_removed: [Optional] If True, the acquisitions no more on disk are returned too.
+        :param limit: [Optional] Maximum number of results.
+        :param details: [Optional] If True, components and tags of each acquisition are returned too.
+        :return: List of dictionaries, in chronological order.
+        """
+        where, params = [], []
+        def add_in(column, values):
+            values = [values] if isinstance(values, (str, int)) else list(values)
+            where.append("{} IN ({})".format(column, ", ".join("?" * len(values))))
+            params.extend(values)
+        if component is not None:
+            components = [component] if isinstance(component, str) else list(component)
+            for c in components:
+                where.append("id IN (SELECT acq_id FROM components WHERE name = ?)")
+                params.append(c)
+        if tags is not None:
+            tags = [tags] if isinstance(tags, str) else list(tags)
+            where.append("id IN (SELECT acq_id FROM tags WHERE label IN ({}))".format(", ".join("?" * len(tags))))
+            params.extend(tags)
+        if since is not None:
+            where.append("start_ts >= ?")
+            params.append(parse_iso_datetime(since).timestamp())
+        if until is not None:
+            where.append("start_ts <= ?")
+            params.append(parse_iso_datetime(until).timestamp())
+        for column, value in (("board_id", board_id), ("fw_id", fw_id), ("fw_name", fw_name), ("cut", cut), ("state", state),
+                              ("integrity_status", integrity_status), ("export_state", export_state), ("transfer_state", transfer_state)):
+            if value is not None:
+                add_in(column, value)
+        if min_duration is not None:
+            where.append("duration >= ?")
+            params.append(min_duration)
+        if not include_removed and state is None:
+            where.append("state != ?")
+            params.append(AcquisitionState.REMOVED)
+        sql = "SELECT * FROM acquisitions" + (" WHERE " + " AND ".join(where) if where else "") + " ORDER BY start_ts IS NULL, start_ts, rel_path"
+        if limit is not None:
+            sql += " LIMIT {}".format(int(limit))
+        with closing(self.__connect()) as conn:
+            rows = conn.execute(sql, params).fetchall()
+            if details:
+                return [self.__row_to_dict(conn, r) for r in rows]
+            return [dict(r, path = self.__abs_path(r["rel_path"])) for r in rows]
+
+    def get_cut_folders(self, include_removed = False):
+        """
+        :param include_removed: [Optional] If True, the cut folders with only removed acquisitions are returned too.
+        :return: List of dictionaries {"cut", "rel_path", "path", "acquisitions", "size", "transferred"} sorted by cut number.
+            Empty cut folders found by the last sync are included.
+        """
+        cuts = {}
+        with closing(self.__connect()) as conn:
+            for r in conn.execute("SELECT rel_path FROM folders WHERE parent = ''"):
+                if CUT_FOLDER_PATTERN.match(r["rel_path"]):
+                    cuts[r["rel_path"]] = {"acquisitions": 0, "size": 0, "transferred": 0, "removed": 0}
+            for r in conn.execute("SELECT parent, state, transfer_state, size FROM acquisitions WHERE cut IS NOT NULL"):
+                top = r["parent"].split("/")[0]
+                if not CUT_FOLDER_PATTERN.match(top):
+                    continue
+                c = cuts.setdefault(top, {"acquisitions": 0, "size": 0, "transferred": 0, "removed": 0})
+                if r["state"] == AcquisitionState.REMOVED:
+                    c["removed"] += 1
+                    continue
+                c["acquisitions"] += 1
+                c["size"] += r["size"] or 0
+                c["transferred"] += 1 if r["transfer_state"] == TransferState.TRANSFERRED else 0
+        res = []
+        for rel_path, c in cuts.items():
+            if not include_removed and c["acquisitions"] == 0 and c["removed"] > 0:
+                continue
+            res.append({"cut": int(CUT_FOLDER_PATTERN.match(rel_path).group(1)), "rel_path": rel_path, "path": self.__abs_path(rel_path),
+                        "acquisitions": c["acquisitions"], "size": c["size"], "transferred": c["acquisitions"] > 0 and c["transferred"] == c["acquisitions"]})
+        return sorted(res, key = lambda c: c["cut"])
+
+    def get_stats(self):
+        """
+        :return: Dictionary with the number of acquisitions and cut folders, total size and the counts by state,
+            integrity status and transfer state (removed acquisitions excluded from the totals).
+        """
+        with closing(self.__connect()) as conn:
+            row = conn.execute("SELECT COUNT(*) AS n, COALESCE(SUM(size), 0) AS size, COALESCE(SUM(duration), 0) AS duration FROM acquisitions WHERE state != ?", (AcquisitionState.REMOVED,)).fetchone()
+            stats = {"acquisitions": row["n"], "size": row["size"], "duration": row["duration"]}
+            for column in ("state", "integrity_status", "transfer_state"):
+                stats["by_" + column] = {r[0]: r[1] for r in conn.execute("SELECT {0}, COUNT(*) FROM acquisitions GROUP BY {0}".format(column))}
+            last_sync = conn.execute("SELECT value FROM meta WHERE key = 'last_sync'").fetchone()
+            stats["last_sync"] = float(last_sync["value"]) if last_sync is not None else None
+        stats["cut_folders"] = len(self.get_cut_folders())
+        return stats
@@ -0,0 +1,292 @@
+# *****************************************************************************
+#  * @file    alignment.py
+#  * @author  SRA
+# ******************************************************************************
+# * @attention
+# *
+# * Copyright (c) 2022 STMicroelectronics.
+# * All rights reserved.
+# *
+# * This software is licensed under terms that can be found in the LICENSE file
+# * in the root directory of this software component.
+# * If no LICENSE file comes with this software, it is provided AS-IS.
+# *
+# *
+# ******************************************************************************
+#
+
+"""
+Streaming time alignment of several component streams on a common, uniform time base.
+
+StreamAligner receives the (data, timestamps) chunks of each stream in any order and returns the
+grid points that every stream already covers, resampled with one of the AlignmentMethod methods:
+
+- nearest: sample closest in time,
+- linear: linear interpolation between the two samples around each grid time,
+- polyphase: anti-aliasing low-pass FIR (windowed sinc, cutoff at the target Nyquist frequency)
+  applied to the stream, then linear interpolation. The filter is designed from the nominal rate of
+  each stream (stream_rates, required) and works on the real timestamps, so it is not a strict
+  rational polyphase resampler, but it removes the aliasing of plain decimation,
+- asof: last sample at or before each grid time (optionally within a tolerance, NaN otherwise).
+
+Only the samples needed by the next grid points (and the FIR history) are kept between chunks,
+so the output does not depend on how the input streams are chunked. A stream that ends without any
+sample ends the alignment, and max_buffered_samples bounds the samples kept while a stream is silent.
+"""
+
+import numpy as np
+
+import stdatalog_core.HSD_utils.logger as logger
+
+log = logger.get_logger(__name__)
+
+class AlignmentMethod:
+    NEAREST = "nearest"
+    LINEAR = "linear"
+    POLYPHASE = "polyphase"
+    ASOF = "asof"
+
+ALIGNMENT_METHODS = (AlignmentMethod.NEAREST, AlignmentMethod.LINEAR, AlignmentMethod.POLYPHASE, AlignmentMethod.ASOF)
+
+# FIR length of the polyphase method: taps per decimation factor unit (odd length, capped)
+FIR_TAPS_PER_RATIO = 8
+FIR_MAX_TAPS = 2047
+
+def design_lowpass_fir(cutoff, nof_taps):
+    """
+    Windowed sinc (Hamming) low-pass FIR with unit DC gain.
+
+    :param cutoff: Cutoff frequency normalized to the sampling rate (0 < cutoff < 0.5).
+    :param nof_taps: Number of taps (odd).
+    :return: numpy float64 array of taps.
+    """
+    n = np.arange(nof_taps) - (nof_taps - 1) / 2
+    taps = 2 * cutoff * np.sinc(2 * cutoff * n) * np.hamming(nof_taps)
+    return taps / np.sum(taps)
+
+def nearest_indices(times, grid):
+    """Index of the sample of times (sorted) closest to each grid time."""
+    idx = np.clip(np.searchsorted(times, grid), 1, len(times) - 1)
+    prev_closer = (grid - times[idx - 1]) <= (times[idx] - grid)
+    return idx - prev_closer
+
+def asof_indices(times, grid):
+    """Index of the last sample of times (sorted) at or before each grid time (-1 if none)."""
+    return np.searchsorted(times, grid, side="right") - 1
+
+def linear_interpolate(times, data, grid):
+    """Vectorized np.interp over all the columns of data (n, dim)."""
+    idx = np.clip(np.searchsorted(times, grid, side="right"), 1, len(times) - 1)
+    t0 = times[idx - 1]
+    dt = times[idx] - t0
+    w = np.divide(grid - t0, dt, out=np.zeros_like(grid), where=dt != 0)
+    w = np.clip(w, 0, 1)[:, None]
+    return data[idx - 1] * (1 - w) + data[idx] * w
+
+class _FirState:
+    """Incremental FIR filtering of a stream (same output as a single 'valid' convolution over the whole stream)."""
+    def __init__(self, taps):
+        self.taps = taps
+        self.half = (len(taps) - 1) // 2
+        self.tail_t = None
+        self.tail_x = None
+
+    def process(self, times, data, flush = False):
+        if self.tail_t is None:
+            # Edge padding at the stream start
+            times = np.concatenate((np.full(self.half, times[0]), times))
+            data = np.concatenate((np.repeat(data[:1], self.half, axis=0), data))
+        else:
+            times = np.concatenate((self.tail_t, times))
+            data = np.concatenate((self.tail_x, data))
+        if flush and len(times) > 0:
+            times = np.concatenate((times, np.full(self.half, times[-1])))
+            data = np.concatenate((data, np.repeat(data[-1:], self.half, axis=0)))
+        nof_taps = len(self.taps)
+        n_out = len(times) - nof_taps + 1
+        if n_out <= 0:
+            self.tail_t, self.tail_x = times, data
+            return times[:0], data[:0]
+        out = np.empty((n_out, data.shape[1]), dtype=np.float64)
+        for col in range(data.shape[1]):
+            out[:, col] = np.convolve(data[:, col], self.taps[::-1], mode="valid")
+        out_t = times[self.half:self.half + n_out]
+        self.tail_t = times[n_out:]
+        self.tail_x = data[n_out:]
+        return out_t, out
+
+class StreamAligner:
+    """
+    Aligns several (data, timestamps) streams on a common uniform time base.
+
+    :param names: Stream names.
+    :param target_rate: Rate [Hz] of the common time base.
+    :param method: [Optional] AlignmentMethod (default: linear).
+    :param start_time: [Optional] First grid time. Default: the latest first timestamp of the streams.
+    :param end_time: [Optional] Grid times are < end_time (-1: no limit).
+    :param tolerance: [Optional] asof/nearest only: maximum distance [s] between a grid time and the
+        selected sample, NaN is returned beyond it. The output of asof, and of nearest with a tolerance, is
+        always float64 (the dtype does not depend on the chunks with invalid samples), the input dtype otherwise.
+    :param stream_rates: [Optional] Dictionary name -> nominal rate [Hz], used by the polyphase method
+        (required by it for every stream).
+    :param max_buffered_samples: [Optional] Maximum number of samples buffered per stream while waiting for
+        the others (e.g. when a stream produces no data): beyond it the oldest samples are dropped (with a warning).
+        None: no limit.
+    :raise ValueError: If the method is unknown, target_rate is not > 0 or a polyphase stream rate is missing.
+    """
+    def __init__(self, names, target_rate, method = AlignmentMethod.LINEAR, start_time = None, end_time = -1, tolerance = None, stream_rates = None,
+                 max_buffered_samples = None):
+        if method not in ALIGNMENT_METHODS:
+            raise ValueError("Unknown alignment method: {} (valid: {})".format(method, ", ".join(ALIGNMENT_METHODS)))
+        if target_rate <= 0:
+            raise ValueError("target_rate must be > 0")
+        self.names = list(names)
+        stream_rates = stream_rates or {}
+        if method == AlignmentMethod.POLYPHASE:
+            missing_rates = [n for n in self.names if not stream_rates.get(n)]
+            if missing_rates:
+                raise ValueError("The polyphase method needs the nominal rate of every stream (missing: {})".format(", ".join(missing_rates)))
+        self.target_rate = float(target_rate)
+        self.method = method
+        self.start_time = start_time
+        self.end_time = end_time
+        self.tolerance = tolerance
+        self.stream_rates = stream_rates
+        self.max_buffered_samples = max_buffered_samples
+        # NaN marks the invalid samples: float64 output for every chunk
+        self.__float_output = method == AlignmentMethod.ASOF or (method == AlignmentMethod.NEAREST and tolerance is not None)
+        self.__nof_dropped = {n: 0 for n in self.names}
+        self.__times = {n: None for n in self.names}
+        self.__data = {n: None for n in self.names}
+        self.__fir = {}
+        self.__finished = set()
+        self.__next_k = 0
+        self.__done = False
+
+    def __get_fir(self, name):
+        if name not in self.__fir:
+            ratio = self.stream_rates[name] / self.target_rate
+            if ratio <= 1:
+                self.__fir[name] = None
+            else:
+                nof_taps = min(int(FIR_TAPS_PER_RATIO * ratio) | 1, FIR_MAX_TAPS)
+                self.__fir[name] = _FirState(design_lowpass_fir(0.5 / ratio, nof_taps))
+                log.debug("{}: anti-aliasing FIR, {} taps (rate ratio {:.2f})".format(name, nof_taps, ratio))
+        return self.__fir[name]
+
+    def __append(self, name, times, data):
+        if self.__times[name] is None:
+            self.__times[name] = times
+            self.__data[name] = data
+        else:
+            self.__times[name] = np.concatenate((self.__times[name], times))
+            self.__data[name] = np.concatenate((self.__data[name], data))
+        nof_samples = len(self.__times[name])
+        if self.max_buffered_samples is not None and nof_samples > self.max_buffered_samples:
+            drop = nof_samples - self.max_buffered_samples
+            if self.__nof_dropped[name] == 0:
+                log.warning("{}: alignment buffer full (waiting for {}), oldest samples dropped".format(
+                    name, ", ".join(n for n in self.names if n != name and self.get_horizon(n) is None) or "the other streams"))
+            self.__nof_dropped[name] += drop
+            self.__times[name] = self.__times[name][drop:]
+            self.__data[name] = self.__data[name][drop:]
+
+    def push(self, name, data, timestamps):
+        """
+        Adds the next chunk of a stream.
+
+        :param name: Stream name.
+        :param data: numpy array (n, dim) or (n,).
+        :param timestamps: numpy array (n, 1) or (n,), increasing and following the previous chunk.
+        """
+        times = np.asarray(timestamps, dtype=np.float64).reshape(-1)
+        if len(times) == 0:
+            return
+        data = np.asarray(data)
+        data = data.reshape(len(times), -1)
+        if self.method == AlignmentMethod.POLYPHASE:
+            fir = self.__get_fir(name)
+            if fir is not None:
+                times, data = fir.process(times, data.astype(np.float64))
+                if len(times) == 0:
+                    return
+        self.__append(name, times, data)
+
+    def finish(self, name):
+        """
+        Marks the end of a stream: the common time base cannot go beyond its last sample.
+        """
+        fir = self.__fir.get(name)
+        if fir is not None and fir.tail_t is not None:
+            times, data = fir.process(fir.tail_t[:0], fir.tail_x[:0], flush=True)
+            if len(times):
+                self.__append(name, times, data)
+        self.__finished.add(name)
+        if self.__times[name] is None:
+            # A stream without data: there is no common time base
+            self.__done = True
+
+    def is_done(self):
+        return self.__done
+
+    def get_nof_dropped_samples(self, name):
+        """Number of samples of a stream dropped because of max_buffered_samples."""
+        return self.__nof_dropped[name]
+
+    def get_horizon(self, name):
+        """Last buffered time of a stream (None if no data has been received yet)."""
+        times = self.__times[name]
+        return None if times is None or len(times) == 0 else times[-1]
+
+    def pop(self):
+        """
+        Returns the grid points covered by all the streams and not returned yet.
+
+        :return: (aligned, timestamps): dictionary name -> numpy array (n, dim) and numpy array (n, 1),
+            or None if no new grid point is available.
+        """
+        if self.__done or any(self.__times[n] is None for n in self.names):
+            return None
+        if self.start_time is None:
+            self.start_time = max(self.__times[n][0] for n in self.names)
+        horizon = min(self.__times[n][-1] for n in self.names)
+        last_k = int(np.floor((horizon - self.start_time) * self.target_rate + 1e-9))
+        if self.end_time != -1:
+            end_k = int(np.ceil((self.end_time - self.start_time) * self.target_rate - 1e-9)) - 1
+            if last_k >= end_k:
+                last_k = end_k
+                self.__done = True
+        if any(n in self.__finished and self.__times[n][-1] == horizon for n in self.names):
+            # The stream that limits the time base has ended
+            self.__done = True
+        if last_k < self.__next_k:
+            return None
+        grid = self.start_time + np.arange(self.__next_k, last_k + 1) / self.target_rate
+        self.__next_k = last_k + 1
+        next_grid = self.start_time + self.__next_k / self.target_rate
+
+        aligned = {}
+        for n in self.names:
+            times = self.__times[n]
+            data = self.__data[n]
+            if self.method == AlignmentMethod.NEAREST:
+                idx = nearest_indices(times, grid) if len(times) > 1 else np.zeros(len(grid), dtype=np.int64)
+                out = data[idx]
+                dist = np.abs(times[idx] - grid)
+            elif self.method == AlignmentMethod.ASOF:
+                idx = asof_indices(times, grid)
+                out = data[np.maximum(idx, 0)]
+                dist = np.where(idx >= 0, grid - times[np.maximum(idx, 0)], np.inf)
+            else:
+                out = linear_interpolate(times, data, grid) if len(times) > 1 else np.repeat(data[:1].astype(np.float64), len(grid), axis=0)
+                dist = None
+            if self.__float_output:
+                invalid = dist > self.tolerance if self.tolerance is not None else np.isinf(dist)
+                out = out.astype(np.float64, copy=False)
+                out[invalid] = np.nan
+            aligned[n] = out
+            # Carry over: keep the last sample before the next grid time and everything after it
+            keep = max(int(np.searchsorted(times, next_grid, side="right")) - 1, 0)
+            self.__times[n] = times[keep:]
+            self.__data[n] = data[keep:]
+        return aligned, grid.reshape(-1, 1)
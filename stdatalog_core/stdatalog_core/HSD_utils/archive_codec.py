@@ -0,0 +1,727 @@
+# *****************************************************************************
+#  * @file    archive_codec.py
+#  * @author  SRA
+# ******************************************************************************
+# * @attention
+# *
+# * Copyright (c) 2022 STMicroelectronics.
+# * All rights reserved.
+# *
+# * This software is licensed under terms that can be found in the LICENSE file
+# * in the root directory of this software component.
+# * If no LICENSE file comes with this software, it is provided AS-IS.
+# *
+# *
+# ******************************************************************************
+#
+
+"""
+Compact, lossless archive format for HSD_v2 acquisition folders.
+
+An archive is a zip file holding the acquisition json files (deflated) and, for each component
+.dat file, a "<comp_name>.dat.sdc" member (stored) made of independently compressed sections:
+
+- the packet counters, delta coded (they are almost always a constant step),
+- the payload (counters stripped), split in frame aligned blocks. In each block the samples are
+  de-interleaved per axis and delta coded (XOR of the bit patterns for floating point types),
+  the frame timestamps are delta coded too, then every section is byte-shuffled and compressed,
+- the trailing partial frame and partial packet, stored as they are.
+
+The layout of every member (section offsets, block first/last timestamps) is described by the
+archive_manifest.json member, written last. The original .dat files are rebuilt byte by byte
+(sha256 checked), and AcquisitionArchive reads the samples of a time range decoding only the
+blocks that overlap it, with the same per-sample time model as HSDatalog_v2.
+
+Sections are compressed with zstandard when the package is installed, otherwise with zlib
+(lzma can be selected explicitly). The codec is recorded in the manifest.
+"""
+
+import os
+import json
+import lzma
+import zlib
+import struct
+import shutil
+import hashlib
+import zipfile
+
+import numpy as np
+
+from stdatalog_core.HSD.utils.type_conversion import TypeConversion
+from stdatalog_core.HSD_utils.exceptions import AcquisitionArchiveError, MissingComponentModelError
+from stdatalog_core.HSD_utils.integrity import DATA_PROTOCOL_SIZE, get_packet_counters
+import stdatalog_core.HSD_utils.logger as logger
+from stdatalog_pnpl.DTDL.dtdl_utils import ComponentTypeEnum
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+log = logger.get_logger(__name__)
+
+ARCHIVE_FORMAT_VERSION = 1
+ARCHIVE_EXTENSION = ".hsdz"
+ARCHIVE_MANIFEST_FILE_NAME = "archive_manifest.json"
+ARCHIVE_MEMBER_EXTENSION = ".sdc"
+ACQUISITION_INFO_FILE_NAME = "acquisition_info.json"
+DEVICE_CONFIG_FILE_NAME = "device_config.json"
+
+# Uncompressed payload bytes per block: the granularity of the time range reads
+DEFAULT_BLOCK_SIZE = 4 * 1024 * 1024
+HASH_CHUNK_SIZE = 16 * 1024 * 1024
+TIMESTAMP_SIZE = 8
+
+class ArchiveCodec:
+    ZSTD = "zstd"
+    ZLIB = "zlib"
+    LZMA = "lzma"
+
+class ComponentEncoding:
+    FRAMES = "frames"   # samples + timestamp frames (samples_per_ts > 0)
+    ROWS = "rows"       # samples only (samples_per_ts == 0)
+    BYTES = "bytes"     # payload compressed as it is (algorithms, actuators, unknown layouts)
+
+# Data types whose samples are delta coded as integers. Floating point samples are XOR coded.
+_FLOAT_TYPES = ("float", "float_t", "float32", "double", "double_t", "float64")
+
+def get_default_codec():
+    return ArchiveCodec.ZSTD if zstandard is not None else ArchiveCodec.ZLIB
+
+def _get_compress_function(codec, level = None):
+    if codec == ArchiveCodec.ZSTD:
+        if zstandard is None:
+            raise AcquisitionArchiveError("zstd codec requested but the zstandard package is not installed")
+        return zstandard.ZstdCompressor(level=3 if level is None else level).compress
+    if codec == ArchiveCodec.ZLIB:
+        lvl = 6 if level is None else level
+        return lambda data: zlib.compress(data, lvl)
+    if codec == ArchiveCodec.LZMA:
+        preset = 6 if level is None else level
+        return lambda data: lzma.compress(data, preset=preset)
+    raise AcquisitionArchiveError("Unknown archive codec: {}".format(codec))
+
+def _get_decompress_function(codec):
+    if codec == ArchiveCodec.ZSTD:
+        if zstandard is None:
+            raise AcquisitionArchiveError("This archive is zstd compressed: install the zstandard package to read it")
+        dctx = zstandard.ZstdDecompressor()
+        return lambda data, raw_len: dctx.decompress(data, max_output_size=raw_len)
+    if codec == ArchiveCodec.ZLIB:
+        return lambda data, raw_len: zlib.decompress(data)
+    if codec == ArchiveCodec.LZMA:
+        return lambda data, raw_len: lzma.decompress(data)
+    raise AcquisitionArchiveError("Unknown archive codec: {}".format(codec))
+
+def get_samples_per_ts(comp_status):
+    spts = comp_status.get("samples_per_ts", 0)
+    if isinstance(spts, int):
+        return spts
+    return spts.get("val", 0) if spts else 0
+
+def get_data_packet_size(comp_status, interface):
+    """
+    Returns the number of payload bytes per packet of a component .dat file (counter excluded).
+
+    :param comp_status: Component status dictionary.
+    :param interface: Acquisition interface (0:sd card, 1:usb, 2:ble, 3:serial).
+    :return: The packet data size, or None if it is not available.
+    """
+    if interface == 0:
+        sd_dps = comp_status.get("sd_dps")
+        return sd_dps - DATA_PROTOCOL_SIZE if sd_dps else None
+    key = {1: "usb_dps", 2: "ble_dps", 3: "serial_dps"}.get(interface)
+    return comp_status.get(key) if key is not None else None
+
+def get_component_layout(comp_name, comp_status):
+    """
+    Returns the payload layout used to encode a component stream.
+
+    :param comp_name: Component name.
+    :param comp_status: Component status dictionary.
+    :return: Dictionary with encoding (ComponentEncoding), data_type, dim, samples_per_ts and frame_size.
+    """
+    data_type = comp_status.get("data_type")
+    dim = comp_status.get("dim", 1)
+    if comp_status.get("c_type") != ComponentTypeEnum.SENSOR.value or data_type is None or not isinstance(dim, int) or dim <= 0:
+        return {"encoding": ComponentEncoding.BYTES}
+    try:
+        sample_size = TypeConversion.check_type_length(data_type)
+    except KeyError:
+        return {"encoding": ComponentEncoding.BYTES}
+    spts = get_samples_per_ts(comp_status)
+    layout = {"data_type": data_type, "dim": dim, "samples_per_ts": spts, "sample_size": sample_size}
+    if spts > 0:
+        layout["encoding"] = ComponentEncoding.FRAMES
+        layout["frame_size"] = spts * dim * sample_size + TIMESTAMP_SIZE
+    else:
+        layout["encoding"] = ComponentEncoding.ROWS
+        layout["frame_size"] = dim * sample_size
+    return layout
+
+def _shuffle(array):
+    """Byte planes of a 2D (axes, n) array: (axes, itemsize, n) bytes, so that equal bytes are contiguous."""
+    a = np.ascontiguousarray(array)
+    return a.view(np.uint8).reshape(a.shape[0], a.shape[1], a.itemsize).transpose(0, 2, 1).tobytes()
+
+def _unshuffle(data, dtype, nof_axes, n):
+    itemsize = np.dtype(dtype).itemsize
+    planes = np.frombuffer(data, dtype=np.uint8).reshape(nof_axes, itemsize, n)
+    return np.ascontiguousarray(planes.transpose(0, 2, 1)).view(dtype).reshape(nof_axes, n)
+
+def _delta_encode(values):
+    d = values.copy()
+    d[:, 1:] -= values[:, :-1]
+    return d
+
+def _delta_decode(deltas):
+    return np.cumsum(deltas, axis=1, dtype=deltas.dtype)
+
+def _xor_encode(values):
+    d = values.copy()
+    d[:, 1:] ^= values[:, :-1]
+    return d
+
+def _xor_decode(deltas):
+    return np.bitwise_xor.accumulate(deltas, axis=1)
+
+def _int32_to_int24(values):
+    return np.ascontiguousarray(values.astype('<i4').view(np.uint8).reshape(-1, 4)[:, :3]).reshape(-1)
+
+def encode_samples(raw, data_type, dim):
+    """
+    De-interleaves and delta codes the samples of a block.
+
+    :param raw: numpy uint8 array with an integer number of rows (dim samples of data_type).
+    :param data_type: Sample data type (as in the component status).
+    :param dim: Number of axes.
+    :return: The shuffled bytes to compress.
+    """
+    if data_type in ("int24", "int24_t"):
+        return _shuffle(_delta_encode(TypeConversion.decode_int24(raw).reshape(-1, dim).T))
+    if data_type in _FLOAT_TYPES:
+        itemsize = TypeConversion.check_type_length(data_type)
+        return _shuffle(_xor_encode(raw.view('<u{}'.format(itemsize)).reshape(-1, dim).T))
+    dtype = np.dtype(TypeConversion.get_np_dtype(data_type)).newbyteorder('<')
+    return _shuffle(_delta_encode(raw.view(dtype).reshape(-1, dim).T))
+
+def decode_samples(data, data_type, dim, nof_rows):
+    """
+    Inverse of encode_samples.
+
+    :return: numpy uint8 array with the original interleaved sample bytes.
+    """
+    if data_type in ("int24", "int24_t"):
+        values = _delta_decode(_unshuffle(data, '<i4', dim, nof_rows))
+        return _int32_to_int24(values.T.reshape(-1))
+    if data_type in _FLOAT_TYPES:
+        itemsize = TypeConversion.check_type_length(data_type)
+        values = _xor_decode(_unshuffle(data, '<u{}'.format(itemsize), dim, nof_rows))
+    else:
+        dtype = np.dtype(TypeConversion.get_np_dtype(data_type)).newbyteorder('<')
+        values = _delta_decode(_unshuffle(data, dtype, dim, nof_rows))
+    return np.ascontiguousarray(values.T).view(np.uint8).reshape(-1)
+
+def _get_member_data_offset(fp, zinfo):
+    fp.seek(zinfo.header_offset)
+    header = fp.read(30)
+    if header[:4] != b"PK\x03\x04":
+        raise AcquisitionArchiveError("Bad local header for archive member {}".format(zinfo.filename))
+    name_len, extra_len = struct.unpack("<HH", header[26:30])
+    return zinfo.header_offset + 30 + name_len + extra_len
+
+def _hash_file(file_path):
+    h = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        while True:
+            chunk = f.read(HASH_CHUNK_SIZE)
+            if not chunk:
+                break
+            h.update(chunk)
+    return h.hexdigest()
+
+class _SectionWriter:
+    def __init__(self, fout, compress):
+        self.fout = fout
+        self.compress = compress
+        self.offset = 0
+
+    def write(self, data):
+        data = bytes(data)
+        cdata = self.compress(data)
+        section = {"o": self.offset, "n": len(cdata), "r": len(data)}
+        self.fout.write(cdata)
+        self.offset += len(cdata)
+        return section
+
+def _encode_component(dat_path, comp_name, comp_status, interface, writer, block_size):
+    file_size = os.path.getsize(dat_path)
+    if file_size > 0:
+        mm = np.memmap(dat_path, dtype=np.uint8, mode='r')
+    else:
+        mm = np.empty(0, dtype=np.uint8)
+    data_packet_size = get_data_packet_size(comp_status, interface) if comp_status is not None else None
+    layout = get_component_layout(comp_name, comp_status) if comp_status is not None else {"encoding": ComponentEncoding.BYTES}
+
+    desc = dict(layout)
+    desc["original_size"] = file_size
+    if data_packet_size:
+        packet_size = data_packet_size + DATA_PROTOCOL_SIZE
+        nof_packets = file_size // packet_size
+        counters = get_packet_counters(mm, packet_size)
+        desc["data_packet_size"] = data_packet_size
+        desc["data_protocol_size"] = DATA_PROTOCOL_SIZE
+        desc["nof_packets"] = nof_packets
+        desc["counters"] = writer.write(_shuffle(_delta_encode(counters.reshape(1, -1)))) if nof_packets else None
+        payload_len = nof_packets * data_packet_size
+        packets = mm[:nof_packets * packet_size].reshape(-1, packet_size)
+        def get_payload(start, end):
+            k0 = start // data_packet_size
+            k1 = -(-end // data_packet_size)
+            chunk = packets[k0:k1, DATA_PROTOCOL_SIZE:].reshape(-1)
+            return chunk[start - k0 * data_packet_size:end - k0 * data_packet_size]
+        desc["file_tail"] = writer.write(mm[nof_packets * packet_size:].tobytes())
+    else:
+        # No packet structure known: the whole file is the payload
+        desc["encoding"] = layout["encoding"] = ComponentEncoding.BYTES
+        payload_len = file_size
+        def get_payload(start, end):
+            return mm[start:end]
+
+    blocks = []
+    if layout["encoding"] == ComponentEncoding.BYTES:
+        for start in range(0, payload_len, block_size):
+            end = min(start + block_size, payload_len)
+            blocks.append({"bytes": writer.write(get_payload(start, end).tobytes())})
+        encoded_len = payload_len
+    else:
+        frame_size = layout["frame_size"]
+        nof_frames = payload_len // frame_size
+        frames_per_block = max(1, block_size // frame_size)
+        data_size = frame_size - TIMESTAMP_SIZE if layout["encoding"] == ComponentEncoding.FRAMES else frame_size
+        for first in range(0, nof_frames, frames_per_block):
+            n = min(frames_per_block, nof_frames - first)
+            frames = get_payload(first * frame_size, (first + n) * frame_size).reshape(n, frame_size)
+            block = {"first_frame": first, "frames": n}
+            block["samples"] = writer.write(encode_samples(np.ascontiguousarray(frames[:, :data_size]).reshape(-1), layout["data_type"], layout["dim"]))
+            if layout["encoding"] == ComponentEncoding.FRAMES:
+                ts = np.ascontiguousarray(frames[:, data_size:]).view('<u8').reshape(1, -1)
+                block["timestamps"] = writer.write(_shuffle(_delta_encode(ts)))
+                ts_values = ts.view('<f8')
+                block["t0"] = float(ts_values[0, 0])
+                block["t1"] = float(ts_values[0, -1])
+            blocks.append(block)
+        desc["nof_frames"] = nof_frames
+        encoded_len = nof_frames * frame_size
+    desc["payload_tail"] = writer.write(get_payload(encoded_len, payload_len).tobytes()) if payload_len > encoded_len else None
+    desc["blocks"] = blocks
+    del mm
+    return desc
+
+def create_archive(acquisition_folder, archive_path = None, codec = None, level = None, block_size = DEFAULT_BLOCK_SIZE, verify = True):
+    """
+    Encodes an HSD_v2 acquisition folder into a single compressed archive.
+
+    :param acquisition_folder: Acquisition folder path.
+    :param archive_path: [Optional] Output archive path. Default: acquisition folder + ARCHIVE_EXTENSION.
+    :param codec: [Optional] ArchiveCodec (default: zstd if available, otherwise zlib).
+    :param level: [Optional] Compression level of the codec.
+    :param block_size: [Optional] Uncompressed payload bytes per block (time range read granularity).
+    :param verify: [Optional] If True, every .dat file is decoded back from the archive and its sha256 checked.
+    :return: The archive path.
+    """
+    acquisition_folder = os.path.normpath(acquisition_folder)
+    if archive_path is None:
+        archive_path = acquisition_folder + ARCHIVE_EXTENSION
+    codec = codec or get_default_codec()
+    compress = _get_compress_function(codec, level)
+
+    acq_info_path = os.path.join(acquisition_folder, ACQUISITION_INFO_FILE_NAME)
+    device_config_path = os.path.join(acquisition_folder, DEVICE_CONFIG_FILE_NAME)
+    if not os.path.exists(acq_info_path) or not os.path.exists(device_config_path):
+        raise AcquisitionArchiveError("{} is not an HSD_v2 acquisition folder".format(acquisition_folder))
+    with open(acq_info_path, "r") as f:
+        interface = json.load(f).get("interface")
+    with open(device_config_path, "r") as f:
+        device_config = json.load(f)
+    device = device_config["devices"][0] if "devices" in device_config else device_config
+    comp_statuses = {}
+    for c in device.get("components", []):
+        comp_name = list(c.keys())[0]
+        if isinstance(c[comp_name], dict):
+            comp_statuses[comp_name] = c[comp_name]
+
+    manifest = {
+        "format": "hsd_archive",
+        "version": ARCHIVE_FORMAT_VERSION,
+        "codec": codec,
+        "acquisition": os.path.basename(acquisition_folder),
+        "files": [],
+        "components": {},
+    }
+    tmp_path = archive_path + ".part"
+    try:
+        with zipfile.ZipFile(tmp_path, "w", allowZip64=True) as zf:
+            for dirpath, dirnames, filenames in os.walk(acquisition_folder):
+                dirnames.sort()
+                for file_name in sorted(filenames):
+                    file_path = os.path.join(dirpath, file_name)
+                    arcname = os.path.relpath(file_path, acquisition_folder).replace(os.sep, "/")
+                    if dirpath == acquisition_folder and file_name.endswith(".dat"):
+                        comp_name = file_name[:-len(".dat")]
+                        member = file_name + ARCHIVE_MEMBER_EXTENSION
+                        with zf.open(zipfile.ZipInfo(member, date_time=zipfile.ZipInfo.from_file(file_path).date_time), "w", force_zip64=True) as fout:
+                            desc = _encode_component(file_path, comp_name, comp_statuses.get(comp_name), interface, _SectionWriter(fout, compress), block_size)
+                        desc["member"] = member
+                        desc["sha256"] = _hash_file(file_path)
+                        manifest["components"][comp_name] = desc
+                        log.debug("{}: {} -> {} bytes".format(file_name, desc["original_size"], zf.getinfo(member).compress_size))
+                    else:
+                        zf.write(file_path, arcname, compress_type=zipfile.ZIP_DEFLATED)
+                        manifest["files"].append(arcname)
+            zf.writestr(ARCHIVE_MANIFEST_FILE_NAME, json.dumps(manifest, indent=1), compress_type=zipfile.ZIP_DEFLATED)
+        if verify:
+            with AcquisitionArchive(tmp_path) as archive:
+                archive.verify()
+        os.replace(tmp_path, archive_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    log.info("Acquisition {} archived in {}".format(acquisition_folder, archive_path))
+    return archive_path
+
+def extract_archive(archive_path, output_folder, verify = True):
+    """
+    Rebuilds the original acquisition folder from an archive.
+
+    :param archive_path: Archive path.
+    :param output_folder: Destination folder (created if needed).
+    :param verify: [Optional] If True, the sha256 of every rebuilt .dat file is checked.
+    :return: The output folder.
+    """
+    with AcquisitionArchive(archive_path) as archive:
+        archive.extract(output_folder, verify)
+    return output_folder
+
+class AcquisitionArchive:
+    """
+    Reader of an acquisition archive created by create_archive.
+
+    :param archive_path: Archive path.
+    """
+    def __init__(self, archive_path):
+        self.archive_path = archive_path
+        self.__zf = zipfile.ZipFile(archive_path, "r")
+        try:
+            self.manifest = json.loads(self.__zf.read(ARCHIVE_MANIFEST_FILE_NAME))
+        except KeyError:
+            self.__zf.close()
+            raise AcquisitionArchiveError("{} is not an acquisition archive (missing {})".format(archive_path, ARCHIVE_MANIFEST_FILE_NAME))
+        if self.manifest.get("version", 0) > ARCHIVE_FORMAT_VERSION:
+            self.__zf.close()
+            raise AcquisitionArchiveError("Unsupported archive version: {}".format(self.manifest.get("version")))
+        self.__decompress = _get_decompress_function(self.manifest["codec"])
+        self.__fp = open(archive_path, "rb")
+        self.__member_offsets = {}
+        self.__acq_info = None
+        self.__device_config = None
+        self.__hsd = None
+
+    def close(self):
+        self.__fp.close()
+        self.__zf.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def get_acquisition_name(self):
+        return self.manifest.get("acquisition")
+
+    def get_acquisition_info(self):
+        if self.__acq_info is None:
+            self.__acq_info = json.loads(self.__zf.read(ACQUISITION_INFO_FILE_NAME))
+        return self.__acq_info
+
+    def get_device_config(self):
+        if self.__device_config is None:
+            self.__device_config = json.loads(self.__zf.read(DEVICE_CONFIG_FILE_NAME))
+        return self.__device_config
+
+    def read_file(self, file_name):
+        """Returns the content of a non-.dat file of the acquisition (e.g. ispu_output_format.json)."""
+        return self.__zf.read(file_name)
+
+    def list_components(self):
+        return list(self.manifest["components"].keys())
+
+    def get_component_status(self, comp_name):
+        """
+        Returns the status of a component as loaded by HSDatalog_v2 (enum properties, e.g. odr, converted to
+        their values). The raw device_config.json status is returned if the device model cannot be loaded.
+
+        :param comp_name: Component name.
+        :return: Component status dictionary, None if the component is not in the device configuration.
+        """
+        hsd = self.__get_hsd()
+        if hsd is not None:
+            try:
+                return hsd.get_component(comp_name)[comp_name]
+            except MissingComponentModelError:
+                pass
+        device_config = self.get_device_config()
+        device = device_config["devices"][0] if "devices" in device_config else device_config
+        for c in device.get("components", []):
+            if comp_name in c:
+                return c[comp_name]
+        return None
+
+    def __get_hsd(self):
+        if self.__hsd is None:
+            from stdatalog_core.HSD.HSDatalog_v2 import HSDatalog_v2
+            try:
+                self.__hsd = HSDatalog_v2(self.archive_path, update_catalog = False)
+            except Exception as e:
+                log.warning("{}: device model not loaded ({}), raw component statuses used".format(self.archive_path, e))
+                self.__hsd = False
+        return self.__hsd or None
+
+    def get_compression_stats(self):
+        """
+        :return: Dictionary comp_name -> {original_size, archived_size, ratio}.
+        """
+        stats = {}
+        for comp_name, desc in self.manifest["components"].items():
+            archived = self.__zf.getinfo(desc["member"]).compress_size
+            stats[comp_name] = {"original_size": desc["original_size"], "archived_size": archived,
+                                "ratio": desc["original_size"] / archived if archived else None}
+        return stats
+
+    def __get_desc(self, comp_name):
+        desc = self.manifest["components"].get(comp_name)
+        if desc is None:
+            raise AcquisitionArchiveError("Component {} not found in {}".format(comp_name, self.archive_path))
+        return desc
+
+    def __read_section(self, desc, section):
+        if section is None:
+            return b""
+        member = desc["member"]
+        if member not in self.__member_offsets:
+            self.__member_offsets[member] = _get_member_data_offset(self.__fp, self.__zf.getinfo(member))
+        self.__fp.seek(self.__member_offsets[member] + section["o"])
+        data = self.__decompress(self.__fp.read(section["n"]), section["r"])
+        if len(data) != section["r"]:
+            raise AcquisitionArchiveError("Corrupted section in archive member {}".format(member))
+        return data
+
+    def __decode_block(self, desc, block):
+        """Returns the payload bytes (numpy uint8) of a block."""
+        if desc["encoding"] == ComponentEncoding.BYTES:
+            return np.frombuffer(self.__read_section(desc, block["bytes"]), dtype=np.uint8)
+        n = block["frames"]
+        spts = max(desc["samples_per_ts"], 1)
+        samples = decode_samples(self.__read_section(desc, block["samples"]), desc["data_type"], desc["dim"], n * spts)
+        if desc["encoding"] == ComponentEncoding.ROWS:
+            return samples
+        frames = np.empty((n, desc["frame_size"]), dtype=np.uint8)
+        frames[:, :-TIMESTAMP_SIZE] = samples.reshape(n, -1)
+        ts = _delta_decode(_unshuffle(self.__read_section(desc, block["timestamps"]), '<u8', 1, n))
+        frames[:, -TIMESTAMP_SIZE:] = ts.view(np.uint8).reshape(n, TIMESTAMP_SIZE)
+        return frames.reshape(-1)
+
+    def __iter_payload(self, desc):
+        for block in desc["blocks"]:
+            yield self.__decode_block(desc, block)
+        if desc.get("payload_tail") is not None:
+            yield np.frombuffer(self.__read_section(desc, desc["payload_tail"]), dtype=np.uint8)
+
+    def iter_dat(self, comp_name):
+        """
+        Rebuilds the original .dat file of a component, chunk by chunk.
+
+        :param comp_name: Component name.
+        :return: Generator of bytes chunks.
+        """
+        desc = self.__get_desc(comp_name)
+        data_packet_size = desc.get("data_packet_size")
+        if not data_packet_size:
+            for chunk in self.__iter_payload(desc):
+                yield chunk.tobytes()
+            return
+        nof_packets = desc["nof_packets"]
+        protocol_size = desc["data_protocol_size"]
+        counters = b""
+        if nof_packets:
+            counters = _delta_decode(_unshuffle(self.__read_section(desc, desc["counters"]), '<u4', 1, nof_packets)).reshape(-1)
+        pending = bytearray()
+        packet_idx = 0
+        for chunk in self.__iter_payload(desc):
+            pending += memoryview(chunk)
+            k = len(pending) // data_packet_size
+            if k:
+                out = np.empty((k, data_packet_size + protocol_size), dtype=np.uint8)
+                out[:, :protocol_size] = counters[packet_idx:packet_idx + k].view(np.uint8).reshape(k, protocol_size)
+                out[:, protocol_size:] = np.frombuffer(pending, dtype=np.uint8, count=k * data_packet_size).reshape(k, data_packet_size)
+                del pending[:k * data_packet_size]
+                packet_idx += k
+                yield out.tobytes()
+        if packet_idx != nof_packets or pending:
+            raise AcquisitionArchiveError("Corrupted archive member {}".format(desc["member"]))
+        tail = self.__read_section(desc, desc.get("file_tail"))
+        if tail:
+            yield tail
+
+    def read_dat(self, comp_name):
+        """Returns the original .dat file content of a component (bytes)."""
+        return b"".join(self.iter_dat(comp_name))
+
+    def verify(self, comp_name = None):
+        """
+        Checks that the .dat files rebuilt from the archive match the sha256 of the originals.
+
+        :param comp_name: [Optional] Component to check (default: all).
+        :raise AcquisitionArchiveError: If a file does not match.
+        """
+        for name in ([comp_name] if comp_name is not None else self.list_components()):
+            desc = self.__get_desc(name)
+            h = hashlib.sha256()
+            size = 0
+            for chunk in self.iter_dat(name):
+                h.update(chunk)
+                size += len(chunk)
+            if size != desc["original_size"] or h.hexdigest() != desc["sha256"]:
+                raise AcquisitionArchiveError("{}: rebuilt .dat file does not match the original".format(name))
+
+    def extract(self, output_folder, verify = True):
+        """
+        Rebuilds the original acquisition folder.
+
+        :param output_folder: Destination folder (created if needed).
+        :param verify: [Optional] If True, the sha256 of every rebuilt .dat file is checked.
+        """
+        os.makedirs(output_folder, exist_ok=True)
+        for file_name in self.manifest["files"]:
+            dst = os.path.join(output_folder, *file_name.split("/"))
+            os.makedirs(os.path.dirname(dst), exist_ok=True)
+            with self.__zf.open(file_name) as src, open(dst, "wb") as fout:
+                shutil.copyfileobj(src, fout)
+        for comp_name, desc in self.manifest["components"].items():
+            h = hashlib.sha256()
+            with open(os.path.join(output_folder, comp_name + ".dat"), "wb") as fout:
+                for chunk in self.iter_dat(comp_name):
+                    fout.write(chunk)
+                    if verify:
+                        h.update(chunk)
+            if verify and h.hexdigest() != desc["sha256"]:
+                raise AcquisitionArchiveError("{}: rebuilt .dat file does not match the original".format(comp_name))
+        log.info("Archive {} extracted in {}".format(self.archive_path, output_folder))
+
+    def get_packet_counters(self, comp_name):
+        """Returns the packet counters of a component (numpy '<u4' array), without decoding the payload."""
+        desc = self.__get_desc(comp_name)
+        if not desc.get("nof_packets"):
+            return np.empty(0, dtype='<u4')
+        return _delta_decode(_unshuffle(self.__read_section(desc, desc["counters"]), '<u4', 1, desc["nof_packets"])).reshape(-1)
+
+    def get_data_and_timestamps(self, comp_name, start_time = 0, end_time = -1, raw_data = False):
+        """
+        Reads the samples of a sensor component in a time range, decoding only the blocks that overlap it.
+
+        The sample times follow the HSDatalog_v2 model: the ioffset of the component precedes the first
+        frame timestamp and the samples of each frame are linearly interpolated between two timestamps.
+        Frames recorded after the end of the acquisition (acquisition_info.json end_time) are dropped as
+        HSDatalog_v2.get_data_and_timestamps_batch does (see HSDatalog_v2.get_extraction_end_frame), so a
+        full read returns the same samples as HSDatalog.get_data_and_timestamps.
+
+        Only sensor components can be read by time: the files of the other components (e.g. the motor control
+        telemetries) are stored as bytes, use read_dat or extract and the HSDatalog API to decode them.
+
+        :param comp_name: Component name.
+        :param start_time: [Optional] Start time [s] (included).
+        :param end_time: [Optional] End time [s] (excluded), -1 to read until the end.
+        :param raw_data: [Optional] If True, the samples are not multiplied by the sensitivity.
+        :return: (data, timestamps) numpy arrays: data (n, dim), timestamps (n, 1).
+        :raise AcquisitionArchiveError: If the component is not a sensor.
+        """
+        from stdatalog_core.HSD.HSDatalog_v2 import HSDatalog_v2
+
+        desc = self.__get_desc(comp_name)
+        if desc["encoding"] == ComponentEncoding.BYTES:
+            raise AcquisitionArchiveError("{}: time based reads are supported for sensor components only, use read_dat".format(comp_name))
+        comp_status = self.get_component_status(comp_name)
+        spts = desc["samples_per_ts"]
+        dim = desc["dim"]
+        ioffset = comp_status.get("ioffset", 0) or 0
+        blocks = desc["blocks"]
+
+        sample_blocks = []
+        times_blocks = []
+        if desc["encoding"] == ComponentEncoding.FRAMES:
+            frame_period = HSDatalog_v2.get_frame_period(comp_name, comp_status, spts)
+            # frames after the end of the acquisition are dropped, as in the HSDatalog_v2 .dat extraction
+            acq_duration = HSDatalog_v2.get_acquisition_duration(self.get_acquisition_info())
+            frame_size = desc["frame_size"]
+            prev_ts = ioffset
+            for block in blocks:
+                block_prev_ts = prev_ts
+                prev_ts = block["t1"]
+                if block["t1"] < start_time and block["t1"] < acq_duration:
+                    continue
+                if end_time != -1 and block_prev_ts >= end_time:
+                    break
+                n = block["frames"]
+                payload = self.__decode_block(desc, block).reshape(n, frame_size)
+                ts = np.ascontiguousarray(payload[:, -TIMESTAMP_SIZE:]).view('<f8').reshape(-1)
+                acq_end_frame = HSDatalog_v2.get_extraction_end_frame(ts, acq_duration)
+                if acq_end_frame is not None:
+                    n = acq_end_frame
+                    payload = payload[:n]
+                    ts = ts[:n]
+                sample_blocks.append(np.ascontiguousarray(payload[:, :-TIMESTAMP_SIZE]).reshape(-1))
+                if spts > 1:
+                    starts = np.concatenate(([block_prev_ts], ts[:-1]))
+                    if frame_period > 0:
+                        gaps = np.abs(ts - starts) > frame_period + frame_period * 0.33
+                        starts[gaps] = ts[gaps] - frame_period
+                    times_blocks.append((starts[:, None] + (ts - starts)[:, None] * (np.arange(spts) / spts)).reshape(-1))
+                else:
+                    times_blocks.append(ts)
+                if acq_end_frame is not None:
+                    break
+        else:
+            odr = comp_status.get("measodr") or comp_status.get("odr")
+            for block in blocks:
+                t0 = ioffset + block["first_frame"] / odr
+                t1 = ioffset + (block["first_frame"] + block["frames"] - 1) / odr
+                if t1 < start_time:
+                    continue
+                if end_time != -1 and t0 >= end_time:
+                    break
+                sample_blocks.append(self.__decode_block(desc, block))
+                times_blocks.append(ioffset + np.arange(block["first_frame"], block["first_frame"] + block["frames"]) / odr)
+
+        if len(sample_blocks) == 0:
+            return [], []
+        raw = np.concatenate(sample_blocks)
+        times = np.concatenate(times_blocks)
+        data_type = desc["data_type"]
+        if "_ispu" in comp_name:
+            data = raw.view(np.int8).reshape(len(times), -1)
+        else:
+            if data_type in ("int24", "int24_t"):
+                values = TypeConversion.decode_int24(raw)
+            else:
+                values = raw.view(np.dtype(TypeConversion.get_np_dtype(data_type)).newbyteorder('<'))
+            data = values.reshape(-1, dim)
+            if not raw_data:
+                data = data.astype(np.float32)
+                sensitivity = float(comp_status.get("sensitivity") or 1)
+                np.multiply(data, sensitivity, out=data, casting='unsafe')
+        mask = times >= start_time
+        if end_time != -1:
+            mask &= times < end_time
+        return data[mask], times[mask].reshape(-1, 1)
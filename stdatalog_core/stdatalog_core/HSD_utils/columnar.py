@@ -0,0 +1,151 @@
+# *****************************************************************************
+#  * @file    columnar.py
+#  * @author  SRA
+# ******************************************************************************
+# * @attention
+# *
+# * Copyright (c) 2022 STMicroelectronics.
+# * All rights reserved.
+# *
+# * This software is licensed under terms that can be found in the LICENSE file
+# * in the root directory of this software component.
+# * If no LICENSE file comes with this software, it is provided AS-IS.
+# *
+# *
+# ******************************************************************************
+#
+
+"""
+Arrow columnar results: component chunks as pyarrow RecordBatches (and Tables) with separate typed columns:
+    - "Time": float64 timestamps [s],
+    - one column per axis, in the native type (raw data or sensitivity 1) or float64 (scaled samples,
+      rounded to 6 decimals as the dataframe columns),
+    - tags: one bool column per tag label (TagsEncoding.BOOL) or a single "Tag" dictionary column
+      holding the active tag label of each sample (TagsEncoding.DICTIONARY).
+
+Numeric columns wrap the numpy buffers without copies (the data block is only rearranged column by column
+when it has more than one axis) and can be handed to pandas (pandas.ArrowDtype), polars and numpy without
+further copies. pyarrow (and pandas/polars for the respective conversions) is imported only when used.
+"""
+
+import numpy as np
+
+import stdatalog_core.HSD_utils.logger as logger
+
+log = logger.get_logger(__name__)
+
+class TagsEncoding:
+    BOOL = "bool"
+    DICTIONARY = "dictionary"
+
+TAGS_ENCODINGS = (TagsEncoding.BOOL, TagsEncoding.DICTIONARY)
+
+TIME_COLUMN = "Time"
+# Dictionary tags column name and separator of the labels of overlapping tags (e.g. "walk|outdoor")
+TAGS_COLUMN = "Tag"
+TAGS_SEPARATOR = "|"
+# Maximum number of tags labels encoded in a dictionary column (one bit per label)
+MAX_DICTIONARY_TAGS = 63
+
+def encode_tags_dictionary(tags_masks):
+    """
+    Encodes the tags masks as a single dictionary column: each sample holds the label of its active tag
+    (the labels of overlapping tags are joined with TAGS_SEPARATOR), null when no tag is active.
+
+    :param tags_masks: Dictionary tag label -> numpy bool array (n_samples,).
+    :return: pyarrow DictionaryArray (int32 indices, string dictionary).
+    """
+    import pyarrow as pa
+    labels = list(tags_masks.keys())
+    if len(labels) > MAX_DICTIONARY_TAGS:
+        raise ValueError("Too many tags labels for a dictionary column: {} (max {})".format(len(labels), MAX_DICTIONARY_TAGS))
+    nof_samples = len(next(iter(tags_masks.values()))) if labels else 0
+    # one bit per label: each combination of active tags becomes a dictionary entry
+    combinations = np.zeros(nof_samples, dtype=np.int64)
+    for bit, label in enumerate(labels):
+        combinations |= np.asarray(tags_masks[label], dtype=np.int64).reshape(-1) << bit
+    codes, indices = np.unique(combinations, return_inverse=True)
+    untagged = combinations == 0
+    if len(codes) > 0 and codes[0] == 0:
+        codes = codes[1:]
+        indices = np.maximum(indices - 1, 0)
+    dictionary = [TAGS_SEPARATOR.join(l for bit, l in enumerate(labels) if code >> bit & 1) for code in codes]
+    return pa.DictionaryArray.from_arrays(pa.array(indices.astype(np.int32), mask=untagged), pa.array(dictionary, type=pa.string()))
+
+def build_record_batch(time, values, columns_names, tags_masks = None, tags_encoding = TagsEncoding.BOOL):
+    """
+    Builds the RecordBatch of a component chunk.
+
+    :param time: numpy array (n_samples,) or (n_samples, 1) of timestamps, None to omit the Time column.
+    :param values: numpy array (n_samples, n_columns) of samples, in the output dtype of the columns.
+    :param columns_names: List of the data columns names.
+    :param tags_masks: [Optional] Dictionary tag label -> numpy bool array (n_samples,).
+    :param tags_encoding: [Optional] TagsEncoding of the tags columns.
+    :return: pyarrow RecordBatch.
+    """
+    import pyarrow as pa
+    if tags_encoding not in TAGS_ENCODINGS:
+        raise ValueError("Unknown tags encoding: {} (valid: {})".format(tags_encoding, ", ".join(TAGS_ENCODINGS)))
+    arrays = []
+    names = []
+    if time is not None:
+        arrays.append(pa.array(np.asarray(time, dtype=np.float64).reshape(-1)))
+        names.append(TIME_COLUMN)
+    values = np.asarray(values)
+    if values.ndim == 1:
+        values = values.reshape(-1, 1)
+    # column-major layout of the data block (a view for single column blocks): each column is wrapped without copies
+    columns_data = np.ascontiguousarray(values.T)
+    for name, column in zip(columns_names, columns_data):
+        arrays.append(pa.array(column))
+        names.append(name)
+    if tags_masks:
+        if tags_encoding == TagsEncoding.BOOL:
+            for label, mask in tags_masks.items():
+                arrays.append(pa.array(np.asarray(mask, dtype=bool).reshape(-1)))
+                names.append(label)
+        else:
+            arrays.append(encode_tags_dictionary(tags_masks))
+            names.append(TAGS_COLUMN)
+    return pa.RecordBatch.from_arrays(arrays, names=names)
+
+def to_pandas(arrow_data):
+    """
+    Converts a RecordBatch or Table to a pandas DataFrame whose columns are backed by the Arrow buffers
+    (pandas.ArrowDtype), without copies.
+
+    :param arrow_data: pyarrow RecordBatch or Table.
+    :return: pandas DataFrame.
+    """
+    import pandas as pd
+    return arrow_data.to_pandas(types_mapper=pd.ArrowDtype)
+
+def to_polars(arrow_data):
+    """
+    Converts a RecordBatch or Table to a polars DataFrame (zero-copy for the numeric columns).
+
+    :param arrow_data: pyarrow RecordBatch or Table.
+    :return: polars DataFrame.
+    """
+    import polars as pl
+    return pl.from_arrow(arrow_data)
+
+def to_numpy(arrow_data):
+    """
+    Converts a RecordBatch or Table to numpy arrays, one per column.
+    The numeric columns of a RecordBatch (or of a single batch Table) are views of the Arrow buffers;
+    bool columns are unpacked and dictionary tags are decoded as object arrays of labels (None when untagged).
+
+    :param arrow_data: pyarrow RecordBatch or Table.
+    :return: Dictionary column name -> numpy array (n_samples,).
+    """
+    import pyarrow as pa
+    columns = {}
+    for name, column in zip(arrow_data.column_names, arrow_data.columns):
+        if pa.types.is_dictionary(column.type):
+            column = column.cast(pa.string())
+        if isinstance(column, pa.ChunkedArray):
+            # chunks are concatenated (copied) only when there is more than one
+            column = column.chunk(0) if column.num_chunks == 1 else column.combine_chunks()
+        columns[name] = column.to_numpy(zero_copy_only=False)
+    return columns
@@ -0,0 +1,117 @@
+# *****************************************************************************
+#  * @file    control_channel.py
+#  * @author  SRA
+# ******************************************************************************
+# * @attention
+# *
+# * Copyright (c) 2022 STMicroelectronics.
+# * All rights reserved.
+# *
+# * This software is licensed under terms that can be found in the LICENSE file
+# * in the root directory of this software component.
+# * If no LICENSE file comes with this software, it is provided AS-IS.
+# *
+# *
+# ******************************************************************************
+#
+
+"""
+Logging control channel messages (trigger sources -> datalogger) and trigger timing records.
+
+A command is a text line "<command>[ <trigger_time>]\\n", where trigger_time is the host time
+[s since the epoch] of the event that triggered the command (e.g. the BLE notification).
+Empty lines are keep-alive messages. The datalogger saves the trigger, command receipt,
+start command and first data times of an acquisition in its acquisition_info.json ("trigger_timing").
+"""
+
+import os
+import json
+from datetime import datetime, timezone
+
+from stdatalog_core.HSD_utils.segmented_log import format_acquisition_time
+import stdatalog_core.HSD_utils.logger as logger
+
+log = logger.get_logger(__name__)
+
+ACQUISITION_INFO_FILE_NAME = "acquisition_info.json"
+TRIGGER_TIMING_KEY = "trigger_timing"
+
+def format_control_command(command, trigger_time = None):
+    """
+    Encodes a control command.
+
+    :param command: Command name (e.g. "start", "stop").
+    :param trigger_time: [Optional] Host time [s since the epoch] of the trigger event.
+    :return: The command line (bytes).
+    """
+    if trigger_time is None:
+        return "{}\n".format(command).encode("utf-8")
+    return "{} {:.6f}\n".format(command, trigger_time).encode("utf-8")
+
+def parse_control_command(line):
+    """
+    Decodes a control command line.
+
+    :param line: Command line (str or bytes).
+    :return: (command, trigger_time): command in lower case (None for a keep-alive line), trigger time or None.
+    """
+    if isinstance(line, bytes):
+        line = line.decode("utf-8", errors="replace")
+    fields = line.strip().lower().split()
+    if len(fields) == 0:
+        return None, None
+    trigger_time = None
+    if len(fields) > 1:
+        try:
+            trigger_time = float(fields[1])
+        except ValueError:
+            log.warning("Invalid trigger time in control command: {}".format(line.strip()))
+    return fields[0], trigger_time
+
+def _format_time(t):
+    return format_acquisition_time(datetime.fromtimestamp(t, timezone.utc))
+
+def get_trigger_timing(trigger_time = None, command_time = None, start_time = None, first_data_time = None):
+    """
+    Builds the trigger timing record of an acquisition (times in the acquisition_info.json format,
+    latencies from the trigger in ms).
+
+    :param trigger_time: [Optional] Host time [s since the epoch] of the trigger event.
+    :param command_time: [Optional] Host time the datalogger received the command.
+    :param start_time: [Optional] Host time the start command was sent to the device.
+    :param first_data_time: [Optional] Host time the first sensor data were received.
+    :return: The trigger timing dictionary.
+    """
+    timing = {}
+    times = {"trigger_time": trigger_time, "command_time": command_time, "start_time": start_time, "first_data_time": first_data_time}
+    for key, t in times.items():
+        if t is not None:
+            timing[key] = _format_time(t)
+    if trigger_time is not None:
+        for key in ("command", "start", "first_data"):
+            t = times[key + "_time"]
+            if t is not None:
+                timing[key + "_latency_ms"] = round((t - trigger_time) * 1000, 3)
+    return timing
+
+def save_trigger_timing(acq_folder, trigger_time = None, command_time = None, start_time = None, first_data_time = None):
+    """
+    Saves the trigger timing record (see get_trigger_timing) in the acquisition_info.json of an acquisition folder.
+    The file is replaced atomically.
+
+    :param acq_folder: Acquisition folder path.
+    :return: The trigger timing dictionary, None if the acquisition has no acquisition_info.json.
+    """
+    acq_info_path = os.path.join(acq_folder, ACQUISITION_INFO_FILE_NAME)
+    if not os.path.exists(acq_info_path):
+        log.warning("{} not found: trigger timing not saved".format(acq_info_path))
+        return None
+    with open(acq_info_path, "r") as f:
+        acq_info = json.loads(f.read().rstrip("\x00"))
+    timing = get_trigger_timing(trigger_time, command_time, start_time, first_data_time)
+    acq_info[TRIGGER_TIMING_KEY] = timing
+    tmp_path = acq_info_path + ".tmp"
+    with open(tmp_path, "w") as f:
+        f.write(json.dumps(acq_info, indent = 4))
+    os.replace(tmp_path, acq_info_path)
+    return timing
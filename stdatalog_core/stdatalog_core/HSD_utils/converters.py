@@ -17,13 +17,17 @@
 
 import os
 import warnings
-import csv
 import numpy as np
 import wave
-import pandas as pd
+from typing import TYPE_CHECKING
 
 import stdatalog_core.HSD_utils.logger as logger
+import stdatalog_core.HSD_utils.profiling as profiling
 from stdatalog_core.HSD_utils.exceptions import NanoEdgeConversionError
+from stdatalog_core.HSD_utils.windowing import SlidingWindowBuffer, flatten_windows, write_csv_rows
+
+if TYPE_CHECKING:
+    import pandas as pd
 
 log = logger.get_logger(__name__)
 
@@ -43,27 +47,22 @@ class NanoedgeCSVWriter:
         filename = comp_name + "_" + os.path.basename(os.path.normpath(output_folder)) +"_NanoEdge.csv"
         self.file_path = os.path.join(output_folder, filename)
 
-        self.buffer = []
-        self.samples_chest = np.array([])
-        self.start_idx = 0
+        # Samples of the incomplete window are carried over to the next chunk
+        self.windows_buffer = SlidingWindowBuffer(self.signal_length, self.signal_increment)
 
+    @profiling.profiled("writer.nanoedge")
     def to_nanoedge_format_batch(self, dataframe, mode = "w", target_value = None):
         """
-        Writes the contents of a NumPy array to a CSV file with a fixed number of columns (M).
-        The array's values are written consecutively without padding, filling up rows as needed.
+        Writes a chunk of samples as NanoEdge signals: one CSV row per window of signal_length samples
+        (taken every signal_increment samples), with the optional target value as first column.
+        The samples of the last incomplete window are kept for the next chunk.
 
-        Parameters:
-        - input_array: A NumPy array to be written to the CSV.
+        :param dataframe: The chunk dataframe ("Time" column + one column per axis).
+        :param mode: The file writing mode ('w' for write, 'a' for append).
+        :param target_value: [Optional] The target value (Mandatory for NEAI extrapolation datasets).
         """
         # arrange data for nanoedge
-        filtered_df = dataframe.drop('Time', axis=1)
-        dataset = filtered_df.to_numpy()
-
-        if len(self.samples_chest) != 0:
-            dataset = np.vstack((self.samples_chest, dataset))
-
-        idx = self.start_idx
-        #Number of rows extractable from the array (taking into account of signal_increment)
+        dataset = dataframe.drop('Time', axis=1).to_numpy()
         #e.g.
         # - dataset_length (samples) = 10 [1,2,3,4,5,6,7,8,9,10]
         # - signal_length (samples) = 4
@@ -73,50 +72,63 @@ class NanoedgeCSVWriter:
         #  3, 4, 5, 6   | n_signals = 4
         #  5, 6, 7, 8   |
         #  7, 8, 9, 10  ┘
-        #  8, 10, X, X
-        n_signals = ((np.shape(dataset[idx:])[0] - self.signal_length) // self.signal_increment) + 1
-        
+        #  9, 10 --> carried over to the next chunk
+        windows, _ = self.windows_buffer.push(dataset)
         with open(self.file_path , mode, newline="") as f:
-            writer = csv.writer(f)
-            for _ in range(0, n_signals): #rows of final dataset
-                if target_value is not None:
-                    self.buffer.append(target_value)
-                for cc in range(idx, idx + self.signal_length): #cc = columns in input dataset
-                    if cc >= dataset.shape[0]:
-                        continue
-                    for el in dataset[cc]:
-                        self.buffer.append(el)
-    
-                idx += self.signal_increment
-                writer.writerow(list(self.buffer))
-                self.buffer.clear()
-
-        if n_signals > 0:
-            a = self.signal_length - self.signal_increment
-            if a >= 0: #To manage: signal_increment >= signal_length
-                try:
-                    self.samples_chest = dataset[(cc+1)-(a):]
-                except Exception as e:
-                    pass
-            else: #To manage: signal_increment > signal_length
-                try:
-                    self.samples_chest = dataset[(cc+1):]
-                    self.start_idx = -a
-                except Exception as e:
-                    pass
-
+            write_csv_rows(f, flatten_windows(windows), target_value)
         return True
 
     def flush(self):
         """
-        Writes any remaining values in the buffer to the CSV file as a partial row.
-        This should be called after all arrays have been processed.
+        Kept for compatibility: rows are written as soon as their window is complete,
+        incomplete windows are not written.
+        """
+        pass
+
+class ParquetBatchWriter:
+    """
+    Writes Arrow record batches (see HSDatalog.get_arrow_gen) in a Parquet file, one row group per batch,
+    without intermediate pandas DataFrames. All the batches are appended to the same file.
+    The file has the schema written by HSDatalogConverter.to_parquet for the same columns (pandas metadata included),
+    so it is read back as the corresponding dataframe.
+    """
+    def __init__(self, filename):
+        """
+        :param filename: The base name of the file to write to (".parquet" is appended).
+        """
+        self.file_path = filename + ".parquet"
+        self.nof_rows = 0
+        self.__schema = None
+        self.__writer = None
+
+    @profiling.profiled("writer.parquet")
+    def write(self, batch):
+        """
+        :param batch: pyarrow RecordBatch (or Table) with the columns of the first written batch.
         """
-        if self.buffer:
-            with open(self.file_path, 'a', newline='') as csvfile:
-                csv_writer = csv.writer(csvfile)
-                csv_writer.writerow(self.buffer)
-            self.buffer = []
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        if self.__writer is None:
+            # Schema of DataFrame.to_parquet(index=False), from an empty slice of the first batch
+            self.__schema = pa.Schema.from_pandas(batch.slice(0, 0).to_pandas(), preserve_index=False)
+            self.__writer = pq.ParquetWriter(self.file_path, self.__schema)
+        if not batch.schema.equals(self.__schema, check_metadata=True):
+            batch = pa.Table.from_batches([batch]) if isinstance(batch, pa.RecordBatch) else batch
+            batch = batch.cast(self.__schema)
+        self.__writer.write(batch)
+        self.nof_rows += batch.num_rows
+
+    def close(self):
+        if self.__writer is not None:
+            self.__writer.close()
+            self.__writer = None
+            log.debug(f"--> File: \"{self.file_path}\": {self.nof_rows} rows written")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
 
 class HSDatalogConverter:
 
@@ -156,7 +168,8 @@ class HSDatalogConverter:
         # Delegate the conversion to the generic 'to_xsv' method for TSV format.
         HSDatalogConverter.to_xsv(df, filename, '.tsv', '\t', mode)
     
-    def to_parquet(df:pd.DataFrame, filename, mode = 'w'):
+    @profiling.profiled("writer.parquet")
+    def to_parquet(df:"pd.DataFrame", filename, mode = 'w'):
         """
         Converts a DataFrame to a Parquet file.
 
@@ -176,6 +189,7 @@ class HSDatalogConverter:
         log.debug(f"--> File: \"{parquet_file_path}\" converted chunk appended successfully")
 
     @staticmethod
+    @profiling.profiled("writer.xsv")
     def to_xsv_numpy(df, filename, extension, separator, mode = 'w'):
         """
         Converts a DataFrame to a delimited text file (e.g., CSV, TSV) using NumPy's savetxt method.
@@ -204,6 +218,7 @@ class HSDatalogConverter:
             np.savetxt(f, df.values, delimiter=separator, fmt=formats,comments='')
 
     @staticmethod
+    @profiling.profiled("writer.xsv")
     def to_xsv(df, filename, extension, separator, mode = 'w'):
         """
         Converts a DataFrame to a delimited text file (e.g., CSV, TSV) using pandas to_csv method.
@@ -221,6 +236,7 @@ class HSDatalogConverter:
         log.debug("--> File: \"{}\" converted chunk appended successfully".format(filename + extension))
 
     @staticmethod
+    @profiling.profiled("writer.wav")
     def to_wav(pcm_data, filename, sample_freq):
         """
         Converts PCM data to a WAV file.
@@ -266,6 +282,7 @@ class HSDatalogConverter:
         return wav_file
 
     @staticmethod
+    @profiling.profiled("writer.wav")
     def wav_append(wav_file, pcm_data):
         """
         Appends PCM data to an open WAV file.
@@ -367,6 +384,7 @@ class HSDatalogConverter:
         :param tags_columns_names: A list of column names to exclude from renaming.
         :return: The merged DataFrame.
         """
+        import pandas as pd
         # Define a list of columns to exclude
         cols_to_exclude = ["Time"]
         if len(tags_columns_names) > 0:
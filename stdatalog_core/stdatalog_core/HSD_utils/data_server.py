@@ -0,0 +1,578 @@
+# *****************************************************************************
+#  * @file    data_server.py
+#  * @author  SRA
+# ******************************************************************************
+# * @attention
+# *
+# * Copyright (c) 2022 STMicroelectronics.
+# * All rights reserved.
+# *
+# * This software is licensed under terms that can be found in the LICENSE file
+# * in the root directory of this software component.
+# * If no LICENSE file comes with this software, it is provided AS-IS.
+# *
+# *
+# ******************************************************************************
+#
+
+"""
+Socket server streaming decoded live component data to external processes.
+
+The acquisition threads publish the raw component blocks (packet counters included) or
+payloads; each component stream is decoded once (StreamFrameDecoder) and the decoded frames are
+queued to every connected subscriber interested in that component. Subscribers connect through
+a Unix domain socket or a TCP socket (localhost by default), so analytics written in any
+language can consume the stream without touching the USB link.
+
+Every message is [MESSAGE_HEADER][json metadata][binary data]:
+ - MSG_HELLO (server -> client): metadata of the published components.
+ - MSG_SUBSCRIBE (client -> server): {"components": [...] or null (all), "decimation": N}.
+ - MSG_FRAME (server -> client): metadata {comp_name, dtype, dim, nof_samples, nof_timestamps,
+   start_index, decimation, sensitivity, dropped_frames}, data: samples (nof_samples x dim,
+   C order, little endian dtype) followed by nof_timestamps TIMESTAMP_DTYPE records.
+ - MSG_END (server -> client): the server is shutting down.
+
+Slow subscribers never stall the acquisition unless BackPressurePolicy.BLOCK is selected:
+each subscriber has a bounded queue and, by default, the oldest frames are dropped (and
+counted) when the queue is full.
+"""
+
+import json
+import os
+import socket
+import struct
+import threading
+from collections import deque
+from enum import Enum
+
+import numpy as np
+
+from stdatalog_core.HSD_utils.shm_bus import StreamFrameDecoder, TIMESTAMP_DTYPE
+from stdatalog_core.HSD_utils.integrity import DATA_PROTOCOL_SIZE
+import stdatalog_core.HSD_utils.logger as logger
+
+log = logger.get_logger(__name__)
+
+DEFAULT_SERVER_HOST = "127.0.0.1"
+DEFAULT_SERVER_PORT = 8889
+DEFAULT_MAX_QUEUED_BYTES = 8 * 1024 * 1024
+DEFAULT_BLOCK_TIMEOUT = 1.0
+
+MESSAGE_MAGIC = b'SDLS'
+MESSAGE_HEADER = struct.Struct('<4sB3xII')
+MSG_HELLO = 1
+MSG_SUBSCRIBE = 2
+MSG_FRAME = 3
+MSG_END = 4
+
+class BackPressurePolicy(Enum):
+    DROP_OLDEST = "drop_oldest"
+    BLOCK = "block"
+    DISCONNECT = "disconnect"
+
+def parse_server_address(address):
+    """
+    Parses a data server address.
+
+    :param address: (host, port) tuple, "host:port" / "tcp://host:port" string, port number,
+        or "unix:/path" / "unix:///path" string or filesystem path for a Unix domain socket.
+    :return: A tuple (socket family, address).
+    """
+    if address is None:
+        return socket.AF_INET, (DEFAULT_SERVER_HOST, DEFAULT_SERVER_PORT)
+    if isinstance(address, int):
+        return socket.AF_INET, (DEFAULT_SERVER_HOST, address)
+    if isinstance(address, tuple):
+        return socket.AF_INET, (address[0], int(address[1]))
+    address = str(address)
+    if address.startswith("unix:"):
+        path = address[len("unix:"):]
+        if path.startswith("//"):
+            path = path[2:]
+        return socket.AF_UNIX, path
+    if address.startswith("tcp://"):
+        address = address[len("tcp://"):]
+    host, sep, port = address.rpartition(":")
+    if sep and port.isdigit():
+        return socket.AF_INET, (host or DEFAULT_SERVER_HOST, int(port))
+    return socket.AF_UNIX, address
+
+def pack_message(msg_type, meta, data = b''):
+    """
+    Builds the header and metadata part of a message.
+
+    :param msg_type: Message type (MSG_HELLO, MSG_SUBSCRIBE, MSG_FRAME, MSG_END).
+    :param meta: JSON serializable metadata.
+    :param data: [Optional] Binary data (only its length is used).
+    :return: The header + metadata bytes (data must be sent right after them).
+    """
+    meta_bytes = json.dumps(meta).encode()
+    return MESSAGE_HEADER.pack(MESSAGE_MAGIC, msg_type, len(meta_bytes), len(data)) + meta_bytes
+
+def _recv_exact(sock, size):
+    buf = bytearray(size)
+    view = memoryview(buf)
+    received = 0
+    while received < size:
+        n = sock.recv_into(view[received:], size - received)
+        if n == 0:
+            return None
+        received += n
+    return buf
+
+def recv_message(sock):
+    """
+    Receives a message.
+
+    :param sock: Connected socket.
+    :return: A tuple (msg_type, meta, data), or None if the connection was closed.
+    """
+    header = _recv_exact(sock, MESSAGE_HEADER.size)
+    if header is None:
+        return None
+    magic, msg_type, meta_len, data_len = MESSAGE_HEADER.unpack(header)
+    if magic != MESSAGE_MAGIC:
+        raise ValueError("Invalid data server message")
+    meta = _recv_exact(sock, meta_len) if meta_len > 0 else b'{}'
+    data = _recv_exact(sock, data_len) if data_len > 0 else bytearray()
+    if meta is None or data is None:
+        return None
+    return msg_type, json.loads(bytes(meta)), data
+
+class _PublishedComponent:
+    def __init__(self, comp_name, dim, data_type, samples_per_ts, sensitivity, odr, packet_data_size):
+        self.decoder = StreamFrameDecoder(dim, data_type, samples_per_ts)
+        self.packet_data_size = packet_data_size
+        self.last_start_index = 0
+        self.meta = {
+            "comp_name": comp_name,
+            "dim": dim,
+            "data_type": data_type,
+            "dtype": self.decoder.np_dtype.str if self.decoder.sample_size != 3 else '<i4',
+            "samples_per_ts": samples_per_ts,
+            "sensitivity": sensitivity,
+            "odr": odr,
+        }
+
+class _Subscriber:
+    """
+    A connected client: its subscription, its bounded frame queue and its sender thread.
+    """
+    def __init__(self, server, sock, peer):
+        self.server = server
+        self.sock = sock
+        self.peer = peer
+        self.components = None
+        self.decimation = 1
+        self.subscribed = False
+        self.queue = deque()
+        self.queued_bytes = 0
+        self.dropped_frames = 0
+        self.sent_frames = 0
+        self.cond = threading.Condition()
+        self.closed = False
+        self.sender = threading.Thread(target=self.__run_sender, daemon=True)
+        self.receiver = threading.Thread(target=self.__run_receiver, daemon=True)
+
+    def start(self):
+        self.sender.start()
+        self.receiver.start()
+
+    def wants(self, comp_name):
+        return self.subscribed and (self.components is None or comp_name in self.components)
+
+    def enqueue(self, message, size):
+        """
+        Queues a message, applying the server back-pressure policy.
+
+        :return: False if the subscriber has been (or must be) disconnected.
+        """
+        with self.cond:
+            if self.closed:
+                return False
+            max_bytes = self.server.max_queued_bytes
+            if self.queued_bytes + size > max_bytes and len(self.queue) > 0:
+                policy = self.server.back_pressure
+                if policy == BackPressurePolicy.BLOCK:
+                    self.cond.wait_for(lambda: self.closed or self.queued_bytes + size <= max_bytes or len(self.queue) == 0, self.server.block_timeout)
+                elif policy == BackPressurePolicy.DISCONNECT:
+                    log.warning("Data server subscriber {} too slow, disconnecting".format(self.peer))
+                    self.queue.clear()
+                    self.queued_bytes = 0
+                    self.closed = True
+                    self.cond.notify_all()
+                    return False
+                while self.queued_bytes + size > max_bytes and len(self.queue) > 0:
+                    _, dropped_size = self.queue.popleft()
+                    self.queued_bytes -= dropped_size
+                    self.dropped_frames += 1
+            self.queue.append((message, size))
+            self.queued_bytes += size
+            self.cond.notify_all()
+            return True
+
+    def close(self, send_end = False):
+        with self.cond:
+            if self.closed and not send_end:
+                return
+            if send_end:
+                self.queue.append(([pack_message(MSG_END, {})], 0))
+            self.closed = True
+            self.cond.notify_all()
+
+    def __run_sender(self):
+        try:
+            while True:
+                with self.cond:
+                    self.cond.wait_for(lambda: self.closed or len(self.queue) > 0)
+                    if len(self.queue) == 0:
+                        break
+                    message, size = self.queue.popleft()
+                    self.queued_bytes -= size
+                    dropped_frames = self.dropped_frames
+                    self.cond.notify_all()
+                if callable(message):
+                    message = message(dropped_frames)
+                for part in message:
+                    self.sock.sendall(part)
+                self.sent_frames += 1
+        except OSError as e:
+            log.debug("Data server subscriber {} disconnected: {}".format(self.peer, e))
+        finally:
+            self.close()
+            try:
+                self.sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            self.sock.close()
+            self.server._remove_subscriber(self)
+
+    def __run_receiver(self):
+        try:
+            while not self.closed:
+                msg = recv_message(self.sock)
+                if msg is None:
+                    break
+                msg_type, meta, _ = msg
+                if msg_type == MSG_SUBSCRIBE:
+                    components = meta.get("components")
+                    self.components = set(components) if components is not None else None
+                    self.decimation = max(1, int(meta.get("decimation", 1)))
+                    self.subscribed = True
+                    log.info("Data server subscriber {}: components {}, decimation {}".format(self.peer, "all" if components is None else components, self.decimation))
+        except (OSError, ValueError) as e:
+            log.debug("Data server subscriber {} receive error: {}".format(self.peer, e))
+        self.close()
+
+class LiveDataServer:
+    """
+    Threaded socket server publishing decoded live component data.
+
+    :param address: [Optional] Server address (see parse_server_address). Default: 127.0.0.1:8889.
+    :param max_queued_bytes: [Optional] Maximum size of the frames queued for each subscriber.
+    :param back_pressure: [Optional] BackPressurePolicy applied when a subscriber queue is full.
+    :param block_timeout: [Optional] Maximum publisher wait [s] with BackPressurePolicy.BLOCK (then the oldest frames are dropped).
+    """
+    def __init__(self, address = None, max_queued_bytes = DEFAULT_MAX_QUEUED_BYTES, back_pressure = BackPressurePolicy.DROP_OLDEST, block_timeout = DEFAULT_BLOCK_TIMEOUT):
+        self.family, self.address = parse_server_address(address)
+        self.max_queued_bytes = max_queued_bytes
+        self.back_pressure = BackPressurePolicy(back_pressure)
+        self.block_timeout = block_timeout
+        self.components = {}
+        self.subscribers = []
+        self.lock = threading.Lock()
+        self.server_socket = None
+        self.accept_thread = None
+        self.running = False
+
+    def start(self):
+        """
+        Opens the server socket and starts accepting subscribers.
+
+        :return: The bound address.
+        """
+        if self.family == socket.AF_UNIX and os.path.exists(self.address):
+            os.unlink(self.address)
+        self.server_socket = socket.socket(self.family, socket.SOCK_STREAM)
+        if self.family == socket.AF_INET:
+            self.server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.server_socket.bind(self.address)
+        self.server_socket.listen()
+        self.address = self.server_socket.getsockname()
+        self.running = True
+        self.accept_thread = threading.Thread(target=self.__run_accept, daemon=True)
+        self.accept_thread.start()
+        log.info("Live data server listening on {}".format(self.address))
+        return self.address
+
+    def stop(self):
+        """
+        Notifies and disconnects the subscribers and closes the server socket.
+        """
+        self.running = False
+        if self.server_socket is not None:
+            try:
+                self.server_socket.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            self.server_socket.close()
+            self.server_socket = None
+        if self.accept_thread is not None:
+            self.accept_thread.join()
+            self.accept_thread = None
+        with self.lock:
+            subscribers = list(self.subscribers)
+        for s in subscribers:
+            s.close(send_end=True)
+        for s in subscribers:
+            s.sender.join(self.block_timeout)
+        if self.family == socket.AF_UNIX and isinstance(self.address, str) and os.path.exists(self.address):
+            os.unlink(self.address)
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    def __run_accept(self):
+        while self.running:
+            try:
+                sock, peer = self.server_socket.accept()
+            except OSError:
+                break
+            if self.family == socket.AF_INET:
+                sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            subscriber = _Subscriber(self, sock, peer if peer else "unix")
+            with self.lock:
+                self.subscribers.append(subscriber)
+                hello = [pack_message(MSG_HELLO, {"components": [c.meta for c in self.components.values()]})]
+            subscriber.enqueue(hello, 0)
+            subscriber.start()
+            log.info("Data server subscriber connected: {}".format(subscriber.peer))
+
+    def _remove_subscriber(self, subscriber):
+        with self.lock:
+            if subscriber in self.subscribers:
+                self.subscribers.remove(subscriber)
+                log.info("Data server subscriber disconnected: {} (sent {} frames, dropped {})".format(subscriber.peer, subscriber.sent_frames, subscriber.dropped_frames))
+
+    def add_component(self, comp_name, comp_status):
+        """
+        Registers a sensor component from its status (odr/measodr, dim, data_type, samples_per_ts, sensitivity, usb_dps).
+        Components registered after a subscriber connected are announced by a new MSG_HELLO.
+
+        :return: True if the component can be published.
+        """
+        data_type = comp_status.get("data_type")
+        if data_type is None:
+            return False
+        spts = comp_status.get("samples_per_ts", 0)
+        if not isinstance(spts, int):
+            spts = spts.get("val", 0) if spts else 0
+        odr = comp_status.get("measodr") or comp_status.get("odr")
+        component = _PublishedComponent(comp_name, comp_status.get("dim", 1), data_type, spts, comp_status.get("sensitivity", 1), odr, comp_status.get("usb_dps"))
+        with self.lock:
+            self.components[comp_name] = component
+            subscribers = list(self.subscribers)
+            hello = [pack_message(MSG_HELLO, {"components": [c.meta for c in self.components.values()]})]
+        for s in subscribers:
+            s.enqueue(hello, 0)
+        return True
+
+    def remove_component(self, comp_name):
+        with self.lock:
+            self.components.pop(comp_name, None)
+
+    def get_subscribers_stats(self):
+        """
+        :return: List of dictionaries (peer, components, decimation, queued_bytes, sent_frames, dropped_frames).
+        """
+        with self.lock:
+            return [{"peer": str(s.peer), "components": sorted(s.components) if s.components is not None else None, "decimation": s.decimation,
+                     "queued_bytes": s.queued_bytes, "sent_frames": s.sent_frames, "dropped_frames": s.dropped_frames} for s in self.subscribers]
+
+    def publish_block(self, comp_name, block):
+        """
+        Publishes a block of complete packets, as returned by get_sensor_data (packet counters included).
+
+        :param comp_name: Component name.
+        :param block: The data block (bytes-like object).
+        """
+        component = self.components.get(comp_name)
+        if component is None:
+            return
+        if not self.__has_subscribers(comp_name):
+            # No subscribers: the stream only advances to stay frame aligned (complete frames are not decoded)
+            self.__discard_block(component, block)
+            return
+        samples, timestamps = self.__decode_block(component, block)
+        self.__publish(component, samples, timestamps)
+
+    def publish_payload(self, comp_name, payload):
+        """
+        Publishes a component payload (packet counters excluded).
+
+        :param comp_name: Component name.
+        :param payload: bytes-like object.
+        """
+        component = self.components.get(comp_name)
+        if component is None:
+            return
+        if not self.__has_subscribers(comp_name):
+            component.decoder.discard(payload)
+            return
+        start_index = component.decoder.nof_samples
+        samples, timestamps = component.decoder.decode(payload)
+        self.__publish(component, samples, timestamps, start_index)
+
+    def __decode_block(self, component, block):
+        start_index = component.decoder.nof_samples
+        packet_data_size = component.packet_data_size
+        if packet_data_size:
+            packet_size = packet_data_size + DATA_PROTOCOL_SIZE
+            packets = np.frombuffer(block, dtype=np.uint8)
+            packets = packets[:len(packets) // packet_size * packet_size].reshape(-1, packet_size)
+            payload = packets[:, DATA_PROTOCOL_SIZE:].tobytes()
+        else:
+            payload = block
+        samples, timestamps = component.decoder.decode(payload)
+        component.last_start_index = start_index
+        return samples, timestamps
+
+    @staticmethod
+    def __discard_block(component, block):
+        decoder = component.decoder
+        packet_data_size = component.packet_data_size
+        if not packet_data_size:
+            decoder.discard(block)
+            return
+        packet_size = packet_data_size + DATA_PROTOCOL_SIZE
+        nof_packets = len(block) // packet_size
+        payload_size = nof_packets * packet_data_size
+        tail_size = decoder.get_tail_size(payload_size)
+        decoder.skip(payload_size - tail_size)
+        if tail_size > 0:
+            # payload of the last packets only, holding the incomplete frame
+            nof_tail_packets = -(-tail_size // packet_data_size)
+            packets = np.frombuffer(block, dtype=np.uint8, count=nof_packets * packet_size).reshape(-1, packet_size)
+            decoder.decode(packets[-nof_tail_packets:, DATA_PROTOCOL_SIZE:].tobytes()[-tail_size:])
+
+    def __has_subscribers(self, comp_name):
+        with self.lock:
+            return any(s.wants(comp_name) for s in self.subscribers)
+
+    def __publish(self, component, samples, timestamps, start_index = None):
+        if start_index is None:
+            start_index = component.last_start_index
+        if len(samples) == 0 and len(timestamps) == 0:
+            return
+        comp_name = component.meta["comp_name"]
+        with self.lock:
+            subscribers = [s for s in self.subscribers if s.wants(comp_name)]
+        # Frames are built once per decimation factor and shared by the subscribers
+        frames = {}
+        for s in subscribers:
+            if s.decimation not in frames:
+                frames[s.decimation] = self.__build_frame(component, samples, timestamps, start_index, s.decimation)
+            build, size = frames[s.decimation]
+            if not s.enqueue(build, size):
+                s.close()
+
+    @staticmethod
+    def __build_frame(component, samples, timestamps, start_index, decimation):
+        if decimation > 1:
+            first = (-start_index) % decimation
+            samples = samples[first::decimation]
+            start_index += first
+        data = np.ascontiguousarray(samples).tobytes() + timestamps.tobytes()
+        meta = dict(component.meta)
+        meta.update({"nof_samples": len(samples), "nof_timestamps": len(timestamps), "start_index": start_index, "decimation": decimation})
+        # The metadata is completed by the sender thread (dropped frames count at send time)
+        def build(dropped_frames):
+            meta["dropped_frames"] = dropped_frames
+            return [pack_message(MSG_FRAME, meta, data), data]
+        return build, len(data)
+
+class LiveDataFrame:
+    """
+    Frame received by a LiveDataClient.
+
+    :param comp_name: Component name.
+    :param start_index: Absolute index of the first sample (in the not decimated stream).
+    :param samples: (n, dim) array of samples (device data type, not scaled).
+    :param timestamps: TIMESTAMP_DTYPE array (sample_index refers to the not decimated stream).
+    :param meta: Frame metadata (sensitivity, data_type, decimation, dropped_frames, ...).
+    """
+    def __init__(self, comp_name, start_index, samples, timestamps, meta):
+        self.comp_name = comp_name
+        self.start_index = start_index
+        self.samples = samples
+        self.timestamps = timestamps
+        self.meta = meta
+
+    @property
+    def scaled_samples(self):
+        return self.samples.astype(np.float32) * np.float32(self.meta.get("sensitivity", 1))
+
+class LiveDataClient:
+    """
+    Subscriber of a LiveDataServer.
+
+    :param address: [Optional] Server address (see parse_server_address).
+    :param components: [Optional] List of component names to receive (default: all).
+    :param decimation: [Optional] Keep one sample every `decimation` samples.
+    :param timeout: [Optional] Socket timeout [s].
+    """
+    def __init__(self, address = None, components = None, decimation = 1, timeout = None):
+        family, self.address = parse_server_address(address)
+        self.sock = socket.socket(family, socket.SOCK_STREAM)
+        self.sock.settimeout(timeout)
+        self.sock.connect(self.address)
+        self.components = {}
+        self.subscribe(components, decimation)
+
+    def subscribe(self, components = None, decimation = 1):
+        """
+        Changes the subscription (components filter and decimation).
+        """
+        self.sock.sendall(pack_message(MSG_SUBSCRIBE, {"components": list(components) if components is not None else None, "decimation": decimation}))
+
+    def receive(self):
+        """
+        Receives the next frame (MSG_HELLO messages update self.components).
+
+        :return: A LiveDataFrame, or None when the server closed the stream.
+        """
+        while True:
+            msg = recv_message(self.sock)
+            if msg is None:
+                return None
+            msg_type, meta, data = msg
+            if msg_type == MSG_HELLO:
+                self.components = {c["comp_name"]: c for c in meta.get("components", [])}
+            elif msg_type == MSG_END:
+                return None
+            elif msg_type == MSG_FRAME:
+                dtype = np.dtype(meta["dtype"])
+                samples_size = meta["nof_samples"] * meta["dim"] * dtype.itemsize
+                samples = np.frombuffer(data, dtype=dtype, count=meta["nof_samples"] * meta["dim"]).reshape(-1, meta["dim"])
+                timestamps = np.frombuffer(data, dtype=TIMESTAMP_DTYPE, offset=samples_size, count=meta["nof_timestamps"])
+                return LiveDataFrame(meta["comp_name"], meta["start_index"], samples, timestamps, meta)
+
+    def __iter__(self):
+        while True:
+            frame = self.receive()
+            if frame is None:
+                return
+            yield frame
+
+    def close(self):
+        self.sock.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
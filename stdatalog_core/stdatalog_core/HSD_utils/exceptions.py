@@ -122,6 +122,15 @@ class DeviceDisconnectedError(HSDLibError):
 class AcquisitionFormatError(HSDError):
     pass
 
+class AcquisitionArchiveError(HSDError):
+    pass
+
+class SegmentedLogError(HSDError):
+    pass
+
+class LoggingSessionError(HSDError):
+    pass
+
 class EmptyCommandResponse(HSDLibError):
     pass
 
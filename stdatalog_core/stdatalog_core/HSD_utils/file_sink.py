@@ -0,0 +1,431 @@
+# *****************************************************************************
+#  * @file    file_sink.py
+#  * @author  SRA
+# ******************************************************************************
+# * @attention
+# *
+# * Copyright (c) 2022 STMicroelectronics.
+# * All rights reserved.
+# *
+# * This software is licensed under terms that can be found in the LICENSE file
+# * in the root directory of this software component.
+# * If no LICENSE file comes with this software, it is provided AS-IS.
+# *
+# *
+# ******************************************************************************
+#
+
+"""
+Buffered sink for the raw sensor streams (.dat files) saved during a live acquisition.
+
+Acquisition threads poll small data blocks (a few KB every 20 ms) from the device.
+Writing each block directly to a file causes many small writes that, on SD-card backed
+hosts (e.g. Raspberry Pi), lead to write amplification and stalls. SensorDataFileSink
+collects the blocks in large page-aligned buffers and writes them out in full chunks,
+optionally from a background writer thread with a bounded number of buffers.
+"""
+
+import os
+import sys
+import math
+import mmap
+import time
+import errno
+import queue
+import bisect
+from enum import Enum
+from threading import Thread, Lock
+
+from stdatalog_core.HSD.utils.type_conversion import TypeConversion
+import stdatalog_core.HSD_utils.logger as logger
+
+log = logger.get_logger(__name__)
+
+# Write size/address alignment (required by O_DIRECT, matches the page size of the supported hosts)
+ALIGNMENT = 4096
+DEFAULT_BUFFER_SIZE = 1024 * 1024
+DEFAULT_MAX_QUEUED_BYTES = 16 * 1024 * 1024
+# Buffered data older than this [s] is written out even if the buffer is not full
+DEFAULT_MAX_BUFFER_AGE = 2.0
+# fallocate mode flag (linux/falloc.h): reserve the blocks without changing the file size
+FALLOC_FL_KEEP_SIZE = 0x01
+
+class FsyncPolicy(Enum):
+    NEVER = "never"
+    ON_CLOSE = "on_close"
+    PERIODIC = "periodic"
+
+class WriteLatencyHistogram:
+    """
+    Fixed-bucket latency histogram (bucket upper bounds in milliseconds).
+    """
+    BUCKET_BOUNDS_MS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000)
+
+    def __init__(self):
+        self.counts = [0] * (len(self.BUCKET_BOUNDS_MS) + 1)
+        self.count = 0
+        self.total_s = 0.0
+        self.max_s = 0.0
+
+    def record(self, duration_s):
+        self.counts[bisect.bisect_left(self.BUCKET_BOUNDS_MS, duration_s * 1000)] += 1
+        self.count += 1
+        self.total_s += duration_s
+        if duration_s > self.max_s:
+            self.max_s = duration_s
+
+    def percentile(self, q):
+        """
+        Returns the upper bound [ms] of the bucket containing the q-th percentile (0-100),
+        or the maximum recorded latency for the overflow bucket.
+        """
+        if self.count == 0:
+            return None
+        threshold = self.count * q / 100
+        cumulative = 0
+        for i, c in enumerate(self.counts):
+            cumulative += c
+            if cumulative >= threshold and c > 0:
+                return self.BUCKET_BOUNDS_MS[i] if i < len(self.BUCKET_BOUNDS_MS) else self.max_s * 1000
+        return self.max_s * 1000
+
+    def to_dict(self):
+        buckets = {"<={}ms".format(b): c for b, c in zip(self.BUCKET_BOUNDS_MS, self.counts)}
+        buckets[">{}ms".format(self.BUCKET_BOUNDS_MS[-1])] = self.counts[-1]
+        return {
+            "count": self.count,
+            "mean_ms": (self.total_s / self.count) * 1000 if self.count else None,
+            "p50_ms": self.percentile(50),
+            "p99_ms": self.percentile(99),
+            "max_ms": self.max_s * 1000,
+            "buckets": buckets,
+        }
+
+def reserve_file_space(fd, size):
+    """
+    Reserves the disk blocks of a file without changing its size (Linux fallocate with FALLOC_FL_KEEP_SIZE):
+    the file grows only with the written data, so an unterminated file has no zero-filled tail.
+
+    :param fd: File descriptor.
+    :param size: Size [bytes] to reserve, from the beginning of the file.
+    :return: True if reserved, False if not supported by the platform or by the filesystem.
+    """
+    if not sys.platform.startswith("linux"):
+        return False
+    import ctypes
+    try:
+        libc = ctypes.CDLL(None, use_errno=True)
+        # fallocate64 takes 64-bit offsets also on 32-bit hosts (e.g. Raspberry Pi OS)
+        fallocate = getattr(libc, "fallocate64", None) or libc.fallocate
+    except (OSError, AttributeError):
+        return False
+    fallocate.argtypes = [ctypes.c_int, ctypes.c_int, ctypes.c_int64, ctypes.c_int64]
+    fallocate.restype = ctypes.c_int
+    if fallocate(fd, FALLOC_FL_KEEP_SIZE, 0, int(size)) != 0:
+        err = ctypes.get_errno()
+        if err in (errno.EOPNOTSUPP, errno.ENOSYS):
+            return False
+        raise OSError(err, os.strerror(err))
+    return True
+
+def estimate_stream_size(odr, duration, dim, data_type, samples_per_ts = 0, packet_data_size = None):
+    """
+    Estimates the size in bytes of a component .dat file from its configuration.
+
+    :param odr: Output data rate [Hz].
+    :param duration: Expected acquisition duration [s].
+    :param dim: Number of axes.
+    :param data_type: Sample data type (e.g. "int16").
+    :param samples_per_ts: [Optional] Number of samples per timestamp (0: no timestamps).
+    :param packet_data_size: [Optional] Packet payload size (adds the 4-byte packet counters).
+    :return: The estimated size in bytes.
+    """
+    n_samples = odr * duration
+    size = n_samples * dim * TypeConversion.check_type_length(data_type)
+    if samples_per_ts:
+        size += (n_samples / samples_per_ts) * 8
+    if packet_data_size:
+        size += (size / packet_data_size) * 4
+    return int(math.ceil(size))
+
+class SensorDataFileSink:
+    """
+    File-like object (write/flush/close) buffering a raw sensor stream to disk.
+
+    :param file_path: Output file path. The file is created (or truncated).
+    :param buffer_size: Size of each write buffer, rounded down to a multiple of ALIGNMENT.
+    :param background_writer: If True, full buffers are written by a dedicated thread.
+    :param max_queued_bytes: Background writer only - memory bound for the buffers waiting to be written.
+        When all the buffers are queued, write() blocks until the storage catches up.
+    :param fsync_policy: FsyncPolicy value (NEVER, ON_CLOSE, PERIODIC).
+    :param fsync_period: Minimum time [s] between two fsync calls with FsyncPolicy.PERIODIC.
+    :param max_buffer_age: Maximum time [s] buffered data waits before being written out (None: only full buffers).
+        With the background writer the age is also checked by the writer thread, so a stream that goes quiet is written out too.
+    :param preallocate_size: [Optional] Expected file size in bytes, preallocated on disk. On Linux the blocks are
+        reserved keeping the file size (fallocate FALLOC_FL_KEEP_SIZE): the file size is always the size of the
+        written data. Elsewhere posix_fallocate is used (when the filesystem does not support FALLOC_FL_KEEP_SIZE too):
+        the file is zero-padded to preallocate_size until close, that truncates it to the written data size
+        (bytes_written). A file not closed (e.g. after a crash) keeps the padding, read as packets with counter 0.
+    :param direct_io: If True, the file is opened with O_DIRECT (Linux only), bypassing the page cache.
+        Falls back to buffered I/O when not supported by the platform or filesystem.
+    """
+    def __init__(self, file_path, buffer_size = DEFAULT_BUFFER_SIZE, background_writer = False, max_queued_bytes = DEFAULT_MAX_QUEUED_BYTES,
+                 fsync_policy = FsyncPolicy.NEVER, fsync_period = 1.0, max_buffer_age = DEFAULT_MAX_BUFFER_AGE, preallocate_size = None, direct_io = False):
+        self.name = file_path
+        self.closed = False
+        self.fsync_policy = FsyncPolicy(fsync_policy)
+        self.fsync_period = fsync_period
+        self.max_buffer_age = max_buffer_age
+        self.bytes_written = 0
+        self.nof_stalls = 0
+        self.stall_time_s = 0.0
+        # write() call duration (as seen by the acquisition thread, including back-pressure stalls)
+        self.write_latency = WriteLatencyHistogram()
+        # os.write duration of each buffer written to the storage
+        self.disk_write_latency = WriteLatencyHistogram()
+        self.fsync_latency = WriteLatencyHistogram()
+
+        self._buffer_size = max(ALIGNMENT, buffer_size - buffer_size % ALIGNMENT)
+        self._lock = Lock()
+        self._fd = self.__open(file_path, direct_io)
+
+        self.preallocated = False
+        # True when the preallocation extended the file size (zero-filled tail until close)
+        self.zero_padded = False
+        self._preallocate_size = preallocate_size
+        if preallocate_size:
+            try:
+                if reserve_file_space(self._fd, preallocate_size):
+                    self.preallocated = True
+                elif hasattr(os, "posix_fallocate"):
+                    os.posix_fallocate(self._fd, 0, int(preallocate_size))
+                    self.preallocated = True
+                    self.zero_padded = True
+            except OSError as e:
+                log.warning("{} - preallocation of {} bytes failed: {}".format(file_path, preallocate_size, e))
+
+        # mmap buffers are page-aligned, as required by O_DIRECT
+        self._buffer = mmap.mmap(-1, self._buffer_size)
+        self._buffer_pos = 0
+        self._last_dispatch_time = time.perf_counter()
+        self._last_fsync_time = self._last_dispatch_time
+
+        self._writer_thread = None
+        self._writer_error = None
+        self._queued_bytes = 0
+        # _queued_bytes is updated by write() and by the writer thread (a dedicated lock: close() joins the writer holding _lock)
+        self._queued_bytes_lock = Lock()
+        if background_writer:
+            nof_buffers = max(2, int(max_queued_bytes // self._buffer_size))
+            self._free_buffers = queue.Queue()
+            for _ in range(nof_buffers - 1):
+                self._free_buffers.put(mmap.mmap(-1, self._buffer_size))
+            self._write_queue = queue.Queue()
+            self._writer_thread = Thread(target=self.__writer_loop, name="{}_writer".format(os.path.basename(file_path)), daemon=True)
+            self._writer_thread.start()
+
+    def __open(self, file_path, direct_io):
+        flags = os.O_WRONLY | os.O_CREAT | os.O_TRUNC | getattr(os, "O_BINARY", 0)
+        self.direct_io = False
+        if direct_io:
+            if hasattr(os, "O_DIRECT"):
+                try:
+                    fd = os.open(file_path, flags | os.O_DIRECT, 0o666)
+                    self.direct_io = True
+                    return fd
+                except OSError as e:
+                    log.warning("{} - O_DIRECT not supported ({}), using buffered I/O".format(file_path, e))
+            else:
+                log.warning("O_DIRECT not supported on this platform, using buffered I/O")
+        return os.open(file_path, flags, 0o666)
+
+    def __disable_direct_io(self):
+        import fcntl
+        fcntl.fcntl(self._fd, fcntl.F_SETFL, fcntl.fcntl(self._fd, fcntl.F_GETFL) & ~os.O_DIRECT)
+        self.direct_io = False
+
+    def __write_out(self, buffer, length):
+        t0 = time.perf_counter()
+        with memoryview(buffer) as mv:
+            written = 0
+            while written < length:
+                try:
+                    written += os.write(self._fd, mv[written:length])
+                except OSError as e:
+                    if e.errno == errno.EINVAL and self.direct_io:
+                        log.warning("{} - O_DIRECT write rejected, using buffered I/O".format(self.name))
+                        self.__disable_direct_io()
+                    else:
+                        raise
+        now = time.perf_counter()
+        self.disk_write_latency.record(now - t0)
+        if self.fsync_policy == FsyncPolicy.PERIODIC and now - self._last_fsync_time >= self.fsync_period:
+            self.__sync()
+
+    def __sync(self):
+        t0 = time.perf_counter()
+        getattr(os, "fdatasync", os.fsync)(self._fd)
+        self._last_fsync_time = time.perf_counter()
+        self.fsync_latency.record(self._last_fsync_time - t0)
+
+    def __writer_loop(self):
+        # With max_buffer_age, the writer wakes up periodically to write out the data of a quiet stream
+        timeout = self.max_buffer_age / 2 if self.max_buffer_age is not None else None
+        while True:
+            try:
+                item = self._write_queue.get(timeout=timeout)
+            except queue.Empty:
+                self.__flush_aged_buffer()
+                continue
+            if item is None:
+                break
+            buffer, length = item
+            try:
+                if self._writer_error is None:
+                    self.__write_out(buffer, length)
+            except OSError as e:
+                self._writer_error = e
+                log.error("{} - write error: {}".format(self.name, e))
+            finally:
+                self._free_buffers.put(buffer)
+                with self._queued_bytes_lock:
+                    self._queued_bytes -= length
+
+    def __flush_aged_buffer(self):
+        # The acquisition thread is writing (it checks the age itself) or the sink is closing
+        if not self._lock.acquire(blocking=False):
+            return
+        try:
+            # No buffer is waiting in the queue (only write() adds them, holding _lock): the buffered data
+            # can be written out in place, by the writer thread, without reordering the file content
+            if not self.closed and self._writer_error is None and self._buffer_pos > 0 and self._write_queue.empty() \
+                    and time.perf_counter() - self._last_dispatch_time >= self.max_buffer_age:
+                self.__dispatch_buffer(partial = True, in_place = True)
+        except OSError as e:
+            self._writer_error = e
+            log.error("{} - write error: {}".format(self.name, e))
+        finally:
+            self._lock.release()
+
+    def __get_free_buffer(self):
+        try:
+            return self._free_buffers.get_nowait()
+        except queue.Empty:
+            # All the buffers are waiting to be written: the storage is not keeping up
+            t0 = time.perf_counter()
+            buffer = self._free_buffers.get()
+            self.stall_time_s += time.perf_counter() - t0
+            self.nof_stalls += 1
+            if self.nof_stalls == 1 or self.nof_stalls % 100 == 0:
+                log.warning("{} - storage is falling behind the data stream ({} stalls, {:.3f} s)".format(self.name, self.nof_stalls, self.stall_time_s))
+            return buffer
+
+    def __dispatch_buffer(self, partial = False, in_place = False):
+        length = self._buffer_pos
+        if partial and self.direct_io:
+            length -= length % ALIGNMENT
+        if length == 0:
+            return
+        remainder = self._buffer_pos - length
+        if self._writer_thread is None or in_place:
+            self.__write_out(self._buffer, length)
+            if remainder > 0:
+                self._buffer.move(0, length, remainder)
+        else:
+            new_buffer = self.__get_free_buffer()
+            if remainder > 0:
+                new_buffer[0:remainder] = self._buffer[length:self._buffer_pos]
+            with self._queued_bytes_lock:
+                self._queued_bytes += length
+            self._write_queue.put((self._buffer, length))
+            self._buffer = new_buffer
+        self._buffer_pos = remainder
+        self._last_dispatch_time = time.perf_counter()
+
+    def write(self, data):
+        t0 = time.perf_counter()
+        with self._lock:
+            if self.closed:
+                raise ValueError("write to closed file")
+            if self._writer_error is not None:
+                raise self._writer_error
+            with memoryview(data) as view:
+                n = len(view)
+                pos = 0
+                while pos < n:
+                    chunk = min(n - pos, self._buffer_size - self._buffer_pos)
+                    self._buffer[self._buffer_pos:self._buffer_pos + chunk] = view[pos:pos + chunk]
+                    self._buffer_pos += chunk
+                    pos += chunk
+                    if self._buffer_pos == self._buffer_size:
+                        self.__dispatch_buffer()
+            if self.max_buffer_age is not None and self._buffer_pos > 0 and t0 - self._last_dispatch_time >= self.max_buffer_age:
+                self.__dispatch_buffer(partial = True)
+            self.bytes_written += n
+        self.write_latency.record(time.perf_counter() - t0)
+        return n
+
+    def flush(self):
+        """
+        Hands the buffered data to the OS (only the aligned part with O_DIRECT).
+        """
+        with self._lock:
+            if not self.closed:
+                self.__dispatch_buffer(partial = True)
+
+    def close(self):
+        with self._lock:
+            if self.closed:
+                return
+            self.closed = True
+            try:
+                if self._writer_thread is not None:
+                    self.__dispatch_buffer(partial = True)
+                    self._write_queue.put(None)
+                    self._writer_thread.join()
+                    self._writer_thread = None
+                if self._buffer_pos > 0 and self._writer_error is None:
+                    # the unaligned tail cannot be written with O_DIRECT
+                    if self.direct_io:
+                        self.__disable_direct_io()
+                    self.__write_out(self._buffer, self._buffer_pos)
+                    self._buffer_pos = 0
+                if self.preallocated:
+                    # drops the zero padding (posix_fallocate) or the reserved blocks past the end of the data
+                    os.ftruncate(self._fd, os.lseek(self._fd, 0, os.SEEK_CUR))
+                if self.fsync_policy != FsyncPolicy.NEVER:
+                    self.__sync()
+            finally:
+                os.close(self._fd)
+                self._buffer.close()
+                if hasattr(self, "_free_buffers"):
+                    while not self._free_buffers.empty():
+                        self._free_buffers.get_nowait().close()
+            if self.nof_stalls > 0:
+                log.warning("{} - storage fell behind {} times during the acquisition ({:.3f} s stalled)".format(self.name, self.nof_stalls, self.stall_time_s))
+
+    def get_stats(self):
+        """
+        Returns the sink statistics (bytes written, write/disk/fsync latency histograms, back-pressure stalls).
+        """
+        return {
+            "file": self.name,
+            "bytes_written": self.bytes_written,
+            "buffer_size": self._buffer_size,
+            "queued_bytes": self._queued_bytes,
+            "direct_io": self.direct_io,
+            "preallocated": self.preallocated,
+            "zero_padded": self.zero_padded,
+            "nof_stalls": self.nof_stalls,
+            "stall_time_s": self.stall_time_s,
+            "write_latency": self.write_latency.to_dict(),
+            "disk_write_latency": self.disk_write_latency.to_dict(),
+            "fsync_latency": self.fsync_latency.to_dict(),
+        }
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
@@ -0,0 +1,364 @@
+# *****************************************************************************
+#  * @file    integrity.py
+#  * @author  SRA
+# ******************************************************************************
+# * @attention
+# *
+# * Copyright (c) 2022 STMicroelectronics.
+# * All rights reserved.
+# *
+# * This software is licensed under terms that can be found in the LICENSE file
+# * in the root directory of this software component.
+# * If no LICENSE file comes with this software, it is provided AS-IS.
+# *
+# *
+# ******************************************************************************
+#
+
+"""
+Packet-counter and timestamp integrity checks for component data streams.
+
+Each data packet of a stream starts with a 4-byte little endian counter holding the number
+of payload bytes sent before the packet (wrapping at 2^32). The counters of all the packets in
+a block are read with a single strided numpy view, so the same checks can run inline in the
+acquisition threads (PacketCounterChecker) and as a fast offline pass over .dat files
+(check_dat_file).
+"""
+
+import os
+import json
+from datetime import datetime
+
+import numpy as np
+
+from stdatalog_core.HSD.utils.type_conversion import TypeConversion
+from stdatalog_core.HSD.utils.virtual_fs import VirtualFS
+import stdatalog_core.HSD_utils.logger as logger
+
+log = logger.get_logger(__name__)
+
+INTEGRITY_REPORT_FILE_NAME = "integrity_report.json"
+DATA_PROTOCOL_SIZE = 4
+# Maximum number of gaps (and timestamp anomalies) listed in a report. The totals are always complete.
+MAX_REPORTED_GAPS = 1000
+
+COUNTER_MODULO = 2 ** 32
+
+class GapKind:
+    LOST = "lost"                  # one or more whole packets are missing
+    DUPLICATED = "duplicated"      # same counter received twice
+    BACKWARD = "backward"          # counter went back (device restart, corrupted counter)
+    MISALIGNED = "misaligned"      # counter step is not a multiple of the packet data size
+
+def get_packet_counters(buffer, packet_size, data_protocol_size = DATA_PROTOCOL_SIZE):
+    """
+    Returns a strided view on the packet counters of a buffer of complete packets (no copy).
+
+    :param buffer: bytes, bytearray, memoryview or numpy uint8 array (e.g. np.memmap) holding the packets.
+    :param packet_size: Complete packet size (data_protocol_size + packet data size).
+    :param data_protocol_size: [Optional] Counter size in bytes (default 4).
+    :return: numpy '<u4' array with one counter per complete packet.
+    """
+    nof_packets = len(buffer) // packet_size
+    if nof_packets == 0:
+        return np.empty(0, dtype='<u4')
+    if data_protocol_size != 4:
+        raise ValueError("Unsupported packet counter size: {}".format(data_protocol_size))
+    return np.ndarray((nof_packets,), dtype='<u4', buffer=buffer, offset=0, strides=(packet_size,))
+
+def get_payload_byte_rate(comp_status):
+    """
+    Computes the payload byte rate [bytes/s] of a sensor component (samples + timestamps, counters excluded).
+
+    :param comp_status: Component status dictionary (odr/measodr, dim, data_type, samples_per_ts).
+    :return: The byte rate, or None if the component has no output data rate.
+    """
+    odr = comp_status.get("measodr") or comp_status.get("odr")
+    if not odr or "data_type" not in comp_status:
+        return None
+    dim = comp_status.get("dim", 1)
+    spts = comp_status.get("samples_per_ts", 0)
+    if not isinstance(spts, int):
+        spts = spts.get("val", 0) if spts else 0
+    rate = odr * dim * TypeConversion.check_type_length(comp_status["data_type"])
+    if spts:
+        rate += (odr / spts) * 8
+    return rate
+
+def get_counter_steps(counters, prev_counter = None):
+    """
+    Computes the counter step (modulo 2^32) preceding each packet.
+
+    :param counters: numpy array of packet counters.
+    :param prev_counter: [Optional] Counter of the packet preceding counters[0]. If None, the step of counters[0] is 0.
+    :return: numpy int64 array of steps.
+    """
+    c = counters.astype(np.int64)
+    return np.diff(c, prepend=c[0] if prev_counter is None else prev_counter) % COUNTER_MODULO
+
+def classify_gap_step(step, packet_data_size):
+    if step == 0:
+        return GapKind.DUPLICATED
+    if step >= COUNTER_MODULO // 2:
+        return GapKind.BACKWARD
+    if step % packet_data_size != 0:
+        return GapKind.MISALIGNED
+    return GapKind.LOST
+
+class PacketCounterChecker:
+    """
+    Incremental packet-counter checker for a live component stream.
+
+    :param comp_name: Component name.
+    :param packet_data_size: Number of payload bytes per packet (usb_dps, sd_dps - 4, ...).
+    :param payload_byte_rate: [Optional] Payload bytes per second, used to report gaps as time ranges.
+    :param time_offset: [Optional] Time [s] corresponding to counter 0 (e.g. component ioffset).
+    """
+    def __init__(self, comp_name, packet_data_size, payload_byte_rate = None, time_offset = 0.0, data_protocol_size = DATA_PROTOCOL_SIZE):
+        self.comp_name = comp_name
+        self.packet_data_size = packet_data_size
+        self.data_protocol_size = data_protocol_size
+        self.packet_size = packet_data_size + data_protocol_size
+        self.payload_byte_rate = payload_byte_rate
+        self.time_offset = time_offset
+        self.prev_counter = None
+        # counter value unwrapped over the 2^32 wraps (payload offset of the last packet)
+        self.unwrapped_counter = None
+        self.first_counter = None
+        self.nof_packets = 0
+        self.nof_gap_events = 0
+        self.nof_lost_packets = 0
+        self.lost_bytes = 0
+        self.gap_counts = {GapKind.LOST: 0, GapKind.DUPLICATED: 0, GapKind.BACKWARD: 0, GapKind.MISALIGNED: 0}
+        self.gaps = []
+
+    def check_block(self, block):
+        """
+        Checks the counters of a block of complete packets, as returned by get_sensor_data.
+
+        :param block: The data block (bytes-like object).
+        :return: List of the gaps (dictionaries) found in the block.
+        """
+        counters = get_packet_counters(block, self.packet_size, self.data_protocol_size)
+        return self.check_counters(counters)
+
+    def check_counters(self, counters):
+        """
+        Checks a sequence of packet counters following the ones already checked.
+
+        :param counters: numpy array of packet counters.
+        :return: List of the gaps (dictionaries) found.
+        """
+        n = len(counters)
+        if n == 0:
+            return []
+        if self.prev_counter is None:
+            self.first_counter = int(counters[0])
+            prev_counter = int(counters[0]) - self.packet_data_size
+            self.unwrapped_counter = prev_counter
+        else:
+            prev_counter = self.prev_counter
+        steps = get_counter_steps(counters, prev_counter)
+        indexes = np.flatnonzero(steps != self.packet_data_size)
+        new_gaps = []
+        if len(indexes) > 0:
+            # Signed steps give the unwrapped counter of each packet
+            signed_steps = steps.copy()
+            signed_steps[signed_steps >= COUNTER_MODULO // 2] -= COUNTER_MODULO
+            unwrapped = self.unwrapped_counter + np.cumsum(signed_steps)
+            for i in indexes.tolist():
+                new_gaps.append(self.__make_gap(self.nof_packets + i, int(unwrapped[i] - signed_steps[i]), int(unwrapped[i]), int(steps[i])))
+            self.unwrapped_counter = int(unwrapped[-1])
+        else:
+            self.unwrapped_counter += n * self.packet_data_size
+        self.prev_counter = int(counters[-1])
+        self.nof_packets += n
+        return new_gaps
+
+    def __make_gap(self, packet_index, prev_unwrapped, unwrapped, step):
+        kind = classify_gap_step(step, self.packet_data_size)
+        expected = prev_unwrapped + self.packet_data_size
+        gap = {
+            "kind": kind,
+            "packet_index": packet_index,
+            "file_offset": packet_index * self.packet_size,
+            "expected_counter": expected % COUNTER_MODULO,
+            "counter": unwrapped % COUNTER_MODULO,
+            "start_byte": expected,
+            "end_byte": unwrapped,
+        }
+        if kind == GapKind.LOST:
+            gap["lost_bytes"] = unwrapped - expected
+            gap["lost_packets"] = (unwrapped - expected) // self.packet_data_size
+            self.nof_lost_packets += gap["lost_packets"]
+            self.lost_bytes += gap["lost_bytes"]
+        if self.payload_byte_rate:
+            gap["start_time"] = self.time_offset + expected / self.payload_byte_rate
+            gap["end_time"] = self.time_offset + unwrapped / self.payload_byte_rate
+        self.nof_gap_events += 1
+        self.gap_counts[kind] += 1
+        if len(self.gaps) < MAX_REPORTED_GAPS:
+            self.gaps.append(gap)
+        return gap
+
+    def get_report(self):
+        return {
+            "packet_data_size": self.packet_data_size,
+            "nof_packets": self.nof_packets,
+            "first_counter": self.first_counter,
+            "nof_gap_events": self.nof_gap_events,
+            "nof_lost_packets": self.nof_lost_packets,
+            "lost_bytes": self.lost_bytes,
+            "gap_counts": dict(self.gap_counts),
+            "gaps": list(self.gaps),
+            "nof_gaps_not_reported": max(0, self.nof_gap_events - len(self.gaps)),
+        }
+
+def check_timestamps(timestamps, expected_period = None):
+    """
+    Checks a sequence of frame timestamps for duplicated, non-monotonic and missing values.
+
+    :param timestamps: numpy array of timestamps [s].
+    :param expected_period: [Optional] Expected time between two timestamps [s]; steps longer than 1.5 periods are reported.
+    :return: A dictionary with the anomalies found.
+    """
+    timestamps = np.asarray(timestamps, dtype=np.float64)
+    report = {"nof_timestamps": int(len(timestamps)), "nof_duplicated": 0, "nof_non_monotonic": 0, "nof_time_gaps": 0}
+    if len(timestamps) < 2:
+        return report
+    steps = np.diff(timestamps)
+    duplicated = np.flatnonzero(steps == 0) + 1
+    non_monotonic = np.flatnonzero(steps < 0) + 1
+    report["nof_duplicated"] = int(len(duplicated))
+    report["nof_non_monotonic"] = int(len(non_monotonic))
+    report["duplicated"] = [{"index": int(i), "time": float(timestamps[i])} for i in duplicated[:MAX_REPORTED_GAPS]]
+    report["non_monotonic"] = [{"index": int(i), "time": float(timestamps[i]), "prev_time": float(timestamps[i-1])} for i in non_monotonic[:MAX_REPORTED_GAPS]]
+    report["first_time"] = float(timestamps[0])
+    report["last_time"] = float(timestamps[-1])
+    if expected_period:
+        time_gaps = np.flatnonzero(steps > 1.5 * expected_period) + 1
+        report["expected_period"] = expected_period
+        report["nof_time_gaps"] = int(len(time_gaps))
+        report["time_gaps"] = [{"start_time": float(timestamps[i-1]), "end_time": float(timestamps[i])} for i in time_gaps[:MAX_REPORTED_GAPS]]
+    return report
+
+def extract_frame_timestamps(packets, counters, packet_data_size, frame_size, timestamp_size = 8, data_protocol_size = DATA_PROTOCOL_SIZE):
+    """
+    Gathers the frame timestamps of a packet stream without rebuilding the payload.
+    The timestamp positions are computed from the packet counters, so the timestamps that fall
+    in lost packets are skipped and the following ones are still found.
+
+    :param packets: numpy uint8 array (e.g. np.memmap) holding the complete packets.
+    :param counters: The packet counters (see get_packet_counters).
+    :param packet_data_size: Number of payload bytes per packet.
+    :param frame_size: Frame size in bytes (samples_per_ts * dim * sample size + timestamp size).
+    :return: A tuple (timestamps, frame_indexes).
+    """
+    packet_size = packet_data_size + data_protocol_size
+    steps = get_counter_steps(counters)
+    if np.any((steps[1:] == 0) | (steps[1:] >= COUNTER_MODULO // 2)):
+        # Counters not usable as payload offsets: assume a loss-free stream
+        payload_offsets = np.arange(len(counters), dtype=np.int64) * packet_data_size
+    else:
+        # Unwrapped counters = payload offset of each packet
+        payload_offsets = int(counters[0]) + np.cumsum(steps)
+    end_offset = payload_offsets[-1] + packet_data_size
+    nof_frames = int(end_offset // frame_size)
+    if nof_frames == 0:
+        return np.empty(0, dtype=np.float64), np.empty(0, dtype=np.int64)
+
+    frame_indexes = np.arange(int(payload_offsets[0] // frame_size), nof_frames, dtype=np.int64)
+    # payload offset of the first timestamp byte of each frame, and the packet holding it
+    ts_offsets = frame_indexes * frame_size + (frame_size - timestamp_size)
+    packet_idx = np.searchsorted(payload_offsets, ts_offsets, side="right") - 1
+    in_packet = ts_offsets - payload_offsets[np.clip(packet_idx, 0, None)]
+    found = (packet_idx >= 0) & (in_packet < packet_data_size)
+    # timestamps entirely inside a packet are gathered from a strided (n_bytes, timestamp_size) view of the stream
+    inner = found & (in_packet + timestamp_size <= packet_data_size)
+    ts_windows = np.lib.stride_tricks.sliding_window_view(np.asarray(packets, dtype=np.uint8), timestamp_size)
+    raw = np.empty((len(frame_indexes), timestamp_size), dtype=np.uint8)
+    raw[inner] = ts_windows[packet_idx[inner] * packet_size + data_protocol_size + in_packet[inner]]
+    valid = inner
+    # the few timestamps split across packets are gathered byte by byte (valid only if every byte was received)
+    split = np.flatnonzero(found & ~inner)
+    if len(split) > 0:
+        ts_bytes = ts_offsets[split, None] + np.arange(timestamp_size, dtype=np.int64)[None, :]
+        bytes_packet_idx = np.searchsorted(payload_offsets, ts_bytes, side="right") - 1
+        bytes_in_packet = ts_bytes - payload_offsets[np.clip(bytes_packet_idx, 0, None)]
+        split_valid = ((bytes_packet_idx >= 0) & (bytes_in_packet < packet_data_size)).all(axis=1)
+        split = split[split_valid]
+        ts_bytes_pos = bytes_packet_idx[split_valid] * packet_size + data_protocol_size + bytes_in_packet[split_valid]
+        raw[split] = np.asarray(packets[ts_bytes_pos.reshape(-1)], dtype=np.uint8).reshape(-1, timestamp_size)
+        valid = valid.copy()
+        valid[split] = True
+    timestamps = raw[valid].view('<f8').reshape(-1)
+    return timestamps, frame_indexes[valid]
+
+def check_dat_file(file_path, packet_data_size, frame_size = None, payload_byte_rate = None, time_offset = 0.0, expected_period = None, data_protocol_size = DATA_PROTOCOL_SIZE, comp_name = None):
+    """
+    Offline integrity pass over a component .dat file.
+    Plain files are memory mapped, files inside an archive (see VirtualFS) are read in memory.
+
+    :param file_path: The .dat file path (possibly crossing an archive).
+    :param packet_data_size: Number of payload bytes per packet.
+    :param frame_size: [Optional] Frame size in bytes including the 8-byte timestamp. If None, timestamps are not checked.
+    :param payload_byte_rate: [Optional] Payload bytes per second, used to report gaps as time ranges.
+    :param time_offset: [Optional] Time [s] corresponding to counter 0.
+    :param expected_period: [Optional] Expected time between two timestamps [s].
+    :param comp_name: [Optional] Component name (default: file name).
+    :return: The component integrity report dictionary.
+    """
+    comp_name = comp_name or os.path.splitext(os.path.basename(file_path))[0]
+    packet_size = packet_data_size + data_protocol_size
+    file_size = VirtualFS.getsize(file_path)
+    checker = PacketCounterChecker(comp_name, packet_data_size, payload_byte_rate, time_offset, data_protocol_size)
+    report = {"file": os.path.basename(file_path), "file_size": file_size, "trailing_bytes": file_size % packet_size}
+    if file_size < packet_size:
+        report.update(checker.get_report())
+        return report
+
+    packets_size = file_size - file_size % packet_size
+    if VirtualFS.is_archive_path(file_path):
+        with VirtualFS.open(file_path, "rb") as f:
+            packets = np.frombuffer(f.read(packets_size), dtype=np.uint8)
+    else:
+        packets = np.memmap(file_path, dtype=np.uint8, mode='r', shape=(packets_size,))
+    try:
+        counters = get_packet_counters(packets, packet_size, data_protocol_size)
+        checker.check_counters(counters)
+        report.update(checker.get_report())
+        if frame_size:
+            timestamps, _ = extract_frame_timestamps(packets, counters, packet_data_size, frame_size, data_protocol_size = data_protocol_size)
+            report["timestamps"] = check_timestamps(timestamps, expected_period)
+    finally:
+        del packets
+    return report
+
+def is_report_clean(comp_report):
+    ts = comp_report.get("timestamps", {})
+    return comp_report.get("nof_gap_events", 0) == 0 and ts.get("nof_duplicated", 0) == 0 and ts.get("nof_non_monotonic", 0) == 0
+
+def save_integrity_report(acq_folder, comp_reports, source):
+    """
+    Saves (or updates) the integrity report in a folder (created if missing).
+
+    :param acq_folder: The report folder path (e.g. the acquisition folder).
+    :param comp_reports: Dictionary {component name: component report}.
+    :param source: Origin of the reports ("live" or "offline").
+    :return: The report file path.
+    """
+    os.makedirs(acq_folder, exist_ok=True)
+    report_path = os.path.join(acq_folder, INTEGRITY_REPORT_FILE_NAME)
+    report = {"components": {}}
+    if os.path.exists(report_path):
+        try:
+            with open(report_path, "r") as f:
+                report = json.load(f)
+        except (OSError, ValueError) as e:
+            log.warning("Invalid integrity report {} overwritten: {}".format(report_path, e))
+    components = report.setdefault("components", {})
+    for comp_name, comp_report in comp_reports.items():
+        components.setdefault(comp_name, {})[source] = dict(comp_report, date = datetime.now().isoformat(), ok = is_report_clean(comp_report))
+    with open(report_path, "w") as f:
+        json.dump(report, f, indent=4)
+    return report_path
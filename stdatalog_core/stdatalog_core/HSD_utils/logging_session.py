@@ -0,0 +1,334 @@
+# *****************************************************************************
+#  * @file    logging_session.py
+#  * @author  SRA
+# ******************************************************************************
+# * @attention
+# *
+# * Copyright (c) 2022 STMicroelectronics.
+# * All rights reserved.
+# *
+# * This software is licensed under terms that can be found in the LICENSE file
+# * in the root directory of this software component.
+# * If no LICENSE file comes with this software, it is provided AS-IS.
+# *
+# *
+# ******************************************************************************
+#
+
+"""
+Warm-start HSD_v2 logging session.
+
+A LoggingSession keeps its acquisition threads alive between acquisitions and prepares the next
+acquisition while the device is idle: prepare() creates the (hidden) acquisition folder, sets the
+device RTC and opens the .dat file sinks (buffers allocated, files preallocated), so that trigger()
+only sends the start command to the device and wakes up the threads. stop() closes the sinks,
+saves the json files, publishes the acquisition folder (renamed to the trigger date/time) and, by
+default, arms the session again for the next trigger.
+
+The latency from the trigger to the first data received of each component is measured and reported
+by get_metrics().
+"""
+
+import os
+import time
+import shutil
+from datetime import datetime
+from threading import Thread, Event, Lock
+
+from stdatalog_core.HSD_utils.exceptions import LoggingSessionError
+from stdatalog_core.HSD_utils.file_sink import SensorDataFileSink
+import stdatalog_core.HSD_utils.logger as logger
+
+log = logger.get_logger(__name__)
+
+ARMED_FOLDER_PREFIX = ".armed_"
+# Sensor data polling period [s] while logging (as SensorAcquisitionThread)
+DATA_POLL_PERIOD = 0.02
+# Sensor data polling period [s] between the trigger and the first data received
+FIRST_DATA_POLL_PERIOD = 0.001
+# Maximum time [s] to wait for the acquisition threads to go idle on stop
+THREADS_IDLE_TIMEOUT = 2.0
+# Number of acquisitions kept in the metrics history
+METRICS_HISTORY_SIZE = 100
+
+class SessionAcquisitionThread(Thread):
+    """
+    Long-lived acquisition thread of a LoggingSession component: it waits while the session is idle
+    and polls the component sensor data while the session is logging.
+
+    :param hsd_link: HSDLink_v2 instance.
+    :param d_id: Device ID.
+    :param comp_name: Component name.
+    :param logging_event: Event set while the session is logging.
+    :param closed_event: Event set to terminate the thread.
+    :param data_server: [Optional] Running LiveDataServer to publish sensor data to.
+    """
+    def __init__(self, hsd_link, d_id, comp_name, logging_event, closed_event, data_server = None):
+        Thread.__init__(self, name="logging_session_{}".format(comp_name), daemon=True)
+        self.hsd_link = hsd_link
+        self.d_id = d_id
+        self.s_id = comp_name
+        self.logging = logging_event
+        self.closed = closed_event
+        self.data_server = data_server
+        self.idle = Event()
+        self.idle.set()
+        self.sink = None
+        self.trigger_time = None
+        self.first_data_latency = None
+        self.first_data_time = None
+
+    def arm(self, sink):
+        """
+        Sets the sink of the next acquisition (called while the session is idle).
+
+        :param sink: SensorDataFileSink (or file-like object) receiving the sensor data.
+        """
+        self.sink = sink
+        self.trigger_time = None
+        self.first_data_latency = None
+        self.first_data_time = None
+
+    def run(self):
+        while not self.closed.is_set():
+            if not self.logging.wait(0.1):
+                continue
+            self.idle.clear()
+            try:
+                self.__poll()
+            finally:
+                self.idle.set()
+
+    def __poll(self):
+        poll_period = FIRST_DATA_POLL_PERIOD
+        while self.logging.is_set() and not self.closed.is_set():
+            res = self.hsd_link.get_sensor_data(self.d_id, self.s_id)
+            if res is not None:
+                size, sensor_data = res
+                if self.first_data_latency is None:
+                    self.first_data_time = time.time()
+                    if self.trigger_time is not None:
+                        self.first_data_latency = time.perf_counter() - self.trigger_time
+                    poll_period = DATA_POLL_PERIOD
+                self.hsd_link.sensor_data_counts[self.s_id] = self.hsd_link.sensor_data_counts.get(self.s_id, 0) + size
+                if self.sink is not None:
+                    self.sink.write(sensor_data)
+                if self.data_server is not None:
+                    self.data_server.publish_block(self.s_id, sensor_data)
+            self.closed.wait(poll_period)
+
+class LoggingSession:
+    """
+    Warm-start logging session on an HSD_v2 device (USB interface).
+
+    :param hsd_link: HSDLink_v2 instance.
+    :param device_id: Device ID.
+    :param components: Names of the components to save (e.g. the active sensors list).
+    :param output_folder: Folder where the acquisitions are published.
+    :param sink_options: [Optional] SensorDataFileSink options (see HSDLink.start_sensor_acquisition_thread).
+    :param expected_duration: [Optional] Expected acquisition duration [s], used to preallocate the .dat files.
+    :param data_server: [Optional] Running LiveDataServer the sensor data are also streamed to.
+    :param acquisition_catalog: [Optional] AcquisitionCatalog updated with the published acquisitions.
+    :param extra_files: [Optional] Dictionary file name -> source file path of files copied in every acquisition (e.g. UCF files).
+    :param rearm: If True (default), stop() prepares the session for the next trigger.
+    """
+    def __init__(self, hsd_link, device_id, components, output_folder, sink_options = None, expected_duration = None,
+                 data_server = None, acquisition_catalog = None, extra_files = None, rearm = True):
+        self.hsd_link = hsd_link
+        self.device_id = device_id
+        self.components = list(components)
+        self.output_folder = output_folder
+        self.sink_options = dict(sink_options) if sink_options is not None else {}
+        self.expected_duration = expected_duration
+        self.data_server = data_server
+        self.acquisition_catalog = acquisition_catalog
+        self.extra_files = dict(extra_files) if extra_files is not None else {}
+        self.rearm = rearm
+        self.is_armed = False
+        self.is_logging = False
+        self.published_acquisitions = []
+        self.sensor_data_files = []
+        self.__lock = Lock()
+        self.__logging_event = Event()
+        self.__closed_event = Event()
+        self.__threads = {}
+        self.__armed_folder = os.path.join(output_folder, "{}{}".format(ARMED_FOLDER_PREFIX, device_id))
+        self.__trigger_perf = None
+        self.__trigger_datetime = None
+        self.__last_metrics = None
+        self.__metrics_history = []
+
+    def get_armed_folder(self):
+        """Hidden folder where the next (or current) acquisition is written until it is published."""
+        return self.__armed_folder
+
+    def __start_threads(self):
+        from stdatalog_core.HSD_link.HSDLink import HSDLink
+        for comp_name in self.components:
+            if self.data_server is not None:
+                comp_status = HSDLink.get_component_status(self.hsd_link, self.device_id, comp_name)
+                if comp_status is not None:
+                    comp_status = comp_status.get(comp_name, comp_status)
+                if comp_status is None or not self.data_server.add_component(comp_name, comp_status):
+                    log.warning("{} cannot be streamed by the live data server".format(comp_name))
+            thread = SessionAcquisitionThread(self.hsd_link, self.device_id, comp_name, self.__logging_event, self.__closed_event, self.data_server)
+            self.__threads[comp_name] = thread
+            thread.start()
+
+    def prepare(self):
+        """
+        Arms the session: creates the acquisition folder, sets the device RTC, opens the .dat file sinks
+        and starts the acquisition threads (first call only). Nothing is sent to the device on trigger() but the start command.
+        """
+        from stdatalog_core.HSD_link.HSDLink import HSDLink
+        from stdatalog_core.HSD_link.HSDLink_v2 import HSDLink_v2, HSDLink_v2_Serial
+        if not isinstance(self.hsd_link, HSDLink_v2) or isinstance(self.hsd_link, HSDLink_v2_Serial):
+            raise LoggingSessionError("Logging sessions are supported only by HSD_v2 (USB) devices")
+        with self.__lock:
+            if self.__closed_event.is_set():
+                raise LoggingSessionError("Logging session closed")
+            if self.is_armed or self.is_logging:
+                return
+            if not self.__threads:
+                self.__start_threads()
+            if os.path.exists(self.__armed_folder):
+                # left by an interrupted session: nothing was published from it
+                shutil.rmtree(self.__armed_folder)
+            os.makedirs(self.__armed_folder)
+            self.sensor_data_files = []
+            for comp_name in self.components:
+                sink_options = dict(self.sink_options)
+                if self.expected_duration is not None and "preallocate_size" not in sink_options:
+                    sink_options["preallocate_size"] = HSDLink.get_expected_sensor_data_size(self.hsd_link, self.device_id, comp_name, self.expected_duration)
+                sink = SensorDataFileSink(os.path.join(self.__armed_folder, comp_name + ".dat"), **sink_options)
+                self.sensor_data_files.append(sink)
+                self.__threads[comp_name].arm(sink)
+            self.hsd_link.set_rtc_time(self.device_id)
+            self.is_armed = True
+            log.info("Logging session armed ({})".format(self.__armed_folder))
+
+    def trigger(self, interface = 1):
+        """
+        Starts the armed acquisition: sends the start command and wakes up the acquisition threads.
+
+        :param interface: Device logging interface (see HSDLink.start_log).
+        :return: The start command response.
+        """
+        with self.__lock:
+            if not self.is_armed:
+                raise LoggingSessionError("Logging session not armed (call prepare first)")
+            self.hsd_link.sensor_data_counts = {c: 0 for c in self.components}
+            self.__trigger_datetime = datetime.today()
+            start_time = time.time()
+            self.__trigger_perf = time.perf_counter()
+            for thread in self.__threads.values():
+                thread.trigger_time = self.__trigger_perf
+            self.__logging_event.set()
+            res = self.hsd_link.start_log(self.device_id, interface, acq_folder=self.__armed_folder, sub_folder=False, set_rtc=False)
+            start_command_latency = time.perf_counter() - self.__trigger_perf
+            # acquisition_folder stays the armed folder until stop(): restore the base folder
+            self.hsd_link.update_base_acquisition_folder(self.output_folder)
+            self.is_armed = False
+            self.is_logging = True
+            self.__last_metrics = {"start_time": start_time, "start_command_latency_s": start_command_latency}
+            return res
+
+    def __get_published_folder(self):
+        name = self.__trigger_datetime.strftime('%Y%m%d_%H_%M_%S')
+        folder = os.path.join(self.output_folder, name)
+        i = 1
+        while os.path.exists(folder):
+            folder = os.path.join(self.output_folder, "{}_{}".format(name, i))
+            i += 1
+        return folder
+
+    def stop(self, manual_tags = None):
+        """
+        Stops the acquisition, saves the json files and publishes the acquisition folder.
+        The session is armed again for the next trigger if rearm is True.
+
+        :param manual_tags: [Optional] Tags saved in acquisition_info.json instead of the device ones.
+        :return: The published acquisition folder path, None if the session was not logging.
+        """
+        with self.__lock:
+            if not self.is_logging:
+                return None
+            self.__logging_event.clear()
+            for thread in self.__threads.values():
+                if not thread.idle.wait(THREADS_IDLE_TIMEOUT):
+                    log.warning("{} acquisition thread still busy on stop".format(thread.s_id))
+            self.hsd_link.stop_log(self.device_id)
+            for sink in self.sensor_data_files:
+                sink.close()
+            self.is_logging = False
+
+            self.hsd_link.save_json_device_file(self.device_id)
+            self.hsd_link.save_json_acq_info_file(self.device_id, manual_tags=manual_tags)
+            for file_name, src_path in self.extra_files.items():
+                shutil.copyfile(src_path, os.path.join(self.__armed_folder, file_name))
+            published_folder = self.__get_published_folder()
+            os.replace(self.__armed_folder, published_folder)
+            self.hsd_link.acquisition_folder = published_folder
+            if self.acquisition_catalog is not None:
+                try:
+                    self.acquisition_catalog.move_acquisition(self.__armed_folder, published_folder)
+                except Exception as e:
+                    log.warning("Acquisition catalog not updated: {}".format(e))
+            self.published_acquisitions.append(published_folder)
+            self.__update_metrics()
+            log.info("Acquisition published: {}".format(published_folder))
+        if self.rearm:
+            self.prepare()
+        return published_folder
+
+    def __update_metrics(self):
+        first_data_latencies = {c: t.first_data_latency for c, t in self.__threads.items()}
+        received = [t for t in first_data_latencies.values() if t is not None]
+        self.__last_metrics["first_data_latency_s"] = min(received) if received else None
+        first_data_times = [t.first_data_time for t in self.__threads.values() if t.first_data_time is not None]
+        self.__last_metrics["first_data_time"] = min(first_data_times) if first_data_times else None
+        self.__last_metrics["components_first_data_latency_s"] = first_data_latencies
+        if received:
+            log.info("Trigger to first data latency: {:.1f} ms".format(min(received) * 1000))
+        self.__metrics_history.append(self.__last_metrics)
+        del self.__metrics_history[:-METRICS_HISTORY_SIZE]
+
+    def get_metrics(self):
+        """
+        Retrieves the session latency metrics.
+
+        :return: Dictionary with the number of published acquisitions, the last acquisition metrics
+            (start_time and first_data_time [s since the epoch], start_command_latency_s, first_data_latency_s,
+            components_first_data_latency_s) and
+            the min/mean/max of the trigger to first data latency over the last acquisitions.
+        """
+        latencies = [m["first_data_latency_s"] for m in self.__metrics_history if m.get("first_data_latency_s") is not None]
+        return {
+            "nof_acquisitions": len(self.published_acquisitions),
+            "last": dict(self.__last_metrics) if self.__last_metrics is not None else None,
+            "first_data_latency_s": {
+                "min": min(latencies) if latencies else None,
+                "mean": sum(latencies) / len(latencies) if latencies else None,
+                "max": max(latencies) if latencies else None,
+            },
+        }
+
+    def close(self):
+        """
+        Stops the session (publishing the running acquisition, if any), terminates the acquisition threads
+        and removes the armed (never triggered) acquisition folder.
+        """
+        self.rearm = False
+        self.stop()
+        with self.__lock:
+            self.__closed_event.set()
+            for thread in self.__threads.values():
+                thread.join()
+            self.__threads = {}
+            if self.is_armed:
+                for sink in self.sensor_data_files:
+                    sink.close()
+                self.sensor_data_files = []
+                shutil.rmtree(self.__armed_folder, ignore_errors=True)
+                self.is_armed = False
+        log.info("Logging session closed")
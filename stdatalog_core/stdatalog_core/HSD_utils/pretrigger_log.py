@@ -0,0 +1,335 @@
+# *****************************************************************************
+#  * @file    pretrigger_log.py
+#  * @author  SRA
+# ******************************************************************************
+# * @attention
+# *
+# * Copyright (c) 2022 STMicroelectronics.
+# * All rights reserved.
+# *
+# * This software is licensed under terms that can be found in the LICENSE file
+# * in the root directory of this software component.
+# * If no LICENSE file comes with this software, it is provided AS-IS.
+# *
+# *
+# ******************************************************************************
+#
+
+"""
+Pre-trigger HSD_v2 logging: the acquisitions include the data preceding their trigger.
+
+The device streams continuously, as in a segmented logging session (see HSD_utils.segmented_log).
+While no acquisition is recording, each component stream is written (re-packetized, one data frame
+per packet) to a PacketRingBuffer keeping the last pre_trigger_time seconds. On trigger the
+history is written at the beginning of the new acquisition .dat files, renumbered, followed by
+the live data. On release the acquisition goes on for post_trigger_time seconds, then the streams
+go back to new ring buffers and the acquisition folder is completed and published atomically.
+
+As for the segments, device_config.json reports the re-packetized packet size and, as "ioffset",
+the timestamp of the frame preceding the history, so that HSDatalog reads each acquisition with
+the sample times of the continuous stream.
+"""
+
+import os
+import math
+import time
+import struct
+from datetime import datetime
+from threading import Lock, Timer
+
+import numpy as np
+
+from stdatalog_core.HSD_utils.acquisition_catalog import parse_iso_datetime
+from stdatalog_core.HSD_utils.archive_codec import TIMESTAMP_SIZE
+from stdatalog_core.HSD_utils.exceptions import SegmentedLogError
+from stdatalog_core.HSD_utils.file_sink import SensorDataFileSink
+from stdatalog_core.HSD_utils.integrity import DATA_PROTOCOL_SIZE, get_payload_byte_rate
+from stdatalog_core.HSD_utils.segmented_log import PARTIAL_SEGMENT_SUFFIX, SegmentedStreamWriter, get_components_status, \
+    write_segment_files, publish_segment_folder
+import stdatalog_core.HSD_utils.logger as logger
+
+log = logger.get_logger(__name__)
+
+class PacketRingBuffer:
+    """
+    Bounded in-memory history of a component stream: file-like object (write/close) keeping the last
+    packets (counter + payload) written by a SegmentedStreamWriter.
+
+    :param packet_size: Packet size [bytes] (counter included).
+    :param capacity: Maximum number of packets kept.
+    :param has_timestamps: True if each packet payload ends with a frame timestamp.
+    :param prev_timestamp: [Optional] Timestamp of the frame preceding the first packet written.
+    """
+    def __init__(self, packet_size, capacity, has_timestamps, prev_timestamp = None):
+        self.packet_size = packet_size
+        self.capacity = max(1, int(capacity))
+        self.has_timestamps = has_timestamps
+        # timestamp of the frame preceding the oldest packet kept
+        self.prev_timestamp = prev_timestamp
+        self.nof_packets = 0
+        self.closed = False
+        self.__packets = np.empty((self.capacity, packet_size), dtype=np.uint8)
+        self.__pos = 0
+
+    def __get_timestamp(self, packet):
+        return struct.unpack("<d", packet[-TIMESTAMP_SIZE:].tobytes())[0]
+
+    def write(self, data):
+        packets = np.frombuffer(data, dtype=np.uint8).reshape(-1, self.packet_size)
+        n = len(packets)
+        if n == 0:
+            return 0
+        nof_dropped = self.nof_packets + n - self.capacity
+        if nof_dropped > 0 and self.has_timestamps:
+            # last dropped packet: from the buffer or from the new packets
+            if nof_dropped <= self.nof_packets:
+                self.prev_timestamp = self.__get_timestamp(self.__packets[(self.__pos - self.nof_packets + nof_dropped - 1) % self.capacity])
+            else:
+                self.prev_timestamp = self.__get_timestamp(packets[nof_dropped - self.nof_packets - 1])
+        packets = packets[-self.capacity:]
+        n = len(packets)
+        idx = (self.__pos + np.arange(n)) % self.capacity
+        self.__packets[idx] = packets
+        self.__pos = (self.__pos + n) % self.capacity
+        self.nof_packets = min(self.capacity, self.nof_packets + n)
+        return len(data)
+
+    def get_packets(self):
+        """
+        Returns the packets kept, oldest first.
+
+        :return: numpy uint8 array (n, packet_size) (copy).
+        """
+        idx = (self.__pos - self.nof_packets + np.arange(self.nof_packets)) % self.capacity
+        return self.__packets[idx]
+
+    def close(self):
+        self.closed = True
+
+class PreTriggerAcquisition:
+    """
+    Pre-trigger logging session on an HSD_v2 device: the device streams continuously, and each triggered
+    acquisition starts pre_trigger_time seconds before its trigger and ends post_trigger_time seconds after its release.
+
+    :param hsd_link: HSDLink_v2 instance.
+    :param device_id: Device ID.
+    :param components: Names of the components to save.
+    :param output_folder: Folder where the acquisitions are published (see also trigger).
+    :param pre_trigger_time: History [s] saved before the trigger.
+    :param post_trigger_time: [Optional] Time [s] recorded after the release.
+    :param sink_options: [Optional] SensorDataFileSink options (see HSDLink.start_sensor_acquisition_thread).
+    :param data_server: [Optional] Running LiveDataServer the sensor data are also streamed to.
+    :param on_acquisition_published: [Optional] Callback(acquisition_folder, acquisition_index) called after each publication.
+    :param acquisition_catalog: [Optional] AcquisitionCatalog updated with the published acquisitions.
+    :param extra_files: [Optional] Dictionary file name -> source file path of files copied in every acquisition (e.g. UCF files).
+    """
+    def __init__(self, hsd_link, device_id, components, output_folder, pre_trigger_time, post_trigger_time = 0, sink_options = None,
+                 data_server = None, on_acquisition_published = None, acquisition_catalog = None, extra_files = None):
+        if pre_trigger_time is None or pre_trigger_time < 0:
+            raise ValueError("pre_trigger_time must be >= 0")
+        if post_trigger_time is None or post_trigger_time < 0:
+            raise ValueError("post_trigger_time must be >= 0")
+        self.hsd_link = hsd_link
+        self.device_id = device_id
+        self.components = list(components)
+        self.output_folder = output_folder
+        self.pre_trigger_time = pre_trigger_time
+        self.post_trigger_time = post_trigger_time
+        self.sink_options = dict(sink_options) if sink_options is not None else {}
+        self.data_server = data_server
+        self.on_acquisition_published = on_acquisition_published
+        self.acquisition_catalog = acquisition_catalog
+        self.extra_files = dict(extra_files) if extra_files is not None else {}
+        self.published_acquisitions = []
+        self.is_started = False
+        self.is_recording = False
+        # Host time [s since the epoch] of the last trigger
+        self.trigger_time = None
+        self.__writers = {}
+        self.__ring_capacities = {}
+        self.__threads_stop_flags = []
+        self.__sensor_data_files = []
+        self.__lock = Lock()
+        self.__release_timer = None
+        self.__release_id = 0
+        self.__acquisition_folder = None
+        self.__ioffsets = {}
+        self.__device_status = None
+        self.__acq_info = None
+        self.__start_datetime = None
+        self.__start_perf = None
+
+    def __get_device_status(self):
+        try:
+            res = self.hsd_link.get_device_status(self.device_id)
+        except Exception as e:
+            log.warning("Device status not updated: {}".format(e))
+            res = None
+        if res is not None:
+            self.__device_status = res
+        return self.__device_status
+
+    def __get_acquisition_info(self):
+        try:
+            res = self.hsd_link.get_acquisition_info(self.device_id)
+        except Exception as e:
+            log.warning("Acquisition info not updated: {}".format(e))
+            res = None
+        if res is not None:
+            self.__acq_info = res.get("acquisition_info", res)
+        return self.__acq_info
+
+    def __new_ring(self, comp_name, prev_timestamp = None):
+        writer = self.__writers[comp_name]
+        return PacketRingBuffer(writer.segment_packet_size + DATA_PROTOCOL_SIZE, self.__ring_capacities[comp_name], writer.has_timestamps, prev_timestamp)
+
+    def start(self):
+        """
+        Starts the device logging and the acquisition threads: the component streams are kept in the ring buffers.
+        """
+        from stdatalog_core.HSD_link.HSDLink import HSDLink
+        from stdatalog_core.HSD_link.HSDLink_v2 import HSDLink_v2
+        if not isinstance(self.hsd_link, HSDLink_v2):
+            raise SegmentedLogError("Pre-trigger logging is supported only by HSD_v2 devices")
+        if self.is_started:
+            return
+        device_status = self.__get_device_status()
+        if device_status is None:
+            raise SegmentedLogError("Device status not available")
+        comp_statuses = get_components_status(device_status)
+
+        self.hsd_link.start_log(self.device_id, sub_folder=False, save_files=False)
+        self.__start_perf = time.perf_counter()
+        acq_info = self.__get_acquisition_info() or {}
+        self.__start_datetime = parse_iso_datetime(acq_info.get("start_time"))
+        interface = acq_info.get("interface", 1)
+
+        for comp_name in self.components:
+            comp_status = comp_statuses.get(comp_name, {})
+            writer = SegmentedStreamWriter(comp_name, comp_status, interface, None)
+            if writer.data_packet_size is None:
+                self.hsd_link.stop_log(self.device_id)
+                raise SegmentedLogError("{}: packet size not available, pre-trigger history not supported".format(comp_name))
+            byte_rate = get_payload_byte_rate(comp_status) or 0
+            self.__ring_capacities[comp_name] = math.ceil(self.pre_trigger_time * byte_rate / writer.segment_packet_size) + 1
+            self.__writers[comp_name] = writer
+            writer.rotate(self.__new_ring(comp_name))
+            HSDLink.start_sensor_acquisition_thread(self.hsd_link, self.device_id, comp_name, self.__threads_stop_flags, self.__sensor_data_files,
+                                                    data_server=self.data_server, sensor_data_file=writer)
+        self.is_started = True
+        log.info("Pre-trigger logging started ({:g} s history)".format(self.pre_trigger_time))
+
+    def trigger(self, output_folder = None):
+        """
+        Starts a new acquisition with the history kept in the ring buffers (or extends the running one, if any).
+
+        :param output_folder: [Optional] Folder where the acquisition is published (default: output_folder).
+        :return: The hidden folder the acquisition is written to until it is published.
+        """
+        with self.__lock:
+            if not self.is_started:
+                raise SegmentedLogError("Pre-trigger logging not started")
+            if self.__release_timer is not None:
+                # the post-trigger tail becomes part of the running acquisition
+                self.__release_timer.cancel()
+                self.__release_timer = None
+                self.__release_id += 1
+            if self.is_recording:
+                return self.__acquisition_folder
+            self.trigger_time = time.time()
+            output_folder = output_folder if output_folder is not None else self.output_folder
+            os.makedirs(output_folder, exist_ok=True)
+            name = datetime.today().strftime('%Y%m%d_%H_%M_%S')
+            folder = os.path.join(output_folder, "." + name + PARTIAL_SEGMENT_SUFFIX)
+            i = 1
+            while os.path.exists(folder) or os.path.exists(os.path.join(output_folder, name)):
+                name = "{}_{}".format(datetime.today().strftime('%Y%m%d_%H_%M_%S'), i)
+                folder = os.path.join(output_folder, "." + name + PARTIAL_SEGMENT_SUFFIX)
+                i += 1
+            os.makedirs(folder)
+            for comp_name, writer in self.__writers.items():
+                sink = SensorDataFileSink(os.path.join(folder, comp_name + ".dat"), **self.sink_options)
+                ring, _ = writer.rotate(sink, carry_over=True)
+                # the acquisition starts after the frame preceding the history
+                self.__ioffsets[comp_name] = ring.prev_timestamp
+                ring.close()
+            self.__acquisition_folder = folder
+            self.is_recording = True
+            log.info("Pre-trigger acquisition started ({})".format(folder))
+            return folder
+
+    def release(self):
+        """
+        Ends the running acquisition after post_trigger_time seconds (immediately if 0).
+        A trigger before the end continues the same acquisition.
+        """
+        with self.__lock:
+            if not self.is_recording or self.__release_timer is not None:
+                return
+            if self.post_trigger_time > 0:
+                self.__release_id += 1
+                self.__release_timer = Timer(self.post_trigger_time, self.__end_acquisition, args=(self.__release_id,))
+                self.__release_timer.daemon = True
+                self.__release_timer.start()
+                return
+        self.__end_acquisition()
+
+    def __end_acquisition(self, release_id = None):
+        with self.__lock:
+            if release_id is not None and release_id != self.__release_id:
+                # release cancelled by a new trigger
+                return None
+            self.__release_timer = None
+            if not self.is_recording:
+                return None
+            last_timestamps = {}
+            old_sinks = []
+            for comp_name, writer in self.__writers.items():
+                prev_timestamp = writer.last_timestamp
+                old_sink, last_timestamps[comp_name] = writer.rotate(self.__new_ring(comp_name, prev_timestamp))
+                old_sinks.append(old_sink)
+            self.is_recording = False
+            partial_folder, ioffsets = self.__acquisition_folder, dict(self.__ioffsets)
+        # a new acquisition can be triggered while this one is published
+        for s in old_sinks:
+            s.close()
+        return self.__publish_acquisition(partial_folder, last_timestamps, ioffsets)
+
+    def stop(self):
+        """
+        Ends the running acquisition (without the post-trigger tail still to record), stops the
+        acquisition threads and the device logging.
+
+        :return: The list of the published acquisition folders.
+        """
+        from stdatalog_core.HSD_link.HSDLink import HSDLink
+        if not self.is_started:
+            return self.published_acquisitions
+        with self.__lock:
+            if self.__release_timer is not None:
+                self.__release_timer.cancel()
+                self.__release_timer = None
+        self.__end_acquisition()
+        with self.__lock:
+            HSDLink.stop_sensor_acquisition_threads(self.__threads_stop_flags, self.__sensor_data_files)
+            self.hsd_link.stop_log(self.device_id)
+            self.is_started = False
+        log.info("Pre-trigger logging stopped: {} acquisitions".format(len(self.published_acquisitions)))
+        return self.published_acquisitions
+
+    def __publish_acquisition(self, partial_folder, last_timestamps, ioffsets):
+        end_offset = time.perf_counter() - self.__start_perf
+        end_offset = max([end_offset] + [t for t in last_timestamps.values() if t is not None])
+        write_segment_files(partial_folder, self.__get_device_status(), self.__get_acquisition_info(), self.__writers,
+                            ioffsets, self.__start_datetime, end_offset, self.extra_files)
+        acquisition_folder = publish_segment_folder(partial_folder)
+        self.published_acquisitions.append(acquisition_folder)
+        log.info("Pre-trigger acquisition published: {}".format(acquisition_folder))
+        if self.acquisition_catalog is not None:
+            try:
+                self.acquisition_catalog.update_acquisition(acquisition_folder)
+            except Exception as e:
+                log.warning("Acquisition catalog not updated: {}".format(e))
+        if self.on_acquisition_published is not None:
+            self.on_acquisition_published(acquisition_folder, len(self.published_acquisitions))
+        return acquisition_folder
@@ -0,0 +1,289 @@
+# *****************************************************************************
+#  * @file    profiling.py
+#  * @author  SRA
+# ******************************************************************************
+# * @attention
+# *
+# * Copyright (c) 2022 STMicroelectronics.
+# * All rights reserved.
+# *
+# * This software is licensed under terms that can be found in the LICENSE file
+# * in the root directory of this software component.
+# * If no LICENSE file comes with this software, it is provided AS-IS.
+# *
+# *
+# ******************************************************************************
+#
+
+"""
+Hot-path instrumentation: named spans and counters around the main processing stages
+(.dat read, packet strip, datalog processing, dataframe build, file writers, USB data pull,
+DataReader, plot updates, DataToolkit plugins).
+
+Instrumentation is disabled by default: span() returns a shared no-op context manager and
+count() returns immediately, so the instrumented code only pays a flag check.
+When enabled (start_profiling, the --profile option of the CLI applications or the
+STDATALOG_PROFILE=<output folder> environment variable), each span is recorded:
+    - in a latency histogram per span name (aggregate statistics),
+    - in a timeline exported in the Chrome trace event format (chrome://tracing, Perfetto).
+
+Usage:
+    with profiling.span("hsd.dat_read", {"component": comp_name}):
+        ...
+    profiling.count("hsd.dat_bytes", nbytes)
+
+    @profiled("dataframe.build")
+    def build(...): ...
+"""
+
+import os
+import json
+import time
+import atexit
+import functools
+import threading
+
+from stdatalog_core.HSD_utils.file_sink import WriteLatencyHistogram
+import stdatalog_core.HSD_utils.logger as logger
+
+log = logger.get_logger(__name__)
+
+# Output folder of the profile of the whole process run (profiling enabled at import)
+PROFILE_ENV_VAR = "STDATALOG_PROFILE"
+# Maximum number of timeline events kept in memory (histograms and counters are always updated)
+MAX_TRACE_EVENTS = 1000000
+TRACE_FILE_SUFFIX = "_trace.json"
+STATS_FILE_SUFFIX = "_stats.json"
+
+class _NullSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+_NULL_SPAN = _NullSpan()
+
+class _Span:
+    __slots__ = ("profiler", "name", "args", "start")
+
+    def __init__(self, profiler, name, args):
+        self.profiler = profiler
+        self.name = name
+        self.args = args
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.profiler.record(self.name, self.start, time.perf_counter() - self.start, self.args)
+        return False
+
+class Profiler:
+    """
+    Collects spans (latency histograms and timeline events) and counters.
+    """
+
+    def __init__(self, max_trace_events = MAX_TRACE_EVENTS):
+        """
+        :param max_trace_events: [Optional] Maximum number of timeline events kept in memory.
+        """
+        self.enabled = False
+        self.max_trace_events = max_trace_events
+        self.__lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """Clears the collected spans and counters."""
+        with self.__lock:
+            self.__origin = time.perf_counter()
+            self.__histograms = {}
+            self.__counters = {}
+            self.__events = []
+            self.__thread_names = {}
+            self.dropped_events = 0
+
+    def enable(self):
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+
+    def __add_event(self, event):
+        if len(self.__events) < self.max_trace_events:
+            self.__events.append(event)
+            thread = threading.current_thread()
+            if thread.ident not in self.__thread_names:
+                self.__thread_names[thread.ident] = thread.name
+        else:
+            self.dropped_events += 1
+
+    def record(self, name, start, duration, args = None):
+        """
+        Records a span.
+
+        :param name: Span name (e.g. "hsd.dat_read").
+        :param start: Start time (time.perf_counter()).
+        :param duration: Duration [s].
+        :param args: [Optional] Dictionary of span arguments shown in the timeline.
+        """
+        with self.__lock:
+            histogram = self.__histograms.get(name)
+            if histogram is None:
+                histogram = self.__histograms[name] = WriteLatencyHistogram()
+            histogram.record(duration)
+            self.__add_event(("X", name, start, duration, threading.get_ident(), args))
+
+    def count(self, name, value = 1):
+        """
+        Increments a counter.
+
+        :param name: Counter name (e.g. "hsd.dat_bytes").
+        :param value: [Optional] Increment.
+        """
+        with self.__lock:
+            total = self.__counters.get(name, 0) + value
+            self.__counters[name] = total
+            self.__add_event(("C", name, time.perf_counter(), total, threading.get_ident(), None))
+
+    def get_stats(self):
+        """
+        :return: Dictionary {"spans": {name: histogram dictionary + "total_ms"}, "counters": {name: value}, "dropped_events": n}.
+        """
+        with self.__lock:
+            spans = {}
+            for name, histogram in self.__histograms.items():
+                stats = histogram.to_dict()
+                stats["total_ms"] = histogram.total_s * 1000
+                spans[name] = stats
+            return {"spans": spans, "counters": dict(self.__counters), "dropped_events": self.dropped_events}
+
+    def get_chrome_trace(self):
+        """
+        :return: The timeline as a Chrome trace event format dictionary.
+        """
+        pid = os.getpid()
+        trace_events = []
+        with self.__lock:
+            for tid, thread_name in self.__thread_names.items():
+                trace_events.append({"name": "thread_name", "ph": "M", "pid": pid, "tid": tid, "args": {"name": thread_name}})
+            for phase, name, start, value, tid, args in self.__events:
+                event = {"name": name, "cat": name.split(".")[0], "ph": phase, "pid": pid, "tid": tid,
+                         "ts": round((start - self.__origin) * 1e6, 3)}
+                if phase == "X":
+                    event["dur"] = round(value * 1e6, 3)
+                    if args:
+                        event["args"] = args
+                else:
+                    event["args"] = {name: value}
+                trace_events.append(event)
+        return {"traceEvents": trace_events, "displayTimeUnit": "ms"}
+
+    def format_stats(self):
+        """
+        :return: The aggregate statistics as a text table (spans sorted by total time).
+        """
+        stats = self.get_stats()
+        lines = ["{:<36} {:>9} {:>12} {:>10} {:>10} {:>10} {:>10}".format("span", "count", "total [ms]", "mean [ms]", "p50 [ms]", "p99 [ms]", "max [ms]")]
+        for name, s in sorted(stats["spans"].items(), key=lambda item: item[1]["total_ms"], reverse=True):
+            lines.append("{:<36} {:>9} {:>12.3f} {:>10.3f} {:>10.3f} {:>10.3f} {:>10.3f}".format(
+                name, s["count"], s["total_ms"], s["mean_ms"], s["p50_ms"], s["p99_ms"], s["max_ms"]))
+        for name, value in sorted(stats["counters"].items()):
+            lines.append("{:<36} {:>9}".format(name, value))
+        if stats["dropped_events"] > 0:
+            lines.append("{} timeline events dropped (histograms and counters are complete)".format(stats["dropped_events"]))
+        return "\n".join(lines)
+
+    def export(self, output_folder, prefix = "profile"):
+        """
+        Saves the timeline (<prefix>_trace.json, Chrome trace event format) and the aggregate
+        statistics (<prefix>_stats.json).
+
+        :param output_folder: Output folder (created if needed).
+        :param prefix: [Optional] File names prefix.
+        :return: (trace file path, statistics file path).
+        """
+        os.makedirs(output_folder, exist_ok=True)
+        trace_path = os.path.join(output_folder, prefix + TRACE_FILE_SUFFIX)
+        stats_path = os.path.join(output_folder, prefix + STATS_FILE_SUFFIX)
+        with open(trace_path, "w") as f:
+            json.dump(self.get_chrome_trace(), f)
+        with open(stats_path, "w") as f:
+            json.dump(self.get_stats(), f, indent = 4)
+        return trace_path, stats_path
+
+_profiler = Profiler()
+
+def get_profiler():
+    """
+    :return: The process Profiler.
+    """
+    return _profiler
+
+def is_enabled():
+    return _profiler.enabled
+
+def span(name, args = None):
+    """
+    Returns a context manager measuring a span (a no-op when profiling is disabled).
+
+    :param name: Span name ("<stage category>.<stage>", e.g. "hsd.dat_read").
+    :param args: [Optional] Dictionary of span arguments shown in the timeline.
+    """
+    if not _profiler.enabled:
+        return _NULL_SPAN
+    return _Span(_profiler, name, args)
+
+def count(name, value = 1):
+    """
+    Increments a counter (nothing is done when profiling is disabled).
+    """
+    if _profiler.enabled:
+        _profiler.count(name, value)
+
+def profiled(name):
+    """
+    Decorator measuring each call of a function as a span.
+
+    :param name: Span name.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _profiler.enabled:
+                return func(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                _profiler.record(name, start, time.perf_counter() - start)
+        return wrapper
+    return decorator
+
+def start_profiling():
+    """Clears the collected data and enables the instrumentation."""
+    _profiler.reset()
+    _profiler.enable()
+
+def stop_profiling(output_folder = None, prefix = "profile"):
+    """
+    Disables the instrumentation, logs the aggregate statistics and saves the profile.
+
+    :param output_folder: [Optional] Folder where the timeline and the statistics are saved (see Profiler.export).
+    :param prefix: [Optional] File names prefix.
+    :return: (trace file path, statistics file path), None if output_folder is None.
+    """
+    _profiler.disable()
+    log.info("Profile:\n{}".format(_profiler.format_stats()))
+    if output_folder is None:
+        return None
+    paths = _profiler.export(output_folder, prefix)
+    log.info("Profile timeline saved in {} (open it with chrome://tracing or https://ui.perfetto.dev)".format(paths[0]))
+    return paths
+
+if os.environ.get(PROFILE_ENV_VAR):
+    start_profiling()
+    atexit.register(stop_profiling, os.environ[PROFILE_ENV_VAR], "profile_{}".format(os.getpid()))
@@ -0,0 +1,541 @@
+# *****************************************************************************
+#  * @file    segmented_log.py
+#  * @author  SRA
+# ******************************************************************************
+# * @attention
+# *
+# * Copyright (c) 2022 STMicroelectronics.
+# * All rights reserved.
+# *
+# * This software is licensed under terms that can be found in the LICENSE file
+# * in the root directory of this software component.
+# * If no LICENSE file comes with this software, it is provided AS-IS.
+# *
+# *
+# ******************************************************************************
+#
+
+"""
+Continuous (gap-free) HSD_v2 logging split in segments, i.e. output file rotation.
+
+The device keeps streaming for the whole session: the acquisition threads are started once and
+each component stream is written through a SegmentedStreamWriter. When a segment is rotated (by
+time, by size or on request) every writer switches to a new .dat file, without losing or
+duplicating any byte, and the closed segment folder is completed with its own json files and
+published atomically (renamed from a hidden ".<name>.partial" folder).
+
+To make every segment a valid acquisition folder, the writers strip the device packet counters
+and re-packetize the payload with one data frame (samples_per_ts samples + timestamp) per packet:
+a segment always starts at a frame boundary. The segment device_config.json reports
+the new packet size (usb/serial/ble_dps, sd_dps) and, as "ioffset", the timestamp of the last
+frame of the previous segment, so that HSDatalog reads each segment with the same sample times
+as the continuous stream. acquisition_info.json keeps the start time of the whole session (the
+time base of the data and tags timestamps), end_time is the end of the segment.
+After a packet counter discontinuity (device data lost) the incomplete frame is dropped, the writing
+resumes at the next frame boundary and the segment counters skip the bytes not written, so that the
+gap is still reported by the integrity checks.
+"""
+
+import os
+import json
+import time
+import uuid
+import shutil
+import struct
+from datetime import timedelta
+from threading import Thread, Event, Lock
+
+import numpy as np
+
+from stdatalog_core.HSD_utils.acquisition_catalog import parse_iso_datetime
+from stdatalog_core.HSD_utils.archive_codec import TIMESTAMP_SIZE, get_component_layout, get_data_packet_size
+from stdatalog_core.HSD_utils.exceptions import SegmentedLogError
+from stdatalog_core.HSD_utils.file_sink import SensorDataFileSink
+from stdatalog_core.HSD_utils.integrity import DATA_PROTOCOL_SIZE
+import stdatalog_core.HSD_utils.logger as logger
+
+log = logger.get_logger(__name__)
+
+ACQUISITION_INFO_FILE_NAME = "acquisition_info.json"
+DEVICE_CONFIG_FILE_NAME = "device_config.json"
+PARTIAL_SEGMENT_SUFFIX = ".partial"
+# Period [s] of the rotation thread checks (segment time and size limits)
+ROTATION_CHECK_PERIOD = 0.05
+
+def get_segment_packet_size(comp_status, interface):
+    """
+    Returns the payload size of the packets written in the segments of a component: one data frame
+    (samples_per_ts samples + timestamp), so that no complete frame is left out when the session stops.
+    Without timestamps, the largest multiple of the sample size not greater than the device packet payload.
+
+    :param comp_status: Component status dictionary.
+    :param interface: Acquisition interface (0:sd card, 1:usb, 2:ble, 3:serial).
+    :return: (device packet payload size, segment packet payload size, layout) or (None, None, layout)
+        if the device packet size is not available.
+    """
+    layout = get_component_layout(None, comp_status)
+    data_packet_size = get_data_packet_size(comp_status, interface)
+    if not data_packet_size:
+        return None, None, layout
+    frame_size = layout.get("frame_size")
+    if not frame_size:
+        return data_packet_size, data_packet_size, layout
+    if layout.get("samples_per_ts", 0) > 0:
+        return data_packet_size, frame_size, layout
+    return data_packet_size, frame_size * max(1, data_packet_size // frame_size), layout
+
+def format_acquisition_time(dt):
+    """Formats a datetime as the acquisition_info.json times (e.g. "2024-09-16T15:38:54.000Z")."""
+    return dt.strftime("%Y-%m-%dT%H:%M:%S.") + "{:03d}Z".format(dt.microsecond // 1000)
+
+def get_components_status(device_status):
+    """
+    Returns the components status of a device status (get_device_status response).
+
+    :param device_status: Device status dictionary.
+    :return: Dictionary component name -> component status.
+    """
+    comp_statuses = {}
+    for c in device_status["devices"][0]["components"]:
+        comp_name = list(c.keys())[0]
+        comp_statuses[comp_name] = c[comp_name]
+    return comp_statuses
+
+def write_segment_files(segment_folder, device_status, acq_info, writers, ioffsets, start_datetime, end_offset, extra_files = None):
+    """
+    Completes a segment folder: device_config.json with the segment packet sizes and ioffsets,
+    acquisition_info.json with a new uuid and the segment end time, and the extra files.
+
+    :param segment_folder: Segment folder path.
+    :param device_status: Device status dictionary (None: device_config.json is not written).
+    :param acq_info: Acquisition info dictionary of the session.
+    :param writers: Dictionary component name -> SegmentedStreamWriter.
+    :param ioffsets: Dictionary component name -> timestamp of the frame preceding the segment (None: device ioffset).
+    :param start_datetime: Session start datetime (None: end_time is not updated).
+    :param end_offset: Segment end time [s] from the session start.
+    :param extra_files: [Optional] Dictionary file name -> source file path of files copied in the segment.
+    """
+    acq_info = dict(acq_info or {})
+    if device_status is not None:
+        device_status = json.loads(json.dumps(device_status))
+        components = device_status["devices"][0]["components"]
+        for i, c in enumerate(components):
+            if "acquisition_info" in c:
+                device_status["uuid"] = c["acquisition_info"].get("uuid")
+                components.pop(i)
+                break
+        for c in components:
+            comp_name = list(c.keys())[0]
+            writer = writers.get(comp_name)
+            if writer is None or writer.data_packet_size is None:
+                continue
+            comp_status = c[comp_name]
+            for dps_key in ("usb_dps", "ble_dps", "serial_dps"):
+                if comp_status.get(dps_key):
+                    comp_status[dps_key] = writer.segment_packet_size
+            if comp_status.get("sd_dps"):
+                comp_status["sd_dps"] = writer.segment_packet_size + DATA_PROTOCOL_SIZE
+            if ioffsets.get(comp_name) is not None:
+                comp_status["ioffset"] = ioffsets[comp_name]
+        with open(os.path.join(segment_folder, DEVICE_CONFIG_FILE_NAME), "w") as f:
+            f.write(json.dumps(device_status, indent = 4))
+    if start_datetime is not None:
+        acq_info["end_time"] = format_acquisition_time(start_datetime + timedelta(seconds=end_offset))
+    acq_info["uuid"] = str(uuid.uuid4())
+    with open(os.path.join(segment_folder, ACQUISITION_INFO_FILE_NAME), "w") as f:
+        f.write(json.dumps(acq_info, indent = 4))
+    for file_name, src_path in (extra_files or {}).items():
+        shutil.copyfile(src_path, os.path.join(segment_folder, file_name))
+
+def publish_segment_folder(partial_folder):
+    """
+    Publishes a completed segment folder, renaming (atomically) ".<name>.partial" to "<name>".
+
+    :param partial_folder: Hidden partial folder path.
+    :return: The published folder path.
+    """
+    name = os.path.basename(partial_folder)[1:-len(PARTIAL_SEGMENT_SUFFIX)]
+    segment_folder = os.path.join(os.path.dirname(partial_folder), name)
+    os.replace(partial_folder, segment_folder)
+    return segment_folder
+
+class SegmentedStreamWriter:
+    """
+    File-like object (write/close) receiving the raw stream of a component (device packets:
+    counter + payload) and writing it re-packetized, as whole data frames, to the current segment file.
+
+    :param comp_name: Component name.
+    :param comp_status: Component status dictionary.
+    :param interface: Acquisition interface (0:sd card, 1:usb, 2:ble, 3:serial).
+    :param sink: File object (e.g. SensorDataFileSink) of the first segment.
+    """
+    def __init__(self, comp_name, comp_status, interface, sink):
+        self.name = comp_name
+        self.closed = False
+        self.data_packet_size, self.segment_packet_size, layout = get_segment_packet_size(comp_status, interface)
+        self.has_timestamps = layout.get("samples_per_ts", 0) > 0
+        if self.data_packet_size is None:
+            log.warning("{}: packet size not available, the segments are cut at data block boundaries".format(comp_name))
+        self.nof_counter_errors = 0
+        self.segment_bytes = 0
+        self.last_timestamp = None
+        self.first_data_time = None
+        self.__sink = sink
+        self.__lock = Lock()
+        # Unit of the realignment after a packet counter discontinuity (the output packets are multiples of it)
+        self.__frame_size = layout.get("frame_size") or self.segment_packet_size
+        self.__packets = bytearray()
+        self.__payload = bytearray()
+        self.__prev_counter = None
+        self.__out_counter = 0
+        # Device stream positions [bytes, from the first packet]: end of the received payload, next byte to be written
+        self.__stream_pos = 0
+        self.__next_pos = 0
+
+    def write(self, data):
+        with self.__lock:
+            if self.closed:
+                return 0
+            if self.first_data_time is None:
+                self.first_data_time = time.time()
+            if self.data_packet_size is None:
+                self.__sink.write(data)
+                self.segment_bytes += len(data)
+                return len(data)
+            self.__packets += data
+            packet_size = self.data_packet_size + DATA_PROTOCOL_SIZE
+            nof_packets = len(self.__packets) // packet_size
+            if nof_packets > 0:
+                packets = np.frombuffer(self.__packets, dtype=np.uint8, count=nof_packets * packet_size).reshape(nof_packets, packet_size)
+                counters = packets[:, :DATA_PROTOCOL_SIZE].copy().view("<u4").reshape(-1)
+                for start, stop, step in self.__get_contiguous_runs(counters):
+                    if step is not None:
+                        self.__resync(step)
+                    self.__append_payload(packets[start:stop, DATA_PROTOCOL_SIZE:])
+                    self.__write_packets()
+                del packets
+                del self.__packets[:nof_packets * packet_size]
+            return len(data)
+
+    def __get_contiguous_runs(self, counters):
+        """
+        Splits a block of packets at the packet counter discontinuities.
+
+        :param counters: numpy array of the packet counters.
+        :return: List of (first packet, end packet, counter step preceding the first packet), the step is None
+            if the run follows the previous packets without discontinuity.
+        """
+        prev_counter = int(counters[0]) - self.data_packet_size if self.__prev_counter is None else self.__prev_counter
+        steps = np.diff(counters.astype(np.int64), prepend=prev_counter) & 0xFFFFFFFF
+        self.__prev_counter = int(counters[-1])
+        gaps = np.flatnonzero(steps != self.data_packet_size).tolist()
+        if len(gaps) == 0:
+            return [(0, len(counters), None)]
+        if self.nof_counter_errors == 0:
+            log.warning("{}: packet counter discontinuity, device data lost".format(self.name))
+        self.nof_counter_errors += len(gaps)
+        runs = [(0, gaps[0], None)] if gaps[0] > 0 else []
+        for i, start in enumerate(gaps):
+            stop = gaps[i + 1] if i + 1 < len(gaps) else len(counters)
+            runs.append((start, stop, int(steps[start])))
+        return runs
+
+    def __resync(self, step):
+        """
+        Handles a packet counter discontinuity: the incomplete output packet is dropped and the writing resumes
+        at the first frame boundary of the stream following the discontinuity. The output counter is advanced
+        by the bytes not written (dropped, lost and skipped), so that the gap is reported by the segment counters.
+
+        :param step: Counter step [bytes] preceding the first packet after the discontinuity.
+        """
+        # stream position of the first byte of the packet following the discontinuity
+        run_start = self.__stream_pos - self.data_packet_size + step
+        payload_start = self.__next_pos - len(self.__payload)
+        del self.__payload[:]
+        resume_pos = -(-max(run_start, self.__next_pos) // self.__frame_size) * self.__frame_size
+        self.__out_counter = (self.__out_counter + resume_pos - payload_start) & 0xFFFFFFFF
+        self.__next_pos = resume_pos
+        self.__stream_pos = run_start
+
+    def __append_payload(self, payload):
+        """
+        :param payload: numpy uint8 array (n, data_packet_size) of the payload of contiguous packets.
+        """
+        size = payload.size
+        # bytes to be skipped (up to the frame boundary following a discontinuity)
+        skip = self.__next_pos - self.__stream_pos
+        if skip == 0:
+            self.__payload += payload.tobytes()
+            self.__next_pos += size
+        elif skip < size:
+            self.__payload += payload.tobytes()[skip:]
+            self.__next_pos = self.__stream_pos + size
+        self.__stream_pos += size
+
+    def __write_packets(self):
+        size = self.segment_packet_size
+        nof_packets = len(self.__payload) // size
+        if nof_packets == 0:
+            return
+        packets = np.empty((nof_packets, size + DATA_PROTOCOL_SIZE), dtype=np.uint8)
+        packets[:, DATA_PROTOCOL_SIZE:] = np.frombuffer(self.__payload, dtype=np.uint8, count=nof_packets * size).reshape(nof_packets, size)
+        counters = (self.__out_counter + size * np.arange(1, nof_packets + 1, dtype=np.int64)) & 0xFFFFFFFF
+        packets[:, :DATA_PROTOCOL_SIZE] = counters.astype("<u4").view(np.uint8).reshape(nof_packets, DATA_PROTOCOL_SIZE)
+        self.__out_counter = int(counters[-1])
+        if self.has_timestamps:
+            self.last_timestamp = struct.unpack("<d", packets[-1, -TIMESTAMP_SIZE:].tobytes())[0]
+        del self.__payload[:nof_packets * size]
+        self.__sink.write(packets.reshape(-1))
+        self.segment_bytes += packets.nbytes
+
+    def rotate(self, new_sink, carry_over = False):
+        """
+        Switches to a new segment file. The data not written yet (an incomplete packet) goes to the new file.
+
+        :param new_sink: File object of the new segment.
+        :param carry_over: If True, the packets held by the current sink (get_packets(), e.g. a PacketRingBuffer)
+            are written first in the new file, renumbered from the segment origin (counter gaps included).
+        :return: (old_sink, last_timestamp): the file of the closed segment (to be closed by the caller)
+            and the timestamp of its last frame (None if not available).
+        """
+        with self.__lock:
+            old_sink, last_timestamp = self.__sink, self.last_timestamp
+            self.__sink = new_sink
+            self.__out_counter = 0
+            self.segment_bytes = 0
+            if carry_over:
+                packets = old_sink.get_packets()
+                nof_packets = len(packets)
+                if nof_packets > 0:
+                    # The counters are shifted to start from the segment origin: the steps (and the gaps) are kept
+                    counters = packets[:, :DATA_PROTOCOL_SIZE].copy().view("<u4").reshape(-1).astype(np.int64)
+                    counters = (counters - counters[0] + self.segment_packet_size) & 0xFFFFFFFF
+                    packets[:, :DATA_PROTOCOL_SIZE] = counters.astype("<u4").view(np.uint8).reshape(nof_packets, DATA_PROTOCOL_SIZE)
+                    self.__out_counter = int(counters[-1])
+                    new_sink.write(packets.reshape(-1))
+                    self.segment_bytes = packets.nbytes
+            return old_sink, last_timestamp
+
+    def close(self):
+        """
+        Closes the current segment file. An incomplete trailing packet is dropped, as by HSDatalog when reading.
+        """
+        with self.__lock:
+            if self.closed:
+                return
+            self.closed = True
+            self.__sink.close()
+
+    def get_sink(self):
+        return self.__sink
+
+class SegmentedAcquisition:
+    """
+    Continuous logging session on an HSD_v2 device with output segments rotated by time and/or size.
+
+    :param hsd_link: HSDLink_v2 instance.
+    :param device_id: Device ID.
+    :param components: Names of the components to save.
+    :param output_folder: Folder where the segments are published.
+    :param segment_time: [Optional] Segment duration [s].
+    :param segment_size: [Optional] Maximum segment size [bytes] (all the .dat files).
+    :param sink_options: [Optional] SensorDataFileSink options (see HSDLink.start_sensor_acquisition_thread).
+    :param data_server: [Optional] Running LiveDataServer the sensor data are also streamed to.
+    :param on_segment_published: [Optional] Callback(segment_folder, segment_index) called after each publication.
+    :param acquisition_catalog: [Optional] AcquisitionCatalog updated with the published segments.
+    :param extra_files: [Optional] Dictionary file name -> source file path of files copied in every segment (e.g. UCF files).
+    """
+    def __init__(self, hsd_link, device_id, components, output_folder, segment_time = None, segment_size = None, sink_options = None,
+                 data_server = None, on_segment_published = None, acquisition_catalog = None, extra_files = None):
+        if segment_time is not None and segment_time <= 0:
+            raise ValueError("segment_time must be > 0")
+        if segment_size is not None and segment_size <= 0:
+            raise ValueError("segment_size must be > 0")
+        self.hsd_link = hsd_link
+        self.device_id = device_id
+        self.components = list(components)
+        self.output_folder = output_folder
+        self.segment_time = segment_time
+        self.segment_size = segment_size
+        self.sink_options = dict(sink_options) if sink_options is not None else {}
+        self.data_server = data_server
+        self.on_segment_published = on_segment_published
+        self.acquisition_catalog = acquisition_catalog
+        self.extra_files = dict(extra_files) if extra_files is not None else {}
+        self.published_segments = []
+        self.is_started = False
+        self.__writers = {}
+        self.__threads_stop_flags = []
+        self.__sensor_data_files = []
+        self.__rotation_lock = Lock()
+        self.__rotation_stop = Event()
+        self.__rotation_thread = None
+        self.__segment_index = 0
+        self.__segment_folder = None
+        self.__segment_start = None
+        self.__ioffsets = {}
+        self.__device_status = None
+        self.__acq_info = None
+        self.__start_datetime = None
+        self.__start_perf = None
+        # Host times [s since the epoch] of the start command and of the first data received
+        self.start_time = None
+
+    def __get_device_status(self):
+        try:
+            res = self.hsd_link.get_device_status(self.device_id)
+        except Exception as e:
+            log.warning("Device status not updated: {}".format(e))
+            res = None
+        if res is not None:
+            self.__device_status = res
+        return self.__device_status
+
+    def __get_acquisition_info(self):
+        try:
+            res = self.hsd_link.get_acquisition_info(self.device_id)
+        except Exception as e:
+            log.warning("Acquisition info not updated: {}".format(e))
+            res = None
+        if res is not None:
+            self.__acq_info = res.get("acquisition_info", res)
+        return self.__acq_info
+
+    def __new_segment_folder(self):
+        self.__segment_index += 1
+        name = "{}_{:05d}".format(time.strftime("%Y%m%d_%H_%M_%S"), self.__segment_index)
+        folder = os.path.join(self.output_folder, "." + name + PARTIAL_SEGMENT_SUFFIX)
+        os.makedirs(folder, exist_ok=True)
+        return folder
+
+    def __new_sink(self, segment_folder, comp_name):
+        return SensorDataFileSink(os.path.join(segment_folder, comp_name + ".dat"), **self.sink_options)
+
+    def start(self):
+        """
+        Starts the device logging and the acquisition threads, and opens the first segment.
+        """
+        from stdatalog_core.HSD_link.HSDLink import HSDLink
+        from stdatalog_core.HSD_link.HSDLink_v2 import HSDLink_v2
+        if not isinstance(self.hsd_link, HSDLink_v2):
+            raise SegmentedLogError("Segmented logging is supported only by HSD_v2 devices")
+        if self.is_started:
+            return
+        os.makedirs(self.output_folder, exist_ok=True)
+        device_status = self.__get_device_status()
+        if device_status is None:
+            raise SegmentedLogError("Device status not available")
+        comp_statuses = get_components_status(device_status)
+
+        # The segment folders are created here: the device logging does not save any file
+        self.start_time = time.time()
+        self.hsd_link.start_log(self.device_id, sub_folder=False, save_files=False)
+        self.__start_perf = time.perf_counter()
+        acq_info = self.__get_acquisition_info() or {}
+        self.__start_datetime = parse_iso_datetime(acq_info.get("start_time"))
+        interface = acq_info.get("interface", 1)
+
+        self.__segment_folder = self.__new_segment_folder()
+        self.__segment_start = time.perf_counter()
+        for comp_name in self.components:
+            comp_status = comp_statuses.get(comp_name, {})
+            # The first segment keeps the ioffset reported by the device
+            self.__ioffsets[comp_name] = None
+            writer = SegmentedStreamWriter(comp_name, comp_status, interface, self.__new_sink(self.__segment_folder, comp_name))
+            self.__writers[comp_name] = writer
+            HSDLink.start_sensor_acquisition_thread(self.hsd_link, self.device_id, comp_name, self.__threads_stop_flags, self.__sensor_data_files,
+                                                    data_server=self.data_server, sensor_data_file=writer)
+        self.is_started = True
+        if self.segment_time is not None or self.segment_size is not None:
+            self.__rotation_stop.clear()
+            self.__rotation_thread = Thread(target=self.__rotation_loop, name="segment_rotation", daemon=True)
+            self.__rotation_thread.start()
+        log.info("Segmented logging started ({})".format(self.output_folder))
+
+    def __rotation_loop(self):
+        while not self.__rotation_stop.wait(ROTATION_CHECK_PERIOD):
+            elapsed = time.perf_counter() - self.__segment_start
+            size = sum(w.segment_bytes for w in self.__writers.values())
+            if (self.segment_time is not None and elapsed >= self.segment_time) or (self.segment_size is not None and size >= self.segment_size):
+                try:
+                    self.rotate()
+                except Exception as e:
+                    log.error("Segment rotation failed: {}".format(e))
+
+    def get_first_data_time(self):
+        """Host time [s since the epoch] the first sensor data were received, None if no data were received."""
+        times = [w.first_data_time for w in self.__writers.values() if w.first_data_time is not None]
+        return min(times) if times else None
+
+    def get_segment_elapsed_time(self):
+        """Time [s] since the current segment was opened."""
+        return time.perf_counter() - self.__segment_start if self.__segment_start is not None else 0
+
+    def rotate(self):
+        """
+        Closes the current segment (publishing it) and continues in a new one.
+
+        :return: The published segment folder path.
+        """
+        with self.__rotation_lock:
+            if not self.is_started:
+                return None
+            closed_folder = self.__segment_folder
+            self.__segment_folder = self.__new_segment_folder()
+            self.__segment_start = time.perf_counter()
+            old_sinks = []
+            last_timestamps = {}
+            for comp_name, writer in self.__writers.items():
+                old_sink, last_timestamps[comp_name] = writer.rotate(self.__new_sink(self.__segment_folder, comp_name))
+                old_sinks.append(old_sink)
+            for s in old_sinks:
+                s.close()
+            published_folder = self.__publish_segment(closed_folder, last_timestamps)
+            # Next segment: its first frame follows the last frame of the published one
+            for comp_name, last_timestamp in last_timestamps.items():
+                if last_timestamp is not None:
+                    self.__ioffsets[comp_name] = last_timestamp
+            return published_folder
+
+    def stop(self):
+        """
+        Stops the acquisition threads and the device logging, and publishes the last segment.
+
+        :return: The list of the published segment folders.
+        """
+        from stdatalog_core.HSD_link.HSDLink import HSDLink
+        if not self.is_started:
+            return self.published_segments
+        if self.__rotation_thread is not None:
+            self.__rotation_stop.set()
+            self.__rotation_thread.join()
+            self.__rotation_thread = None
+        with self.__rotation_lock:
+            HSDLink.stop_sensor_acquisition_threads(self.__threads_stop_flags, self.__sensor_data_files)
+            self.hsd_link.stop_log(self.device_id)
+            self.is_started = False
+            last_timestamps = {comp_name: w.last_timestamp for comp_name, w in self.__writers.items()}
+            self.__publish_segment(self.__segment_folder, last_timestamps)
+            nof_counter_errors = sum(w.nof_counter_errors for w in self.__writers.values())
+            if nof_counter_errors > 0:
+                log.warning("{} packet counter discontinuities during the segmented logging".format(nof_counter_errors))
+        log.info("Segmented logging stopped: {} segments".format(len(self.published_segments)))
+        return self.published_segments
+
+    def __publish_segment(self, partial_folder, last_timestamps):
+        # Times relative to the session start: the end time covers the last timestamp of the segment
+        end_offset = time.perf_counter() - self.__start_perf
+        end_offset = max([end_offset] + [t for t in last_timestamps.values() if t is not None])
+        write_segment_files(partial_folder, self.__get_device_status(), self.__get_acquisition_info(), self.__writers,
+                            self.__ioffsets, self.__start_datetime, end_offset, self.extra_files)
+        segment_folder = publish_segment_folder(partial_folder)
+        self.published_segments.append(segment_folder)
+        log.info("Segment published: {}".format(segment_folder))
+        if self.acquisition_catalog is not None:
+            try:
+                self.acquisition_catalog.update_acquisition(segment_folder)
+            except Exception as e:
+                log.warning("Acquisition catalog not updated: {}".format(e))
+        if self.on_segment_published is not None:
+            self.on_segment_published(segment_folder, len(self.published_segments))
+        return segment_folder
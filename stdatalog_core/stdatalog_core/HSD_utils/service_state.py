@@ -0,0 +1,347 @@
+# *****************************************************************************
+#  * @file    service_state.py
+#  * @author  SRA
+# ******************************************************************************
+# * @attention
+# *
+# * Copyright (c) 2022 STMicroelectronics.
+# * All rights reserved.
+# *
+# * This software is licensed under terms that can be found in the LICENSE file
+# * in the root directory of this software component.
+# * If no LICENSE file comes with this software, it is provided AS-IS.
+# *
+# *
+# ******************************************************************************
+#
+
+"""
+Service state snapshots: structured state and metrics published by the long running services
+(datalogger, BLE controller) and read by the monitoring tools without parsing their logs.
+
+Each service periodically replaces (atomically) a small JSON snapshot "<service>.state.json" in
+STATE_DIR (a RAM-backed folder when available). A snapshot is a dictionary:
+    {"service": ..., "pid": ..., "timestamp": ..., "start_time": ...,
+     <state fields>, "counters": {...}, "last_error": {"message": ..., "time": ...},
+     <collected sections, e.g. "components": {comp_name: {"bytes": ..., "bytes_per_s": ...}}>}
+Readers open one small file per service (O(1), whatever the service uptime) and check its age
+to detect a stalled service, its "running" flag (false in the last snapshot of a stopped service)
+and its pid to detect a terminated one. asyncio services publish from their event loop
+(publish_loop), so that a blocked loop results in a stale snapshot. format_prometheus_metrics renders the snapshots in the
+Prometheus text exposition format.
+"""
+
+import os
+import re
+import json
+import time
+import logging
+import tempfile
+from threading import Thread, Event, Lock
+
+import stdatalog_core.HSD_utils.logger as logger
+
+log = logger.get_logger(__name__)
+
+# Snapshots folder: shared memory (tmpfs) when available, the temporary folder otherwise
+STATE_DIR = "/dev/shm/stdatalog" if os.path.isdir("/dev/shm") else os.path.join(tempfile.gettempdir(), "stdatalog")
+STATE_FILE_SUFFIX = ".state.json"
+# Default snapshot publication period [s]
+DEFAULT_PUBLISH_PERIOD = 1.0
+# Prefix of the exported Prometheus metrics
+METRICS_PREFIX = "stdatalog"
+# Label of the entries of the snapshot sections (e.g. "components": {comp_name: {...}})
+SECTION_LABELS = {"components": "component", "queues": "queue", "sensors": "sensor"}
+
+def get_state_file_path(service, state_dir = None):
+    """
+    :param service: Service name (e.g. "stdatalog-cli").
+    :param state_dir: [Optional] Snapshots folder (default: STATE_DIR).
+    :return: The snapshot file path of the service.
+    """
+    return os.path.join(state_dir or STATE_DIR, service + STATE_FILE_SUFFIX)
+
+def write_service_state(service, state, state_dir = None):
+    """
+    Replaces (atomically) the snapshot of a service.
+
+    :param service: Service name.
+    :param state: Snapshot dictionary (JSON serializable). "service", "pid" and "timestamp" are added.
+    :return: The snapshot file path.
+    """
+    path = get_state_file_path(service, state_dir)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    snapshot = dict(state)
+    snapshot["service"] = service
+    snapshot["pid"] = os.getpid()
+    snapshot["timestamp"] = time.time()
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(snapshot, f)
+    os.replace(tmp_path, path)
+    return path
+
+def read_service_state(service, state_dir = None, max_age = None):
+    """
+    Reads the snapshot of a service.
+
+    :param service: Service name.
+    :param state_dir: [Optional] Snapshots folder (default: STATE_DIR).
+    :param max_age: [Optional] Maximum snapshot age [s]: older snapshots are reported as stale.
+    :return: The snapshot dictionary ("age_s" and "stale" added), None if the service never published one.
+        A snapshot is stale when older than max_age, written by a stopped service or by a process no longer running.
+    """
+    try:
+        with open(get_state_file_path(service, state_dir), "r") as f:
+            snapshot = json.load(f)
+    except (OSError, ValueError):
+        return None
+    snapshot["age_s"] = round(max(0.0, time.time() - snapshot.get("timestamp", 0)), 3)
+    snapshot["stale"] = (max_age is not None and snapshot["age_s"] > max_age) or snapshot.get("running") is False \
+        or not is_process_alive(snapshot.get("pid"))
+    return snapshot
+
+def is_process_alive(pid):
+    """
+    :param pid: Process id.
+    :return: False if no process with the given pid is running (checked on POSIX systems only, True otherwise).
+    """
+    if os.name != "posix" or not pid:
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        # e.g. PermissionError: the process exists (owned by another user)
+        pass
+    return True
+
+def _metric_name(*parts):
+    return re.sub(r'[^a-zA-Z0-9_]', '_', "_".join([METRICS_PREFIX] + [p for p in parts if p]))
+
+def _label_value(value):
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+def _metric_value(value):
+    if isinstance(value, bool):
+        return 1 if value else 0
+    if isinstance(value, (int, float)):
+        return value
+    return None
+
+def format_prometheus_metrics(snapshots):
+    """
+    Renders service snapshots in the Prometheus text exposition format.
+    Numeric and boolean fields become gauges, "counters" entries become counters (<name>_total),
+    sections of entries (e.g. "components") become labelled gauges. Other values (strings) are skipped.
+
+    :param snapshots: Dictionary service name -> snapshot (see read_service_state), None for services without snapshot.
+    :return: The metrics text.
+    """
+    metrics = {}  # name -> (type, [(labels, value)])
+
+    def add(name, metric_type, labels, value):
+        value = _metric_value(value)
+        if value is None:
+            return
+        metrics.setdefault(name, (metric_type, []))[1].append((labels, value))
+
+    for service, snapshot in snapshots.items():
+        service_label = {"service": service}
+        add(_metric_name("up"), "gauge", service_label, snapshot is not None and not snapshot.get("stale", False))
+        if snapshot is None:
+            continue
+        add(_metric_name("state_age_seconds"), "gauge", service_label, snapshot.get("age_s"))
+        for key, value in snapshot.items():
+            if key in ("service", "pid", "timestamp", "age_s", "stale"):
+                continue
+            if key == "counters":
+                for counter, count in value.items():
+                    add(_metric_name(counter, "total"), "counter", service_label, count)
+            elif key == "last_error":
+                if value is not None:
+                    add(_metric_name("last_error_timestamp_seconds"), "gauge", service_label, value.get("time"))
+            elif isinstance(value, dict):
+                label = SECTION_LABELS.get(key, key.rstrip("s"))
+                for entry, entry_value in value.items():
+                    labels = dict(service_label)
+                    labels[label] = entry
+                    if isinstance(entry_value, dict):
+                        for field, field_value in entry_value.items():
+                            add(_metric_name(label, field), "gauge", labels, field_value)
+                    else:
+                        add(_metric_name(label), "gauge", labels, entry_value)
+            else:
+                add(_metric_name(key), "gauge", service_label, value)
+
+    lines = []
+    for name, (metric_type, samples) in metrics.items():
+        lines.append("# TYPE {} {}".format(name, metric_type))
+        for labels, value in samples:
+            labels_text = ",".join("{}=\"{}\"".format(k, _label_value(v)) for k, v in labels.items())
+            lines.append("{}{{{}}} {}".format(name, labels_text, value))
+    return "\n".join(lines) + "\n"
+
+class SensorDataRateMonitor:
+    """
+    Per component data counters and rates, computed from the bytes counted by the acquisition threads
+    (hsd_link.sensor_data_counts).
+    """
+
+    def __init__(self, hsd_link):
+        """
+        :param hsd_link: Instance of HSDLink (HSDLink_v1 or HSDLink_v2).
+        """
+        self.hsd_link = hsd_link
+        self.__prev_counts = {}
+        self.__prev_time = None
+
+    def get_rates(self):
+        """
+        :return: Dictionary component name -> {"bytes": received bytes, "bytes_per_s": rate since the previous call}.
+        """
+        now = time.monotonic()
+        counts = {}
+        for key, count in list(getattr(self.hsd_link, "sensor_data_counts", {}).items()):
+            # HSD_v1 counters are indexed by (sensor id, sub-sensor id)
+            name = key if isinstance(key, str) else ".".join(str(k) for k in key)
+            counts[name] = count
+        rates = {}
+        elapsed = now - self.__prev_time if self.__prev_time is not None else 0
+        for name, count in counts.items():
+            delta = count - self.__prev_counts.get(name, 0)
+            # Counters are reset when an acquisition starts
+            if delta < 0:
+                delta = count
+            rates[name] = {"bytes": count, "bytes_per_s": round(delta / elapsed, 1) if elapsed > 0 else 0.0}
+        self.__prev_counts = counts
+        self.__prev_time = now
+        return rates
+
+class _LastErrorHandler(logging.Handler):
+    def __init__(self, publisher, level):
+        logging.Handler.__init__(self, level)
+        self.publisher = publisher
+
+    def emit(self, record):
+        try:
+            self.publisher.set_error(record.getMessage())
+        except Exception:
+            pass
+
+class ServiceStatePublisher:
+    """
+    Publishes the snapshot of a service: state fields (set), counters (increment), last error (set_error)
+    and sections computed by collectors at each publication (add_collector). The snapshot is written
+    by publish(), or every period seconds by a background thread (start/stop) or by a task of the
+    service asyncio event loop (publish_loop/stop). The last snapshot written by stop() has "running": false.
+    """
+
+    def __init__(self, service, state_dir = None, period = DEFAULT_PUBLISH_PERIOD):
+        """
+        :param service: Service name (e.g. "stdatalog-cli").
+        :param state_dir: [Optional] Snapshots folder (default: STATE_DIR).
+        :param period: [Optional] Background publication period [s].
+        """
+        self.service = service
+        self.state_dir = state_dir
+        self.period = period
+        self.__lock = Lock()
+        self.__fields = {"start_time": time.time(), "running": True}
+        self.__counters = {}
+        self.__last_error = None
+        self.__collectors = []
+        self.__stop = Event()
+        self.__thread = None
+
+    def set(self, **fields):
+        """Sets state fields (JSON serializable values)."""
+        with self.__lock:
+            self.__fields.update(fields)
+
+    def increment(self, counter, value = 1):
+        """Increments a counter."""
+        with self.__lock:
+            self.__counters[counter] = self.__counters.get(counter, 0) + value
+
+    def set_error(self, message):
+        """Records the last error of the service (the "errors" counter is incremented)."""
+        with self.__lock:
+            self.__last_error = {"message": str(message), "time": time.time()}
+            self.__counters["errors"] = self.__counters.get("errors", 0) + 1
+
+    def add_collector(self, collector):
+        """
+        :param collector: Callable returning a dictionary merged in each snapshot (e.g. {"components": {...}}).
+        """
+        self.__collectors.append(collector)
+
+    def get_log_handler(self, level = logging.ERROR):
+        """
+        :param level: [Optional] Minimum level of the records reported as last error.
+        :return: A logging.Handler recording the logged errors in the snapshot.
+        """
+        return _LastErrorHandler(self, level)
+
+    def get_state(self):
+        """
+        :return: The current snapshot dictionary.
+        """
+        with self.__lock:
+            state = dict(self.__fields)
+            state["counters"] = dict(self.__counters)
+            state["last_error"] = self.__last_error
+        for collector in self.__collectors:
+            try:
+                state.update(collector())
+            except Exception as e:
+                log.debug("Service state collector failed: {}".format(e))
+        return state
+
+    def publish(self):
+        """
+        Writes the snapshot.
+
+        :return: The snapshot file path, None if the snapshot could not be written.
+        """
+        try:
+            return write_service_state(self.service, self.get_state(), self.state_dir)
+        except OSError as e:
+            log.warning("Service state not published: {}".format(e))
+            return None
+
+    def __publish_loop(self):
+        while not self.__stop.wait(self.period):
+            self.publish()
+
+    def start(self):
+        """Starts the background publication."""
+        if self.__thread is not None:
+            return
+        self.set(running=True)
+        self.publish()
+        self.__stop.clear()
+        self.__thread = Thread(target=self.__publish_loop, name="service_state", daemon=True)
+        self.__thread.start()
+
+    async def publish_loop(self):
+        """
+        Publishes the snapshot every period seconds from the running asyncio event loop, e.g.
+        asyncio.create_task(publisher.publish_loop()) (cancel the task, then call stop()).
+        The snapshot gets stale when the event loop is blocked.
+        """
+        import asyncio
+        self.set(running=True)
+        while True:
+            self.publish()
+            await asyncio.sleep(self.period)
+
+    def stop(self):
+        """Stops the background publication and writes a last snapshot, reporting the service as not running."""
+        if self.__thread is not None:
+            self.__stop.set()
+            self.__thread.join()
+            self.__thread = None
+        self.set(running=False)
+        self.publish()
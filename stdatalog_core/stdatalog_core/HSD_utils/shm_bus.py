@@ -0,0 +1,551 @@
+# *****************************************************************************
+#  * @file    shm_bus.py
+#  * @author  SRA
+# ******************************************************************************
+# * @attention
+# *
+# * Copyright (c) 2022 STMicroelectronics.
+# * All rights reserved.
+# *
+# * This software is licensed under terms that can be found in the LICENSE file
+# * in the root directory of this software component.
+# * If no LICENSE file comes with this software, it is provided AS-IS.
+# *
+# *
+# ******************************************************************************
+#
+
+"""
+Shared-memory publish/subscribe bus for live component data.
+
+Each component gets a ComponentDataBus: the raw payload of the component (packet counters
+already removed) is decoded once by a StreamFrameDecoder and the decoded samples (device data
+type, not scaled) and frame timestamps are written in ring buffers allocated in a
+multiprocessing.shared_memory block. Any number of BusSubscriber objects, in the same process
+(plots, DataToolkit plugins, recorders) or in other processes (e.g. an inference service), read
+the rings with independent cursors. Reads return numpy views on the shared memory (no copies)
+unless the requested range wraps around the end of the ring.
+
+Shared memory layout: [header (128 bytes)][samples ring: capacity x dim][timestamps ring: ts_capacity x (sample_index, timestamp)]
+Single writer, multiple readers: the writer publishes the end index of each write (write sequence)
+before the data and updates the write indexes after it. Readers detect that they have been lapped
+by comparing their cursor with the write index, and check the write sequence again after their copy
+to drop (and count as lost) the samples overwritten while they were reading.
+"""
+
+import re
+import sys
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from stdatalog_core.HSD.utils.type_conversion import TypeConversion
+import stdatalog_core.HSD_utils.logger as logger
+
+log = logger.get_logger(__name__)
+
+BUS_MAGIC = 0x42444C53
+BUS_LAYOUT_VERSION = 2
+DEFAULT_BUS_PREFIX = "stdatalog"
+# Default ring buffer length [s] at the component ODR
+DEFAULT_BUS_DURATION = 10.0
+
+HEADER_SIZE = 128
+HEADER_DTYPE = np.dtype([
+    ('magic', '<u4'),
+    ('version', '<u4'),
+    ('dim', '<u4'),
+    ('samples_per_ts', '<u4'),
+    ('dtype', 'S8'),
+    ('sensitivity', '<f8'),
+    ('capacity', '<u8'),
+    ('ts_capacity', '<u8'),
+    ('write_index', '<u8'),
+    ('ts_write_index', '<u8'),
+    ('closed', '<u4'),
+    ('reserved', '<u4'),
+    # end indexes of the writes in progress (set before the data, checked by the readers after their copy)
+    ('write_seq', '<u8'),
+    ('ts_write_seq', '<u8'),
+])
+TIMESTAMP_DTYPE = np.dtype([('sample_index', '<i8'), ('timestamp', '<f8')])
+
+def get_bus_shm_name(comp_name, prefix = DEFAULT_BUS_PREFIX):
+    """
+    Returns the shared memory block name of a component bus.
+
+    :param comp_name: Component name (e.g. "iis3dwb_acc").
+    :param prefix: [Optional] Bus name prefix, to run more applications on the same host.
+    :return: The shared memory name.
+    """
+    return re.sub(r'[^A-Za-z0-9_]', '_', "{}_{}".format(prefix, comp_name))
+
+def _align(size, alignment = 64):
+    return (size + alignment - 1) // alignment * alignment
+
+class StreamFrameDecoder:
+    """
+    Incremental decoder of a component payload stream: frames of samples_per_ts * dim samples,
+    each one followed by an 8-byte timestamp (no timestamps if samples_per_ts is 0).
+    Data can be fed in blocks of any size; incomplete samples and timestamps are kept for the next block.
+
+    :param dim: Number of axes.
+    :param data_type: Sample data type (as in device_config.json).
+    :param samples_per_ts: Number of samples per timestamp.
+    """
+    TIMESTAMP_SIZE = 8
+
+    def __init__(self, dim, data_type, samples_per_ts):
+        self.dim = dim
+        self.data_type = data_type
+        self.samples_per_ts = samples_per_ts
+        self.sample_size = TypeConversion.check_type_length(data_type)
+        self.np_dtype = np.dtype(TypeConversion.get_np_dtype(data_type)).newbyteorder('<')
+        self.row_size = dim * self.sample_size
+        if samples_per_ts != 0:
+            self.frame_data_size = samples_per_ts * self.row_size
+            self.frame_size = self.frame_data_size + self.TIMESTAMP_SIZE
+        else:
+            self.frame_data_size = self.row_size
+            self.frame_size = self.row_size
+        self.stream_offset = 0
+        self.nof_samples = 0
+        self.nof_timestamps = 0
+        self._pending_sample_bytes = np.empty(0, dtype=np.uint8)
+        self._pending_ts_bytes = np.empty(0, dtype=np.uint8)
+
+    def __bytes_to_samples(self, raw):
+        if self.sample_size == 3:
+            return TypeConversion.decode_int24(raw).reshape(-1, self.dim)
+        return raw.view(self.np_dtype).reshape(-1, self.dim)
+
+    def __split_frames(self, buf):
+        # head: end of the frame started in the previous blocks (the intra-frame offset is carried over)
+        frame_offset = self.stream_offset % self.frame_size
+        head_size = min(len(buf), (self.frame_size - frame_offset) % self.frame_size)
+        head_data_size = min(head_size, max(0, self.frame_data_size - frame_offset))
+        # body: complete frames, reshaped on the frame boundaries; tail: start of the next frame
+        nof_frames = (len(buf) - head_size) // self.frame_size
+        body_end = head_size + nof_frames * self.frame_size
+        frames = buf[head_size:body_end].reshape(nof_frames, self.frame_size)
+        tail = buf[body_end:]
+        sample_parts = (buf[:head_data_size], frames[:, :self.frame_data_size].reshape(-1), tail[:self.frame_data_size])
+        ts_parts = (buf[head_data_size:head_size], frames[:, self.frame_data_size:].reshape(-1), tail[self.frame_data_size:])
+        return sample_parts, ts_parts
+
+    def decode(self, payload):
+        """
+        Decodes a payload block.
+
+        :param payload: bytes-like object (component payload, packet counters excluded).
+        :return: A tuple (samples, timestamps): samples is a (n, dim) array, timestamps a
+            TIMESTAMP_DTYPE array where sample_index is the index of the first sample after the frame.
+        """
+        buf = np.frombuffer(payload, dtype=np.uint8)
+        if self.samples_per_ts != 0:
+            sample_parts, ts_parts = self.__split_frames(buf)
+        else:
+            sample_parts = (buf,)
+            ts_parts = None
+        self.stream_offset += len(buf)
+
+        # incomplete samples and timestamps of the previous blocks are prepended in the same copy
+        sample_bytes = np.concatenate((self._pending_sample_bytes,) + sample_parts)
+        nof_rows = len(sample_bytes) // self.row_size
+        samples = self.__bytes_to_samples(np.ascontiguousarray(sample_bytes[:nof_rows * self.row_size]))
+        self._pending_sample_bytes = sample_bytes[nof_rows * self.row_size:].copy()
+        self.nof_samples += nof_rows
+
+        timestamps = np.empty(0, dtype=TIMESTAMP_DTYPE)
+        if ts_parts is not None:
+            ts_bytes = np.concatenate((self._pending_ts_bytes,) + ts_parts)
+            nof_ts = len(ts_bytes) // self.TIMESTAMP_SIZE
+            if nof_ts > 0:
+                timestamps = np.empty(nof_ts, dtype=TIMESTAMP_DTYPE)
+                timestamps['timestamp'] = np.ascontiguousarray(ts_bytes[:nof_ts * self.TIMESTAMP_SIZE]).view('<f8')
+                timestamps['sample_index'] = (self.nof_timestamps + 1 + np.arange(nof_ts, dtype=np.int64)) * self.samples_per_ts
+                self.nof_timestamps += nof_ts
+            self._pending_ts_bytes = ts_bytes[nof_ts * self.TIMESTAMP_SIZE:].copy()
+        return samples, timestamps
+
+    def get_tail_size(self, nof_bytes):
+        """
+        Returns the number of bytes, at the end of the next nof_bytes bytes of the stream, that belong to an incomplete frame.
+
+        :param nof_bytes: Length of the next block.
+        """
+        return min(nof_bytes, (self.stream_offset + nof_bytes) % self.frame_size)
+
+    def skip(self, nof_bytes):
+        """
+        Advances the stream by nof_bytes bytes without decoding them (e.g. no one is reading the samples).
+        The skipped bytes must end on a frame boundary (see get_tail_size): the incomplete frame that follows is decoded as usual.
+
+        :param nof_bytes: Number of bytes to skip.
+        """
+        if nof_bytes <= 0:
+            return
+        boundary = self.stream_offset + nof_bytes
+        if boundary % self.frame_size != 0:
+            raise ValueError("Skipped bytes must end on a frame boundary")
+        nof_frames = boundary // self.frame_size
+        self.stream_offset = boundary
+        self.nof_samples = nof_frames * (self.samples_per_ts or 1)
+        if self.samples_per_ts != 0:
+            self.nof_timestamps = nof_frames
+        self._pending_sample_bytes = np.empty(0, dtype=np.uint8)
+        self._pending_ts_bytes = np.empty(0, dtype=np.uint8)
+
+    def discard(self, payload):
+        """
+        Consumes a payload block without decoding its complete frames: only the trailing incomplete frame is decoded,
+        so that the following blocks stay frame aligned.
+
+        :param payload: bytes-like object (component payload, packet counters excluded).
+        """
+        tail_size = self.get_tail_size(len(payload))
+        self.skip(len(payload) - tail_size)
+        self.decode(memoryview(payload)[len(payload) - tail_size:])
+
+class _BusMapping:
+    """
+    numpy views on the header and the rings of a bus shared memory block.
+    """
+    def __init__(self, shm):
+        self.shm = shm
+        self.header = np.ndarray((1,), dtype=HEADER_DTYPE, buffer=shm.buf, offset=0)
+        h = self.header[0]
+        if h['magic'] != BUS_MAGIC or h['version'] != BUS_LAYOUT_VERSION:
+            raise ValueError("{} is not a compatible data bus".format(shm.name))
+        self.dim = int(h['dim'])
+        self.samples_per_ts = int(h['samples_per_ts'])
+        self.dtype = np.dtype(h['dtype'].decode())
+        self.sensitivity = float(h['sensitivity'])
+        self.capacity = int(h['capacity'])
+        self.ts_capacity = int(h['ts_capacity'])
+        samples_offset = HEADER_SIZE
+        ts_offset = _align(samples_offset + self.capacity * self.dim * self.dtype.itemsize)
+        self.samples = np.ndarray((self.capacity, self.dim), dtype=self.dtype, buffer=shm.buf, offset=samples_offset)
+        self.timestamps = np.ndarray((self.ts_capacity,), dtype=TIMESTAMP_DTYPE, buffer=shm.buf, offset=ts_offset)
+
+    @staticmethod
+    def get_size(dim, dtype, capacity, ts_capacity):
+        return _align(HEADER_SIZE + capacity * dim * dtype.itemsize) + ts_capacity * TIMESTAMP_DTYPE.itemsize
+
+    def release(self):
+        # numpy views must be released before closing the shared memory
+        self.header = None
+        self.samples = None
+        self.timestamps = None
+
+class ComponentDataBus:
+    """
+    Publisher side of a component bus. Owns (creates and unlinks) the shared memory block.
+
+    :param comp_name: Component name.
+    :param dim: Number of axes.
+    :param data_type: Sample data type (as in device_config.json).
+    :param capacity: Samples ring length (number of samples per axis).
+    :param samples_per_ts: [Optional] Number of samples per timestamp (0: no timestamps).
+    :param sensitivity: [Optional] Component sensitivity, stored for the subscribers (samples are not scaled).
+    :param prefix: [Optional] Bus name prefix (see get_bus_shm_name).
+    """
+    def __init__(self, comp_name, dim, data_type, capacity, samples_per_ts = 0, sensitivity = 1.0, prefix = DEFAULT_BUS_PREFIX):
+        self.comp_name = comp_name
+        self.decoder = StreamFrameDecoder(dim, data_type, samples_per_ts)
+        dtype = self.decoder.np_dtype if self.decoder.sample_size != 3 else np.dtype('<i4')
+        capacity = max(1, int(capacity))
+        ts_capacity = (capacity // samples_per_ts + 1) if samples_per_ts else 1
+        self.shm_name = get_bus_shm_name(comp_name, prefix)
+        size = _BusMapping.get_size(dim, dtype, capacity, ts_capacity)
+        try:
+            self._shm = shared_memory.SharedMemory(name=self.shm_name, create=True, size=size)
+        except FileExistsError:
+            # left behind by an application that did not close the bus
+            log.warning("Stale data bus {} found, replaced".format(self.shm_name))
+            stale = shared_memory.SharedMemory(name=self.shm_name)
+            stale.close()
+            stale.unlink()
+            self._shm = shared_memory.SharedMemory(name=self.shm_name, create=True, size=size)
+
+        header = np.ndarray((1,), dtype=HEADER_DTYPE, buffer=self._shm.buf, offset=0)
+        header[0] = (BUS_MAGIC, BUS_LAYOUT_VERSION, dim, samples_per_ts, dtype.str.encode(), sensitivity if sensitivity is not None else 1.0,
+                     capacity, ts_capacity, 0, 0, 0, 0, 0, 0)
+        del header
+        self._mapping = _BusMapping(self._shm)
+        self.closed = False
+
+    @property
+    def write_index(self):
+        return int(self._mapping.header[0]['write_index'])
+
+    def publish_payload(self, payload):
+        """
+        Decodes a component payload block and publishes the decoded samples and timestamps.
+
+        :param payload: bytes-like object (component payload, packet counters excluded).
+        :return: Number of samples published.
+        """
+        samples, timestamps = self.decoder.decode(payload)
+        self.publish(samples, timestamps)
+        return len(samples)
+
+    def publish(self, samples, timestamps = None):
+        """
+        Writes decoded samples (and the related frame timestamps) in the rings.
+
+        :param samples: (n, dim) array of samples.
+        :param timestamps: [Optional] TIMESTAMP_DTYPE array.
+        """
+        m = self._mapping
+        header = m.header[0]
+        n = len(samples)
+        if n > 0:
+            write_index = int(header['write_index'])
+            if n > m.capacity:
+                samples = samples[-m.capacity:]
+                write_index += n - m.capacity
+            m.header['write_seq'] = write_index + len(samples)
+            self.__write_ring(m.samples, samples, write_index % m.capacity)
+            m.header['write_index'] = write_index + len(samples)
+        if timestamps is not None and len(timestamps) > 0:
+            ts_write_index = int(header['ts_write_index'])
+            if len(timestamps) > m.ts_capacity:
+                ts_write_index += len(timestamps) - m.ts_capacity
+                timestamps = timestamps[-m.ts_capacity:]
+            m.header['ts_write_seq'] = ts_write_index + len(timestamps)
+            self.__write_ring(m.timestamps, timestamps, ts_write_index % m.ts_capacity)
+            m.header['ts_write_index'] = ts_write_index + len(timestamps)
+
+    @staticmethod
+    def __write_ring(ring, values, start):
+        first = min(len(values), len(ring) - start)
+        ring[start:start + first] = values[:first]
+        if first < len(values):
+            ring[:len(values) - first] = values[first:]
+
+    def subscribe(self, from_start = False):
+        """
+        Creates an in-process subscriber sharing this bus mapping.
+
+        :param from_start: [Optional] If True, the subscriber starts from the oldest sample still in the ring,
+            otherwise from the next published sample.
+        """
+        return BusSubscriber(self.shm_name, from_start = from_start, _mapping = self._mapping)
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        self._mapping.header['closed'] = 1
+        self._mapping.release()
+        self._mapping = None
+        try:
+            self._shm.close()
+        except BufferError:
+            # in-process subscribers still hold views: the block is released with them
+            log.debug("Data bus {} closed with active views".format(self.shm_name))
+        self._shm.unlink()
+
+class BusChunk:
+    """
+    Result of a BusSubscriber read.
+
+    :param start_index: Absolute index of the first sample.
+    :param samples: (n, dim) array of samples (view on the shared memory unless copied).
+    :param timestamps: TIMESTAMP_DTYPE array of the frames completed in the read range.
+    :param lost_samples: Samples skipped because the subscriber was lapped by the publisher (before or during the read).
+    """
+    def __init__(self, start_index, samples, timestamps, lost_samples = 0):
+        self.start_index = start_index
+        self.samples = samples
+        self.timestamps = timestamps
+        self.lost_samples = lost_samples
+
+    @property
+    def end_index(self):
+        return self.start_index + len(self.samples)
+
+class BusSubscriber:
+    """
+    Reader of a component bus with its own cursor.
+
+    :param shm_name: Shared memory block name (see get_bus_shm_name).
+    :param from_start: [Optional] If True, reading starts from the oldest sample still in the ring.
+    """
+    def __init__(self, shm_name, from_start = False, _mapping = None):
+        self.shm_name = shm_name
+        self._shm = None
+        if _mapping is None:
+            self._shm = BusSubscriber.__attach_shm(shm_name)
+            _mapping = _BusMapping(self._shm)
+        self._mapping = _mapping
+        self.dim = _mapping.dim
+        self.dtype = _mapping.dtype
+        self.sensitivity = _mapping.sensitivity
+        self.samples_per_ts = _mapping.samples_per_ts
+        write_index = int(_mapping.header[0]['write_index'])
+        ts_write_index = int(_mapping.header[0]['ts_write_index'])
+        if from_start:
+            self.cursor = max(0, write_index - _mapping.capacity)
+            self.ts_cursor = max(0, ts_write_index - _mapping.ts_capacity)
+        else:
+            self.cursor = write_index
+            self.ts_cursor = ts_write_index
+        self.lost_samples = 0
+
+    @staticmethod
+    def __attach_shm(shm_name):
+        if sys.version_info >= (3, 13):
+            return shared_memory.SharedMemory(name=shm_name, track=False)
+        shm = shared_memory.SharedMemory(name=shm_name)
+        try:
+            # Attached blocks must not be unlinked by this process resource tracker at exit
+            from multiprocessing import resource_tracker
+            resource_tracker.unregister(shm._name, "shared_memory")
+        except Exception:
+            pass
+        return shm
+
+    @classmethod
+    def attach(cls, comp_name, prefix = DEFAULT_BUS_PREFIX, from_start = False):
+        """
+        Attaches to the bus of a component published by another process.
+
+        :param comp_name: Component name.
+        :param prefix: [Optional] Bus name prefix used by the publisher.
+        :param from_start: [Optional] If True, reading starts from the oldest sample still in the ring.
+        """
+        return cls(get_bus_shm_name(comp_name, prefix), from_start)
+
+    def is_closed(self):
+        return self._mapping is None or self._mapping.header is None or bool(self._mapping.header[0]['closed'])
+
+    def read(self, max_samples = None, copy = False):
+        """
+        Reads the samples published after the subscriber cursor.
+
+        :param max_samples: [Optional] Maximum number of samples to read.
+        :param copy: [Optional] If True, returned arrays own their data. Views stay valid until
+            the publisher writes capacity - n further samples.
+        :return: A BusChunk, or None if there are no new samples.
+        """
+        m = self._mapping
+        if m is None or m.header is None:
+            return None
+        lost = 0
+        while True:
+            write_index = int(m.header[0]['write_index'])
+            if write_index - self.cursor > m.capacity:
+                lost += self.__skip(write_index - m.capacity - self.cursor)
+            n = write_index - self.cursor
+            if max_samples is not None:
+                n = min(n, max_samples)
+            if n <= 0:
+                return None
+            start = self.cursor % m.capacity
+            if start + n <= m.capacity:
+                samples = m.samples[start:start + n]
+                if copy:
+                    samples = samples.copy()
+            else:
+                samples = np.concatenate((m.samples[start:], m.samples[:n - (m.capacity - start)]))
+            # The publisher may have overwritten the oldest samples of the range during the copy:
+            # the write sequence (end of the write in progress) is checked again and the torn samples are dropped
+            overrun = min(n, int(m.header[0]['write_seq']) - m.capacity - self.cursor)
+            if overrun > 0:
+                lost += self.__skip(overrun)
+                samples = samples[overrun:]
+                n -= overrun
+                log.debug("Data bus {} subscriber overrun: {} samples dropped".format(self.shm_name, overrun))
+                if n == 0:
+                    continue
+            chunk = BusChunk(self.cursor, samples, self.__read_timestamps(self.cursor + n), lost)
+            self.cursor += n
+            return chunk
+
+    def __skip(self, nof_samples):
+        self.cursor += nof_samples
+        self.lost_samples += nof_samples
+        return nof_samples
+
+    def __read_timestamps(self, end_index):
+        m = self._mapping
+        ts_write_index = int(m.header[0]['ts_write_index'])
+        if ts_write_index - self.ts_cursor > m.ts_capacity:
+            self.ts_cursor = ts_write_index - m.ts_capacity
+        n = ts_write_index - self.ts_cursor
+        if n <= 0:
+            return np.empty(0, dtype=TIMESTAMP_DTYPE)
+        idx = (self.ts_cursor + np.arange(n)) % m.ts_capacity
+        timestamps = m.timestamps[idx]
+        # timestamps overwritten during the copy are dropped
+        overrun = min(n, int(m.header[0]['ts_write_seq']) - m.ts_capacity - self.ts_cursor)
+        if overrun > 0:
+            timestamps = timestamps[overrun:]
+            self.ts_cursor += overrun
+        # only the frames ending inside the read range
+        timestamps = timestamps[timestamps['sample_index'] <= end_index]
+        self.ts_cursor += len(timestamps)
+        return timestamps
+
+    def close(self):
+        self._mapping = None
+        if self._shm is not None:
+            try:
+                self._shm.close()
+            except BufferError:
+                log.debug("Data bus {} subscriber closed with active views".format(self.shm_name))
+            self._shm = None
+
+class LiveDataBus:
+    """
+    Collection of the component buses of a live acquisition.
+
+    :param prefix: [Optional] Bus name prefix (see get_bus_shm_name).
+    :param duration: [Optional] Ring buffers length [s] at the component ODR.
+    """
+    def __init__(self, prefix = DEFAULT_BUS_PREFIX, duration = DEFAULT_BUS_DURATION):
+        self.prefix = prefix
+        self.duration = duration
+        self.buses = {}
+
+    def add_component(self, comp_name, comp_status):
+        """
+        Creates the bus of a sensor component from its status (odr/measodr, dim, data_type, samples_per_ts, sensitivity).
+
+        :return: The ComponentDataBus, or None if the component cannot be published.
+        """
+        odr = comp_status.get("measodr") or comp_status.get("odr")
+        data_type = comp_status.get("data_type")
+        if not odr or data_type is None:
+            return None
+        spts = comp_status.get("samples_per_ts", 0)
+        if not isinstance(spts, int):
+            spts = spts.get("val", 0) if spts else 0
+        if comp_name in self.buses:
+            self.buses[comp_name].close()
+        bus = ComponentDataBus(comp_name, comp_status.get("dim", 1), data_type, odr * self.duration, spts, comp_status.get("sensitivity", 1), self.prefix)
+        self.buses[comp_name] = bus
+        log.debug("Live data bus for {}: {}".format(comp_name, bus.shm_name))
+        return bus
+
+    def get_bus(self, comp_name):
+        return self.buses.get(comp_name)
+
+    def publish_payload(self, comp_name, payload):
+        bus = self.buses.get(comp_name)
+        if bus is not None:
+            bus.publish_payload(payload)
+
+    def subscribe(self, comp_name, from_start = False):
+        bus = self.buses.get(comp_name)
+        return bus.subscribe(from_start) if bus is not None else None
+
+    def get_shm_names(self):
+        return {c: b.shm_name for c, b in self.buses.items()}
+
+    def close(self):
+        for bus in self.buses.values():
+            bus.close()
+        self.buses = {}
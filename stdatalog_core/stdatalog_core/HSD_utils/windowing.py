@@ -0,0 +1,260 @@
+# *****************************************************************************
+#  * @file    windowing.py
+#  * @author  SRA
+# ******************************************************************************
+# * @attention
+# *
+# * Copyright (c) 2022 STMicroelectronics.
+# * All rights reserved.
+# *
+# * This software is licensed under terms that can be found in the LICENSE file
+# * in the root directory of this software component.
+# * If no LICENSE file comes with this software, it is provided AS-IS.
+# *
+# *
+# ******************************************************************************
+#
+
+"""
+Sliding-window segmentation of sample streams (NanoEdge AI datasets, ML training datasets).
+
+SlidingWindowBuffer turns consecutive chunks of (n, dim) samples into windows of signal_length
+samples taken every signal_increment samples. The windows of a chunk are a strided view on the
+samples (numpy sliding_window_view), flattened row by row into (n_windows, signal_length * dim),
+and only the samples of the next, incomplete window are carried over to the following chunk.
+
+The windows can be written as NanoEdge CSV rows (write_csv_rows), or as datasets for training:
+.npy arrays (NpyArrayWriter, shape (n_windows, signal_length, dim)) or Parquet files with one
+fixed size list column per window (WindowDatasetWriter).
+"""
+
+import os
+
+import numpy as np
+
+import stdatalog_core.HSD_utils.logger as logger
+
+log = logger.get_logger(__name__)
+
+class WindowDatasetFormat:
+    NPY = "npy"
+    PARQUET = "parquet"
+
+WINDOW_DATASET_FORMATS = (WindowDatasetFormat.NPY, WindowDatasetFormat.PARQUET)
+
+# Fixed .npy header size, so that the shape can be rewritten in place when the file is closed
+NPY_HEADER_SIZE = 128
+
+def get_sliding_windows(samples, signal_length, signal_increment):
+    """
+    Returns the windows of a (n, dim) samples array as a strided view (no copy).
+
+    :param samples: numpy array (n, dim).
+    :param signal_length: Window length [samples].
+    :param signal_increment: Distance between the starts of two consecutive windows [samples].
+    :return: numpy array (n_windows, signal_length, dim).
+    """
+    dim = samples.shape[1]
+    if len(samples) < signal_length:
+        return samples[:0].reshape(0, signal_length, dim)
+    windows = np.lib.stride_tricks.sliding_window_view(samples, (signal_length, dim))[::signal_increment, 0]
+    return windows
+
+class SlidingWindowBuffer:
+    """
+    Segments a stream of samples, delivered in chunks, into (overlapping) windows.
+
+    :param signal_length: Window length [samples].
+    :param signal_increment: [Optional] Distance between the starts of two consecutive windows [samples].
+        signal_increment < signal_length: overlapping windows, > signal_length: samples skipped between windows.
+        If <= 0, signal_increment = signal_length (no overlap).
+    """
+    def __init__(self, signal_length, signal_increment = 0):
+        if signal_length <= 0:
+            raise ValueError("signal_length must be > 0")
+        self.signal_length = signal_length
+        self.signal_increment = signal_increment if signal_increment > 0 else signal_length
+        self.__carry = None
+        self.__carry_times = None
+        # samples to drop at the beginning of the next chunk (signal_increment > signal_length)
+        self.__skip = 0
+
+    def push(self, samples, timestamps = None):
+        """
+        Adds a chunk of samples and returns the windows completed by it.
+
+        :param samples: numpy array (n, dim) or (n,).
+        :param timestamps: [Optional] numpy array (n,) or (n, 1) with the sample times.
+        :return: (windows, start_times): numpy array (n_windows, signal_length, dim) (a view when possible)
+            and the time of the first sample of each window (None if timestamps is None).
+        """
+        samples = np.asarray(samples)
+        if samples.ndim == 1:
+            samples = samples.reshape(-1, 1)
+        times = None if timestamps is None else np.asarray(timestamps).reshape(-1)
+        if self.__skip:
+            skipped = min(self.__skip, len(samples))
+            samples = samples[skipped:]
+            times = times[skipped:] if times is not None else None
+            self.__skip -= skipped
+        if self.__carry is not None and len(self.__carry) > 0:
+            samples = np.concatenate((self.__carry, samples))
+            if times is not None:
+                times = np.concatenate((self.__carry_times, times))
+
+        windows = get_sliding_windows(samples, self.signal_length, self.signal_increment)
+        n_windows = len(windows)
+        next_start = n_windows * self.signal_increment
+        if next_start <= len(samples):
+            self.__carry = samples[next_start:].copy()
+            self.__carry_times = times[next_start:].copy() if times is not None else None
+        else:
+            self.__carry = None
+            self.__carry_times = None
+            self.__skip = next_start - len(samples)
+        start_times = times[:next_start:self.signal_increment] if times is not None else None
+        return windows, start_times
+
+def flatten_windows(windows):
+    """(n_windows, signal_length, dim) -> (n_windows, signal_length * dim), samples after samples (NanoEdge row layout)."""
+    return windows.reshape(len(windows), windows.shape[1] * windows.shape[2])
+
+def write_csv_rows(f, rows, target_value = None, separator = ","):
+    """
+    Writes a numeric matrix as delimited text rows, with an optional constant first column.
+
+    Values are formatted as str() does (shortest representation) and rows end with "\r\n",
+    i.e. as csv.writer writes numpy scalars.
+
+    :param f: Text file object (opened with newline="").
+    :param rows: numpy array (n_rows, n_columns).
+    :param target_value: [Optional] Value written as first column of each row.
+    :param separator: [Optional] Column separator.
+    """
+    if len(rows) == 0:
+        return
+    prefix = "" if target_value is None else str(target_value).replace("%", "%%") + separator
+    fmt = [prefix + "%s"] + ["%s"] * (rows.shape[1] - 1)
+    np.savetxt(f, rows, fmt=fmt, delimiter=separator, newline="\r\n")
+
+class NpyArrayWriter:
+    """
+    Appends arrays along the first axis to a .npy file (loadable with numpy.load, also with mmap_mode).
+
+    :param file_path: Output .npy file path.
+    """
+    def __init__(self, file_path):
+        self.file_path = file_path
+        self.__f = open(file_path, "wb")
+        self.__f.write(b"\x00" * NPY_HEADER_SIZE)
+        self.__dtype = None
+        self.__item_shape = None
+        self.__count = 0
+
+    def append(self, array):
+        array = np.ascontiguousarray(array)
+        if self.__dtype is None:
+            self.__dtype = array.dtype
+            self.__item_shape = array.shape[1:]
+        elif array.shape[1:] != self.__item_shape:
+            raise ValueError("Shape mismatch: {} != {}".format(array.shape[1:], self.__item_shape))
+        self.__f.write(array.astype(self.__dtype, copy=False).tobytes())
+        self.__count += len(array)
+
+    def close(self):
+        if self.__f.closed:
+            return
+        dtype = self.__dtype if self.__dtype is not None else np.dtype(np.float32)
+        item_shape = self.__item_shape if self.__item_shape is not None else ()
+        header = {"descr": np.lib.format.dtype_to_descr(dtype), "fortran_order": False, "shape": (self.__count,) + tuple(item_shape)}
+        header_str = repr(header)
+        # magic (6) + version (2) + header length (2) + header, padded with spaces and terminated by "\n"
+        header_len = NPY_HEADER_SIZE - 10
+        if len(header_str) + 1 > header_len:
+            raise ValueError("Array shape too large for the .npy header")
+        self.__f.seek(0)
+        self.__f.write(b"\x93NUMPY\x01\x00" + header_len.to_bytes(2, "little") + (header_str.ljust(header_len - 1) + "\n").encode("latin1"))
+        self.__f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+class WindowDatasetWriter:
+    """
+    Writes windows, their start times and an optional target value as a training dataset.
+
+    - npy: <name>_windows.npy (n_windows, signal_length, dim), <name>_times.npy (n_windows,) and,
+      with a target value, <name>_targets.npy (n_windows,).
+    - parquet: <name>_windows.parquet with the columns "start_time", "target" (optional) and
+      "window" (fixed size list of signal_length * dim values). Requires pyarrow.
+
+    :param output_folder: Output folder (created if needed).
+    :param name: Dataset base name.
+    :param out_format: [Optional] WindowDatasetFormat.
+    :param target_value: [Optional] Target value of all the windows.
+    """
+    def __init__(self, output_folder, name, out_format = WindowDatasetFormat.NPY, target_value = None):
+        if out_format not in WINDOW_DATASET_FORMATS:
+            raise ValueError("Unknown window dataset format: {} (valid: {})".format(out_format, ", ".join(WINDOW_DATASET_FORMATS)))
+        os.makedirs(output_folder, exist_ok=True)
+        self.out_format = out_format
+        self.target_value = target_value
+        self.nof_windows = 0
+        base_path = os.path.join(output_folder, name)
+        if out_format == WindowDatasetFormat.NPY:
+            self.file_path = base_path + "_windows.npy"
+            self.__windows = NpyArrayWriter(self.file_path)
+            self.__times = NpyArrayWriter(base_path + "_times.npy")
+            self.__targets = NpyArrayWriter(base_path + "_targets.npy") if target_value is not None else None
+        else:
+            self.file_path = base_path + "_windows.parquet"
+            self.__parquet_writer = None
+
+    def write(self, windows, start_times = None):
+        """
+        :param windows: numpy array (n_windows, signal_length, dim).
+        :param start_times: [Optional] numpy array (n_windows,).
+        """
+        n = len(windows)
+        if n == 0:
+            return
+        if start_times is None:
+            start_times = np.full(n, np.nan)
+        if self.out_format == WindowDatasetFormat.NPY:
+            self.__windows.append(windows)
+            self.__times.append(np.asarray(start_times, dtype=np.float64))
+            if self.__targets is not None:
+                self.__targets.append(np.full(n, self.target_value))
+        else:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+            flat = np.ascontiguousarray(flatten_windows(windows))
+            columns = {"start_time": pa.array(np.asarray(start_times, dtype=np.float64))}
+            if self.target_value is not None:
+                columns["target"] = pa.array(np.full(n, self.target_value))
+            columns["window"] = pa.FixedSizeListArray.from_arrays(pa.array(flat.reshape(-1)), flat.shape[1])
+            table = pa.table(columns)
+            if self.__parquet_writer is None:
+                self.__parquet_writer = pq.ParquetWriter(self.file_path, table.schema)
+            self.__parquet_writer.write_table(table)
+        self.nof_windows += n
+
+    def close(self):
+        if self.out_format == WindowDatasetFormat.NPY:
+            self.__windows.close()
+            self.__times.close()
+            if self.__targets is not None:
+                self.__targets.close()
+        elif self.__parquet_writer is not None:
+            self.__parquet_writer.close()
+            self.__parquet_writer = None
+        log.debug("--> {}: {} windows".format(self.file_path, self.nof_windows))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
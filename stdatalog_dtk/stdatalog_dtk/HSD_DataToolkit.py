@@ -24,14 +24,25 @@ from PySide6.QtCore import Signal
 from stdatalog_dtk.HSD_DataToolkit_Pipeline import HSD_DataToolkit_data
 from stdatalog_core.HSD.utils.type_conversion import TypeConversion
 from stdatalog_core.HSD_utils.DataClass import DataClass
+import stdatalog_core.HSD_utils.logger as logger
+
+log = logger.get_logger(__name__)
 
 class HSD_DataToolkit(Thread):
-    def __init__(self, components_status, data_pipeline, data_ready_evt:Signal):
+    # Polling period of the live data bus subscribers [s]
+    BUS_POLL_PERIOD = 0.01
+
+    def __init__(self, components_status, data_pipeline, data_ready_evt:Signal, live_data_bus = None):
         Thread.__init__(self)
         self.components_status = components_status
         self.data_pipeline = data_pipeline
         self.data_queue = queue.Queue()
 
+        # Components published on the live data bus are read from shared memory (already decoded)
+        self.live_data_bus = live_data_bus
+        self.bus_subscribers = {}
+        self.bus_pending_samples = {}
+
         self.data_ready_evt = data_ready_evt
         self.data_ready_evt.connect(self.add_data_to_queue)
 
@@ -72,14 +83,57 @@ class HSD_DataToolkit(Thread):
             self.data_pipeline.process_data(HSD_DataToolkit_data(comp_name, data_buffer, timestamp))
 
 
+    def read_data_bus(self):
+        for comp_name, bus in list(self.live_data_bus.buses.items()):
+            subscriber = self.bus_subscribers.get(comp_name)
+            if subscriber is None:
+                subscriber = bus.subscribe(from_start = True)
+                self.bus_subscribers[comp_name] = subscriber
+                self.bus_pending_samples[comp_name] = None
+            chunk = subscriber.read()
+            if chunk is None:
+                continue
+            if subscriber.samples_per_ts == 0:
+                # No frame timestamps: one pipeline item per sample (timestamp = None), as in extract_data
+                for sample in chunk.samples.copy():
+                    self.data_pipeline.process_data(HSD_DataToolkit_data(comp_name, sample, None))
+                continue
+            spts = subscriber.samples_per_ts
+            pending = self.bus_pending_samples[comp_name]
+            if chunk.lost_samples > 0:
+                log.warning("{}: {} samples lost on the live data bus".format(comp_name, chunk.lost_samples))
+                # the pending samples are not contiguous with the new ones anymore
+                pending = None
+            # Split the samples in frames (samples_per_ts samples followed by a timestamp)
+            samples = chunk.samples if pending is None else np.concatenate((pending, chunk.samples))
+            start_index = chunk.start_index - (0 if pending is None else len(pending))
+            frame_start = 0
+            for ts in chunk.timestamps:
+                frame_end = int(ts['sample_index']) - start_index
+                nof_frame_samples = frame_end - frame_start
+                if nof_frame_samples >= spts:
+                    if nof_frame_samples > spts:
+                        # timestamps of the previous frames lost: only the samples of this frame are sent
+                        log.debug("{}: {} samples without timestamp skipped".format(comp_name, nof_frame_samples - spts))
+                    self.data_pipeline.process_data(HSD_DataToolkit_data(comp_name, samples[frame_end - spts:frame_end].reshape(-1).copy(), float(ts['timestamp'])))
+                elif nof_frame_samples > 0:
+                    # frame started before the first read (or lost samples): incomplete, skipped
+                    log.debug("{}: incomplete frame skipped ({}/{} samples)".format(comp_name, nof_frame_samples, spts))
+                frame_start = max(frame_start, frame_end)
+            self.bus_pending_samples[comp_name] = samples[frame_start:].copy() if frame_start < len(samples) else None
+
     def run(self):
         while not self.stop_thread:
+            if self.live_data_bus is not None:
+                self.read_data_bus()
             try:
                 # Wait for data to be available in the queue
-                data = self.data_queue.get(timeout=1)  # Adjust timeout as needed
+                data = self.data_queue.get(timeout=self.BUS_POLL_PERIOD if self.live_data_bus is not None else 1)  # Adjust timeout as needed
                 self.extract_data(data)
             except queue.Empty:
                 continue
+        for subscriber in self.bus_subscribers.values():
+            subscriber.close()
 
     def add_data_to_queue(self, data:DataClass):
             self.data_queue.put(data)
@@ -4,6 +4,8 @@ import re
 import importlib
 from abc import ABC, abstractmethod
 
+import stdatalog_core.HSD_utils.profiling as profiling
+
 class HSD_Plugin(ABC):
     def __init__(self):
         self.components_status = {}
@@ -134,5 +136,6 @@ class HSD_DataToolkit_Pipeline:
     def process_data(self, data_obj):
         data = data_obj
         for plugin in self.plugins:
-            data = plugin.process(data)
+            with profiling.span("dtk." + type(plugin).__name__):
+                data = plugin.process(data)
         return data
\ No newline at end of file
@@ -0,0 +1,420 @@
+# *****************************************************************************
+#  * @file    bench_utils.py
+#  * @author  SRA
+# ******************************************************************************
+# * @attention
+# *
+# * Copyright (c) 2022 STMicroelectronics.
+# * All rights reserved.
+# *
+# * This software is licensed under terms that can be found in the LICENSE file
+# * in the root directory of this software component.
+# * If no LICENSE file comes with this software, it is provided AS-IS.
+# *
+# *
+# ******************************************************************************
+#
+
+"""
+Shared helpers for the STDatalog benchmark scripts: host description, JSON report
+handling, timing/percentile utilities and synthetic `.dat` stream generation.
+"""
+
+import os
+import sys
+import copy
+import json
+import time
+import shutil
+import socket
+import subprocess
+import platform
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from stdatalog_core.HSD.utils.type_conversion import TypeConversion
+
+# Version of the JSON report layout. Bump it when keys are renamed or removed.
+BENCH_SCHEMA_VERSION = "1.0.0"
+
+# Size in bytes of the packet counter that prefixes each data packet in a .dat file
+DATA_PROTOCOL_SIZE = 4
+# Size in bytes of the timestamp appended to each frame (samples_per_ts * dim samples)
+TIMESTAMP_SIZE = 8
+
+# Representative component configurations (values taken from STWIN.box device templates)
+SYNTHETIC_STREAM_PRESETS = {
+    "iis3dwb_acc": {"odr": 26667, "dim": 3, "data_type": "int16", "samples_per_ts": 1000, "usb_dps": 7000},
+    "ism330dhcx_acc": {"odr": 7680, "dim": 3, "data_type": "int16", "samples_per_ts": 1000, "usb_dps": 2000},
+    "imp23absu_mic": {"odr": 192000, "dim": 1, "data_type": "int16", "samples_per_ts": 1000, "usb_dps": 7000},
+    "imp23absu_mic_int24": {"odr": 192000, "dim": 1, "data_type": "int24", "samples_per_ts": 1000, "usb_dps": 7200},
+    "iis2mdc_mag": {"odr": 100, "dim": 3, "data_type": "int16", "samples_per_ts": 100, "usb_dps": 30},
+    "ilps22qs_press": {"odr": 200, "dim": 1, "data_type": "float", "samples_per_ts": 200, "usb_dps": 40},
+}
+
+# Recorded acquisitions used as device_config.json templates by the synthetic acquisitions
+ACQUISITION_TEMPLATES_FOLDER = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "acquisition_examples", "STWIN.box_acquisition_examples"))
+
+# Acquisition interfaces (acquisition_info.json "interface" value): .dat packet size is sd_dps - 4 (SD) or usb_dps (USB)
+ACQ_INTERFACE_SD = 0
+ACQ_INTERFACE_USB = 1
+
+# Fast motor control telemetries as published by FP-IND-DATALOGMC (only the d/q currents and voltages enabled)
+MC_FAST_TELEMETRIES_STATUS = {
+    "usb_dps": 2048, "sd_dps": 8192, "enable": True, "data_type": "int16", "dim": 4,
+    "i_q": {"enabled": True, "unit": "A"}, "i_d": {"enabled": True, "unit": "A"},
+    "i_q_ref": {"enabled": False, "unit": "A"}, "i_d_ref": {"enabled": False, "unit": "A"},
+    "v_q": {"enabled": True, "unit": "V"}, "v_d": {"enabled": True, "unit": "V"},
+    "i_a": {"enabled": False, "unit": "A"}, "i_b": {"enabled": False, "unit": "A"},
+    "v_a": {"enabled": False, "unit": "V"}, "v_b": {"enabled": False, "unit": "V"},
+    "sensitivity": {"voltage": 0.000805, "current": 0.000305, "frequency": 1},
+    "samples_per_ts": 1000, "odr": 30000, "ioffset": 0.0, "c_type": 3, "stream_id": 0, "ep_id": 0,
+}
+
+# Representative acquisitions synthesised by the offline benchmark. Each preset names a template acquisition
+# (device_config.json source), the component to enable, the acquisition interface and the status fields to override.
+# "device" overrides board/firmware identifiers, "add_component" adds a component missing in the template,
+# "stream_odr" is the output rate [Hz] of components without odr in their status (e.g. ISPU, paced by its input sensor).
+SYNTHETIC_ACQUISITION_PRESETS = {
+    "mems_int16_usb": {"template": "DL2_00001", "component": "iis3dwb_acc", "interface": ACQ_INTERFACE_USB, "status": {}},
+    "mems_int16_sd": {"template": "DL2_00001", "component": "iis3dwb_acc", "interface": ACQ_INTERFACE_SD, "status": {}},
+    "mems_int16_lowodr_usb": {"template": "DL2_00001", "component": "iis2mdc_mag", "interface": ACQ_INTERFACE_USB, "status": {}},
+    "audio_int16_usb": {"template": "DL2_00001", "component": "imp23absu_mic", "interface": ACQ_INTERFACE_USB, "status": {}},
+    "audio_int24_usb": {"template": "DL2_00001", "component": "imp23absu_mic", "interface": ACQ_INTERFACE_USB,
+                        "status": {"data_type": "int24", "usb_dps": 7200, "sensitivity": 1.0 / (2 ** 23)}},
+    "audio_int24_sd": {"template": "DL2_00001", "component": "imp23absu_mic", "interface": ACQ_INTERFACE_SD,
+                       "status": {"data_type": "int24", "sd_dps": 126976, "sensitivity": 1.0 / (2 ** 23)}},
+    "ispu_usb": {"template": "20240916_15_45_40", "component": "ism330is_ispu", "interface": ACQ_INTERFACE_USB, "status": {}, "stream_odr": 26},
+    "tof_usb": {"template": "20240916_15_38_55", "component": "vl53l8cx_tof", "interface": ACQ_INTERFACE_USB, "status": {}},
+    "mc_fast_telemetries_usb": {"template": "DL2_00001", "component": "fast_mc_telemetries", "interface": ACQ_INTERFACE_USB, "status": {},
+                                "device": {"fw_id": 0x2F, "fw_name": "FP-IND-DATALOGMC_DatalogMC", "fw_version": "2.1.0"},
+                                "add_component": MC_FAST_TELEMETRIES_STATUS},
+}
+
+def get_host_info():
+    """
+    Collects a description of the host running the benchmark, so that results taken
+    on different machines (e.g. x86 workstation vs ARM Raspberry Pi) can be compared.
+
+    :return: A dictionary with platform, CPU and Python information.
+    """
+    return {
+        "hostname": socket.gethostname(),
+        "system": platform.system(),
+        "release": platform.release(),
+        "machine": platform.machine(),
+        "processor": platform.processor(),
+        "cpu_count": os.cpu_count(),
+        "python_version": platform.python_version(),
+        "numpy_version": np.__version__,
+    }
+
+def get_peak_rss_mb():
+    """
+    Returns the peak resident set size of the current process in MB, or None if
+    it cannot be measured on this platform.
+    """
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is expressed in bytes on macOS and in kilobytes on Linux
+    if sys.platform == "darwin":
+        return peak / (1024 * 1024)
+    return peak / 1024
+
+def latency_stats(latencies_s):
+    """
+    Summarizes a list of latencies (seconds) as milliseconds percentiles.
+
+    :param latencies_s: Iterable of latency values in seconds.
+    :return: A dictionary with count, mean, p50, p95, p99 and max values [ms].
+    """
+    values = np.asarray(list(latencies_s), dtype=np.float64)
+    if values.size == 0:
+        return {"count": 0, "mean_ms": None, "p50_ms": None, "p95_ms": None, "p99_ms": None, "max_ms": None}
+    values_ms = values * 1000.0
+    p50, p95, p99 = np.percentile(values_ms, [50, 95, 99])
+    return {
+        "count": int(values.size),
+        "mean_ms": float(values_ms.mean()),
+        "p50_ms": float(p50),
+        "p95_ms": float(p95),
+        "p99_ms": float(p99),
+        "max_ms": float(values_ms.max()),
+    }
+
+class StageTimer:
+    """
+    Context manager measuring wall-clock and process CPU time of a benchmark stage.
+    """
+    def __init__(self):
+        self.wall_s = 0.0
+        self.cpu_s = 0.0
+
+    def __enter__(self):
+        self._t0 = time.perf_counter()
+        self._c0 = time.process_time()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.wall_s = time.perf_counter() - self._t0
+        self.cpu_s = time.process_time() - self._c0
+        return False
+
+def run_probe(code):
+    """
+    Runs a probe in a fresh Python process.
+
+    :param code: Python code printing a JSON line as last output line.
+    :return: A tuple (probe result dictionary, process wall time [s]).
+    """
+    # The probe process resolves the SDK packages as this process does
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(p for p in sys.path if p)
+    t0 = time.perf_counter()
+    res = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, env=env)
+    wall_s = time.perf_counter() - t0
+    if res.returncode != 0:
+        raise RuntimeError(res.stderr.strip().splitlines()[-1] if res.stderr.strip() else "probe failed")
+    return json.loads(res.stdout.strip().splitlines()[-1]), wall_s
+
+def default_report_path(suite_name, output_folder = None):
+    """
+    Builds the default path of a benchmark JSON report.
+    The host architecture and a datetime are part of the file name to keep reports from different runs apart.
+
+    :param suite_name: Name of the benchmark suite (e.g. "streaming").
+    :param output_folder: [Optional] Folder where the report is saved. Defaults to the current working directory.
+    :return: The report file path.
+    """
+    file_name = "bench_{}_{}_{}.json".format(suite_name, platform.machine().lower(), datetime.now().strftime("%Y%m%d_%H_%M_%S"))
+    return os.path.join(output_folder or os.getcwd(), file_name)
+
+def build_report(suite_name, config, results):
+    """
+    Wraps benchmark results with the metadata needed to compare runs across releases and hosts.
+
+    :param suite_name: Name of the benchmark suite.
+    :param config: Dictionary describing the benchmark configuration.
+    :param results: Dictionary with the benchmark results.
+    :return: The complete report dictionary.
+    """
+    return {
+        "schema_version": BENCH_SCHEMA_VERSION,
+        "suite": suite_name,
+        "date": datetime.now().isoformat(),
+        "host": get_host_info(),
+        "config": config,
+        "results": results,
+    }
+
+def save_report(report, report_path):
+    """
+    Saves a benchmark report as JSON.
+
+    :param report: The report dictionary (see build_report).
+    :param report_path: Output file path.
+    """
+    report_folder = os.path.dirname(os.path.abspath(report_path))
+    if not os.path.exists(report_folder):
+        os.makedirs(report_folder)
+    with open(report_path, "w") as f:
+        json.dump(report, f, indent=4)
+
+def synthesize_frames(odr, dim, data_type, samples_per_ts, duration, ioffset = 0.0, seed = 0):
+    """
+    Generates the payload of a component stream as the device produces it: frames of
+    samples_per_ts * dim interleaved samples, each followed by a double timestamp
+    (no timestamps if samples_per_ts is 0).
+
+    :param odr: Output data rate [Hz].
+    :param dim: Number of axes.
+    :param data_type: Sample data type (as in device_config.json, e.g. "int16", "int24", "float").
+    :param samples_per_ts: Number of samples per timestamp.
+    :param duration: Stream duration [s].
+    :param ioffset: [Optional] Initial timestamp offset [s].
+    :param seed: [Optional] Random generator seed.
+    :return: The payload as bytes (packet counters excluded).
+    """
+    rng = np.random.default_rng(seed)
+    n_samples = int(odr * duration)
+    if samples_per_ts > 0:
+        n_frames = max(1, n_samples // samples_per_ts)
+        n_samples = n_frames * samples_per_ts
+
+    t = np.arange(n_samples, dtype=np.float64) / odr
+    # One sine per axis (shifted in phase) plus some noise
+    signal = np.sin(2 * np.pi * 50.0 * t[:, None] + np.arange(dim)[None, :] * (np.pi / 3))
+    signal += 0.05 * rng.standard_normal(signal.shape)
+
+    type_name = TypeConversion.check_type(data_type)
+    if type_name in ("float32", "double"):
+        samples = signal.astype(TypeConversion.get_np_dtype(data_type))
+        raw = samples.view(np.uint8).reshape(n_samples, dim * samples.itemsize)
+    elif type_name == "int24":
+        scaled = (signal * (2 ** 21)).astype(np.int32)
+        # keep the 3 least significant bytes (little endian) of every int32 sample
+        raw = scaled.view(np.uint8).reshape(n_samples, dim, 4)[:, :, :3].reshape(n_samples, dim * 3)
+    else:
+        np_dtype = np.dtype(TypeConversion.get_np_dtype(data_type))
+        amplitude = np.iinfo(np_dtype).max // 4
+        offset = amplitude if np_dtype.kind == "u" else 0
+        samples = (signal * amplitude + offset).astype(np_dtype)
+        raw = samples.view(np.uint8).reshape(n_samples, dim * np_dtype.itemsize)
+
+    if samples_per_ts == 0:
+        return np.ascontiguousarray(raw).tobytes()
+
+    frame_data = np.ascontiguousarray(raw).reshape(n_frames, samples_per_ts * raw.shape[1])
+    timestamps = ioffset + (np.arange(1, n_frames + 1, dtype=np.float64) * samples_per_ts / odr)
+    frames = np.concatenate((frame_data, timestamps.reshape(-1, 1).view(np.uint8)), axis=1)
+    return frames.tobytes()
+
+def packetize(payload, packet_data_size, drop_rate = 0.0, seed = 0):
+    """
+    Splits a component payload in data packets, each one prefixed with the 4-byte
+    packet counter (number of payload bytes sent before the packet, wrapping at 2^32).
+    Packets can be randomly dropped to simulate a lossy link; the counters of the
+    remaining packets are left unchanged so that gaps are detectable.
+
+    :param payload: Component payload (see synthesize_frames).
+    :param packet_data_size: Number of payload bytes per packet (usb_dps).
+    :param drop_rate: [Optional] Probability of dropping each packet (0.0 - 1.0).
+    :param seed: [Optional] Random generator seed.
+    :return: A tuple (stream_bytes, nof_packets, nof_dropped_packets).
+    """
+    payload_array = np.frombuffer(payload, dtype=np.uint8)
+    nof_packets = len(payload_array) // packet_data_size
+    payload_array = payload_array[:nof_packets * packet_data_size].reshape(nof_packets, packet_data_size)
+
+    counters = ((np.arange(nof_packets, dtype=np.uint64) * packet_data_size) % (2 ** 32)).astype("<u4")
+    packets = np.empty((nof_packets, packet_data_size + DATA_PROTOCOL_SIZE), dtype=np.uint8)
+    packets[:, :DATA_PROTOCOL_SIZE] = counters.view(np.uint8).reshape(nof_packets, DATA_PROTOCOL_SIZE)
+    packets[:, DATA_PROTOCOL_SIZE:] = payload_array
+
+    nof_dropped = 0
+    if drop_rate > 0:
+        rng = np.random.default_rng(seed)
+        keep = rng.random(nof_packets) >= drop_rate
+        # Never drop the first packet: it is the reference for the counter check
+        keep[0] = True
+        nof_dropped = int(nof_packets - np.count_nonzero(keep))
+        packets = packets[keep]
+
+    return packets.tobytes(), nof_packets, nof_dropped
+
+def synthesize_component_stream(spec, duration, drop_rate = 0.0, seed = 0):
+    """
+    Generates a complete USB packet stream (as it would be written in a .dat file) for a component spec.
+
+    :param spec: Dictionary with odr, dim, data_type, samples_per_ts and usb_dps keys (see SYNTHETIC_STREAM_PRESETS).
+    :param duration: Stream duration [s].
+    :param drop_rate: [Optional] Probability of dropping each packet.
+    :param seed: [Optional] Random generator seed.
+    :return: A tuple (stream_bytes, nof_packets, nof_dropped_packets).
+    """
+    payload = synthesize_frames(spec["odr"], spec["dim"], spec["data_type"], spec["samples_per_ts"], duration, seed = seed)
+    return packetize(payload, spec["usb_dps"], drop_rate, seed)
+
+def build_synthetic_device_config(preset):
+    """
+    Builds the device_config.json content of a synthetic acquisition from the preset template:
+    only the preset component is enabled and its status fields are overridden.
+
+    :param preset: A SYNTHETIC_ACQUISITION_PRESETS entry.
+    :return: The device_config.json dictionary.
+    """
+    template_path = os.path.join(ACQUISITION_TEMPLATES_FOLDER, preset["template"], "device_config.json")
+    with open(template_path, "r") as f:
+        device_config = json.load(f)
+    device = device_config["devices"][0]
+    comp_name = preset["component"]
+    if preset.get("add_component") is not None:
+        device["components"].append({comp_name: copy.deepcopy(preset["add_component"])})
+    found = False
+    for c in device["components"]:
+        name = list(c.keys())[0]
+        status = c[name]
+        if name == "firmware_info" and preset.get("device") is not None:
+            status.update({k: v for k, v in preset["device"].items() if k in ("fw_name", "fw_version")})
+        elif "enable" in status:
+            status["enable"] = name == comp_name
+        if name == comp_name:
+            status.update(preset.get("status", {}))
+            found = True
+    if not found:
+        raise ValueError("Component {} not found in the {} template".format(comp_name, preset["template"]))
+    if preset.get("device") is not None:
+        device.update({k: v for k, v in preset["device"].items() if k in ("board_id", "fw_id")})
+    return device_config
+
+def write_synthetic_acquisition(preset, output_folder, duration, seed = 0):
+    """
+    Writes a synthetic acquisition folder (device_config.json, acquisition_info.json, the component .dat file
+    and the template ispu_output_format.json, if any) that can be opened by HSDatalog.create_hsd.
+    The .dat content is generated from the component status as decoded by the SDK (odr, measodr, dim,
+    data_type, samples_per_ts and packet size of the acquisition interface).
+
+    :param preset: A SYNTHETIC_ACQUISITION_PRESETS entry.
+    :param output_folder: Acquisition folder to be created.
+    :param duration: Acquisition duration [s].
+    :param seed: [Optional] Random generator seed.
+    :return: A dictionary with the component name, .dat file path and size, number of packets and samples.
+    """
+    from stdatalog_core.HSD.HSDatalog import HSDatalog
+
+    os.makedirs(output_folder, exist_ok=True)
+    with open(os.path.join(output_folder, "device_config.json"), "w") as f:
+        json.dump(build_synthetic_device_config(preset), f, indent=4)
+    ispu_output_format_path = os.path.join(ACQUISITION_TEMPLATES_FOLDER, preset["template"], "ispu_output_format.json")
+    if os.path.exists(ispu_output_format_path):
+        shutil.copy(ispu_output_format_path, output_folder)
+
+    start_time = datetime(2000, 1, 1, 0, 0, 0)
+    acquisition_info = {
+        "tags": [],
+        "name": "synthetic_{}".format(preset["component"]),
+        "description": "STDatalog benchmark synthetic acquisition",
+        "uuid": "00000000-0000-0000-0000-{:012d}".format(seed),
+        "start_time": start_time.strftime("%Y-%m-%dT%H:%M:%S.000Z"),
+        "end_time": (start_time + timedelta(seconds=duration)).strftime("%Y-%m-%dT%H:%M:%S.%f")[:-3] + "Z",
+        "data_ext": ".dat",
+        "data_fmt": "HSD_2.0.0",
+        "interface": preset["interface"],
+        "schema_version": "2.0.0",
+        "c_type": 2
+    }
+    with open(os.path.join(output_folder, "acquisition_info.json"), "w") as f:
+        json.dump(acquisition_info, f, indent=4)
+
+    # Stream parameters as decoded by the SDK (enum values converted, e.g. odr index -> Hz)
+    comp_name = preset["component"]
+    hsd = HSDatalog().create_hsd(output_folder, update_catalog=False)
+    status = HSDatalog.get_component(hsd, comp_name)[comp_name]
+    odr = status.get("measodr") or status.get("odr") or preset.get("stream_odr")
+    spts = status.get("samples_per_ts", 0)
+    samples_per_ts = spts if isinstance(spts, int) else spts.get("val", 0)
+    if preset["interface"] == ACQ_INTERFACE_SD:
+        packet_data_size = status["sd_dps"] - DATA_PROTOCOL_SIZE
+    else:
+        packet_data_size = status["usb_dps"]
+
+    payload = synthesize_frames(odr, status.get("dim", 1), status["data_type"], samples_per_ts, duration, status.get("ioffset", 0.0), seed)
+    stream, nof_packets, _ = packetize(payload, packet_data_size, seed = seed)
+    dat_path = os.path.join(output_folder, comp_name + ".dat")
+    with open(dat_path, "wb") as f:
+        f.write(stream)
+    return {
+        "component": comp_name,
+        "dat_file": dat_path,
+        "dat_size": len(stream),
+        "nof_packets": nof_packets,
+        "odr": odr,
+        "dim": status.get("dim", 1),
+        "data_type": status["data_type"],
+        "samples_per_ts": samples_per_ts,
+        "packet_data_size": packet_data_size,
+    }
@@ -0,0 +1,321 @@
+# *****************************************************************************
+#  * @file    stdatalog_bench_offline.py
+#  * @author  SRA
+# ******************************************************************************
+# * @attention
+# *
+# * Copyright (c) 2022 STMicroelectronics.
+# * All rights reserved.
+# *
+# * This software is licensed under terms that can be found in the LICENSE file
+# * in the root directory of this software component.
+# * If no LICENSE file comes with this software, it is provided AS-IS.
+# *
+# *
+# ******************************************************************************
+#
+
+"""
+This script, `stdatalog_bench_offline.py`, benchmarks the offline read and conversion path of the SDK
+on synthetic acquisitions. For each configuration (see bench_utils.SYNTHETIC_ACQUISITION_PRESETS:
+MEMS int16 3-axis with samples_per_ts, int16/int24 audio, ISPU, ToF, MC fast telemetries, SD vs USB
+packet sizes) an acquisition folder (device_config.json + acquisition_info.json + .dat) is generated
+from a recorded STWIN.box acquisition template.
+
+Measured per configuration and stage:
+- get_data_and_timestamps, get_dataframe
+- convert_dat_to_xsv (CSV, TSV, TXT, PARQUET), convert_acquisition_to_hdf5
+- convert_dat_to_wav (audio components), convert_dat_to_nanoedge, convert_dat_to_unico
+- archive_read: create_archive + AcquisitionArchive.get_data_and_timestamps of the whole component (sensor
+  components), checked against HSDatalog.get_data_and_timestamps: a mismatch fails the stage
+Each stage runs in a fresh Python process (default) and reports wall/CPU time, throughput [MB/s of .dat
+input], output size and peak RSS. Stages needing a missing optional dependency (pandas, pyarrow, h5py)
+are reported as skipped.
+
+Results are saved in a JSON report together with a host description (see bench_utils) and can be
+compared with a baseline report: stages slower than the baseline by more than the tolerance are
+reported as regressions.
+"""
+
+import sys
+import os
+import json
+import shutil
+import tempfile
+
+# Add the STDatalog SDK root directory to the sys.path to access the SDK packages
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+
+import click
+import stdatalog_core.HSD_utils.logger as logger
+from stdatalog_examples.benchmarks.bench_utils import ACQ_INTERFACE_SD, SYNTHETIC_ACQUISITION_PRESETS, StageTimer, build_report, default_report_path, \
+    get_peak_rss_mb, run_probe, save_report, write_synthetic_acquisition
+
+# Set up the application logger
+log = logger.setup_applevel_logger(is_debug = False, file_name= "app_debug.log")
+
+# Define the script version
+script_version = "1.0.0"
+
+# Benchmarked stages, in execution order
+STAGES = ["get_data_and_timestamps", "get_dataframe", "xsv_csv", "xsv_tsv", "xsv_txt", "xsv_parquet", "hdf5", "wav", "nanoedge", "unico", "archive_read"]
+# NanoEdge segmentation (samples per signal, no overlap)
+NANOEDGE_SIGNAL_LENGTH = 1024
+# Default regression tolerance: a stage is a regression if its wall time exceeds the baseline by more than 15%
+DEFAULT_TOLERANCE = 0.15
+
+# Code run in a fresh interpreter: prints a JSON line with the stage results
+STAGE_PROBE = """
+import json
+from stdatalog_examples.benchmarks.stdatalog_bench_offline import run_stage
+print(json.dumps(run_stage({acq_folder!r}, {component!r}, {stage!r}, {output_folder!r}, {chunk_size})))
+"""
+
+def is_stage_applicable(stage, comp_name):
+    """
+    :return: True if the stage applies to the component (WAV export is only meaningful for microphones,
+        archive time based reads are available for sensors only).
+    """
+    if stage == "wav":
+        return "_mic" in comp_name
+    if stage == "archive_read":
+        return "_telemetries" not in comp_name
+    return True
+
+def check_archive_read(hsd, component, output_folder, chunk_size):
+    """
+    Archives the acquisition and checks that a full read of the component from the archive returns
+    the same raw samples and timestamps as HSDatalog.get_data_and_timestamps.
+
+    :param hsd: HSDatalog instance of the acquisition.
+    :param component: Component dictionary {name: status}.
+    :param output_folder: Folder of the archive.
+    :param chunk_size: Number of samples per processed chunk (HSDatalog read).
+    :raise ValueError: If the archive read differs from the HSDatalog one.
+    """
+    import numpy as np
+    from stdatalog_core.HSD.HSDatalog import HSDatalog
+    from stdatalog_core.HSD_utils.archive_codec import AcquisitionArchive, create_archive
+
+    comp_name = list(component.keys())[0]
+    archive_path = create_archive(hsd.get_acquisition_path(), os.path.join(output_folder, "acquisition.hsdz"))
+    with AcquisitionArchive(archive_path) as archive:
+        data, timestamps = archive.get_data_and_timestamps(comp_name, raw_data = True)
+    d_and_t = HSDatalog.get_data_and_timestamps(hsd, component, raw_data = True, chunk_size = chunk_size)
+    hsd_data = np.concatenate([d for d, _ in d_and_t]) if len(d_and_t) > 0 else np.empty((0,))
+    hsd_timestamps = np.concatenate([t for _, t in d_and_t]) if len(d_and_t) > 0 else np.empty((0, 1))
+    if len(data) != len(hsd_data) or not np.array_equal(np.asarray(data).reshape(len(data), -1), hsd_data.reshape(len(hsd_data), -1)):
+        raise ValueError("{}: archive read samples differ from HSDatalog ({} vs {})".format(comp_name, len(data), len(hsd_data)))
+    if not np.allclose(np.asarray(timestamps).reshape(-1), hsd_timestamps.reshape(-1)):
+        raise ValueError("{}: archive read timestamps differ from HSDatalog".format(comp_name))
+
+def run_stage_call(hsd, component, stage, output_folder, chunk_size):
+    """
+    Runs a benchmark stage on a component.
+
+    :param hsd: HSDatalog instance of the acquisition.
+    :param component: Component dictionary {name: status}.
+    :param stage: Stage name (see STAGES).
+    :param output_folder: Folder of the converted files.
+    :param chunk_size: Number of samples per processed chunk.
+    """
+    from stdatalog_core.HSD.HSDatalog import HSDatalog
+
+    if stage == "get_data_and_timestamps":
+        HSDatalog.get_data_and_timestamps(hsd, component, chunk_size = chunk_size)
+    elif stage == "get_dataframe":
+        HSDatalog.get_dataframe(hsd, component, chunk_size = chunk_size)
+    elif stage.startswith("xsv_"):
+        HSDatalog.convert_dat_to_xsv(hsd, component, 0, -1, False, False, output_folder, stage[len("xsv_"):].upper(), chunk_size = chunk_size)
+    elif stage == "hdf5":
+        HSDatalog.convert_acquisition_to_hdf5(hsd, [component], 0, -1, False, output_folder, chunk_size = chunk_size)
+    elif stage == "wav":
+        HSDatalog.convert_dat_to_wav(hsd, component, 0, -1, output_folder, chunk_size = chunk_size)
+    elif stage == "nanoedge":
+        HSDatalog.convert_dat_to_nanoedge(hsd, component, NANOEDGE_SIGNAL_LENGTH, NANOEDGE_SIGNAL_LENGTH, 0, -1, False, output_folder, chunk_size = chunk_size)
+    elif stage == "unico":
+        HSDatalog.convert_dat_to_unico(hsd, [component], 0, -1, False, output_folder, "TXT", chunk_size = chunk_size)
+    elif stage == "archive_read":
+        check_archive_read(hsd, component, output_folder, chunk_size)
+    else:
+        raise ValueError("Unknown stage: {}".format(stage))
+
+def get_folder_size(folder):
+    return sum(os.path.getsize(os.path.join(root, f)) for root, _, files in os.walk(folder) for f in files)
+
+def run_stage(acq_folder, comp_name, stage, output_folder, chunk_size):
+    """
+    Opens an acquisition and measures a stage on one of its components.
+
+    :return: A dictionary with open_s, wall_s, cpu_s, output_bytes and peak_rss_mb,
+        {"skipped": reason} if an optional dependency is missing, {"error": message} if the stage failed.
+    """
+    from stdatalog_core.HSD.HSDatalog import HSDatalog
+
+    with StageTimer() as open_timer:
+        hsd = HSDatalog().create_hsd(acq_folder, update_catalog = False)
+        component = HSDatalog.get_component(hsd, comp_name)
+    os.makedirs(output_folder, exist_ok = True)
+    try:
+        with StageTimer() as timer:
+            run_stage_call(hsd, component, stage, output_folder, chunk_size)
+    except ImportError as e:
+        return {"skipped": "missing dependency: {}".format(e.name or e)}
+    except Exception as e:
+        return {"error": "{}: {}".format(type(e).__name__, e)}
+    return {
+        "open_s": open_timer.wall_s,
+        "wall_s": timer.wall_s,
+        "cpu_s": timer.cpu_s,
+        "output_bytes": get_folder_size(output_folder),
+        "peak_rss_mb": get_peak_rss_mb(),
+    }
+
+def bench_configuration(name, preset, work_folder, duration, stages, chunk_size, in_process):
+    """
+    Synthesises the acquisition of a configuration and measures the requested stages.
+
+    :return: A dictionary with the acquisition description and the results per stage.
+    """
+    acq_folder = os.path.join(work_folder, name)
+    acq = write_synthetic_acquisition(preset, acq_folder, duration)
+    comp_name = acq["component"]
+    dat_mb = acq["dat_size"] / 1e6
+    log.info("{}: {} ({}, dim {}, {:.0f} Hz, spts {}, {} packets of {} B) - {:.2f} MB".format(
+        name, comp_name, acq["data_type"], acq["dim"], acq["odr"], acq["samples_per_ts"],
+        "SD" if preset["interface"] == ACQ_INTERFACE_SD else "USB", acq["packet_data_size"], dat_mb))
+
+    results = {}
+    for stage in stages:
+        if not is_stage_applicable(stage, comp_name):
+            continue
+        output_folder = os.path.join(work_folder, "{}_{}_out".format(name, stage))
+        if in_process:
+            r = run_stage(acq_folder, comp_name, stage, output_folder, chunk_size)
+        else:
+            try:
+                r, _ = run_probe(STAGE_PROBE.format(acq_folder=acq_folder, component=comp_name, stage=stage,
+                                                    output_folder=output_folder, chunk_size=chunk_size))
+            except RuntimeError as e:
+                r = {"error": str(e)}
+        shutil.rmtree(output_folder, ignore_errors = True)
+
+        if "wall_s" in r:
+            r["mbps"] = dat_mb / r["wall_s"] if r["wall_s"] > 0 else None
+            log.info("--> {:<24} {:8.3f} s {:9.2f} MB/s  peak RSS {} MB".format(
+                stage, r["wall_s"], r["mbps"] or 0, "{:.1f}".format(r["peak_rss_mb"]) if r["peak_rss_mb"] is not None else "n.a."))
+        elif "skipped" in r:
+            log.info("--> {:<24} skipped ({})".format(stage, r["skipped"]))
+        else:
+            log.warning("--> {:<24} failed ({})".format(stage, r["error"]))
+        results[stage] = r
+
+    acq.pop("dat_file")
+    return {"acquisition": acq, "interface": preset["interface"], "stages": results}
+
+def compare_with_baseline(results, baseline_path, tolerance):
+    """
+    Compares the stage wall times with a baseline report of this suite.
+
+    :param results: Results of the current run {configuration: {"stages": {stage: {...}}}}.
+    :param baseline_path: Path of the baseline JSON report.
+    :param tolerance: Relative slowdown above which a stage is reported as a regression.
+    :return: A dictionary with the baseline path, the ratios (current / baseline wall time) and the regressions.
+    """
+    with open(baseline_path, "r") as f:
+        baseline = json.load(f)
+    if baseline.get("suite") != "offline":
+        raise ValueError("{} is not an offline benchmark report".format(baseline_path))
+
+    ratios = {}
+    regressions = []
+    for name, r in results.items():
+        b_stages = baseline["results"].get("configurations", {}).get(name, {}).get("stages", {})
+        for stage, s in r["stages"].items():
+            b = b_stages.get(stage, {})
+            if "wall_s" not in s or not b.get("wall_s"):
+                continue
+            ratio = s["wall_s"] / b["wall_s"]
+            ratios.setdefault(name, {})[stage] = ratio
+            if ratio > 1 + tolerance:
+                regressions.append({"configuration": name, "stage": stage, "ratio": ratio,
+                                    "wall_s": s["wall_s"], "baseline_wall_s": b["wall_s"]})
+                log.warning("Regression: {} {} {:.3f} s (baseline {:.3f} s, x{:.2f})".format(name, stage, s["wall_s"], b["wall_s"], ratio))
+    log.info("Baseline comparison: {} stages compared, {} regressions (tolerance {:.0%})".format(
+        sum(len(v) for v in ratios.values()), len(regressions), tolerance))
+    return {"path": os.path.abspath(baseline_path), "host": baseline.get("host"), "tolerance": tolerance,
+            "ratios": ratios, "regressions": regressions}
+
+# Define a callback function to show help information
+def show_help(ctx, param, value):
+    if value and not ctx.resilient_parsing:
+        # Display the help information for the command
+        click.secho(ctx.get_help(), color=ctx.color)
+        # Display examples of script execution
+        click.secho("\n-> Script execution examples:")
+        # Example: Benchmark all configurations and stages
+        click.secho("   python stdatalog_bench_offline.py", fg='cyan')
+        # Example: Benchmark the audio configurations with 60 s acquisitions, read and CSV stages only
+        click.secho("   python stdatalog_bench_offline.py -c audio_int16_usb -c audio_int24_usb -d 60 -s get_data_and_timestamps -s xsv_csv", fg='cyan')
+        # Example: Compare with a baseline report, exit with an error in case of regressions
+        click.secho("   python stdatalog_bench_offline.py -b bench_offline_baseline.json --fail_on_regression", fg='cyan')
+        # Exit the context after showing help
+        ctx.exit()
+
+@click.command()
+@click.option('-c', '--config', 'configs', help="Configuration to benchmark (repeatable). Default: all", type=click.Choice(list(SYNTHETIC_ACQUISITION_PRESETS.keys())), multiple=True)
+@click.option('-s', '--stage', 'stages', help="Stage to benchmark (repeatable). Default: all", type=click.Choice(STAGES), multiple=True)
+@click.option('-d', '--duration', help="Synthetic acquisition duration [s]", type=float, default=30.0)
+@click.option('-cs', '--chunk_size', help="Number of samples per processed chunk", type=int, default=10000000)
+@click.option('-ip', '--in_process', help="Run all the stages in this process (faster, peak RSS is then cumulative)", is_flag=True, default=False)
+@click.option('-w', '--work_folder', help="Folder of the synthetic acquisitions. Default: a temporary folder", type=click.Path(), default=None)
+@click.option('-k', '--keep_files', help="Keep the synthetic acquisitions at the end of the benchmark", is_flag=True, default=False)
+@click.option('-b', '--baseline', help="Baseline JSON report to compare with", type=click.Path(exists=True), default=None)
+@click.option('-t', '--tolerance', help="Regression tolerance (relative wall time increase)", type=float, default=DEFAULT_TOLERANCE)
+@click.option('-f', '--fail_on_regression', help="Exit with an error code if a regression is found", is_flag=True, default=False)
+@click.option('-o', '--output', help="Output JSON report path", type=click.Path(), default=None)
+@click.version_option(script_version, '-v', '--version', prog_name="stdatalog_bench_offline", is_flag=True, help="stdatalog_bench_offline tool version number")
+@click.option("-h", "--help", is_flag=True, is_eager=True, expose_value=False, callback=show_help, help="Show this message and exit.",)
+
+def bench_offline_cmd(configs, stages, duration, chunk_size, in_process, work_folder, keep_files, baseline, tolerance, fail_on_regression, output):
+    configs = list(configs) or list(SYNTHETIC_ACQUISITION_PRESETS.keys())
+    stages = [s for s in STAGES if s in stages] if stages else STAGES
+    temp_folder = work_folder is None
+    work_folder = os.path.abspath(work_folder or tempfile.mkdtemp(prefix="stdatalog_bench_offline_"))
+    os.makedirs(work_folder, exist_ok = True)
+
+    results = {}
+    try:
+        for name in configs:
+            results[name] = bench_configuration(name, SYNTHETIC_ACQUISITION_PRESETS[name], work_folder, duration, stages, chunk_size, in_process)
+    finally:
+        if keep_files:
+            log.info("Synthetic acquisitions kept in {}".format(work_folder))
+        elif temp_folder:
+            shutil.rmtree(work_folder, ignore_errors = True)
+        else:
+            for name in configs:
+                shutil.rmtree(os.path.join(work_folder, name), ignore_errors = True)
+
+    report_results = {"configurations": results}
+    if baseline is not None:
+        report_results["baseline"] = compare_with_baseline(results, baseline, tolerance)
+
+    config = {
+        "configurations": configs,
+        "stages": stages,
+        "duration_s": duration,
+        "chunk_size": chunk_size,
+        "in_process": in_process,
+        "python_executable": sys.executable,
+    }
+    report_path = output or default_report_path("offline")
+    save_report(build_report("offline", config, report_results), report_path)
+    log.info("Benchmark report saved: {}".format(report_path))
+
+    if fail_on_regression and baseline is not None and len(report_results["baseline"]["regressions"]) > 0:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    # Execute the main function
+    bench_offline_cmd()
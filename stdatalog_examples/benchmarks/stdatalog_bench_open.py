@@ -0,0 +1,181 @@
+# *****************************************************************************
+#  * @file    stdatalog_bench_open.py
+#  * @author  SRA
+# ******************************************************************************
+# * @attention
+# *
+# * Copyright (c) 2022 STMicroelectronics.
+# * All rights reserved.
+# *
+# * This software is licensed under terms that can be found in the LICENSE file
+# * in the root directory of this software component.
+# * If no LICENSE file comes with this software, it is provided AS-IS.
+# *
+# *
+# ******************************************************************************
+#
+
+"""
+This script, `stdatalog_bench_open.py`, measures the per-process startup cost of the offline
+read path, which dominates batch jobs that open thousands of short acquisitions.
+
+Measured:
+- Import time of the SDK entry-point modules, each one in a fresh Python process, and the
+  heavy optional dependencies (dask, plotly, werkzeug, pandas, h5py, ...) they pull in.
+- Cold open time: fresh process, import + HSDatalog.create_hsd(acquisition folder).
+- Warm open time: repeated HSDatalog.create_hsd calls in the same process.
+
+Results are saved in a JSON report together with a host description (see bench_utils).
+"""
+
+import sys
+import os
+import json
+import time
+
+# Add the STDatalog SDK root directory to the sys.path to access the SDK packages
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+
+import click
+import stdatalog_core.HSD_utils.logger as logger
+from stdatalog_examples.benchmarks.bench_utils import build_report, default_report_path, latency_stats, run_probe, save_report
+
+# Set up the application logger
+log = logger.setup_applevel_logger(is_debug = False, file_name= "app_debug.log")
+
+# Define the script version
+script_version = "1.0.0"
+
+# Modules whose import time is measured
+IMPORT_TARGETS = [
+    "stdatalog_core.HSD.HSDatalog",
+    "stdatalog_core.HSD.HSDatalog_v2",
+    "stdatalog_core.HSD.HSDatalog_v1",
+    "stdatalog_core.HSD_utils.converters",
+]
+
+# Dependencies that should only be loaded by the plot, dask, HDF5 or DataFrame APIs
+HEAVY_MODULES = ["dask", "dask.dataframe", "plotly", "werkzeug", "dash", "pandas", "h5py", "dateutil", "matplotlib"]
+
+# Code run in a fresh interpreter: prints a JSON line with the measured times and the loaded heavy modules
+IMPORT_PROBE = """
+import sys, time, json
+t0 = time.perf_counter()
+import {module}
+t1 = time.perf_counter()
+print(json.dumps({{"import_s": t1 - t0, "heavy_modules": [m for m in {heavy} if m in sys.modules]}}))
+"""
+
+OPEN_PROBE = """
+import sys, time, json
+t0 = time.perf_counter()
+from stdatalog_core.HSD.HSDatalog import HSDatalog
+t1 = time.perf_counter()
+hsd = HSDatalog().create_hsd({acq_folder!r}, update_catalog={update_catalog})
+t2 = time.perf_counter()
+print(json.dumps({{"import_s": t1 - t0, "open_s": t2 - t1, "ok": hsd is not None, "heavy_modules": [m for m in {heavy} if m in sys.modules]}}))
+"""
+
+def bench_imports(repeat):
+    """
+    Measures the import time of IMPORT_TARGETS, each one in `repeat` fresh processes.
+
+    :return: A dictionary {module: results}.
+    """
+    results = {}
+    for module in IMPORT_TARGETS:
+        import_times, process_times = [], []
+        heavy_modules = []
+        try:
+            for _ in range(repeat):
+                r, wall_s = run_probe(IMPORT_PROBE.format(module=module, heavy=HEAVY_MODULES))
+                import_times.append(r["import_s"])
+                process_times.append(wall_s)
+                heavy_modules = r["heavy_modules"]
+        except RuntimeError as e:
+            log.error("Import of {} failed: {}".format(module, e))
+            results[module] = {"error": str(e)}
+            continue
+        results[module] = {"import": latency_stats(import_times), "process": latency_stats(process_times), "heavy_modules": heavy_modules}
+        log.info("--> import {}: p50 {:.1f} ms (process {:.1f} ms), heavy modules loaded: {}".format(
+            module, results[module]["import"]["p50_ms"], results[module]["process"]["p50_ms"], ", ".join(heavy_modules) or "none"))
+    return results
+
+def bench_open(acq_folder, repeat, update_catalog):
+    """
+    Measures the cold (fresh process) and warm (same process) open time of an acquisition folder.
+
+    :return: A dictionary with the cold and warm open results.
+    """
+    import_times, open_times, process_times = [], [], []
+    heavy_modules = []
+    for _ in range(repeat):
+        r, wall_s = run_probe(OPEN_PROBE.format(acq_folder=acq_folder, update_catalog=update_catalog, heavy=HEAVY_MODULES))
+        if not r["ok"]:
+            raise RuntimeError("{} is not a valid acquisition folder".format(acq_folder))
+        import_times.append(r["import_s"])
+        open_times.append(r["open_s"])
+        process_times.append(wall_s)
+        heavy_modules = r["heavy_modules"]
+
+    from stdatalog_core.HSD.HSDatalog import HSDatalog
+    warm_times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        HSDatalog().create_hsd(acq_folder, update_catalog=update_catalog)
+        warm_times.append(time.perf_counter() - t0)
+
+    results = {
+        "cold": {"import": latency_stats(import_times), "open": latency_stats(open_times), "process": latency_stats(process_times), "heavy_modules": heavy_modules},
+        "warm": {"open": latency_stats(warm_times)},
+    }
+    log.info("--> cold open: import p50 {:.1f} ms + open p50 {:.1f} ms (process {:.1f} ms)".format(
+        results["cold"]["import"]["p50_ms"], results["cold"]["open"]["p50_ms"], results["cold"]["process"]["p50_ms"]))
+    log.info("--> warm open: p50 {:.2f} ms".format(results["warm"]["open"]["p50_ms"]))
+    return results
+
+# Define a callback function to show help information
+def show_help(ctx, param, value):
+    if value and not ctx.resilient_parsing:
+        # Display the help information for the command
+        click.secho(ctx.get_help(), color=ctx.color)
+        # Display examples of script execution
+        click.secho("\n-> Script execution examples:")
+        # Example: Measure the import time of the SDK modules
+        click.secho("   python stdatalog_bench_open.py", fg='cyan')
+        # Example: Measure import and open time of an acquisition, without device catalog update
+        click.secho("   python stdatalog_bench_open.py -a Acquisition_Folder_Path -n 20 --no_catalog_update", fg='cyan')
+        # Exit the context after showing help
+        ctx.exit()
+
+@click.command()
+@click.option('-a', '--acq_folder', help="Acquisition folder to open. If not set, only import times are measured", type=click.Path(exists=True), default=None)
+@click.option('-n', '--repeat', help="Number of measurements (fresh processes) per target", type=int, default=10)
+@click.option('-nc', '--no_catalog_update', help="Open the acquisition without updating the device catalog", is_flag=True, default=False)
+@click.option('-o', '--output', help="Output JSON report path", type=click.Path(), default=None)
+@click.version_option(script_version, '-v', '--version', prog_name="stdatalog_bench_open", is_flag=True, help="stdatalog_bench_open tool version number")
+@click.option("-h", "--help", is_flag=True, is_eager=True, expose_value=False, callback=show_help, help="Show this message and exit.",)
+
+def bench_open_cmd(acq_folder, repeat, no_catalog_update, output):
+    log.info("Measuring import times ({} processes per module)...".format(repeat))
+    results = {"imports": bench_imports(repeat)}
+    if acq_folder is not None:
+        log.info("Measuring open time of {}...".format(acq_folder))
+        try:
+            results["open"] = bench_open(os.path.abspath(acq_folder), repeat, not no_catalog_update)
+        except RuntimeError as e:
+            log.error("Open benchmark failed: {}".format(e))
+
+    config = {
+        "acq_folder": os.path.abspath(acq_folder) if acq_folder is not None else None,
+        "repeat": repeat,
+        "update_catalog": not no_catalog_update,
+        "python_executable": sys.executable,
+    }
+    report_path = output or default_report_path("open")
+    save_report(build_report("open", config, results), report_path)
+    log.info("Benchmark report saved: {}".format(report_path))
+
+if __name__ == '__main__':
+    # Execute the main function
+    bench_open_cmd()
@@ -0,0 +1,494 @@
+#!/usr/bin/env python
+# coding: utf-8
+# *****************************************************************************
+#  * @file    stdatalog_bench_streaming.py
+#  * @author  SRA
+# ******************************************************************************
+# * @attention
+# *
+# * Copyright (c) 2022 STMicroelectronics.
+# * All rights reserved.
+# *
+# * This software is licensed under terms that can be found in the LICENSE file
+# * in the root directory of this software component.
+# * If no LICENSE file comes with this software, it is provided AS-IS.
+# *
+# *
+# ******************************************************************************
+#
+
+"""
+This script, `stdatalog_bench_streaming.py`, benchmarks the live acquisition hot path of the SDK
+without a connected board. Component streams are replayed from a recorded acquisition folder
+(USB .dat files) or synthesised, and served at a configurable rate by a replay link that
+implements the `get_sensor_data` API of HSDLink.
+
+Two acquisition paths can be exercised:
+- link: `HSDLink.SensorAcquisitionThread` (TUI/CLI path) -> .dat file write.
+- controller: the per-packet path of the GUI `HSD_Controller.SensorAcquisitionThread`
+  (packet-counter check -> `DataReader.feed_data` -> plot/DTK output) -> .dat file write.
+
+Measured per component:
+- Sustained throughput [MB/s] and offered load [MB/s].
+- End-to-end latency from packet availability to file write and to decoded output (p50/p95/p99/max).
+- CPU time per MB (thread CPU time).
+- Packet-counter gap events and their rate (same check used in HSD_Controller).
+
+Results are saved in a JSON report together with a host description, so regressions can be
+tracked across releases and hosts (x86/ARM).
+"""
+
+import sys
+import os
+import copy
+import json
+import time
+import shutil
+import tempfile
+from datetime import datetime
+from threading import Thread, Event
+
+# Add the STDatalog SDK root directory to the sys.path to access the SDK packages
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+
+import click
+import stdatalog_core.HSD_utils.logger as logger
+from stdatalog_core.HSD_utils.DataClass import DataClass
+from stdatalog_core.HSD_utils.DataReader import DataReader, feed_sensor_data_block
+from stdatalog_core.HSD_utils.integrity import PacketCounterChecker
+from stdatalog_core.HSD_link.HSDLink import SensorAcquisitionThread
+from stdatalog_core.HSD.utils.file_manager import FileManager
+from stdatalog_core.HSD.utils.type_conversion import TypeConversion
+from stdatalog_examples.benchmarks.bench_utils import DATA_PROTOCOL_SIZE, SYNTHETIC_STREAM_PRESETS, StageTimer, build_report, \
+    default_report_path, get_peak_rss_mb, latency_stats, save_report, synthesize_component_stream
+
+# Set up the application logger
+log = logger.setup_applevel_logger(is_debug = False, file_name= "app_debug.log")
+
+# Define the script version
+script_version = "1.0.0"
+
+# Polling period used by the acquisition threads in the SDK [s]
+ACQUISITION_POLL_PERIOD = 0.02
+
+class ReplayStream:
+    """
+    A component packet stream served by ReplayHSDLink.
+    Packets become available following the stream byte rate, as they would arrive from the board.
+    """
+    def __init__(self, comp_name, stream_bytes, packet_data_size, bytes_per_second, status = None, injected_drops = 0):
+        self.comp_name = comp_name
+        self.data = stream_bytes
+        self.packet_data_size = packet_data_size
+        self.packet_size = packet_data_size + DATA_PROTOCOL_SIZE
+        self.nof_packets = len(stream_bytes) // self.packet_size
+        self.bytes_per_second = bytes_per_second
+        # bytes_per_second == 0 means "as fast as possible"
+        self.packet_period = self.packet_size / bytes_per_second if bytes_per_second > 0 else 0
+        self.status = status or {}
+        self.injected_drops = injected_drops
+        self.next_packet = 0
+        # availability time (perf_counter) of the first packet of the last block served
+        self.last_block_release = None
+
+    def get_due_packets(self, elapsed):
+        if self.packet_period == 0:
+            return self.nof_packets
+        return min(self.nof_packets, int(elapsed / self.packet_period))
+
+    def get_release_time(self, packet_index):
+        return (packet_index + 1) * self.packet_period
+
+    def is_exhausted(self):
+        return self.next_packet >= self.nof_packets
+
+class ReplayHSDLink:
+    """
+    Minimal stand-in for HSDLink_v2 serving ReplayStream packets through get_sensor_data.
+    """
+    def __init__(self, streams, max_packets_per_read = None):
+        self.streams = {s.comp_name: s for s in streams}
+        self.max_packets_per_read = max_packets_per_read
+        self.sensor_data_counts = {}
+        self.t0 = None
+
+    def start(self):
+        self.t0 = time.perf_counter()
+
+    def get_sensor_data(self, d_id, comp_name, ss_id = None):
+        stream = self.streams.get(comp_name)
+        if stream is None or self.t0 is None:
+            return None
+        release_offset = time.perf_counter() - self.t0
+        due = stream.get_due_packets(release_offset)
+        if self.max_packets_per_read is not None:
+            due = min(due, stream.next_packet + self.max_packets_per_read)
+        if due <= stream.next_packet:
+            return None
+        first = stream.next_packet
+        sensor_data = stream.data[first * stream.packet_size : due * stream.packet_size]
+        stream.next_packet = due
+        stream.last_block_release = self.t0 + stream.get_release_time(first)
+        return len(sensor_data), sensor_data
+
+    def is_exhausted(self):
+        return all(s.is_exhausted() for s in self.streams.values())
+
+class TimedSensorDataFile:
+    """
+    File wrapper measuring write calls and packet-to-disk latency.
+    """
+    def __init__(self, file, stream):
+        self.file = file
+        self.stream = stream
+        self.bytes_written = 0
+        self.nof_writes = 0
+        self.write_durations = []
+        self.latencies = []
+        self.first_write_time = None
+        self.last_write_time = None
+
+    def write(self, data):
+        t0 = time.perf_counter()
+        res = self.file.write(data)
+        now = time.perf_counter()
+        if self.first_write_time is None:
+            self.first_write_time = t0
+        self.last_write_time = now
+        self.write_durations.append(now - t0)
+        if self.stream.last_block_release is not None:
+            self.latencies.append(now - self.stream.last_block_release)
+        self.bytes_written += len(data)
+        self.nof_writes += 1
+        return res
+
+    def close(self):
+        self.file.close()
+
+class TimedSensorAcquisitionThread(SensorAcquisitionThread):
+    """
+    HSDLink.SensorAcquisitionThread measuring its own CPU time.
+    """
+    def run(self):
+        c0 = time.thread_time()
+        super().run()
+        self.cpu_s = time.thread_time() - c0
+
+class DtkCopyDataReader:
+    """
+    DataReader wrapper copying each packet before feeding it, as HSD_Controller does for the DataToolkit when plugins are loaded.
+    """
+    def __init__(self, data_reader):
+        self.data_reader = data_reader
+
+    def feed_data(self, data):
+        copy.copy(data)
+        self.data_reader.feed_data(data)
+
+class ControllerPathAcquisitionThread(Thread):
+    """
+    HSD_Controller.SensorAcquisitionThread.run without the Qt dependencies (empty data timer and error signal):
+    the same per-block path (feed_sensor_data_block: PacketCounterChecker check, DataReader.feed_data
+    for each packet and block file write), measuring its own CPU time.
+    """
+    def __init__(self, event, hsd_link, data_reader, d_id, comp_name, sensor_data_file, usb_dps, stream, dtk_copy = False):
+        Thread.__init__(self)
+        self.name = comp_name
+        self.stopped = event
+        self.hsd_link = hsd_link
+        self.data_reader = DtkCopyDataReader(data_reader) if dtk_copy else data_reader
+        self.d_id = d_id
+        self.comp_name = comp_name
+        self.sensor_data_file = sensor_data_file
+        self.usb_dps = usb_dps
+        self.stream = stream
+        self.integrity_checker = PacketCounterChecker(comp_name, usb_dps)
+        self.cpu_s = 0
+
+    @property
+    def nof_gap_events(self):
+        return self.integrity_checker.nof_gap_events
+
+    @property
+    def nof_lost_packets(self):
+        return self.integrity_checker.nof_lost_packets
+
+    @property
+    def nof_checked_packets(self):
+        return self.integrity_checker.nof_packets
+
+    def run(self):
+        c0 = time.thread_time()
+        while not self.stopped.wait(ACQUISITION_POLL_PERIOD):
+            sensor_data = self.hsd_link.get_sensor_data(self.d_id, self.comp_name)
+            if sensor_data is not None:
+                feed_sensor_data_block(self.data_reader, self.comp_name, sensor_data[1], self.usb_dps, self.integrity_checker, self.sensor_data_file)
+        self.cpu_s = time.thread_time() - c0
+
+class DecodedDataCollector:
+    """
+    DataReader output function counting decoded samples and measuring packet-to-decode latency.
+    """
+    def __init__(self, stream):
+        self.stream = stream
+        self.nof_outputs = 0
+        self.nof_samples = 0
+        self.latencies = []
+
+    def __call__(self, data:DataClass):
+        self.nof_outputs += 1
+        if len(data.data) > 0:
+            self.nof_samples += len(data.data[0])
+        if self.stream.last_block_release is not None:
+            self.latencies.append(time.perf_counter() - self.stream.last_block_release)
+
+def __get_packet_data_size(comp_status, interface):
+    # data packet size (0:sd card, 1:usb, 2:ble, 3:serial)
+    if interface == 0:
+        return comp_status["sd_dps"] - DATA_PROTOCOL_SIZE
+    elif interface == 2:
+        return comp_status["ble_dps"]
+    elif interface == 3:
+        return comp_status["serial_dps"]
+    return comp_status["usb_dps"]
+
+def load_replay_streams(acq_folder, sensor_name, speed):
+    """
+    Loads the .dat files of a recorded acquisition as replay streams.
+    The replay rate of each component is its recorded byte rate (file size / acquisition duration) times speed.
+    """
+    with open(os.path.join(acq_folder, "acquisition_info.json")) as f:
+        acq_info = json.load(f)
+    with open(os.path.join(acq_folder, "device_config.json")) as f:
+        device_config = json.load(f)
+
+    start_time = datetime.fromisoformat(acq_info["start_time"].replace("Z", "+00:00"))
+    end_time = datetime.fromisoformat(acq_info["end_time"].replace("Z", "+00:00"))
+    acq_duration = (end_time - start_time).total_seconds()
+    interface = acq_info.get("interface", 1)
+
+    streams = []
+    for c in device_config["devices"][0]["components"]:
+        c_name = list(c.keys())[0]
+        c_status = c[c_name]
+        if sensor_name != 'all' and c_name != sensor_name:
+            continue
+        file_path = os.path.join(acq_folder, FileManager.encode_file_name(c_name))
+        if not c_status.get("enable") or not os.path.exists(file_path):
+            continue
+        packet_data_size = __get_packet_data_size(c_status, interface)
+        if not packet_data_size:
+            continue
+        with open(file_path, "rb") as f:
+            stream_bytes = f.read()
+        if len(stream_bytes) < packet_data_size + DATA_PROTOCOL_SIZE:
+            log.warning("{}: not enough data to replay, skipped".format(c_name))
+            continue
+        bytes_per_second = (len(stream_bytes) / acq_duration) * speed if acq_duration > 0 and speed > 0 else 0
+        streams.append(ReplayStream(c_name, stream_bytes, packet_data_size, bytes_per_second, c_status))
+    return streams
+
+def synthesize_streams(presets, duration, speed, drop_rate, seed):
+    """
+    Synthesises a replay stream for each selected component preset (see bench_utils.SYNTHETIC_STREAM_PRESETS).
+    """
+    streams = []
+    for i, p in enumerate(presets):
+        spec = SYNTHETIC_STREAM_PRESETS[p]
+        stream_bytes, nof_packets, nof_dropped = synthesize_component_stream(spec, duration, drop_rate, seed + i)
+        # offered load computed on the nominal (loss-free) stream
+        nominal_rate = (nof_packets * (spec["usb_dps"] + DATA_PROTOCOL_SIZE)) / duration
+        bytes_per_second = nominal_rate * speed if speed > 0 else 0
+        status = dict(spec, sensitivity = 1)
+        streams.append(ReplayStream(p, stream_bytes, spec["usb_dps"], bytes_per_second, status, nof_dropped))
+    return streams
+
+def __create_data_reader(stream, collector):
+    c_status = stream.status
+    spts = c_status.get("samples_per_ts", 1)
+    if not isinstance(spts, int):
+        spts = spts["val"] if spts and "val" in spts else 1
+    data_type = c_status.get("data_type", "int16")
+    sample_size = TypeConversion.check_type_length(data_type)
+    data_format = TypeConversion.get_format_char(data_type)
+    return DataReader(collector, stream.comp_name, spts, c_status.get("dim", 1), sample_size, data_format, c_status.get("sensitivity") or 1)
+
+def run_streaming_benchmark(streams, path, output_folder, dtk_copy = False, max_packets_per_read = None, timeout = None):
+    """
+    Runs the selected acquisition path on the given replay streams and collects the metrics.
+
+    :return: A dictionary with per-component and total results.
+    """
+    hsd_link = ReplayHSDLink(streams, max_packets_per_read)
+    threads = []
+    stop_flags = []
+    sensor_data_files = {}
+    collectors = {}
+
+    for s in streams:
+        sensor_data_file = TimedSensorDataFile(open(os.path.join(output_folder, FileManager.encode_file_name(s.comp_name)), "wb+"), s)
+        sensor_data_files[s.comp_name] = sensor_data_file
+        stop_flag = Event()
+        stop_flags.append(stop_flag)
+        if path == "link":
+            thread = TimedSensorAcquisitionThread(stop_flag, hsd_link, sensor_data_file, 0, s.comp_name)
+        else:
+            collectors[s.comp_name] = DecodedDataCollector(s)
+            data_reader = __create_data_reader(s, collectors[s.comp_name])
+            thread = ControllerPathAcquisitionThread(stop_flag, hsd_link, data_reader, 0, s.comp_name, sensor_data_file, s.packet_data_size, s, dtk_copy)
+        threads.append(thread)
+
+    expected_duration = max((s.nof_packets * s.packet_period for s in streams), default = 0)
+    if timeout is None:
+        timeout = max(10.0, expected_duration * 3)
+
+    with StageTimer() as run_timer:
+        hsd_link.start()
+        for t in threads:
+            t.start()
+        # Wait until every packet has been served and consumed
+        t_limit = time.perf_counter() + timeout
+        while not hsd_link.is_exhausted() and time.perf_counter() < t_limit:
+            time.sleep(ACQUISITION_POLL_PERIOD)
+        for sf in stop_flags:
+            sf.set()
+        for t in threads:
+            t.join()
+        for f in sensor_data_files.values():
+            f.close()
+
+    timed_out = not hsd_link.is_exhausted()
+    if timed_out:
+        log.warning("Benchmark timeout: the acquisition path did not keep up with the replay rate")
+
+    results = {"components": {}}
+    tot_bytes = 0
+    for s, t in zip(streams, threads):
+        f = sensor_data_files[s.comp_name]
+        tot_bytes += f.bytes_written
+        active_time = (f.last_write_time - hsd_link.t0) if f.last_write_time is not None else run_timer.wall_s
+        mb_written = f.bytes_written / 1e6
+        comp_res = {
+            "packets_served": s.next_packet,
+            "packets_in_stream": s.nof_packets,
+            "packet_size": s.packet_size,
+            "bytes_written": f.bytes_written,
+            "nof_writes": f.nof_writes,
+            "avg_write_size": (f.bytes_written / f.nof_writes) if f.nof_writes else 0,
+            "offered_mbps": s.bytes_per_second / 1e6 if s.bytes_per_second else None,
+            "sustained_mbps": mb_written / active_time if active_time > 0 else None,
+            "cpu_s": getattr(t, "cpu_s", None),
+            "cpu_s_per_mb": (t.cpu_s / mb_written) if mb_written > 0 and getattr(t, "cpu_s", None) is not None else None,
+            "write_latency": latency_stats(f.latencies),
+            "write_call_duration": latency_stats(f.write_durations),
+        }
+        if path == "controller":
+            collector = collectors[s.comp_name]
+            comp_res["decode_latency"] = latency_stats(collector.latencies)
+            comp_res["decoded_samples"] = collector.nof_samples
+            comp_res["counter_gaps"] = {
+                "injected_drops": s.injected_drops,
+                "gap_events": t.nof_gap_events,
+                "lost_packets": t.nof_lost_packets,
+                "checked_packets": t.nof_checked_packets,
+                "gap_events_per_s": t.nof_gap_events / active_time if active_time > 0 else None,
+                "gap_events_per_1k_packets": (1000 * t.nof_gap_events / t.nof_checked_packets) if t.nof_checked_packets else None,
+            }
+        results["components"][s.comp_name] = comp_res
+
+    results["total"] = {
+        "wall_s": run_timer.wall_s,
+        "cpu_s": run_timer.cpu_s,
+        "bytes_written": tot_bytes,
+        "mbps": (tot_bytes / 1e6) / run_timer.wall_s if run_timer.wall_s > 0 else None,
+        "cpu_s_per_mb": run_timer.cpu_s / (tot_bytes / 1e6) if tot_bytes > 0 else None,
+        "peak_rss_mb": get_peak_rss_mb(),
+        "timed_out": timed_out,
+    }
+    return results
+
+# Define a callback function to show help information
+def show_help(ctx, param, value):
+    if value and not ctx.resilient_parsing:
+        # Display the help information for the command
+        click.secho(ctx.get_help(), color=ctx.color)
+        # Display examples of script execution
+        click.secho("\n-> Script execution examples:")
+        # Example: Benchmark the default synthetic components in real time (link path)
+        click.secho("   python stdatalog_bench_streaming.py", fg='cyan')
+        # Example: Benchmark the GUI controller path with 1% injected packet loss
+        click.secho("   python stdatalog_bench_streaming.py -p controller -dr 0.01", fg='cyan')
+        # Example: Replay a recorded acquisition at 4x its recorded rate
+        click.secho("   python stdatalog_bench_streaming.py -a Acquisition_Folder_Path -sp 4", fg='cyan')
+        # Example: Synthesise two components for 30 seconds as fast as possible
+        click.secho("   python stdatalog_bench_streaming.py -c iis3dwb_acc -c imp23absu_mic -d 30 -sp 0", fg='cyan')
+        # Exit the context after showing help
+        ctx.exit()
+
+@click.command()
+@click.option('-a', '--acq_folder', help="Recorded acquisition folder to replay (USB .dat files). If not set, streams are synthesised", type=click.Path(exists=True), default=None)
+@click.option('-s', '--sensor_name', help="Replay mode - specify a component name to limit the benchmark", default='all')
+@click.option('-c', '--component', help="Synthetic mode - component preset to synthesise (repeatable): {}".format(", ".join(SYNTHETIC_STREAM_PRESETS.keys())), type=click.Choice(list(SYNTHETIC_STREAM_PRESETS.keys())), multiple=True)
+@click.option('-d', '--duration', help="Synthetic mode - stream duration [s]", type=float, default=10)
+@click.option('-dr', '--drop_rate', help="Synthetic mode - probability of dropping each packet (0.0-1.0)", type=float, default=0.0)
+@click.option('-sp', '--speed', help="Replay speed factor (1 = real time, 0 = as fast as possible)", type=float, default=1.0)
+@click.option('-p', '--path', help="Acquisition path to benchmark", type=click.Choice(["link", "controller"]), default="link")
+@click.option('-dtk', '--dtk_copy', help="Controller path - copy each packet as done when DataToolkit plugins are loaded", is_flag=True, default=False)
+@click.option('-mr', '--max_packets_per_read', help="Maximum number of packets returned by each get_sensor_data call", type=int, default=None)
+@click.option('-o', '--output', help="Output JSON report path", type=click.Path(), default=None)
+@click.option('-k', '--keep_files', help="Keep the .dat files written during the benchmark (saved next to the report)", is_flag=True, default=False)
+@click.option('--seed', help="Random generator seed", type=int, default=0)
+@click.version_option(script_version, '-v', '--version', prog_name="stdatalog_bench_streaming", is_flag=True, help="stdatalog_bench_streaming tool version number")
+@click.option("-h", "--help", is_flag=True, is_eager=True, expose_value=False, callback=show_help, help="Show this message and exit.",)
+
+def bench_streaming(acq_folder, sensor_name, component, duration, drop_rate, speed, path, dtk_copy, max_packets_per_read, output, keep_files, seed):
+    if acq_folder is not None:
+        log.info("Loading recorded acquisition: {}".format(acq_folder))
+        streams = load_replay_streams(acq_folder, sensor_name, speed)
+        source = {"type": "replay", "acq_folder": os.path.abspath(acq_folder)}
+    else:
+        presets = list(component) if component else ["iis3dwb_acc", "imp23absu_mic"]
+        log.info("Synthesising streams: {}".format(", ".join(presets)))
+        streams = synthesize_streams(presets, duration, speed, drop_rate, seed)
+        source = {"type": "synthetic", "components": presets, "duration": duration, "drop_rate": drop_rate, "seed": seed}
+
+    if len(streams) == 0:
+        log.error("No component streams to benchmark")
+        return
+
+    report_path = output or default_report_path("streaming")
+    if keep_files:
+        output_folder = os.path.splitext(report_path)[0] + "_dat"
+        os.makedirs(output_folder, exist_ok=True)
+    else:
+        output_folder = tempfile.mkdtemp(prefix="stdatalog_bench_")
+
+    log.info("Running \"{}\" acquisition path benchmark ({} components, speed: {})...".format(path, len(streams), speed if speed > 0 else "max"))
+    try:
+        results = run_streaming_benchmark(streams, path, output_folder, dtk_copy, max_packets_per_read)
+    finally:
+        if not keep_files:
+            shutil.rmtree(output_folder, ignore_errors=True)
+
+    config = {
+        "source": source,
+        "path": path,
+        "speed": speed,
+        "dtk_copy": dtk_copy,
+        "max_packets_per_read": max_packets_per_read,
+        "poll_period_s": ACQUISITION_POLL_PERIOD,
+    }
+    save_report(build_report("streaming", config, results), report_path)
+
+    for c_name, r in results["components"].items():
+        log.info("--> {}: {:.2f} MB/s sustained (offered: {}), write latency p95: {} ms".format(
+            c_name, r["sustained_mbps"] or 0,
+            "{:.2f} MB/s".format(r["offered_mbps"]) if r["offered_mbps"] else "max",
+            "{:.2f}".format(r["write_latency"]["p95_ms"]) if r["write_latency"]["p95_ms"] is not None else "N/A"))
+        if "counter_gaps" in r:
+            log.info("    counter gap events: {} ({} injected drops)".format(r["counter_gaps"]["gap_events"], r["counter_gaps"]["injected_drops"]))
+    log.info("Benchmark report saved: {}".format(report_path))
+
+if __name__ == '__main__':
+    # Execute the main function
+    bench_streaming()
@@ -86,11 +86,12 @@ def show_help(ctx, param, value):
 @click.option('-et','--end_time', help="Sample End - Data analysis will end up in this time (seconds)", type=int, default=-1)
 @click.option('-cdm','--custom_device_model', help="Upload a custom Device Template Model (DTDL)", type=(int, int, str))
 @click.option('-cs', '--chunk_size', help="Specify the size (number of samples) of each data chunk to be processed", default=HSDatalog.DEFAULT_SAMPLES_CHUNK_SIZE)
+@click.option('-rp', '--report_path', help="Save the integrity report (integrity_report.json) in this folder", type=click.Path(file_okay=False), default=None)
 @click.version_option(script_version, '-v', '--version', prog_name="stdatalog_check_dummy_data", is_flag=True, help="stdatalog_check_dummy_data tool version number")
 @click.option("-h", "--help", is_flag=True, is_eager=True, expose_value=False, callback=show_help, help="Show this message and exit.",)
 
 # Define the main function that will be executed when the script is run
-def hsd_dataframe(acq_folder, sensor_name, start_time, end_time, custom_device_model, chunk_size):
+def hsd_dataframe(acq_folder, sensor_name, start_time, end_time, custom_device_model, chunk_size, report_path):
     
     # If a custom device model is provided, upload it
     if custom_device_model is not None:
@@ -116,7 +117,7 @@ def hsd_dataframe(acq_folder, sensor_name, start_time, end_time, custom_device_m
             component_list = HSDatalog.get_all_components(hsd, only_active=True)
             # Iterate over each component and check data
             for component in component_list:
-                check_data(hsd, component, start_time, end_time, acq_folder, chunk_size)
+                check_data(hsd, component, start_time, end_time, acq_folder, chunk_size, report_path)
             # Set flag to False to exit the loop after processing all components
             df_flag = False
         else:
@@ -124,7 +125,7 @@ def hsd_dataframe(acq_folder, sensor_name, start_time, end_time, custom_device_m
             component = HSDatalog.get_component(hsd, sensor_name)
             if component is not None:
                 # Check data for the specified component
-                check_data(hsd, component, start_time, end_time, acq_folder, chunk_size)
+                check_data(hsd, component, start_time, end_time, acq_folder, chunk_size, report_path)
             else:
                 # Log an error if the specified component is not found
                 log.error("No \"{}\" Component found in your Device Configuration file.".format(sensor_name))
@@ -132,10 +133,10 @@ def hsd_dataframe(acq_folder, sensor_name, start_time, end_time, custom_device_m
             df_flag = False
 
 # Define a helper function to check data for a given component
-def check_data(hsd, component, start_time, end_time, acq_folder, chunk_size):
+def check_data(hsd, component, start_time, end_time, acq_folder, chunk_size, report_path):
     try:
         # Attempt to check dummy data for the given component
-        HSDatalog.check_dummy_data(hsd, component, start_time, end_time, chunk_size)
+        HSDatalog.check_dummy_data(hsd, component, start_time, end_time, chunk_size, report_path)
     except MissingISPUOutputDescriptorException as ispu_err:
         # Handle missing ISPU output descriptor exception
         log.error(ispu_err)
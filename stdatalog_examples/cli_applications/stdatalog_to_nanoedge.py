@@ -45,6 +45,7 @@ import click
 from stdatalog_core.HSD_utils.dtm import HSDatalogDTM
 from stdatalog_core.HSD_utils.exceptions import MissingDeviceModelError, MissingISPUOutputDescriptorException
 import stdatalog_core.HSD_utils.logger as logger
+import stdatalog_core.HSD_utils.profiling as profiling
 from stdatalog_core.HSD.HSDatalog import HSDatalog
 
 # Set up the application logger
@@ -87,10 +88,11 @@ def validate_signal_increment(ctx, param, value):
 @click.option('-cdm','--custom_device_model', help="Upload a custom Device Template Model (DTDL)", type=(int, int, str))
 @click.version_option(script_version, '-v', '--version', prog_name="stdatalog_to_nanoedge", is_flag=True, help="stdatalog_to_nanoedge Converter tool version number")
 @click.option('-d', '--debug', is_flag=True, help="[DEBUG] Check for corrupted data and timestamps", default=False)
+@click.option('--profile', is_flag=True, help="[DEBUG] Profile the conversion stages: a Chrome trace timeline and the stages statistics are saved in the output folder", default=False)
 @click.option("-h", "--help", is_flag=True, is_eager=True, expose_value=False, callback=show_help, help="Show this message and exit.",)
 
 # Define the main function that will be executed when the script is run
-def hsd_dataframe(acq_folder, output_folder, sensor_name, signal_length, signal_increment, start_time, end_time, raw_data, target_value, custom_device_model, debug):
+def hsd_dataframe(acq_folder, output_folder, sensor_name, signal_length, signal_increment, start_time, end_time, raw_data, target_value, custom_device_model, debug, profile):
     
     # If a custom device model is provided, upload it
     if custom_device_model is not None:
@@ -113,6 +115,11 @@ def hsd_dataframe(acq_folder, output_folder, sensor_name, signal_length, signal_
     if not os.path.exists(output_folder):
         os.makedirs(output_folder)
 
+    # Profile the conversion stages (timeline and statistics saved in the output folder when the command ends)
+    if profile:
+        profiling.start_profiling()
+        click.get_current_context().call_on_close(lambda: profiling.stop_profiling(output_folder))
+
     # Enable or disable timestamp recovery based on the debug flag
     hsd.enable_timestamp_recovery(debug)
 
@@ -50,6 +50,7 @@ import click
 from stdatalog_core.HSD_utils.dtm import HSDatalogDTM
 from stdatalog_core.HSD_utils.exceptions import MissingDeviceModelError, MissingISPUOutputDescriptorException, MissingTagsException
 import stdatalog_core.HSD_utils.logger as logger
+import stdatalog_core.HSD_utils.profiling as profiling
 from stdatalog_core.HSD.HSDatalog import HSDatalog
 
 # Set up the application logger to record debug information and errors
@@ -113,10 +114,11 @@ def show_help(ctx, param, value):
 @click.option('-cs', '--chunk_size', help="Specify the size (number of samples) of each data chunk to be processed", default=HSDatalog.DEFAULT_SAMPLES_CHUNK_SIZE)
 @click.version_option(script_version, '-v', '--version', prog_name="HSDatalogToUnico", is_flag=True, help="HSDatalogToUnico Converter tool version number")
 @click.option('-d', '--debug', is_flag=True, help="[DEBUG] Check for corrupted data and timestamps", default=False)
+@click.option('--profile', is_flag=True, help="[DEBUG] Profile the conversion stages: a Chrome trace timeline and the stages statistics are saved in the output folder", default=False)
 @click.option("-h", "--help", is_flag=True, is_eager=True, expose_value=False, callback=show_help, help="Show this message and exit.",)
 
 # Define the main function that will be executed when the script is run
-def hsd_toUnico(acq_folder, output_folder, sensor_name, start_time, end_time, use_datalog_tags, out_format, raw_data, with_untagged, with_timestamps, custom_device_model, aggregation, columns_labels, chunk_size, debug):
+def hsd_toUnico(acq_folder, output_folder, sensor_name, start_time, end_time, use_datalog_tags, out_format, raw_data, with_untagged, with_timestamps, custom_device_model, aggregation, columns_labels, chunk_size, debug, profile):
 
     # If a custom device model is provided, upload it
     if custom_device_model is not None:
@@ -142,6 +144,11 @@ def hsd_toUnico(acq_folder, output_folder, sensor_name, start_time, end_time, us
     if not os.path.exists(output_folder):
         os.makedirs(output_folder)
 
+    # Profile the conversion stages (timeline and statistics saved in the output folder when the command ends)
+    if profile:
+        profiling.start_profiling()
+        click.get_current_context().call_on_close(lambda: profiling.stop_profiling(output_folder))
+
     # Main loop to process data export by tags
     df_flag = True
     while df_flag:
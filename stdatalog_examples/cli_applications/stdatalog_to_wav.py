@@ -45,6 +45,7 @@ import click
 from stdatalog_core.HSD_utils.dtm import HSDatalogDTM
 from stdatalog_core.HSD_utils.exceptions import MissingDeviceModelError
 import stdatalog_core.HSD_utils.logger as logger
+import stdatalog_core.HSD_utils.profiling as profiling
 from stdatalog_core.HSD.HSDatalog import HSDatalog
 
 # Set up the application logger to record debug information and errors
@@ -86,10 +87,11 @@ def show_help(ctx, param, value):
 @click.option('-cdm','--custom_device_model', help="Upload a custom Device Template Model (DTDL)", type=(int, int, str))
 @click.option('-cs', '--chunk_size', help="Specify the size (number of samples) of each data chunk to be processed", default=10000000)
 @click.version_option(script_version, '-v', '--version', prog_name="stdatalog_to_wav", is_flag=True, help="stdatalog_to_wav Converter tool version number")
+@click.option('--profile', is_flag=True, help="[DEBUG] Profile the conversion stages: a Chrome trace timeline and the stages statistics are saved in the output folder", default=False)
 @click.option('-h', '--help', is_flag=True, is_eager=True, expose_value=False, callback=show_help, help="Show this message and exit.",)
 
 # Define the main function that will be executed when the script is run
-def hsd_toWav(acq_folder, output_folder, sensor_name, start_time, end_time, split_per_tags, custom_device_model, chunk_size):
+def hsd_toWav(acq_folder, output_folder, sensor_name, start_time, end_time, split_per_tags, custom_device_model, chunk_size, profile):
     
     # If a custom device model is provided, upload it
     if custom_device_model is not None:
@@ -112,6 +114,11 @@ def hsd_toWav(acq_folder, output_folder, sensor_name, start_time, end_time, spli
     if not os.path.exists(output_folder):
         os.makedirs(output_folder)
 
+    # Profile the conversion stages (timeline and statistics saved in the output folder when the command ends)
+    if profile:
+        profiling.start_profiling()
+        click.get_current_context().call_on_close(lambda: profiling.stop_profiling(output_folder))
+
     # Enable timestamp recovery
     hsd.enable_timestamp_recovery(True)
 
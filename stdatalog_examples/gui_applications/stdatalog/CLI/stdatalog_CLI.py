@@ -54,12 +54,37 @@ PROJECT_ROOT = os.path.abspath(os.path.join(PROJECT_ROOT, "../../../.."))
 # ---- SETTINGS ----
 ACQ_TIME = 1    # seconds to log data
 DELAY = 14      # seconds to wait
+# Continuous logging: the device keeps streaming and each cut is saved as SEGMENT_TIME long
+# segments, without gaps between them (ACQ_TIME and DELAY are used only when False)
+SEGMENTED_LOGGING = True
+SEGMENT_TIME = ACQ_TIME + DELAY   # seconds per segment
+SEGMENT_SIZE = None               # bytes per segment (None: no size limit)
+# Cycles logging only: output folder, files and acquisition threads of the next cycle are
+# prepared during the pause, so that each cycle starts with minimal latency
+WARM_START_LOGGING = True
+# Pre-trigger logging: the device streams continuously and each cut also includes the PRE_TRIGGER_TIME
+# seconds preceding the start command, and the POST_TRIGGER_TIME seconds following the stop command
+# (None: disabled; when enabled, it replaces the segmented and the cycles logging)
+PRE_TRIGGER_TIME = None
+POST_TRIGGER_TIME = 1.0
 DEVICE_CONFIG_PATH = os.path.join(PROJECT_ROOT, "device_config.json")
 OUTPUT_FOLDER = os.path.join(PROJECT_ROOT, "acquisition_data")
 SOCKET_PORT = 8888
+# Maximum number of bytes read per control channel read
+CONTROL_READ_SIZE = 4096
+# Local control channel (Unix domain socket) of the trigger sources (BLE service), None to disable.
+# Commands are also accepted on SOCKET_PORT
+CONTROL_SOCKET_PATH = "/tmp/stdatalog_control.sock"
+# Live data server for external analytics, disabled by default (None). Set the listening address
+# ("host:port", e.g. "127.0.0.1:8889", or "unix:/path") to enable it
+DATA_SERVER_ADDRESS = None
+# Name of the state snapshot read by the service dashboard and the heartbeat monitor, None to disable
+SERVICE_STATE_NAME = "stdatalog-cli"
 
 # Global shutdown flag
 shutdown_event = asyncio.Event()
+# Set when an IPC command is received: wakes up the logging task
+command_event = asyncio.Event()
 
 async def interruptible_sleep(duration):
     """Sleep that can be interrupted by shutdown event."""
@@ -74,6 +99,16 @@ async def interruptible_sleep(duration):
     except asyncio.TimeoutError:
         pass
 
+async def wait_for_command(timeout):
+    """Waits up to timeout seconds for an IPC command or the shutdown signal."""
+    waiters = [asyncio.create_task(command_event.wait()), asyncio.create_task(shutdown_event.wait())]
+    try:
+        await asyncio.wait(waiters, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        for w in waiters:
+            w.cancel()
+    command_event.clear()
+
 def signal_handler(signum, frame):
     """Handle shutdown signals gracefully"""
     logger.info(f"[SIGNAL] Received signal {signum}, initiating graceful shutdown...")
@@ -86,41 +121,102 @@ logger.debug("[STARTUP] Importing stdatalog_TUI...")
 from stdatalog_TUI import HSDInfo
 logger.debug("[STARTUP] Importing HSDLink...")
 from stdatalog_core.HSD_link.HSDLink import HSDLink
+from stdatalog_core.HSD_utils.data_server import LiveDataServer
+from stdatalog_core.HSD_utils.control_channel import parse_control_command
+from stdatalog_core.HSD_utils.service_state import ServiceStatePublisher, SensorDataRateMonitor
 logger.debug("[STARTUP] All imports completed!")
 
+# Connection state, counters, data rates and last error published for the monitoring tools
+service_state = ServiceStatePublisher(SERVICE_STATE_NAME) if SERVICE_STATE_NAME is not None else None
+
+def update_service_state(**fields):
+    if service_state is not None:
+        service_state.set(**fields)
+
+def increment_service_counter(counter):
+    if service_state is not None:
+        service_state.increment(counter)
+
 async def async_socket_listener(state):
     server = await asyncio.start_server(
         lambda r, w: handle_client(r, w, state),
         '127.0.0.1', SOCKET_PORT)
     addrs = ', '.join(str(sock.getsockname()) for sock in server.sockets)
     logger.info(f'[IPC] Async IPC server running on {addrs}')
-    async with server:
-        await server.serve_forever()
+    servers = [server]
+    if CONTROL_SOCKET_PATH is not None and hasattr(asyncio, "start_unix_server"):
+        try:
+            if os.path.exists(CONTROL_SOCKET_PATH):
+                os.unlink(CONTROL_SOCKET_PATH)  # left by a previous run
+            servers.append(await asyncio.start_unix_server(lambda r, w: handle_client(r, w, state), CONTROL_SOCKET_PATH))
+            logger.info(f'[IPC] Control channel on {CONTROL_SOCKET_PATH}')
+        except OSError as e:
+            logger.error(f"ERROR: Control channel not available: {e}")
+    try:
+        await asyncio.gather(*[s.serve_forever() for s in servers])
+    finally:
+        for s in servers:
+            s.close()
+        if len(servers) > 1 and os.path.exists(CONTROL_SOCKET_PATH):
+            os.unlink(CONTROL_SOCKET_PATH)
+
+def dispatch_control_command(line, state, command_time):
+    """Applies a control command line to the state. Returns False after an exit command."""
+    # "<command>[ <trigger_time>]": empty lines are keep-alive messages
+    cmd, trigger_time = parse_control_command(line)
+    if cmd is None:
+        return True
+    increment_service_counter("commands")
+    if cmd == "start" and not state["running"]:
+        state["command"] = "start"
+        state["trigger_time"] = trigger_time
+        state["command_time"] = command_time
+        command_event.set()
+    elif cmd == "stop" and state["running"]:
+        state["command"] = "stop"
+        command_event.set()
+    elif cmd == "exit":
+        state["command"] = "exit"
+        command_event.set()
+        return False
+    return True
 
 async def handle_client(reader, writer, state):
-    addr = writer.get_extra_info('peername')
+    addr = writer.get_extra_info('peername') or 'control channel'
     logger.info(f'[IPC] Connected by {addr}')
+    state["clients"] = state.get("clients", 0) + 1
+    update_service_state(control_clients=state["clients"])
+    # bytes of a command line not terminated yet, and reception time of the last bytes
+    pending = b""
+    command_time = None
     try:
-        while not shutdown_event.is_set():
+        connected = True
+        while connected and not shutdown_event.is_set():
             try:
-                data = await asyncio.wait_for(reader.read(32), timeout=1.0)
+                data = await asyncio.wait_for(reader.read(CONTROL_READ_SIZE), timeout=1.0)
             except asyncio.TimeoutError:
-                continue  # Check shutdown event again
-            
-            if not data:
-                logger.warning(f'[IPC] Disconnected by {addr}')
-                break
-            cmd = data.decode('utf-8').strip().lower()
-            if cmd == "start" and not state["running"]:
-                state["command"] = "start"
-            elif cmd == "stop" and state["running"]:
-                state["command"] = "stop"
-            elif cmd == "exit":
-                state["command"] = "exit"
-                break
+                if not pending:
+                    continue  # Check shutdown event again
+                # a command without trailing newline (e.g. "echo -n start | nc") is accepted once the client is idle
+                lines, pending = [pending], b""
+            else:
+                if not data:
+                    logger.warning(f'[IPC] Disconnected by {addr}')
+                    # the last command may not end with a newline
+                    lines, pending = [pending], b""
+                    connected = False
+                else:
+                    command_time = time.time()
+                    *lines, pending = (pending + data).split(b"\n")
+            for line in lines:
+                if not dispatch_control_command(line, state, command_time):
+                    connected = False
+                    break
     except ConnectionResetError:
         logger.warning(f"[IPC] Disconnected by {addr}")
     finally:
+        state["clients"] -= 1
+        update_service_state(control_clients=state["clients"])
         writer.close()
         await writer.wait_closed()
 
@@ -138,6 +234,26 @@ def get_next_cut_number(parent_folder):
         return max(cut_nums) + 1
     return 1
 
+def get_queue_depths(hsd_info):
+    """Bytes waiting in the live data server and sensor data file queues."""
+    queues = {}
+    if hsd_info.data_server is not None:
+        subscribers = hsd_info.data_server.get_subscribers_stats()
+        queues["data_server_bytes"] = sum(s["queued_bytes"] for s in subscribers)
+        queues["data_server_subscribers"] = len(subscribers)
+    sinks_stats = HSDLink.get_sensor_data_files_stats(getattr(hsd_info, "sensor_data_files", None) or [])
+    queues["file_sink_bytes"] = sum(s["queued_bytes"] for s in sinks_stats)
+    return {"queues": queues}
+
+def save_trigger_timing(hsd_info, acq_folder, trigger_time, command_time):
+    """Saves the trigger timing (trigger -> command -> start -> first data) in the acquisition_info.json."""
+    try:
+        timing = hsd_info.save_trigger_timing(acq_folder, trigger_time, command_time)
+        if timing is not None and "first_data_latency_ms" in timing:
+            logger.info(f"Trigger to first data: {timing['first_data_latency_ms']:.1f} ms")
+    except Exception as e:
+        logger.error(f"ERROR: Trigger timing not saved: {e}")
+
 async def cut_logging_task(state):
     # ---- Device/SDK Initialization ----
     logger.info("Initializing STDatalog CLI...")
@@ -206,11 +322,57 @@ async def cut_logging_task(state):
     hsd_info.check_output_folder()
 
     logger.info(f"Connected to device: {hsd_info.selected_fw_info}")
+    update_service_state(device_connected=True, device=str(hsd_info.selected_fw_info),
+                         active_sensors=len(hsd_info.sensor_list) if hsd_info.sensor_list else 0)
+    if service_state is not None:
+        rate_monitor = SensorDataRateMonitor(hsd_info.hsd_link)
+        service_state.add_collector(lambda: {"components": rate_monitor.get_rates()})
+        service_state.add_collector(lambda: get_queue_depths(hsd_info))
     logger.info(f"Active sensors: {len(hsd_info.sensor_list) if hsd_info.sensor_list else 0}")
     logger.info(f"Output folder: {hsd_info.output_acquisition_path}")
-    logger.info(f"Acquisition cycle: {ACQ_TIME}s logging, {DELAY}s pause")
+    if SEGMENTED_LOGGING:
+        logger.info(f"Acquisition: continuous logging, {SEGMENT_TIME}s segments")
+    else:
+        logger.info(f"Acquisition cycle: {ACQ_TIME}s logging, {DELAY}s pause")
+    if DATA_SERVER_ADDRESS is not None:
+        try:
+            hsd_info.data_server = LiveDataServer(DATA_SERVER_ADDRESS)
+            data_server_address = hsd_info.data_server.start()
+            logger.info(f"Streaming live sensor data on {data_server_address}")
+        except OSError as e:
+            logger.error(f"ERROR: Live data server not started: {e}")
+            hsd_info.data_server = None
+    acquisition_catalog = None
+    try:
+        # Acquisitions catalog queried by the service dashboard and the USB offload job
+        acquisition_catalog = HSDLink.enable_acquisition_catalog(hsd_info.hsd_link, OUTPUT_FOLDER)
+        if acquisition_catalog is not None:
+            acquisition_catalog.sync()
+    except Exception as e:
+        logger.error(f"ERROR: Acquisition catalog not available: {e}")
     logger.info(f"Waiting for external commands via IPC socket on port {SOCKET_PORT}...")
 
+    trigger_timings = {}
+    if PRE_TRIGGER_TIME is not None:
+        def on_acquisition_published(folder, index):
+            logger.info(f"Acquisition {index} saved: {folder}")
+            increment_service_counter("acquisitions")
+            trigger_time, command_time = trigger_timings.pop(os.path.dirname(folder), (None, None))
+            save_trigger_timing(hsd_info, folder, trigger_time, command_time)
+
+        try:
+            hsd_info.start_pretrigger_log(OUTPUT_FOLDER, PRE_TRIGGER_TIME, POST_TRIGGER_TIME, on_acquisition_published)
+            logger.info(f"Pre-trigger logging: {PRE_TRIGGER_TIME}s before start, {POST_TRIGGER_TIME}s after stop")
+        except Exception as e:
+            logger.error(f"ERROR: Pre-trigger logging not started: {e}")
+    elif not SEGMENTED_LOGGING and WARM_START_LOGGING:
+        # The logging session stays armed between the cycles (and the cuts): a start command
+        # only triggers the prepared acquisition
+        try:
+            hsd_info.prepare_log(OUTPUT_FOLDER, expected_duration=ACQ_TIME)
+        except Exception as e:
+            logger.error(f"ERROR: Warm-start logging not available, folders and files are created on start: {e}")
+
     cut_number = get_next_cut_number(OUTPUT_FOLDER)
 
     while not shutdown_event.is_set():
@@ -230,7 +392,11 @@ async def cut_logging_task(state):
             cut_folder = os.path.join(OUTPUT_FOLDER, f"cut_{cut_number}")
             os.makedirs(cut_folder, exist_ok=True)
 
+            trigger_time = state.get("trigger_time")
+            command_time = state.get("command_time")
             logger.info(f"Starting acquisition cycle {cut_number}")
+            increment_service_counter("cuts")
+            update_service_state(logging=True, cut_number=cut_number)
             logger.info(f"Cut folder: {cut_folder}")
 
             # Reset output folder to main directory for logging
@@ -239,9 +405,54 @@ async def cut_logging_task(state):
             hsd_info.update_acq_params()
             hsd_info.check_output_folder()
 
-            logger.info(f"Starting periodic logging: {ACQ_TIME}s log, {DELAY}s pause. Send 'stop' to end safely.")
-            state["running"] = True
-            state["command"] = None
+            if hsd_info.pretrigger_acquisition is not None:
+                logger.info("Recording (pre-trigger history included). Send 'stop' to end safely.")
+                state["running"] = True
+                state["command"] = None
+                # The acquisition is published in the cut folder after the post-trigger tail
+                trigger_timings[cut_folder] = (trigger_time, command_time)
+                hsd_info.trigger_log(cut_folder)
+
+                while state["running"] and state["command"] != "stop" and not shutdown_event.is_set():
+                    await wait_for_command(1.0)
+
+                if shutdown_event.is_set():
+                    logger.info("[SHUTDOWN] Graceful shutdown requested during acquisition.")
+                    state["command"] = "exit"
+                elif state["command"] == "stop":
+                    state["command"] = None
+                state["running"] = False
+                hsd_info.release_log()
+            elif SEGMENTED_LOGGING:
+                logger.info(f"Starting continuous logging: {SEGMENT_TIME}s segments. Send 'stop' to end safely.")
+                state["running"] = True
+                state["command"] = None
+                def on_segment_published(folder, index):
+                    logger.info(f"Segment {index} saved: {folder}")
+                    increment_service_counter("acquisitions")
+                    if index == 1:
+                        save_trigger_timing(hsd_info, folder, trigger_time, command_time)
+
+                try:
+                    # Segments are published directly (and atomically) in the cut folder
+                    hsd_info.start_segmented_log(cut_folder, SEGMENT_TIME, SEGMENT_SIZE, on_segment_published=on_segment_published)
+                except Exception as e:
+                    logger.error(f"ERROR: Continuous logging not started: {e}")
+                    state["running"] = False
+
+                while state["running"] and state["command"] != "stop" and not shutdown_event.is_set():
+                    await wait_for_command(1.0)
+
+                if shutdown_event.is_set():
+                    logger.info("[SHUTDOWN] Graceful shutdown requested during acquisition.")
+                    state["command"] = "exit"
+                elif state["command"] == "stop":
+                    state["command"] = None
+                state["running"] = False
+            else:
+                logger.info(f"Starting periodic logging: {ACQ_TIME}s log, {DELAY}s pause. Send 'stop' to end safely.")
+                state["running"] = True
+                state["command"] = None
 
             while state["running"] and not shutdown_event.is_set():
                 # Check for shutdown signal
@@ -256,13 +467,17 @@ async def cut_logging_task(state):
                 if os.path.exists(OUTPUT_FOLDER):
                     existing_folders = {f for f in os.listdir(OUTPUT_FOLDER) 
                                       if os.path.isdir(os.path.join(OUTPUT_FOLDER, f)) 
-                                      and not f.startswith('cut_')}
+                                      and not f.startswith(('cut_', '.'))}
 
                 logger.info(f"Starting log cycle...")
                 hsd_info.start_log()
                 await interruptible_sleep(ACQ_TIME)
                 hsd_info.stop_log()
                 logger.info(f"Log cycle complete.")
+                increment_service_counter("acquisitions")
+                # Only the first cycle of the cut is started by the trigger
+                save_trigger_timing(hsd_info, hsd_info.output_acquisition_path, trigger_time, command_time)
+                trigger_time = command_time = None
 
                 # Check for shutdown again after logging
                 if shutdown_event.is_set():
@@ -275,7 +490,7 @@ async def cut_logging_task(state):
                 if os.path.exists(OUTPUT_FOLDER):
                     current_folders = {f for f in os.listdir(OUTPUT_FOLDER) 
                                      if os.path.isdir(os.path.join(OUTPUT_FOLDER, f)) 
-                                     and not f.startswith('cut_')}
+                                     and not f.startswith(('cut_', '.'))}
                     
                     new_folders = current_folders - existing_folders
                     
@@ -286,12 +501,15 @@ async def cut_logging_task(state):
                         try:
                             logger.info(f"Moving {folder_name} to {cut_folder}")
                             shutil.move(src_path, dst_path)
+                            if acquisition_catalog is not None:
+                                acquisition_catalog.move_acquisition(src_path, dst_path)
                         except Exception as e:
                             logger.error(f"Error moving folder {folder_name}: {e}")
 
                 logger.info("Waiting for next cycle...")
                 # Wait for DELAY seconds or until a stop command or shutdown signal
-                for i in range(DELAY):
+                delay_end = time.monotonic() + DELAY
+                while time.monotonic() < delay_end:
                     if state["command"] == "stop" or shutdown_event.is_set():
                         if shutdown_event.is_set():
                             logger.info("[SHUTDOWN] Graceful shutdown requested during delay.")
@@ -299,34 +517,55 @@ async def cut_logging_task(state):
                         state["running"] = False
                         state["command"] = None if not shutdown_event.is_set() else "exit"
                         break
-                    await interruptible_sleep(1)
+                    await wait_for_command(delay_end - time.monotonic())
 
             logger.info("Stopping acquisition, cleaning up...")
-            if hsd_info.is_log_started:
+            if hsd_info.segmented_acquisition is not None:
+                segments = hsd_info.stop_segmented_log()
+                logger.info(f"{len(segments)} segments saved in {cut_folder}")
+            elif hsd_info.is_log_started:
                 hsd_info.stop_log()
+            update_service_state(logging=False)
             logger.info("Done. Waiting for new command, or send 'exit' to quit.")
 
             cut_number += 1  # increment for next cycle
 
-        await interruptible_sleep(0.1)
+        await wait_for_command(1.0)
     
     # Final cleanup when exiting the main loop
     logger.info("[SHUTDOWN] Performing final cleanup...")
     try:
-        if 'hsd_info' in locals() and hsd_info.is_log_started:
+        if 'hsd_info' in locals() and hsd_info.segmented_acquisition is not None:
+            logger.info("[SHUTDOWN] Stopping continuous logging...")
+            hsd_info.stop_segmented_log()
+        elif 'hsd_info' in locals() and hsd_info.is_log_started:
             logger.info("[SHUTDOWN] Stopping any active logging...")
             hsd_info.stop_log()
+        if 'hsd_info' in locals() and hsd_info.logging_session is not None:
+            hsd_info.close_log_session()
+        if 'hsd_info' in locals() and hsd_info.pretrigger_acquisition is not None:
+            logger.info("[SHUTDOWN] Stopping pre-trigger logging...")
+            hsd_info.stop_pretrigger_log()
+        if 'hsd_info' in locals() and hsd_info.data_server is not None:
+            hsd_info.data_server.stop()
         logger.info("[SHUTDOWN] HSD cleanup complete.")
     except Exception as e:
         logger.error(f"[ERROR] Error during HSD cleanup: {e}")
 
 async def main():
     state = {"running": False, "command": None, "stop_requested": False}
+    if service_state is not None:
+        service_state.set(device_connected=False, logging=False, control_clients=0)
+        # Logged errors are reported as the service last error
+        logger.addHandler(service_state.get_log_handler())
     try:
         tasks = [
             asyncio.create_task(async_socket_listener(state)),
             asyncio.create_task(cut_logging_task(state))
         ]
+        if service_state is not None:
+            # Published from the event loop: the snapshot gets stale if the loop (and the control server) hangs
+            tasks.append(asyncio.create_task(service_state.publish_loop()))
         
         # Wait for either tasks to complete or shutdown signal
         done, pending = await asyncio.wait(
@@ -352,6 +591,9 @@ async def main():
             if state.get("running", False):
                 logger.info("[SHUTDOWN] Stopping any active logging...")
                 # Note: hsd_info cleanup would be handled in cut_logging_task
+            if service_state is not None:
+                service_state.set(device_connected=False, logging=False)
+                service_state.stop()
             logger.info("[SHUTDOWN] Service shutdown complete.")
         except Exception as e:
             logger.error(f"[ERROR] Error during shutdown: {e}")
@@ -79,6 +79,7 @@ from asciimatics.exceptions import ResizeScreenError
 
 from stdatalog_pnpl.DTDL.device_template_manager import DeviceTemplateManager, DeviceCatalogManager
 from stdatalog_core.HSD_link.HSDLink import HSDLink
+from stdatalog_core.HSD_utils.control_channel import save_trigger_timing
 from stdatalog_examples.gui_applications.stdatalog.TUI.Views.tui_views import HSDMainView, HSDLoggingView
 class HSDInfo():
 
@@ -115,6 +116,11 @@ class HSDInfo():
     threads_stop_flags = []
     tag_status_list = []
     start_time = None
+    data_server = None
+    segmented_acquisition = None
+    logging_session = None
+    pretrigger_acquisition = None
+    log_start_time = None
 
     def __init__(self, tui_flags):
         self.tui_flags = tui_flags
@@ -254,15 +260,26 @@ class HSDInfo():
         HSDLink.set_sw_tag_on_off(self.hsd_link, self.selected_device_id, t_id, self.tag_status_list[t_id])
 
     def start_log(self):
+        self.log_start_time = time.time()
+        if self.logging_session is not None and self.logging_session.is_armed:
+            # Warm start: folder, files and threads are ready, only the start command is sent
+            self.is_log_started = self.logging_session.trigger()
+            self.output_acquisition_path = self.logging_session.get_armed_folder()
+            return
         self.is_log_started = HSDLink.start_log(self.hsd_link, self.selected_device_id, self.tui_flags.sub_datetime_folder)
         self.threads_stop_flags = []
         self.sensor_data_files = []
 
         for s in self.sensor_list:
-            HSDLink.start_sensor_acquisition_thread(self.hsd_link, self.selected_device_id, s, self.threads_stop_flags, self.sensor_data_files)
+            HSDLink.start_sensor_acquisition_thread(self.hsd_link, self.selected_device_id, s, self.threads_stop_flags, self.sensor_data_files, data_server = self.data_server)
         self.output_acquisition_path = HSDLink.get_acquisition_folder(self.hsd_link)
 
     def stop_log(self):
+        if self.logging_session is not None and self.logging_session.is_logging:
+            # json and extra files are saved by the session, that is armed again for the next start_log
+            self.output_acquisition_path = self.logging_session.stop()
+            self.is_log_started = False
+            return
         for sf in self.threads_stop_flags:
             sf.set()
         for f in self.sensor_data_files:
@@ -298,6 +315,91 @@ class HSDInfo():
         HSDLink.refresh_hsd_link(self.hsd_link) #Needed by HSDLink_v1
 
 
+    def get_extra_files(self):
+        # Files saved in the acquisition folder besides the device json files
+        extra_files = {}
+        if self.tui_flags.ucf_file is not None:
+            extra_files[os.path.basename(self.tui_flags.ucf_file)] = self.tui_flags.ucf_file
+        if self.tui_flags.ispu_out_fmt is not None:
+            extra_files["ispu_output_format.json"] = self.tui_flags.ispu_out_fmt
+        return extra_files
+
+    def prepare_log(self, output_folder, expected_duration = None):
+        # Warm-start logging: the next start_log only triggers the prepared acquisition
+        if self.logging_session is None:
+            self.logging_session = HSDLink.create_logging_session(self.hsd_link, self.selected_device_id, self.sensor_list, output_folder,
+                                                                  expected_duration = expected_duration, data_server = self.data_server,
+                                                                  extra_files = self.get_extra_files())
+        self.logging_session.prepare()
+
+    def close_log_session(self):
+        if self.logging_session is not None:
+            self.logging_session.close()
+            log.info("Logging session metrics: {}".format(self.logging_session.get_metrics()))
+            self.logging_session = None
+        self.is_log_started = False
+
+    def save_trigger_timing(self, acq_folder, trigger_time = None, command_time = None):
+        # Trigger, command receipt, start command and first data times, saved in acquisition_info.json
+        start_time = self.log_start_time
+        first_data_time = None
+        if self.segmented_acquisition is not None:
+            start_time = self.segmented_acquisition.start_time
+            first_data_time = self.segmented_acquisition.get_first_data_time()
+        elif self.pretrigger_acquisition is not None:
+            # the pre-trigger history is already recorded when the trigger arrives
+            start_time = first_data_time = self.pretrigger_acquisition.trigger_time
+        elif self.logging_session is not None:
+            last_metrics = self.logging_session.get_metrics()["last"] or {}
+            start_time = last_metrics.get("start_time", start_time)
+            first_data_time = last_metrics.get("first_data_time")
+        return save_trigger_timing(acq_folder, trigger_time, command_time, start_time, first_data_time)
+
+    def start_pretrigger_log(self, output_folder, pre_trigger_time, post_trigger_time = 0, on_acquisition_published = None):
+        # The device streams continuously, each triggered acquisition includes the last pre_trigger_time seconds
+        self.pretrigger_acquisition = HSDLink.start_pretrigger_log(self.hsd_link, self.selected_device_id, self.sensor_list, output_folder,
+                                                                   pre_trigger_time, post_trigger_time, data_server = self.data_server,
+                                                                   on_acquisition_published = on_acquisition_published, extra_files = self.get_extra_files())
+
+    def trigger_log(self, output_folder = None):
+        if self.pretrigger_acquisition is not None:
+            self.output_acquisition_path = self.pretrigger_acquisition.trigger(output_folder)
+            self.is_log_started = True
+
+    def release_log(self):
+        if self.pretrigger_acquisition is not None:
+            self.pretrigger_acquisition.release()
+        self.is_log_started = False
+
+    def stop_pretrigger_log(self):
+        acquisitions = []
+        if self.pretrigger_acquisition is not None:
+            acquisitions = self.pretrigger_acquisition.stop()
+            self.pretrigger_acquisition = None
+        self.is_log_started = False
+        return acquisitions
+
+    def start_segmented_log(self, output_folder, segment_time = None, segment_size = None, on_segment_published = None):
+        # Continuous logging: the device keeps streaming, the data are saved in segments (one acquisition folder each)
+        self.segmented_acquisition = HSDLink.start_segmented_log(self.hsd_link, self.selected_device_id, self.sensor_list, output_folder,
+                                                                 segment_time, segment_size, data_server = self.data_server,
+                                                                 on_segment_published = on_segment_published, extra_files = self.get_extra_files())
+        self.is_log_started = True
+        self.output_acquisition_path = output_folder
+
+    def rotate_log_segment(self):
+        if self.segmented_acquisition is not None:
+            return self.segmented_acquisition.rotate()
+
+    def stop_segmented_log(self):
+        segments = []
+        if self.segmented_acquisition is not None:
+            segments = self.segmented_acquisition.stop()
+            self.segmented_acquisition = None
+        self.is_log_started = False
+        return segments
+
+
 script_version = "1.0.0"
 def show_help(ctx, param, value):
     if value and not ctx.resilient_parsing:
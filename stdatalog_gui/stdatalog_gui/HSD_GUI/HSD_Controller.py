@@ -35,7 +35,10 @@ from stdatalog_pnpl.DTDL.dtdl_utils import UnitMap
 import stdatalog_pnpl.DTDL.dtdl_utils as DTDLUtils
 
 from stdatalog_core.HSD_utils.DataClass import *
-from stdatalog_core.HSD_utils.DataReader import DataReader
+from stdatalog_core.HSD_utils.DataReader import DataReader, feed_sensor_data_block
+from stdatalog_core.HSD_utils.file_sink import SensorDataFileSink
+from stdatalog_core.HSD_utils.integrity import GapKind, PacketCounterChecker, get_payload_byte_rate, save_integrity_report
+from stdatalog_core.HSD_utils.shm_bus import DEFAULT_BUS_PREFIX, LiveDataBus
 
 from stdatalog_gui.STDTDL_Controller import ComponentType, STDTDL_Controller
 from stdatalog_gui.HSD_GUI.Widgets.HSDPlotLinesWidget import HSDPlotLinesWidget
@@ -116,18 +119,29 @@ class HSD_Controller(STDTDL_Controller):
     sig_key_released = Signal(Qt.Key)
     
     class DataReader(DataReader):
-        def __init__(self, controller, output_function, comp_name, samples_per_ts, dimensions, sample_size, data_format, sensitivity=1, interleaved_data=True, flat_raw_data=False):
+        def __init__(self, controller, output_function, comp_name, samples_per_ts, dimensions, sample_size, data_format, sensitivity=1, interleaved_data=True, flat_raw_data=False, data_bus=None):
             self.controller = controller
             super().__init__(output_function, comp_name, samples_per_ts, dimensions, sample_size, data_format, sensitivity, interleaved_data, flat_raw_data)
+            # Component published on the live data bus: decoded once, plots read it as a bus subscriber
+            self.data_bus = data_bus
+            self.plot_subscriber = data_bus.subscribe() if data_bus is not None else None
 
         def feed_data(self, data):
+            if self.data_bus is not None:
+                self.data_bus.publish_payload(data.data)
+                chunk = self.plot_subscriber.read()
+                if chunk is not None:
+                    for i in range(self.dimensions):
+                        self.data_dict[i] = chunk.samples[:, i].astype('f') * self.sensitivity
+                    self.output_function(DataClass(self.comp_name, self.data_dict))
+                return
             if self.controller.dt_plugins_folder_path is not None:
                 a_data = copy.copy(data)
                 self.controller.sig_new_spt_data_ready.emit(a_data)
             super().feed_data(data)
 
     class SensorAcquisitionThread(Thread):
-        def __init__(self, event, hsd_link, data_reader, d_id, comp_name, sensor_data_file, usb_dps, sig_streaming_error = None):
+        def __init__(self, event, hsd_link, data_reader, d_id, comp_name, sensor_data_file, usb_dps, sig_streaming_error = None, payload_byte_rate = None):
 
             class EmptyDataTimer(QObject):
                 timeout_signal = Signal()
@@ -155,7 +169,7 @@ class HSD_Controller(STDTDL_Controller):
             self.usb_dps = usb_dps
             self.over_proto = 0
             self.t0 = 0
-            self.prev_cnt = 0
+            self.integrity_checker = PacketCounterChecker(comp_name, usb_dps, payload_byte_rate)
 
             self.objThread = QThread()
             self.obj = EmptyDataTimer(comp_name)
@@ -176,20 +190,15 @@ class HSD_Controller(STDTDL_Controller):
                 if sensor_data is not None:
                     if self.objThread.isRunning():
                         self.obj.interrupt_event.set()
-                    nof_usb_packet = len(sensor_data[1])/(self.usb_dps + 4)
-                    for p in range(int(nof_usb_packet)):
-                        curr_cnt = struct.unpack("=i",sensor_data[1][p*(self.usb_dps + 4): p*(self.usb_dps + 4)+4])[0]
-                        diff = curr_cnt - self.prev_cnt
-                        if curr_cnt != 0 and diff != self.usb_dps:
-                            error_msg = "Streaming errors in {} component!\n{} USB packets ({} bytes) lost.\nHave a look in {} log file for more detailed info.".format(self.comp_name, int(diff//self.usb_dps), diff, log_file_name if log_file_name is not None else "application")
-                            if self.sig_streaming_error is not None:
-                                self.sig_streaming_error.emit(True, error_msg)
-                            log.error(error_msg)
-                        self.prev_cnt = curr_cnt
-
-                        self.data_reader.feed_data(DataClass(self.comp_name, sensor_data[1][p*(self.usb_dps + 4)+4: (p+1)*(self.usb_dps+4)]))
-                    if self.sensor_data_file is not None:
-                        self.sensor_data_file.write(sensor_data[1])
+                    gaps = feed_sensor_data_block(self.data_reader, self.comp_name, sensor_data[1], self.usb_dps, self.integrity_checker, self.sensor_data_file)
+                    if len(gaps) > 0:
+                        lost_packets = sum(g.get("lost_packets", 0) for g in gaps)
+                        lost_bytes = sum(g.get("lost_bytes", 0) for g in gaps)
+                        counter_errors = sum(1 for g in gaps if g["kind"] != GapKind.LOST)
+                        error_msg = "Streaming errors in {} component!\n{} USB packets ({} bytes) lost{}.\nHave a look in {} log file for more detailed info.".format(self.comp_name, lost_packets, lost_bytes, ", {} packet counter errors".format(counter_errors) if counter_errors else "", log_file_name if log_file_name is not None else "application")
+                        if self.sig_streaming_error is not None:
+                            self.sig_streaming_error.emit(True, error_msg)
+                        log.error(error_msg)
                 else:
                     self.objThread.start()
             if self.objThread.isRunning():
@@ -270,6 +279,7 @@ class HSD_Controller(STDTDL_Controller):
         self.config_error_dict = {}
         self.enabled_stream_comp_set = set()
         self.save_files_flag = True
+        self.file_sink_options = {}
         self.auto_started = False
         #Motor Control 
         self.mcp_is_connected = False
@@ -283,6 +293,9 @@ class HSD_Controller(STDTDL_Controller):
         self.mc_speed_req_name = "speed"
         #DataToolkit
         self.dt_plugins_folder_path = None
+        self.live_data_bus = None
+        self.live_data_bus_enabled = False
+        self.live_data_bus_prefix = DEFAULT_BUS_PREFIX
         #Serial communication
         self.data_reader_params = {}
         self.MAX_HSD_SRL_BANDWIDTH = 6000000
@@ -823,6 +836,21 @@ class HSD_Controller(STDTDL_Controller):
     def set_save_files_flag(self, status):
         self.save_files_flag = status
 
+    def set_live_data_bus_enabled(self, status, prefix = DEFAULT_BUS_PREFIX):
+        # Publish the live sensor data in shared memory (also readable by external processes, see shm_bus.BusSubscriber.attach)
+        self.live_data_bus_enabled = status
+        self.live_data_bus_prefix = prefix
+
+    def get_live_data_bus_names(self):
+        return self.live_data_bus.get_shm_names() if self.live_data_bus is not None else {}
+
+    def set_file_sink_options(self, sink_options):
+        # SensorDataFileSink options (buffer_size, background_writer, fsync_policy, direct_io, ...) used for the .dat files
+        self.file_sink_options = dict(sink_options) if sink_options is not None else {}
+
+    def get_sensor_data_files_stats(self):
+        return HSDLink.get_sensor_data_files_stats(self.sensor_data_files)
+
     def __start_component_plot_serial(self, comp_status, comp_name):
         c_enable = comp_status["enable"] 
             
@@ -830,7 +858,7 @@ class HSD_Controller(STDTDL_Controller):
             c_stream_id = comp_status.get("stream_id")
             if c_stream_id is not None:
                 sensor_data_file_path = os.path.join(self.hsd_link.get_acquisition_folder(),(str(comp_name) + ".dat"))
-                sensor_data_file = open(sensor_data_file_path, "wb+")
+                sensor_data_file = SensorDataFileSink(sensor_data_file_path, **self.file_sink_options)
                 self.sensor_data_files.append(sensor_data_file)
                 
                 c_type = comp_status.get("c_type")
@@ -895,7 +923,7 @@ class HSD_Controller(STDTDL_Controller):
         if c_enable == True:
             if self.save_files_flag:
                 sensor_data_file_path = os.path.join(self.hsd_link.get_acquisition_folder(),(str(comp_name) + ".dat"))
-                sensor_data_file = open(sensor_data_file_path, "wb+")
+                sensor_data_file = SensorDataFileSink(sensor_data_file_path, **self.file_sink_options)
                 self.sensor_data_files.append(sensor_data_file)
             stopFlag = Event()
             self.threads_stop_flags.append(stopFlag)
@@ -955,20 +983,28 @@ class HSD_Controller(STDTDL_Controller):
                 create_thread = True
             
             if create_thread == True:
-                dr = HSD_Controller.DataReader(self, self.add_data_to_a_plot, comp_name, spts, dimensions, sample_size, data_format, sensitivity, interleaved_data, raw_flat_data)
+                data_bus = None
+                # Standard sensor streams are decoded once and shared through the live data bus
+                if self.live_data_bus is not None and c_type == ComponentType.SENSOR.value and interleaved_data and not raw_flat_data:
+                    data_bus = self.live_data_bus.add_component(comp_name, comp_status)
+                dr = HSD_Controller.DataReader(self, self.add_data_to_a_plot, comp_name, spts, dimensions, sample_size, data_format, sensitivity, interleaved_data, raw_flat_data, data_bus)
                 self.data_readers.append(dr)
 
+                payload_byte_rate = get_payload_byte_rate(comp_status) if c_type == ComponentType.SENSOR.value else None
                 if self.save_files_flag:
-                    thread = self.SensorAcquisitionThread(stopFlag, self.hsd_link, dr, self.device_id, comp_name, sensor_data_file, usb_dps, self.sig_streaming_error)
+                    thread = self.SensorAcquisitionThread(stopFlag, self.hsd_link, dr, self.device_id, comp_name, sensor_data_file, usb_dps, self.sig_streaming_error, payload_byte_rate)
                 else:
-                    thread = self.SensorAcquisitionThread(stopFlag, self.hsd_link, dr, self.device_id, comp_name, None, usb_dps, self.sig_streaming_error)
+                    thread = self.SensorAcquisitionThread(stopFlag, self.hsd_link, dr, self.device_id, comp_name, None, usb_dps, self.sig_streaming_error, payload_byte_rate)
                 thread.start()
                 self.sensors_threads.append(thread)
 
     def start_plots(self):
+        if (self.live_data_bus_enabled or self.dt_plugins_folder_path is not None) and type(self.hsd_link) != HSDLink_v1:
+            self.live_data_bus = LiveDataBus(self.live_data_bus_prefix)
+
         if self.dt_plugins_folder_path is not None:
             # Initialize DataToolkit
-            self.dataToolKit = HSD_DataToolkit(self.components_status, self.data_pipeline, self.sig_new_spt_data_ready)
+            self.dataToolKit = HSD_DataToolkit(self.components_status, self.data_pipeline, self.sig_new_spt_data_ready, self.live_data_bus)
             # self.consumer_thread.daemon = True
             self.dataToolKit.start()
 
@@ -979,7 +1015,7 @@ class HSD_Controller(STDTDL_Controller):
             if type(self.hsd_link) == HSDLink_v1:
                     if self.save_files_flag:
                         sensor_data_file_path = os.path.join(self.hsd_link.get_acquisition_folder(),(str(s_plot.comp_name) + ".dat"))
-                        sensor_data_file = open(sensor_data_file_path, "wb+")
+                        sensor_data_file = SensorDataFileSink(sensor_data_file_path, **self.file_sink_options)
                         self.sensor_data_files.append(sensor_data_file)
                     stopFlag = Event()
                     self.threads_stop_flags.append(stopFlag)
@@ -1102,9 +1138,30 @@ class HSD_Controller(STDTDL_Controller):
         for t in self.sensors_threads:
             t.join()
 
+        if self.live_data_bus is not None:
+            if self.dt_plugins_folder_path is not None:
+                self.dataToolKit.join()
+            self.live_data_bus.close()
+            self.live_data_bus = None
+
         if self.save_files_flag:
             for f in self.sensor_data_files:
                 f.close()
+            self.save_integrity_report()
+
+        # Threads and files of this acquisition are stopped and closed
+        self.sensors_threads = []
+        self.threads_stop_flags = []
+        self.sensor_data_files = []
+
+    def save_integrity_report(self):
+        # Packet-counter checks done inline by the acquisition threads
+        comp_reports = {t.comp_name: t.integrity_checker.get_report() for t in self.sensors_threads if hasattr(t, "integrity_checker")}
+        if len(comp_reports) > 0 and self.hsd_link is not None:
+            try:
+                save_integrity_report(self.hsd_link.get_acquisition_folder(), comp_reports, "live")
+            except OSError as e:
+                log.error("Integrity report not saved: {}".format(e))
     
     def plot_window_changed(self, plot_window_time):
         self.sig_plot_window_time_updated.emit(plot_window_time)
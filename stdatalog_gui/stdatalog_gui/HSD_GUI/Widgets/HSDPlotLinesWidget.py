@@ -37,6 +37,7 @@ ispu_out_fmt_ok_status_path = resource_filename('stdatalog_gui.UI.icons', 'outli
 ispu_out_fmt_ko_status_path = resource_filename('stdatalog_gui.UI.icons', 'outline_close_white_36dp.png')
 
 import stdatalog_core.HSD_utils.logger as logger
+import stdatalog_core.HSD_utils.profiling as profiling
 log = logger.get_logger(__name__)
 
 class HSDPlotLinesWidget(PlotLinesWavWidget):    
@@ -358,6 +359,7 @@ class HSDPlotLinesWidget(PlotLinesWavWidget):
     def s_is_detecting(self, status:bool):
         self.s_is_logging(status, 1)
 
+    @profiling.profiled("gui.plot_update")
     def update_plot(self):
         # if self.tf_time_flag:
         self.x_data = self.x_data + self.timer_interval
@@ -22,6 +22,7 @@ import pyqtgraph as pg
 from stdatalog_gui.Utils.PlotParams import LinesPlotParams
 
 from stdatalog_gui.Widgets.Plots.PlotWidget import PlotWidget
+import stdatalog_core.HSD_utils.profiling as profiling
 
 class PlotLinesWidget(PlotWidget):
     def __init__(self, controller, comp_name, comp_display_name, plot_params, p_id = 0, parent=None):
@@ -104,6 +105,7 @@ class PlotLinesWidget(PlotWidget):
         assert(len(interp) == targetLen)
         return interp
     
+    @profiling.profiled("gui.plot_update")
     def update_plot(self):
         self.x_data = self.x_data + self.timer_interval
         # for i in range(self.n_curves):
@@ -16,10 +16,13 @@
 import os
 import sys
 import json
+import time
+import pickle
+import hashlib
+import threading
 from enum import Enum
 from datetime import datetime
 from stdatalog_pnpl.DTDL import device_template_model as DTM
-import requests
 
 class ComponentType(Enum):
     SENSOR = 0
@@ -55,6 +58,26 @@ else:
 
 LOCAL_DEVICE_CATALOG_PATH = os.path.join(os.path.dirname(sys.modules[__name__].__file__), "usb_device_catalog.json")
 
+# On-disk cache of pre-parsed DTDL models (override with the STDATALOG_CACHE_DIR environment variable)
+DTDL_CACHE_DIR = os.path.join(os.environ.get("STDATALOG_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "stdatalog")), "dtdl")
+# Bump when the pickled cache content changes (e.g. device_template_model classes)
+DTDL_CACHE_VERSION = 1
+# File storing the time of the last online catalog check
+CATALOG_CHECK_FILE_NAME = "catalog_check.json"
+# Default minimum time between two online catalog checks [s]
+DEFAULT_CATALOG_TTL = 24 * 3600
+
+class CatalogUpdatePolicy(Enum):
+    NEVER = "never"             # never contact the online catalog when a device or an acquisition is opened
+    ALWAYS = "always"           # synchronous update at each request (legacy behavior)
+    TTL = "ttl"                 # synchronous update if the last check is older than the TTL
+    BACKGROUND = "background"   # update in a background thread if the last check is older than the TTL (never blocks)
+
+# Process-wide caches: DTDL json path -> ((mtime_ns, size), model), id(model) -> (model, parsed InterfaceElement list)
+_dtdl_model_cache = {}
+_dtdl_interfaces_cache = {}
+_cache_lock = threading.Lock()
+
 def generate_datetime_string():
     now = datetime.now()
     datetime_string = now.strftime("%Y-%m-%d %H:%M:%S,%f")[:-3]
@@ -89,8 +112,18 @@ class DeviceCatalogEntry:
     def __repr__(self):
         return f"DeviceCatalogEntry(board_id={self.board_id}, fw_id={self.fw_id}, protocol={self.protocol}, board_name={self.board_name}, fw_name={self.fw_name}, fw_version={self.fw_version}, dtmi={self.dtmi}, dtmi_path={self.dtmi_local_path}, dtmi_url={self.dtmi_url}, fw_bin_url={self.fw_bin_url})"
 
+def get_default_update_policy():
+    try:
+        return CatalogUpdatePolicy(os.environ.get("STDATALOG_CATALOG_UPDATE", CatalogUpdatePolicy.BACKGROUND.value).lower())
+    except ValueError:
+        print_warning(f"{generate_datetime_string()} - HSDatalogApp.{__name__} - WARNING - Invalid STDATALOG_CATALOG_UPDATE value, background catalog update will be used.")
+        return CatalogUpdatePolicy.BACKGROUND
+
 class DeviceCatalogManager:
     _instance = None  # Static variable to hold the singleton instance
+    _update_policy = get_default_update_policy()
+    _update_ttl = DEFAULT_CATALOG_TTL
+    _update_thread = None
 
     @staticmethod
     def get_instance():
@@ -113,6 +146,7 @@ class DeviceCatalogManager:
         instance.new_catalog_flag = False
 
         instance.catalog_entries = []
+        instance.dtdl_index = None
 
         # Load the catalog
         with open(LOCAL_DEVICE_CATALOG_PATH, "r") as catalog:
@@ -259,13 +293,15 @@ class DeviceCatalogManager:
         }
 
     @staticmethod
-    def update_catalog( url = DEFAULT_URL):
+    def update_catalog( url = DEFAULT_URL, quiet = False):
         """
         Updates the catalog by fetching the latest version from the given URL.
         If the fetch is successful, it updates the local catalog file.
+        The attempt time is saved (whatever the result), so that the update policy TTL also applies to failed attempts.
             
         Parameters:
         - url: The URL to fetch the latest catalog from. Defaults to DEFAULT_URL.
+        - quiet: If True, fetch errors are not reported (e.g. background updates on offline hosts).
         """
         
         # Access the singleton instance of DeviceCatalogManager
@@ -275,6 +311,8 @@ class DeviceCatalogManager:
         # Access the catalog_info attribute
         local_catalog_info = instance.catalog_info
 
+        import requests
+        DeviceCatalogManager._save_last_catalog_check()
         try:
             response = requests.get(url, timeout=10)
         
@@ -321,22 +359,22 @@ class DeviceCatalogManager:
                 
                 usb_device_catalog_bkp_path = os.path.join(os.path.dirname(sys.modules[__name__].__file__), "usb_device_catalog_bkp.json")
 
-                # Check if a backup file already exists and remove it
-                if os.path.exists(usb_device_catalog_bkp_path):
-                    os.remove(usb_device_catalog_bkp_path)  # Remove the existing backup file
-
-                # Rename the current catalog file to a backup file
-                os.rename(LOCAL_DEVICE_CATALOG_PATH, usb_device_catalog_bkp_path)
-
                 # Retrieve the custom dtmi entries added by the user from the local catalog
                 custom_dtmi_entries = [entry for entry in local_catalog_dict if "custom_dtmi" in entry and entry["custom_dtmi"]]
 
-                # Update the local catalog with the online catalog data (maintaining the custom dtmi entries)
-                with open(LOCAL_DEVICE_CATALOG_PATH, "w") as catalog:
+                # Write the updated catalog next to the current one (maintaining the custom dtmi entries),
+                # so that an interrupted update (e.g. background update at process exit) never leaves the SDK without a catalog
+                usb_device_catalog_tmp_path = LOCAL_DEVICE_CATALOG_PATH + ".tmp"
+                with open(usb_device_catalog_tmp_path, "w") as catalog:
                     # Add the custom dtmi entries to the online catalog data                        
                     catalog_data["usb"].extend(custom_dtmi_entries)
                     # Save the updated catalog data to the local catalog file
                     json.dump(catalog_data, catalog, indent=4)
+
+                # Keep the current catalog file as a backup file, then replace it
+                with open(LOCAL_DEVICE_CATALOG_PATH, "rb") as src, open(usb_device_catalog_bkp_path, "wb") as dst:
+                    dst.write(src.read())
+                os.replace(usb_device_catalog_tmp_path, LOCAL_DEVICE_CATALOG_PATH)
                 
                 # Update the catalog_dict and catalog_info attributes of the instance
                 DeviceCatalogManager._instance = DeviceCatalogManager._initialize()
@@ -346,10 +384,12 @@ class DeviceCatalogManager:
                 print(f"{generate_datetime_string()} - HSDatalogApp.{__name__} - INFO - Online catalog data matches local catalog data.")
             print(f"{generate_datetime_string()} - HSDatalogApp.{__name__} - INFO - Date: {date}, Version: {version}, Checksum: {checksum}")
         except json.JSONDecodeError:
-            print_error(f"{generate_datetime_string()} - HSDatalogApp.{__name__} - ERROR - Invalid JSON response from URL: {url}")
+            if not quiet:
+                print_error(f"{generate_datetime_string()} - HSDatalogApp.{__name__} - ERROR - Invalid JSON response from URL: {url}")
         except requests.exceptions.RequestException as e:
-            print_warning(f"Network error while trying to fetch the catalog from {url}")
-            print_warning(f"Impossible to update the catalog. Local catalog will be used instead.")
+            if not quiet:
+                print_warning(f"Network error while trying to fetch the catalog from {url}")
+                print_warning(f"Impossible to update the catalog. Local catalog will be used instead.")
     
     @staticmethod
     def download_dtdl_model_from_url(url, save_path):
@@ -363,6 +403,7 @@ class DeviceCatalogManager:
         Returns:
             bool: True if the download was successful, False otherwise.
         """
+        import requests
         try:
             response = requests.get(url)
             if response.status_code == 200:
@@ -408,6 +449,7 @@ class DeviceCatalogManager:
         with open(LOCAL_DEVICE_CATALOG_PATH, "w") as catalog:
             catalog_json = {"usb": catalog_dict , "date": instance.catalog_info["date"], "version": instance.catalog_info["version"], "checksum": instance.catalog_info["checksum"]} 
             json.dump(catalog_json, catalog, indent=4)
+        instance.dtdl_index = None
     
     @staticmethod
     def get_path_from_dtmi(dtmi_string):
@@ -490,6 +532,7 @@ class DeviceCatalogManager:
         with open(LOCAL_DEVICE_CATALOG_PATH, "w") as catalog:
             catalog_json = {"usb": catalog_dict , "date": catalog_info["date"], "version": catalog_info["version"], "checksum": catalog_info["checksum"]} 
             json.dump(catalog_json, catalog, indent=4)
+        instance.dtdl_index = None
 
     @staticmethod
     def add_dtdl_model(board_id:int, fw_id:int, dtdl_model_name, dtdl_model_json):
@@ -550,51 +593,217 @@ class DeviceCatalogManager:
         with open(LOCAL_DEVICE_CATALOG_PATH, "w") as catalog:
             catalog_json = {"usb": catalog_dict , "date": catalog_info["date"], "version": catalog_info["version"], "checksum": catalog_info["checksum"]} 
             json.dump(catalog_json, catalog, indent=4)
+        instance.dtdl_index = None
+
+    @staticmethod
+    def _parse_catalog_id(value):
+        if value in ('', None):
+            return None
+        return int(value, 16) if isinstance(value, str) else value
+
+    @staticmethod
+    def _build_dtdl_index(catalog_dict):
+        """
+        Builds the (board_id, fw_id) -> [(is_custom, custom model path or dtmi)] index of the catalog entries.
+        IDs are parsed once here instead of at each query.
+        """
+        dtdl_index = {}
+        for entry in catalog_dict:
+            board_id = DeviceCatalogManager._parse_catalog_id(entry.get("board_id"))
+            if board_id is None:
+                # Skip the entry if the board_id is not present
+                continue
+            if entry.get("custom_dtmi"):
+                model = (True, entry["custom_dtmi"])
+            elif entry.get("dtmi"):
+                model = (False, entry["dtmi"])
+            else:
+                continue
+            fw_ids = {DeviceCatalogManager._parse_catalog_id(entry.get(k)) for k in ("fw_id", "usb_fw_id")} - {None}
+            for fw_id in fw_ids:
+                dtdl_index.setdefault((board_id, fw_id), []).append(model)
+        return dtdl_index
 
     @staticmethod
     def query_dtdl_model(board_id, fw_id):
-        
+        """
+        Returns the DTDL model of a device (board_id, fw_id as integers or hex strings).
+        Models are resolved through a catalog index and loaded through load_dtdl_model (cached):
+        the returned objects are shared and must not be modified.
+
+        Returns:
+            The DTDL model if only one model matches, otherwise a dictionary {model id: DTDL model}.
+        """
         # Access the singleton instance of DeviceCatalogManager
         instance = DeviceCatalogManager.get_instance()
-        # Access the catalog_dict attribute
-        catalog_dict = instance.catalog_dict
-        
+        if instance.dtdl_index is None:
+            instance.dtdl_index = DeviceCatalogManager._build_dtdl_index(instance.catalog_dict)
+        board_id = int(board_id, 16) if isinstance(board_id, str) else board_id
+        fw_id = int(fw_id, 16) if isinstance(fw_id, str) else fw_id
+
         dtdl_model_ids = []
-        for entry in catalog_dict:
-            if "board_id" in entry and entry["board_id"] != "":
-                entry["board_id"] = int(entry["board_id"], 16) if isinstance(entry["board_id"], str) else entry["board_id"]
-            else:
-                # Skip the entry if the board_id is not present
-                continue
-            if "fw_id" in entry:
-                entry["fw_id"] = int(entry["fw_id"], 16) if isinstance(entry["fw_id"], str) else entry["fw_id"]
+        for is_custom, dtdl_model_id in instance.dtdl_index.get((board_id, fw_id), []):
+            if is_custom:
+                print_warning(f"{generate_datetime_string()} - HSDatalogApp.{__name__} - WARNING - CUSTOM User Device Model selected for (fw_id: {fw_id}, board_id {board_id}).")
             else:
-                entry["usb_fw_id"] = int(entry["usb_fw_id"], 16) if isinstance(entry["usb_fw_id"], str) else entry["usb_fw_id"]
-            board_id = int(board_id, 16) if isinstance(board_id, str) else board_id
-            fw_id = int(fw_id, 16) if isinstance(fw_id, str) else fw_id
-            if entry["board_id"] == board_id and (entry.get("fw_id") == fw_id or entry.get("usb_fw_id") == fw_id):
-                if "custom_dtmi" in entry and entry["custom_dtmi"] != "":
-                    print_warning(f"{generate_datetime_string()} - HSDatalogApp.{__name__} - WARNING - CUSTOM User Device Model selected for (fw_id: {fw_id}, board_id {board_id}).")
-                    dtdl_model_id = entry["custom_dtmi"]
-                    dtdl_model_ids.append(dtdl_model_id)
-                    print("{} - HSDatalogApp.{} - INFO - dtmi: {}".format(generate_datetime_string(), __name__, dtdl_model_id))
-                elif "dtmi" in entry and entry["dtmi"] != "":
-                    print(f"{generate_datetime_string()} - HSDatalogApp.{ __name__} - INFO - dtmi found in SDK supported models")
-                    dtdl_model_id = DeviceCatalogManager.get_path_from_dtmi(entry["dtmi"])
-                    dtdl_model_ids.append(dtdl_model_id)
-                    print(f"{generate_datetime_string()} - HSDatalogApp.{__name__} - INFO - dtmi: {dtdl_model_id}")
+                print(f"{generate_datetime_string()} - HSDatalogApp.{ __name__} - INFO - dtmi found in SDK supported models")
+                dtdl_model_id = DeviceCatalogManager.get_path_from_dtmi(dtdl_model_id)
+            print(f"{generate_datetime_string()} - HSDatalogApp.{__name__} - INFO - dtmi: {dtdl_model_id}")
+            dtdl_model_ids.append(dtdl_model_id)
         if len(dtdl_model_ids) == 1:
-            dtdl_json_path = os.path.join(os.path.dirname(sys.modules[__name__].__file__), dtdl_model_id)
-            with open(dtdl_json_path, "r") as device_model:
-                return json.load(device_model)
-        else:
-            device_models = {}
-            for dtm_id in dtdl_model_ids:
-                dtdl_json_path = os.path.join(os.path.dirname(sys.modules[__name__].__file__), dtm_id)
-                with open(dtdl_json_path, "r") as device_model:
-                    device_models[dtm_id] = json.load(device_model)
-            return device_models
-        return ""
+            return DeviceCatalogManager.load_dtdl_model(os.path.join(os.path.dirname(sys.modules[__name__].__file__), dtdl_model_ids[0]))
+        device_models = {}
+        for dtm_id in dtdl_model_ids:
+            device_models[dtm_id] = DeviceCatalogManager.load_dtdl_model(os.path.join(os.path.dirname(sys.modules[__name__].__file__), dtm_id))
+        return device_models
+
+    @staticmethod
+    def load_dtdl_model(dtdl_json_path):
+        """
+        Loads a DTDL model json file through the process-wide cache (validated on file mtime and size)
+        and the on-disk cache of pre-parsed models (keyed by the file content hash).
+        The parsed interfaces are kept for DeviceTemplateManager, which skips the parsing for cached models.
+
+        Parameters:
+        - dtdl_json_path: The DTDL model json file path.
+
+        Returns:
+        - The DTDL model (shared object, must not be modified).
+        """
+        dtdl_json_path = os.path.abspath(dtdl_json_path)
+        stat = os.stat(dtdl_json_path)
+        file_key = (stat.st_mtime_ns, stat.st_size)
+        with _cache_lock:
+            cached = _dtdl_model_cache.get(dtdl_json_path)
+        if cached is not None and cached[0] == file_key:
+            return cached[1]
+
+        with open(dtdl_json_path, "rb") as f:
+            raw = f.read()
+        digest = hashlib.sha1(raw).hexdigest()
+        cache_file_path = os.path.join(DTDL_CACHE_DIR, "{}_v{}.pkl".format(digest, DTDL_CACHE_VERSION))
+        model, interfaces = None, None
+        if os.path.exists(cache_file_path):
+            try:
+                with open(cache_file_path, "rb") as f:
+                    model, interfaces = pickle.load(f)
+            except Exception:
+                model, interfaces = None, None
+        if model is None:
+            model = json.loads(raw)
+            interfaces = DeviceTemplateManager.parse_interfaces(model)
+            if interfaces is not None:
+                DeviceCatalogManager._save_cache_file(cache_file_path, (model, interfaces))
+
+        with _cache_lock:
+            if cached is not None:
+                _dtdl_interfaces_cache.pop(id(cached[1]), None)
+            _dtdl_model_cache[dtdl_json_path] = (file_key, model)
+            if interfaces is not None:
+                _dtdl_interfaces_cache[id(model)] = (model, interfaces)
+        return model
+
+    @staticmethod
+    def get_cached_interfaces(device_template_json):
+        """
+        Returns the parsed interfaces of a DTDL model loaded by load_dtdl_model, None for other models.
+        """
+        with _cache_lock:
+            cached = _dtdl_interfaces_cache.get(id(device_template_json))
+        if cached is not None and cached[0] is device_template_json:
+            return cached[1]
+        return None
+
+    @staticmethod
+    def clear_model_cache(disk = False):
+        """
+        Clears the process-wide DTDL model cache and, optionally, the on-disk cache.
+        """
+        with _cache_lock:
+            _dtdl_model_cache.clear()
+            _dtdl_interfaces_cache.clear()
+        if disk and os.path.isdir(DTDL_CACHE_DIR):
+            for file_name in os.listdir(DTDL_CACHE_DIR):
+                if file_name.endswith(".pkl"):
+                    os.remove(os.path.join(DTDL_CACHE_DIR, file_name))
+
+    @staticmethod
+    def _save_cache_file(file_path, content):
+        # The cache is an optimization only: read-only or missing home folders are ignored
+        try:
+            os.makedirs(os.path.dirname(file_path), exist_ok=True)
+            tmp_file_path = "{}.{}.tmp".format(file_path, os.getpid())
+            with open(tmp_file_path, "wb") as f:
+                pickle.dump(content, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_file_path, file_path)
+        except Exception:
+            pass
+
+    @staticmethod
+    def set_update_policy(policy, ttl = DEFAULT_CATALOG_TTL):
+        """
+        Sets the catalog update policy applied by request_catalog_update.
+        The STDATALOG_CATALOG_UPDATE environment variable ("never", "always", "ttl", "background") overrides the default policy.
+
+        Parameters:
+        - policy: A CatalogUpdatePolicy (or its value).
+        - ttl: Minimum time between two online catalog checks [s] (TTL and BACKGROUND policies).
+        """
+        DeviceCatalogManager._update_policy = CatalogUpdatePolicy(policy)
+        DeviceCatalogManager._update_ttl = ttl
+
+    @staticmethod
+    def get_update_policy():
+        return DeviceCatalogManager._update_policy
+
+    @staticmethod
+    def request_catalog_update(url = DEFAULT_URL):
+        """
+        Updates the catalog according to the update policy (used when a device or an acquisition is opened).
+        With the default BACKGROUND policy the caller never waits for the network and fetch errors are not reported.
+        Failed attempts count as checks: the next one is made after the TTL.
+
+        Returns:
+        - The background update thread (BACKGROUND policy), otherwise None.
+        """
+        policy = DeviceCatalogManager._update_policy
+        if policy == CatalogUpdatePolicy.NEVER:
+            return None
+        if policy == CatalogUpdatePolicy.ALWAYS:
+            DeviceCatalogManager.update_catalog(url)
+            return None
+        last_check = DeviceCatalogManager._load_last_catalog_check()
+        if last_check is not None and time.time() - last_check < DeviceCatalogManager._update_ttl:
+            return None
+        if policy == CatalogUpdatePolicy.TTL:
+            DeviceCatalogManager.update_catalog(url)
+            return None
+        with _cache_lock:
+            thread = DeviceCatalogManager._update_thread
+            if thread is not None and thread.is_alive():
+                return thread
+            thread = threading.Thread(target=DeviceCatalogManager.update_catalog, args=(url, True), name="catalog_update", daemon=True)
+            DeviceCatalogManager._update_thread = thread
+        thread.start()
+        return thread
+
+    @staticmethod
+    def _load_last_catalog_check():
+        try:
+            with open(os.path.join(os.path.dirname(DTDL_CACHE_DIR), CATALOG_CHECK_FILE_NAME), "r") as f:
+                return json.load(f).get("last_check")
+        except Exception:
+            return None
+
+    @staticmethod
+    def _save_last_catalog_check():
+        check_file_path = os.path.join(os.path.dirname(DTDL_CACHE_DIR), CATALOG_CHECK_FILE_NAME)
+        try:
+            os.makedirs(os.path.dirname(check_file_path), exist_ok=True)
+            with open(check_file_path, "w") as f:
+                json.dump({"last_check": time.time()}, f)
+        except Exception:
+            pass
 
 class DeviceTemplateManager:
 
@@ -619,11 +828,25 @@ class DeviceTemplateManager:
         # self.components = self.get_components()
 
     def __get_interface_list(self):
+        # Models loaded through DeviceCatalogManager.load_dtdl_model are parsed once per process (or read pre-parsed from disk)
+        interfaces = DeviceCatalogManager.get_cached_interfaces(self.device_template_model)
+        if interfaces is not None:
+            return interfaces
         interfaces = []
         for d in self.device_template_model:
             if "contents" in d:
                 interfaces.append(DTM.InterfaceElement.from_dict(d)) 
         return interfaces
+
+    @staticmethod
+    def parse_interfaces(device_template_json):
+        """
+        Parses the interfaces of a DTDL model, returns None if the model cannot be parsed.
+        """
+        try:
+            return [DTM.InterfaceElement.from_dict(d) for d in device_template_json if "contents" in d]
+        except Exception:
+            return None
     
     def __is_root_interface(self, interface):
         return interface.contents[0].type == DTM.ContentType.COMPONENT
@@ -10,9 +10,23 @@ from datetime import datetime
 from bleak import BleakClient, BleakScanner
 from thread.find_root import find_subfolder
 
+try:
+    from stdatalog_core.HSD_utils.service_state import ServiceStatePublisher
+except ImportError:
+    ServiceStatePublisher = None
+
+try:
+    from stdatalog_core.HSD_utils.control_channel import format_control_command
+except ImportError:
+    # stdatalog_core not installed: same "<command> <trigger time>" line of the CLI control channel
+    def format_control_command(command, trigger_time = None):
+        return (f"{command}\n" if trigger_time is None else f"{command} {trigger_time:.6f}\n").encode("utf-8")
+
 # === Configuration ===
 SOCKET_HOST = '127.0.0.1'
 SOCKET_PORT = 8888
+# Local control channel of the CLI (Unix domain socket), used instead of SOCKET_PORT when available
+CONTROL_SOCKET_PATH = "/tmp/stdatalog_control.sock"
 BLE_MACS = {
     "Feedrate": "DE:6D:5D:2A:BD:58",
     "Speed": "F9:51:AC:0F:75:9E"
@@ -28,6 +42,8 @@ ACQ_FOLDER = find_subfolder("acquisition_data")
 if not ACQ_FOLDER:
     raise RuntimeError("acquisition_data folder not found.")
 LOG_FILE = os.path.join(ACQ_FOLDER, "ble_disconnects.txt")
+# Name of the state snapshot read by the service dashboard and the heartbeat monitor, None to disable
+SERVICE_STATE_NAME = "stdatalog-ble"
 
 
 # === Globals ===
@@ -38,6 +54,8 @@ socket_connected = False
 last_command_sent = None
 _last_command_time = 0
 disconnect_timers = {}
+notification_counts = {name: 0 for name in BLE_MACS}
+service_state = None
 
 # Global shutdown flag
 shutdown_event = asyncio.Event()
@@ -80,6 +98,29 @@ handler.setFormatter(formatter)
 logger.addHandler(handler)
 logger.setLevel(logging.DEBUG)
 
+# === Service State ===
+def get_ble_state():
+    """Connection state of the sensors and of the CLI control channel (snapshot collector)."""
+    return {
+        "socket_connected": socket_connected,
+        "last_command": last_command_sent,
+        "sensors": {name: {"connected": ble_connected[name], "value": latest_values[name],
+                           "notifications": notification_counts[name], "mac": BLE_MACS[name]} for name in BLE_MACS}
+    }
+
+def init_service_state():
+    global service_state
+    if ServiceStatePublisher is None or SERVICE_STATE_NAME is None:
+        return
+    service_state = ServiceStatePublisher(SERVICE_STATE_NAME)
+    service_state.add_collector(get_ble_state)
+    # Logged errors are reported as the service last error
+    logger.addHandler(service_state.get_log_handler())
+
+def increment_service_counter(counter):
+    if service_state is not None:
+        service_state.increment(counter)
+
 # === BLE Float Parser ===
 def parse_float32_le(b):
     return struct.unpack('<f', b)[0]
@@ -111,6 +152,7 @@ def on_ble_disconnect(sensor_name):
         ble_connected[sensor_name] = False
         latest_values[sensor_name] = None
         log_disconnection(sensor_name, "disconnected")
+        increment_service_counter("disconnects")
         if sensor_name in disconnect_timers:
             disconnect_timers[sensor_name].cancel()
         disconnect_timers[sensor_name] = asyncio.create_task(handle_disconnect_timeout(sensor_name))
@@ -127,10 +169,14 @@ async def maintain_socket():
     while not shutdown_event.is_set():
         try:
             logger.debug("Attempting socket connection...")
-            reader, writer = await asyncio.open_connection(SOCKET_HOST, SOCKET_PORT)
+            if CONTROL_SOCKET_PATH and hasattr(asyncio, "open_unix_connection") and os.path.exists(CONTROL_SOCKET_PATH):
+                reader, writer = await asyncio.open_unix_connection(CONTROL_SOCKET_PATH)
+                logger.info(f"Socket connected ({CONTROL_SOCKET_PATH})")
+            else:
+                reader, writer = await asyncio.open_connection(SOCKET_HOST, SOCKET_PORT)
+                logger.info("Socket connected")
             socket_writer = writer
             socket_connected = True
-            logger.info("Socket connected")
             while not shutdown_event.is_set():
                 writer.write(b'\n')
                 await writer.drain()
@@ -217,17 +263,21 @@ async def connect_ble(name, mac, uuid, handler, ready_event=None):
 
 # === Notification Handlers ===
 def feedrate_notify_handler(sender, data):
+    notify_time = time.time()
     raw = parse_float32_le(data)
     v_in_min = round(raw * 39.3701 * 60 / 1000, 3)
     latest_values["Feedrate"] = v_in_min
+    notification_counts["Feedrate"] += 1
     _print_debug()
-    _check_and_send_command()
+    _check_and_send_command(notify_time)
 
 def speed_notify_handler(sender, data):
+    notify_time = time.time()
     raw = parse_float32_le(data)
     latest_values["Speed"] = round(raw, 3)
+    notification_counts["Speed"] += 1
     _print_debug()
-    _check_and_send_command()
+    _check_and_send_command(notify_time)
 
 # === Debug Print & Command Logic ===
 def _print_debug():
@@ -238,7 +288,7 @@ def _print_debug():
         feed_str = f"{f:.2f}" if f is not None else "###"
         logger.debug(f"({speed_str} rad/s, {feed_str} in/min)")
 
-def _check_and_send_command():
+def _check_and_send_command(trigger_time=None):
     global last_command_sent
     speed = latest_values["Speed"]
     feed = latest_values["Feedrate"]
@@ -247,14 +297,14 @@ def _check_and_send_command():
 
     if speed > SPEED_REQUIRED_THRESHOLD and feed < FEEDRATE_START_THRESHOLD:
         if last_command_sent != "start":
-            _send_command("start")
+            _send_command("start", trigger_time)
             last_command_sent = "start"
     else:
         if last_command_sent != "stop":
-            _send_command("stop")
+            _send_command("stop", trigger_time)
             last_command_sent = "stop"
 
-def _send_command(cmd: str):
+def _send_command(cmd: str, trigger_time=None):
     global _last_command_time
     now = time.monotonic()
     if now - _last_command_time < BETWEEN_COMMANDS:
@@ -263,8 +313,12 @@ def _send_command(cmd: str):
 
     if socket_connected and socket_writer:
         try:
-            socket_writer.write((cmd + "\n").encode())
+            # "<command> <trigger time>": the CLI saves the trigger time in acquisition_info.json
+            if trigger_time is None:
+                trigger_time = time.time()
+            socket_writer.write(format_control_command(cmd, trigger_time))
             logger.info(f"Sent command: {cmd}")
+            increment_service_counter("commands_sent")
         except Exception as e:
             logger.warning(f"Failed to send command: {e}")
 
@@ -287,12 +341,16 @@ async def monitor_main():
 # === Entrypoint ===
 async def main():
     logger.info("BLE + Socket Monitor starting...")
+    init_service_state()
     try:
         tasks = [
             asyncio.create_task(maintain_socket()),
             asyncio.create_task(ble_startup_sequence()),
             asyncio.create_task(monitor_main())
         ]
+        if service_state is not None:
+            # Published from the event loop: the snapshot gets stale if the loop hangs
+            tasks.append(asyncio.create_task(service_state.publish_loop()))
         
         # Wait for either tasks to complete or shutdown signal
         done, pending = await asyncio.wait(
@@ -332,6 +390,8 @@ async def main():
                     pass
                 logger.info("Disconnected socket connection.")
             
+            if service_state is not None:
+                service_state.stop()
             logger.info("Service shutdown complete.")
         except Exception as e:
             logger.error(f"Error during shutdown: {e}")
@@ -0,0 +1,441 @@
+#!/usr/bin/env python3
+"""
+Incremental, resumable ZIP offload engine used by usb_transfer.py.
+
+- Files are split in chunks compressed in parallel by worker processes (raw deflate streams
+  ended with a sync flush, concatenated as pigz does), so that the archive is written at USB
+  line rate instead of single-core deflate speed. Files whose first MiB does not compress
+  (ratio above INCOMPRESSIBLE_RATIO) are stored.
+- The archive is written to <zip_name>.part; after each member the file is fsync'ed and a
+  checkpoint (<zip_name>.part.json) records the completed members. If the stick is unplugged,
+  the next run truncates the .part to the last checkpoint and resumes from the next file
+  (members whose source file changed are written again).
+- Before the final rename, the member data are read back from the device (page cache dropped)
+  and compared with the CRC32 of the bytes written.
+
+The output is a standard ZIP64 archive (readable by zipfile, unzip, Windows Explorer).
+"""
+
+import os
+import json
+import time
+import zlib
+import errno
+import struct
+import shutil
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+CHUNK_SIZE = 4 * 1024 * 1024
+SAMPLE_SIZE = 1024 * 1024
+INCOMPRESSIBLE_RATIO = 0.95
+COPY_BLOCK_SIZE = 1024 * 1024
+CHECKPOINT_VERSION = 1
+FAT32_MAX_FILE_SIZE = 4 * 1024**3
+
+METHOD_STORED = 0
+METHOD_DEFLATED = 8
+
+_LOCAL_HEADER = struct.Struct("<IHHHHHIIIHH")
+_CENTRAL_HEADER = struct.Struct("<IHHHHHHIIIHHHHHII")
+_ZIP64_LOCAL_EXTRA = struct.Struct("<HHQQ")
+_ZIP64_EOCD = struct.Struct("<IQHHIIQQQQ")
+_ZIP64_EOCD_LOCATOR = struct.Struct("<IIQI")
+_EOCD = struct.Struct("<IHHHHIIH")
+_ZIP64_LIMIT = 0xFFFFFFFF
+_ZIP_FLAG_UTF8 = 0x0800
+_ZIP_VERSION = 45
+
+# ---------------------------------------------------------------------------
+# CRC32 combination (port of zlib crc32_combine, not exposed by the zlib module)
+
+def _gf2_matrix_times(mat, vec):
+    s = 0
+    i = 0
+    while vec:
+        if vec & 1:
+            s ^= mat[i]
+        vec >>= 1
+        i += 1
+    return s
+
+def _gf2_matrix_square(mat):
+    return [_gf2_matrix_times(mat, mat[n]) for n in range(32)]
+
+def crc32_combine(crc1, crc2, len2):
+    """Return the CRC32 of A+B given crc1 = CRC32(A), crc2 = CRC32(B) and len2 = len(B)."""
+    if len2 <= 0:
+        return crc1
+    odd = [0xEDB88320] + [1 << n for n in range(31)]
+    even = _gf2_matrix_square(odd)
+    odd = _gf2_matrix_square(even)
+    while True:
+        even = _gf2_matrix_square(odd)
+        if len2 & 1:
+            crc1 = _gf2_matrix_times(even, crc1)
+        len2 >>= 1
+        if not len2:
+            break
+        odd = _gf2_matrix_square(even)
+        if len2 & 1:
+            crc1 = _gf2_matrix_times(odd, crc1)
+        len2 >>= 1
+        if not len2:
+            break
+    return crc1 ^ crc2
+
+# ---------------------------------------------------------------------------
+# Worker process functions
+
+def _compress_chunk(path, offset, length, level, last):
+    """Compress a file chunk as a raw deflate segment. Returns (crc32, raw length, compressed bytes)."""
+    with open(path, "rb") as f:
+        f.seek(offset)
+        data = f.read(length)
+    comp = zlib.compressobj(level, zlib.DEFLATED, -15)
+    out = comp.compress(data) + comp.flush(zlib.Z_FINISH if last else zlib.Z_SYNC_FLUSH)
+    return zlib.crc32(data), len(data), out
+
+def _sample_ratio(path, level):
+    with open(path, "rb") as f:
+        data = f.read(SAMPLE_SIZE)
+    if not data:
+        return 1.0
+    return len(zlib.compress(data, level)) / len(data)
+
+# ---------------------------------------------------------------------------
+
+def _get_nof_chunks(size):
+    return max(1, (size + CHUNK_SIZE - 1) // CHUNK_SIZE)
+
+def _dos_date_time(mtime):
+    t = time.localtime(mtime)
+    if t.tm_year < 1980:
+        return 0, (1 << 5) | 1
+    return (t.tm_hour << 11) | (t.tm_min << 5) | (t.tm_sec // 2), ((t.tm_year - 1980) << 9) | (t.tm_mon << 5) | t.tm_mday
+
+class OffloadProgress:
+    """Progress of an offload (source bytes), with the throughput measured over the current session."""
+    def __init__(self, folder, total_bytes, callback = None, interval = 1.0):
+        self.folder = folder
+        self.total_bytes = total_bytes
+        self.done_bytes = 0
+        self.resumed_bytes = 0
+        self.written_bytes = 0
+        self.state = "running"
+        self.callback = callback
+        self.interval = interval
+        self.t_start = time.monotonic()
+        self.t_last = 0
+
+    def get_rate(self):
+        elapsed = time.monotonic() - self.t_start
+        return (self.done_bytes - self.resumed_bytes) / elapsed if elapsed > 0 else 0.0
+
+    def to_dict(self):
+        rate = self.get_rate()
+        remaining = max(0, self.total_bytes - self.done_bytes)
+        return {
+            "folder": self.folder,
+            "state": self.state,
+            "done_bytes": self.done_bytes,
+            "total_bytes": self.total_bytes,
+            "resumed_bytes": self.resumed_bytes,
+            "written_bytes": self.written_bytes,
+            "percent": round(100.0 * self.done_bytes / self.total_bytes, 1) if self.total_bytes else 100.0,
+            "rate_mb_s": round(rate / (1024 * 1024), 2),
+            "eta_s": int(remaining / rate) if rate > 0 else None,
+            "timestamp": time.time(),
+        }
+
+    def update(self, done_delta = 0, written_delta = 0, state = None, force = False):
+        self.done_bytes += done_delta
+        self.written_bytes += written_delta
+        if state is not None:
+            self.state = state
+            force = True
+        now = time.monotonic()
+        if self.callback is not None and (force or now - self.t_last >= self.interval):
+            self.t_last = now
+            self.callback(self.to_dict())
+
+class ZipOffload:
+    """
+    Resumable, parallel ZIP writer of a source folder.
+
+    :param src_dir: Folder to archive (arcnames are relative to its parent folder).
+    :param dest_dir: Destination folder (e.g. the USB mount point).
+    :param zip_name: Archive file name.
+    :param workers: Number of compression worker processes (1: compress in this process).
+    :param level: zlib compression level (1 = fastest).
+    :param is_vfat: If True, the archive must stay below 4 GiB (FAT32 limit).
+    :param min_free_bytes: The offload is aborted (ENOSPC, resumable) when the destination free space drops below this value.
+    :param progress_callback: [Optional] Function called (at most once a second) with the OffloadProgress dictionary.
+    :param verify: If True, the data written are read back and checked before the final rename.
+    """
+    def __init__(self, src_dir, dest_dir, zip_name, workers = 1, level = 1, is_vfat = False, min_free_bytes = 0, progress_callback = None, verify = True):
+        self.src_dir = os.path.abspath(src_dir)
+        self.dest_dir = dest_dir
+        self.zip_name = zip_name
+        self.workers = max(1, workers)
+        self.level = level
+        self.is_vfat = is_vfat
+        self.min_free_bytes = min_free_bytes
+        self.progress_callback = progress_callback
+        self.verify = verify
+        self.part_path = os.path.join(dest_dir, zip_name + ".part")
+        self.checkpoint_path = self.part_path + ".json"
+        self.final_path = os.path.join(dest_dir, zip_name)
+
+    def list_files(self):
+        """List the source files (deterministic order, symlinks skipped)."""
+        files = []
+        base = os.path.dirname(self.src_dir)
+        for dirpath, dirnames, filenames in os.walk(self.src_dir):
+            dirnames.sort()
+            for name in sorted(filenames):
+                abs_path = os.path.join(dirpath, name)
+                if os.path.islink(abs_path):
+                    continue
+                st = os.stat(abs_path)
+                files.append({"path": abs_path, "name": os.path.relpath(abs_path, base).replace(os.sep, "/"),
+                              "size": st.st_size, "mtime": st.st_mtime, "mode": st.st_mode})
+        return files
+
+    def get_resumable_bytes(self):
+        """Size of the partial archive already on the destination (0 if none)."""
+        try:
+            return os.path.getsize(self.part_path)
+        except OSError:
+            return 0
+
+    def __load_checkpoint(self, files):
+        """Return (members to keep, part offset) from the checkpoint, checking that the sources did not change."""
+        if not os.path.exists(self.part_path) or not os.path.exists(self.checkpoint_path):
+            return [], 0
+        try:
+            with open(self.checkpoint_path, "r") as f:
+                ckpt = json.load(f)
+        except (OSError, ValueError):
+            return [], 0
+        if ckpt.get("version") != CHECKPOINT_VERSION or ckpt.get("zip_name") != self.zip_name:
+            return [], 0
+        by_name = {f["name"]: f for f in files}
+        members = []
+        for m in ckpt.get("members", []):
+            src = by_name.get(m["name"])
+            if src is None or src["size"] != m["usize"] or src["mtime"] != m["mtime"]:
+                break
+            members.append(m)
+        part_size = self.get_resumable_bytes()
+        offset = members[-1]["end_offset"] if members else 0
+        if offset > part_size:
+            return [], 0
+        return members, offset
+
+    def __save_checkpoint(self, members):
+        tmp_path = self.checkpoint_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"version": CHECKPOINT_VERSION, "zip_name": self.zip_name, "src_dir": self.src_dir, "members": members}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.checkpoint_path)
+
+    def __check_space(self, fobj, last_check):
+        position = fobj.tell()
+        if self.is_vfat and position >= FAT32_MAX_FILE_SIZE:
+            raise OSError(errno.EFBIG, "FAT32 limit: single file must be < 4 GiB.")
+        if position - last_check >= 64 * 1024 * 1024:
+            _, _, free_now = shutil.disk_usage(self.dest_dir)
+            if free_now <= self.min_free_bytes:
+                raise OSError(errno.ENOSPC, "USB nearly out of space during write.")
+            return position
+        return last_check
+
+    def __write_local_header(self, fobj, member):
+        name = member["name"].encode("utf-8")
+        extra = _ZIP64_LOCAL_EXTRA.pack(0x0001, 16, member["usize"], member["csize"])
+        fobj.write(_LOCAL_HEADER.pack(0x04034B50, _ZIP_VERSION, _ZIP_FLAG_UTF8, member["method"], member["dos_time"], member["dos_date"],
+                                      member["crc"], _ZIP64_LIMIT, _ZIP64_LIMIT, len(name), len(extra)))
+        fobj.write(name)
+        fobj.write(extra)
+
+    def run(self):
+        """
+        Write (or resume) the archive, verify it and rename it to its final name.
+
+        :return: A tuple (final archive path, archive size in bytes).
+        """
+        files = self.list_files()
+        members, offset = self.__load_checkpoint(files)
+        done_names = {m["name"] for m in members}
+        todo = [f for f in files if f["name"] not in done_names]
+        progress = OffloadProgress(os.path.basename(self.src_dir), sum(f["size"] for f in files), self.progress_callback)
+        resumed = sum(m["usize"] for m in members)
+        progress.resumed_bytes = resumed
+        progress.update(done_delta = resumed, state = "resuming" if members else "running")
+
+        mode = "r+b" if os.path.exists(self.part_path) and offset > 0 else "wb"
+        executor = ProcessPoolExecutor(max_workers = self.workers) if self.workers > 1 else None
+        try:
+            with open(self.part_path, mode) as fobj:
+                fobj.truncate(offset)
+                fobj.seek(offset)
+                progress.update(state = "running")
+                self.__write_members(fobj, todo, members, executor, progress)
+                self.__write_central_directory(fobj, members)
+                fobj.flush()
+                os.fsync(fobj.fileno())
+        finally:
+            if executor is not None:
+                executor.shutdown(wait = True, cancel_futures = True)
+
+        if self.verify:
+            progress.update(state = "verifying")
+            self.verify_part(members)
+
+        zip_size = os.path.getsize(self.part_path)
+        os.replace(self.part_path, self.final_path)
+        try:
+            os.remove(self.checkpoint_path)
+        except OSError:
+            pass
+        progress.update(state = "done")
+        return self.final_path, zip_size
+
+    def __write_members(self, fobj, todo, members, executor, progress):
+        # Compression method of each file (sample of the first MiB)
+        methods = []
+        for f in todo:
+            if f["size"] == 0:
+                methods.append(METHOD_STORED)
+            else:
+                methods.append(METHOD_DEFLATED if _sample_ratio(f["path"], self.level) < INCOMPRESSIBLE_RATIO else METHOD_STORED)
+
+        # Chunk tasks of the deflated files, submitted ahead of the writer (bounded)
+        def chunk_tasks():
+            for i, f in enumerate(todo):
+                if methods[i] != METHOD_DEFLATED:
+                    continue
+                nof_chunks = _get_nof_chunks(f["size"])
+                for c in range(nof_chunks):
+                    yield f["path"], c * CHUNK_SIZE, CHUNK_SIZE, self.level, c == nof_chunks - 1
+        tasks = chunk_tasks()
+        pending = deque()
+        max_inflight = 2 * self.workers
+        def fill():
+            while executor is not None and len(pending) < max_inflight:
+                task = next(tasks, None)
+                if task is None:
+                    return
+                pending.append(executor.submit(_compress_chunk, *task))
+        def next_chunk():
+            # Chunks are consumed in submission order
+            if executor is None:
+                return _compress_chunk(*next(tasks))
+            fill()
+            res = pending.popleft().result()
+            fill()
+            return res
+
+        last_check = fobj.tell()
+        for i, f in enumerate(todo):
+            fill()
+            dos_time, dos_date = _dos_date_time(f["mtime"])
+            member = {"name": f["name"], "mtime": f["mtime"], "mode": f["mode"], "method": methods[i], "crc": 0, "csize": 0, "usize": f["size"],
+                      "dos_time": dos_time, "dos_date": dos_date, "header_offset": fobj.tell()}
+            self.__write_local_header(fobj, member)
+            member["data_offset"] = fobj.tell()
+            crc = 0
+            data_crc = 0
+            usize = 0
+            if methods[i] == METHOD_STORED:
+                with open(f["path"], "rb") as src:
+                    while usize < f["size"]:
+                        block = src.read(min(COPY_BLOCK_SIZE, f["size"] - usize))
+                        if not block:
+                            break
+                        fobj.write(block)
+                        crc = zlib.crc32(block, crc)
+                        usize += len(block)
+                        progress.update(done_delta = len(block), written_delta = len(block))
+                        last_check = self.__check_space(fobj, last_check)
+                data_crc = crc
+            else:
+                for _ in range(_get_nof_chunks(f["size"])):
+                    chunk_crc, chunk_len, out = next_chunk()
+                    fobj.write(out)
+                    crc = crc32_combine(crc, chunk_crc, chunk_len)
+                    data_crc = zlib.crc32(out, data_crc)
+                    usize += chunk_len
+                    progress.update(done_delta = chunk_len, written_delta = len(out))
+                    last_check = self.__check_space(fobj, last_check)
+            if usize != f["size"]:
+                raise OSError(errno.EIO, "{} changed during the transfer".format(f["path"]))
+            member["end_offset"] = fobj.tell()
+            member["crc"] = crc
+            member["csize"] = member["end_offset"] - member["data_offset"]
+            member["data_crc"] = data_crc
+            # Patch the local header with the final CRC and sizes
+            fobj.seek(member["header_offset"])
+            self.__write_local_header(fobj, member)
+            fobj.seek(member["end_offset"])
+            fobj.flush()
+            os.fsync(fobj.fileno())
+            members.append(member)
+            self.__save_checkpoint(members)
+
+    def __write_central_directory(self, fobj, members):
+        cd_offset = fobj.tell()
+        for m in members:
+            name = m["name"].encode("utf-8")
+            extra_values = []
+            usize = m["usize"]
+            csize = m["csize"]
+            header_offset = m["header_offset"]
+            if usize >= _ZIP64_LIMIT:
+                extra_values.append(usize)
+                usize = _ZIP64_LIMIT
+            if csize >= _ZIP64_LIMIT:
+                extra_values.append(csize)
+                csize = _ZIP64_LIMIT
+            if header_offset >= _ZIP64_LIMIT:
+                extra_values.append(header_offset)
+                header_offset = _ZIP64_LIMIT
+            extra = struct.pack("<HH" + "Q" * len(extra_values), 0x0001, 8 * len(extra_values), *extra_values) if extra_values else b""
+            fobj.write(_CENTRAL_HEADER.pack(0x02014B50, (3 << 8) | _ZIP_VERSION, _ZIP_VERSION, _ZIP_FLAG_UTF8, m["method"], m["dos_time"], m["dos_date"],
+                                            m["crc"], csize, usize, len(name), len(extra), 0, 0, 0, (m["mode"] & 0xFFFF) << 16, header_offset))
+            fobj.write(name)
+            fobj.write(extra)
+        cd_end = fobj.tell()
+        cd_size = cd_end - cd_offset
+        count = len(members)
+        if count >= 0xFFFF or cd_size >= _ZIP64_LIMIT or cd_offset >= _ZIP64_LIMIT:
+            fobj.write(_ZIP64_EOCD.pack(0x06064B50, 44, (3 << 8) | _ZIP_VERSION, _ZIP_VERSION, 0, 0, count, count, cd_size, cd_offset))
+            fobj.write(_ZIP64_EOCD_LOCATOR.pack(0x07064B50, 0, cd_end, 1))
+            fobj.write(_EOCD.pack(0x06054B50, 0, 0, min(count, 0xFFFF), min(count, 0xFFFF), min(cd_size, _ZIP64_LIMIT), min(cd_offset, _ZIP64_LIMIT), 0))
+        else:
+            fobj.write(_EOCD.pack(0x06054B50, 0, 0, count, count, cd_size, cd_offset, 0))
+
+    def verify_part(self, members):
+        """Read back the member data from the device and compare them with the CRC32 of the bytes written."""
+        with open(self.part_path, "rb") as f:
+            fd = f.fileno()
+            if hasattr(os, "posix_fadvise"):
+                # Drop the cached pages: read from the device, not from memory
+                os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+            for m in members:
+                f.seek(m["data_offset"])
+                remaining = m["csize"]
+                data_crc = 0
+                while remaining > 0:
+                    block = f.read(min(COPY_BLOCK_SIZE, remaining))
+                    if not block:
+                        break
+                    data_crc = zlib.crc32(block, data_crc)
+                    remaining -= len(block)
+                if remaining != 0 or data_crc != m["data_crc"]:
+                    # Corrupted data: the member and the following ones are written again
+                    idx = members.index(m)
+                    self.__save_checkpoint(members[:idx])
+                    raise OSError(errno.EIO, "Checksum mismatch on {} in {}".format(m["name"], self.part_path))
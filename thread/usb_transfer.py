@@ -4,8 +4,8 @@ import re
 import time
 import asyncio
 import shutil
+import json
 import getpass
-import zipfile
 import fcntl
 import errno
 from contextlib import contextmanager
@@ -13,6 +13,12 @@ from pathlib import Path
 import sys
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
 from thread.find_root import find_subfolder
+from thread.offload_engine import ZipOffload
+
+try:
+    from stdatalog_core.HSD_utils.acquisition_catalog import AcquisitionCatalog, TransferState, CATALOG_FILE_NAME
+except ImportError:
+    AcquisitionCatalog = None
 
 # =================== Configuration ===================
 ACQ_FOLDER = find_subfolder("acquisition_data")
@@ -31,6 +37,15 @@ REL_MARGIN = 0.05
 # Optional: minimum headroom on ACQ_FOLDER before we start (to avoid odd failures)
 MIN_SRC_HEADROOM = 64 * 1024 * 1024  # 64 MiB
 
+# Offload engine: compression worker processes (one core is left to the logger) and zlib level
+OFFLOAD_WORKERS = max(1, (os.cpu_count() or 2) - 1)
+COMPRESSION_LEVEL = 1
+# Offload progress (MB/s, ETA) read by the service monitor
+PROGRESS_FILE = "/tmp/usb_transfer_progress.json"
+
+# Maximum age (seconds) of the acquisition catalog before a (incremental) re-sync with the folder tree
+CATALOG_SYNC_INTERVAL = 60
+
 # =====================================================
 
 def find_usb_mounts():
@@ -63,6 +78,42 @@ def get_folder_size(folder_path):
         print(f"[USB] Warning: error calculating folder size for {folder_path}: {e}")
     return total_size
 
+def open_acquisition_catalog():
+    """Open the acquisition catalog maintained by the CLI logger (None if not available)."""
+    if AcquisitionCatalog is None or not os.path.exists(os.path.join(ACQ_FOLDER, CATALOG_FILE_NAME)):
+        return None
+    try:
+        return AcquisitionCatalog(ACQ_FOLDER)
+    except Exception as e:
+        print(f"[USB] Warning: acquisition catalog not available: {e}")
+        return None
+
+def list_cut_folders(catalog):
+    """
+    List the cut_* folders (oldest first) with their size in bytes (None if unknown).
+    The acquisition catalog is used when available, otherwise ACQ_FOLDER is scanned.
+    """
+    if catalog is not None:
+        try:
+            catalog.sync(max_age=CATALOG_SYNC_INTERVAL)
+            return [(c["rel_path"], c["size"]) for c in catalog.get_cut_folders()]
+        except Exception as e:
+            print(f"[USB] Warning: acquisition catalog query failed, scanning folders: {e}")
+    cut_folders = [f for f in os.listdir(ACQ_FOLDER)
+                   if f.startswith("cut_") and os.path.isdir(os.path.join(ACQ_FOLDER, f))]
+    return [(f, None) for f in sorted(cut_folders, key=get_cut_number)]
+
+def update_catalog_transfer(catalog, folder_path, state, target=None, removed=False):
+    """Record the transfer state of the acquisitions of a cut folder in the catalog."""
+    if catalog is None:
+        return
+    try:
+        catalog.set_transfer_state(folder_path, state, target)
+        if removed:
+            catalog.remove_acquisitions(folder_path)
+    except Exception as e:
+        print(f"[USB] Warning: acquisition catalog not updated: {e}")
+
 def is_vfat_mount(mount_point):
     """Detect if mount point is FAT32/vfat by inspecting /proc/mounts."""
     try:
@@ -136,105 +187,58 @@ def estimate_clearly_insufficient(folder_size, tgt_free):
     worst_zip = folder_size + safety_margin(folder_size)
     return worst_zip > tgt_free
 
-def zip_directory_stream_to_usb(src_dir, usb_mount, final_zip_name, is_vfat):
+def write_progress(progress):
+    """Publish the offload progress (MB/s, ETA) for the service monitor."""
+    tmp_path = PROGRESS_FILE + ".tmp"
+    try:
+        with open(tmp_path, "w") as f:
+            json.dump(progress, f)
+        os.replace(tmp_path, PROGRESS_FILE)
+    except OSError:
+        pass
+    if progress.get("state") in ("running", "resuming") and progress.get("eta_s") is not None:
+        print(f"[USB] {progress['folder']}: {progress['percent']}% "
+              f"({progress['rate_mb_s']} MB/s, ETA {progress['eta_s']} s)")
+
+def zip_directory_stream_to_usb(src_dir, usb_mount, final_zip_name, is_vfat, workers=OFFLOAD_WORKERS):
     """
-    Stream a ZIP of src_dir directly to the USB device as <final_zip_name>.part,
-    then rename to <final_zip_name> upon success.
+    Write a ZIP of src_dir to the USB device as <final_zip_name>.part (parallel compression, per-file
+    checkpoints), verify it, then rename it to <final_zip_name> (see thread/offload_engine.py).
+    An interrupted offload (unplugged stick, I/O error, no space) resumes from the last completed file.
 
     Returns: absolute path to final zip, and its size in bytes.
-    Raises OSError on ENOSPC or other IO errors. Cleans up partial on failure.
+    Raises OSError on ENOSPC or other IO errors. The partial archive is kept to be resumed.
     """
-    part_path = os.path.join(usb_mount, final_zip_name + ".part")
-    final_path = os.path.join(usb_mount, final_zip_name)
-
-    # Open target as a file object, and give it to ZipFile
-    # Use DEFLATED if available; fallback to ZIP_STORED for safety.
-    compression = zipfile.ZIP_DEFLATED
-    if not zipfile.is_zipfile.__doc__:  # no good check; keep default
-        pass
-
-    # Build a stable list of files first (so we can zip in deterministic order)
-    files = []
-    src_dir = os.path.abspath(src_dir)
-    for dirpath, _, filenames in os.walk(src_dir):
-        for name in sorted(filenames):
-            abs_path = os.path.join(dirpath, name)
-            if os.path.islink(abs_path):
-                # skip symlinks for safety
-                continue
-            files.append(abs_path)
-
     # Ensure we start with enough space for metadata + margin
     _, _, free0 = shutil.disk_usage(usb_mount)
     if free0 < ABS_MARGIN_BYTES:
         raise OSError(errno.ENOSPC, "Not enough initial free space on USB.")
 
-    # Create/overwrite .part
-    # If a previous partial exists, remove it
-    try:
-        if os.path.exists(part_path):
-            os.remove(part_path)
-    except Exception:
-        pass
-
-    bytes_written_last_check = 0
+    offload = ZipOffload(src_dir, usb_mount, final_zip_name, workers=workers, level=COMPRESSION_LEVEL,
+                         is_vfat=is_vfat, min_free_bytes=ABS_MARGIN_BYTES, progress_callback=write_progress)
+    if offload.get_resumable_bytes() > 0:
+        print(f"[USB] {now_ts()} Resuming partial offload of {final_zip_name} "
+              f"({format_mb(offload.get_resumable_bytes())} MB already on USB)")
     try:
-        with open(part_path, "wb") as fobj:
-            with zipfile.ZipFile(fobj, mode="w", compression=compression, allowZip64=True) as zf:
-                for abs_path in files:
-                    rel_arcname = os.path.relpath(abs_path, start=os.path.dirname(src_dir))
-                    # Write file into the zip
-                    zf.write(abs_path, arcname=rel_arcname)
-
-                    # Optional progress-space checks
-                    # Check how big the .part file is becoming
-                    try:
-                        current_size = fobj.tell()
-                    except Exception:
-                        current_size = os.path.getsize(part_path)
-
-                    # If VFAT (FAT32), enforce < 4 GiB single-file limit
-                    if is_vfat and current_size >= (4 * 1024**3):
-                        raise OSError(errno.EFBIG, "FAT32 limit: single file must be < 4 GiB.")
-
-                    # Avoid spamming disk_usage; check when growth exceeds 64 MiB since last check
-                    if current_size - bytes_written_last_check >= ABS_MARGIN_BYTES:
-                        _, _, free_now = shutil.disk_usage(usb_mount)
-                        if free_now <= ABS_MARGIN_BYTES:
-                            # We are about to run out; force an error so we can cleanly abort
-                            raise OSError(errno.ENOSPC, "USB nearly out of space during write.")
-                        bytes_written_last_check = current_size
-
-            # Ensure all data is flushed to the device
-            fobj.flush()
-            os.fsync(fobj.fileno())
-
-        # Final size of the .part
-        zip_size = os.path.getsize(part_path)
-
-        # One more free-space check (not strictly necessary for rename, but explicit)
-        _, _, free_after = shutil.disk_usage(usb_mount)
-        required_margin = safety_margin(zip_size)
-        if free_after < required_margin:
-            # We *could* still rename, but we honor the policy and keep headroom
-            raise OSError(errno.ENOSPC, f"Free space {format_mb(free_after)} MB below safety margin.")
-
-        # Crash-safe publish: atomic rename
-        os.replace(part_path, final_path)
-        print(f"[USB] {now_ts()} ZIP complete: {final_path} ({format_mb(zip_size)} MB)")
-        return final_path, zip_size
-
+        final_path, zip_size = offload.run()
     except Exception as e:
-        # Clean up partial
-        try:
-            if os.path.exists(part_path):
-                os.remove(part_path)
-        except Exception:
-            pass
+        write_progress({"folder": os.path.basename(src_dir), "state": "failed", "error": str(e), "timestamp": time.time()})
         raise
 
+    # One more free-space check (the archive is already complete and verified)
+    _, _, free_after = shutil.disk_usage(usb_mount)
+    if free_after < safety_margin(zip_size):
+        print(f"[USB] Warning: free space {format_mb(free_after)} MB below safety margin after {final_zip_name}.")
+
+    print(f"[USB] {now_ts()} ZIP complete and verified: {final_path} ({format_mb(zip_size)} MB)")
+    return final_path, zip_size
+
 async def monitor_usb():
+    catalog = None
     while True:
+        if catalog is None:
+            # The catalog is created by the CLI logger: it may appear later
+            catalog = open_acquisition_catalog()
         usb_mounts = find_usb_mounts()
         if usb_mounts:
             # Only process the first USB found to avoid conflicts
@@ -250,9 +254,8 @@ async def monitor_usb():
             print(f"[USB] Free space on USB: {format_mb(free)} MB")
 
             # List and sort cut_* folders (oldest first)
-            cut_folders = [f for f in os.listdir(ACQ_FOLDER)
-                           if f.startswith("cut_") and os.path.isdir(os.path.join(ACQ_FOLDER, f))]
-            cut_folders_sorted = sorted(cut_folders, key=get_cut_number)
+            cut_folder_sizes = dict(list_cut_folders(catalog))
+            cut_folders_sorted = sorted(cut_folder_sizes, key=get_cut_number)
             print(f"[USB] All cut folders: {cut_folders_sorted}")
 
             if len(cut_folders_sorted) > MIN_CUT_FOLDERS:
@@ -273,8 +276,14 @@ async def monitor_usb():
                         continue
 
                     # Pre-check: if clearly insufficient, skip (continue)
-                    folder_size = get_folder_size(src)
+                    folder_size = cut_folder_sizes.get(folder)
+                    if folder_size is None:
+                        folder_size = get_folder_size(src)
                     _, _, tgt_free = shutil.disk_usage(usb_mount)
+                    # A partial archive of a previous attempt is resumed, not written again
+                    part_path = os.path.join(usb_mount, final_zip_name + ".part")
+                    if os.path.exists(part_path):
+                        tgt_free += os.path.getsize(part_path)
                     if estimate_clearly_insufficient(folder_size, tgt_free):
                         print(f"[USB] Clearly insufficient space for {folder} "
                               f"(folder ~{format_mb(folder_size)} MB, free {format_mb(tgt_free)} MB incl. margin). Waiting...")
@@ -287,7 +296,7 @@ async def monitor_usb():
                         print("[USB] Detected FAT32/vfat on USB (single file must be < 4 GiB).")
 
                     # Stream zip directly to USB as .part
-                    print(f"[USB] {now_ts()} Zipping (stream) {folder} -> USB (.part then rename)...")
+                    print(f"[USB] {now_ts()} Zipping {folder} -> USB ({OFFLOAD_WORKERS} workers, .part then rename)...")
                     try:
                         final_path, zip_size = zip_directory_stream_to_usb(
                             src_dir=src,
@@ -300,6 +309,7 @@ async def monitor_usb():
                             print(f"[USB] Space/size error while zipping {folder}: {e}. Will retry later.")
                         else:
                             print(f"[USB] I/O error while zipping {folder}: {e}.")
+                        update_catalog_transfer(catalog, src, TransferState.FAILED)
                         # Do not mark transferred; do not delete src
                         await asyncio.sleep(POLL_INTERVAL)
                         continue
@@ -316,8 +326,10 @@ async def monitor_usb():
                     try:
                         shutil.rmtree(src)
                         print(f"[USB] Deleted source folder: {src}")
+                        update_catalog_transfer(catalog, src, TransferState.TRANSFERRED, final_path, removed=True)
                     except Exception as e:
                         print(f"[USB] Warning: could not delete source folder {src}: {e}")
+                        update_catalog_transfer(catalog, src, TransferState.TRANSFERRED, final_path)
 
                 else:
                     print("[USB] No new folders to transfer.")